@@ -21,6 +21,11 @@ def create_app(config_class=Config):
     # 设置字符编码
     app.config['JSON_AS_ASCII'] = False
     
+    # 响应JSON编码：安装orjson时使用其编码器
+    from app.utils.json_provider import OrjsonProvider, orjson
+    if app.config.get('FAST_JSON_ENABLED', True) and orjson is not None:
+        app.json = OrjsonProvider(app)
+    
     # 初始化扩展
     db.init_app(app)
     migrate.init_app(app, db)
@@ -44,6 +49,7 @@ def create_app(config_class=Config):
     from app.api.personalized_recommendation_routes_v2 import personalized_recommendation_bp_v2
     from app.api.llm_routes import llm_bp
     from app.api.product_management_routes import product_management_bp
+    from app.api.job_routes import job_bp
     app.register_blueprint(data_bp)
     app.register_blueprint(search_bp)
     app.register_blueprint(recommendation_bp)
@@ -54,24 +60,89 @@ def create_app(config_class=Config):
     app.register_blueprint(personalized_recommendation_bp_v2)
     app.register_blueprint(llm_bp)
     app.register_blueprint(product_management_bp)
+    app.register_blueprint(job_bp)
+    
+    # pgvector类型转换：vector列直接读为float32数组
+    import logging
+    from app.utils.vector_codec import missing_vector_columns, register_pgvector_adapter
+    with app.app_context():
+        register_pgvector_adapter(db.engine)
+        # 二进制向量列由 flask migrate-vectors 添加，缺少时ORM读写商品、标签、用户会失败
+        logger = logging.getLogger(__name__)
+        try:
+            missing = missing_vector_columns(db.engine)
+        except Exception as e:
+            missing = []
+            logger.warning(f"检查二进制向量列失败: {e}")
+        if missing:
+            logger.error(f"数据库缺少二进制向量列 {', '.join(missing)}，请先执行 flask migrate-vectors")
+    
+    # 进程内商品向量索引：后台构建，构建完成前相似度查询走pgvector
+    from app.services.vector_index_service import ProductVectorIndex
+    vector_index = ProductVectorIndex()
+    vector_index.configure(app)
+    if app.config.get('VECTOR_INDEX_PRELOAD'):
+        vector_index.start_background_build(app)
+    
+    # 搜索建议前缀索引：后台构建，构建完成前建议查询走数据库
+    from app.services.suggestion_index import SuggestionIndex
+    suggestion_index = SuggestionIndex()
+    suggestion_index.configure(app)
+    if app.config.get('SUGGESTION_INDEX_PRELOAD'):
+        suggestion_index.start_background_build(app)
+    
+    # 分类目录（分类层级与各分类商品数）：后台构建，之后随ORM写入增量更新
+    from app.services.category_catalog_service import CategoryCatalog
+    category_catalog = CategoryCatalog()
+    category_catalog.configure(app)
+    if app.config.get('CATEGORY_CATALOG_PRELOAD'):
+        category_catalog.start_background_build(app)
+    
+    # 交互事件写入队列：写入线程在首次接收事件时启动
+    from app.services.interaction_ingest_service import InteractionIngestor
+    InteractionIngestor().configure(app)
+    
+    # 结果缓存的Redis层：连接在首次使用时建立，不可用时只使用进程内缓存
+    from app.utils.result_cache import RedisCacheTier
+    RedisCacheTier().configure(app)
+    
+    # 后台任务管理器：线程池在首次提交任务时创建
+    from app.services.job_manager import JobManager
+    JobManager().configure(app)
+    
+    # 在应用启动时预加载词向量模型（裁剪词表为内存映射文件，加载只需毫秒级）
+    if app.config.get('PRELOAD_WORD_VECTORS'):
+        import logging
+        logger = logging.getLogger(__name__)
+        with app.app_context():
+            try:
+                from app.services.recommendation_service import RecommendationService
+                logger.info("应用启动，正在预加载词向量模型...")
+                
+                service = RecommendationService()
+                if service.word_vectors is not None:
+                    # 同时初始化jieba词典，preload模式下由工作进程共享
+                    import jieba
+                    jieba.initialize()
+                    logger.info("词向量模型预加载成功")
+                else:
+                    logger.warning("词向量模型预加载失败")
+                    
+            except Exception as e:
+                logger.error(f"预加载词向量模型失败: {str(e)}")
     
-    # 在应用启动时预加载词向量模型（暂时禁用，避免启动卡住）
-    # with app.app_context():
-    #     try:
-    #         from app.services.recommendation_service import RecommendationService
-    #         import logging
-    #         
-    #         logger = logging.getLogger(__name__)
-    #         logger.info("应用启动，正在预加载词向量模型...")
-    #         
-    #         service = RecommendationService()
-    #         if service.load_word_vectors():
-    #             logger.info("词向量模型预加载成功")
-    #         else:
-    #             logger.warning("词向量模型预加载失败")
-    #             
-    #     except Exception as e:
-    #         logger.error(f"预加载词向量模型失败: {str(e)}")
+    # 从查询日志预热高频查询的查询向量（preload模式下在主进程完成，工作进程共享）
+    if app.config.get('QUERY_WARMUP_PATH'):
+        import logging
+        logger = logging.getLogger(__name__)
+        with app.app_context():
+            try:
+                from app.services.pgvector_recommendation_service import PgVectorRecommendationService
+                PgVectorRecommendationService().warm_query_vectors_from_log(
+                    app.config['QUERY_WARMUP_PATH'], limit=app.config.get('QUERY_WARMUP_LIMIT', 10000)
+                )
+            except Exception as e:
+                logger.error(f"预热查询向量失败: {str(e)}")
     
     return app
 
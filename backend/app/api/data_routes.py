@@ -10,6 +10,7 @@ import logging
 from typing import Dict, Any
 
 from ..services.data_processing_service import DataProcessingService
+from ..services.job_manager import JobManager, JobFull
 
 logger = logging.getLogger(__name__)
 
@@ -26,19 +27,32 @@ def import_products():
     """
     批量导入商品数据
     POST /api/v1/data/import-products
+    默认以后台任务运行并立即返回任务信息（202），async=false 时同步导入
     """
     try:
         # 获取请求参数
         data = request.get_json() or {}
         file_path = data.get('file_path', 'data/product.txt')
-        batch_size = data.get('batch_size', 100)
+        batch_size = data.get('batch_size', 2000)
+        workers = data.get('workers')
+        run_async = data.get('async', True)
         
         # 验证参数
         if not file_path:
             return jsonify({'success': False, 'error': '文件路径不能为空'}), 400
         
-        if batch_size <= 0 or batch_size > 1000:
-            return jsonify({'success': False, 'error': '批次大小必须在1-1000之间'}), 400
+        if batch_size <= 0 or batch_size > 20000:
+            return jsonify({'success': False, 'error': '批次大小必须在1-20000之间'}), 400
+        
+        if workers is not None and (not isinstance(workers, int) or isinstance(workers, bool)
+                                    or workers <= 0 or workers > 64):
+            return jsonify({'success': False, 'error': '进程数必须是1-64之间的整数'}), 400
+
+        # 字符串形式的 "false" 不能按真值处理
+        if isinstance(run_async, str):
+            run_async = {'true': True, 'false': False}.get(run_async.strip().lower(), run_async)
+        if not isinstance(run_async, bool):
+            return jsonify({'success': False, 'error': 'async 必须是布尔值'}), 400
         
         # 构建完整文件路径
         full_path = os.path.join(os.path.dirname(__file__), '../../..', file_path)
@@ -47,16 +61,27 @@ def import_products():
         if not os.path.exists(full_path):
             return jsonify({'success': False, 'error': f'文件不存在: {file_path}'}), 404
         
+        if run_async:
+            job = JobManager().submit('import_products', {
+                'file_path': os.path.abspath(full_path),
+                'batch_size': batch_size,
+                'workers': workers
+            })
+            logger.info(f"已提交商品导入任务: {job.id}, 文件: {file_path}")
+            return jsonify({'success': True, 'data': job.to_dict(), 'message': '商品导入任务已提交'}), 202
+        
         # 开始导入数据
         logger.info(f"开始导入商品数据: {file_path}, 批次大小: {batch_size}")
         
-        result = data_service.import_products_from_file(full_path, batch_size)
+        result = data_service.import_products_from_file(full_path, batch_size, workers)
         
         if result['status'] == 'completed':
             return jsonify({'success': True, 'data': result, 'message': '商品数据导入完成'})
         else:
             return jsonify({'success': False, 'error': f'商品数据导入失败: {result.get("error", "未知错误")}'}), 500
             
+    except JobFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
     except Exception as e:
         logger.error(f"导入商品数据API错误: {e}")
         return jsonify({'success': False, 'error': f'导入商品数据失败: {str(e)}'}), 500
@@ -71,6 +96,9 @@ def get_import_progress():
     """
     try:
         progress = data_service.get_import_progress()
+        # 最近一次导入任务的进度
+        jobs = JobManager.list_jobs(job_type='import_products', limit=1)
+        progress['job'] = jobs[0].to_dict() if jobs else None
         return jsonify({'success': True, 'data': progress, 'message': '获取导入进度成功'})
         
     except Exception as e:
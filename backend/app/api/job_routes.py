@@ -0,0 +1,115 @@
+"""
+后台任务API路由
+提供后台任务的提交、查询、取消与续跑接口
+"""
+
+from flask import Blueprint, request, jsonify
+import logging
+
+from ..services.job_manager import JobManager, JobFull, JOB_HANDLERS
+
+logger = logging.getLogger(__name__)
+
+# 创建蓝图
+job_bp = Blueprint('jobs', __name__, url_prefix='/api/v1/jobs')
+
+
+@job_bp.route('', methods=['POST'])
+def submit_job():
+    """
+    提交后台任务
+    POST /api/v1/jobs
+    请求体: {"job_type": "precompute_product_vectors", "params": {...}}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        job_type = data.get('job_type')
+        if job_type not in JOB_HANDLERS:
+            return jsonify({'success': False, 'error': f'任务类型必须是: {", ".join(JOB_HANDLERS)}'}), 400
+        
+        job = JobManager().submit(job_type, data.get('params') or {})
+        return jsonify({'success': True, 'data': job.to_dict(), 'message': '任务已提交'}), 202
+        
+    except JobFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except Exception as e:
+        logger.error(f"提交后台任务失败: {e}")
+        return jsonify({'success': False, 'error': f'提交后台任务失败: {str(e)}'}), 500
+
+
+@job_bp.route('', methods=['GET'])
+def list_jobs():
+    """
+    查询后台任务列表
+    GET /api/v1/jobs?job_type=import_products&status=running&limit=20
+    """
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        jobs = JobManager.list_jobs(
+            job_type=request.args.get('job_type'),
+            status=request.args.get('status'),
+            limit=limit
+        )
+        return jsonify({'success': True, 'data': {
+            'jobs': [job.to_dict() for job in jobs],
+            'count': len(jobs)
+        }})
+        
+    except Exception as e:
+        logger.error(f"查询后台任务列表失败: {e}")
+        return jsonify({'success': False, 'error': f'查询后台任务列表失败: {str(e)}'}), 500
+
+
+@job_bp.route('/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    查询后台任务状态
+    GET /api/v1/jobs/<job_id>
+    """
+    try:
+        job = JobManager.get_job(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': f'任务不存在: {job_id}'}), 404
+        return jsonify({'success': True, 'data': job.to_dict()})
+        
+    except Exception as e:
+        logger.error(f"查询后台任务失败: {e}")
+        return jsonify({'success': False, 'error': f'查询后台任务失败: {str(e)}'}), 500
+
+
+@job_bp.route('/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    取消后台任务（运行中的任务在当前批次提交后停止）
+    POST /api/v1/jobs/<job_id>/cancel
+    """
+    try:
+        job = JobManager().cancel(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': f'任务不存在: {job_id}'}), 404
+        return jsonify({'success': True, 'data': job.to_dict(), 'message': '已请求取消任务'})
+        
+    except Exception as e:
+        logger.error(f"取消后台任务失败: {e}")
+        return jsonify({'success': False, 'error': f'取消后台任务失败: {str(e)}'}), 500
+
+
+@job_bp.route('/<int:job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """
+    从最后提交的位置续跑已取消或失败的任务
+    POST /api/v1/jobs/<job_id>/resume
+    """
+    try:
+        job = JobManager().resume(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': f'任务不存在: {job_id}'}), 404
+        return jsonify({'success': True, 'data': job.to_dict(), 'message': '任务已续跑'}), 202
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except JobFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except Exception as e:
+        logger.error(f"续跑后台任务失败: {e}")
+        return jsonify({'success': False, 'error': f'续跑后台任务失败: {str(e)}'}), 500
@@ -8,12 +8,19 @@ from flask import Blueprint, jsonify, request
 from app import db
 from app.models import User, Product, UserInteraction
 from app.services.recommendation_service import RecommendationService
+from app.services.user_profile_service import UserProfileService
 import json
 import numpy as np
 from sqlalchemy import text
+from sqlalchemy.orm import undefer
+from app.utils.result_cache import TieredCache, CATALOG_SCOPE, user_scope, bump_user_version
 
 personalized_recommendation_bp = Blueprint('personalized_recommendation', __name__, url_prefix='/api/v1/personalized-recommendations')
 
+# 个性化推荐结果缓存（进程内LRU + Redis两级缓存）
+personalized_cache = TieredCache('personalized_v1', max_entries=5000,
+                                 max_bytes=64 * 1024 * 1024, ttl=600)
+
 @personalized_recommendation_bp.route('/health', methods=['GET'])
 def health_check():
     """健康检查"""
@@ -42,7 +49,7 @@ def get_user_recommendations(user_id):
             }), 404
 
         # 检查用户是否有特征向量
-        if not user.feature_vector:
+        if not user.has_feature_vector():
             return jsonify({
                 'success': False,
                 'error': '用户尚未生成特征向量，请先进行商品交互',
@@ -53,45 +60,12 @@ def get_user_recommendations(user_id):
         limit = request.args.get('limit', 12, type=int)
         limit = min(limit, 50)  # 限制最大数量
 
-        # 解析用户特征向量
-        user_vector = np.array(json.loads(user.feature_vector))
-        
-        # 使用Python层面的向量相似度计算
-        # 使用稳定的排序策略：只使用主键ID排序，确保结果一致性
-        # 避免使用可能重复的字段（如name）导致QuickSort非确定性结果
-        products = Product.query.filter(
-            Product.embedding.isnot(None)
-        ).order_by(
-            Product.id  # 只使用主键排序，确保稳定性
-        ).limit(min(limit * 10, 1000)).all()
-        
-        print(f'查询到 {len(products)} 个商品进行相似度计算')
-        
-        recommendations = []
-        for product in products:
-            try:
-                product_vector = np.array(json.loads(product.embedding))
-                # 计算余弦相似度
-                similarity = np.dot(user_vector, product_vector) / (np.linalg.norm(user_vector) * np.linalg.norm(product_vector))
-                
-                product_dict = {
-                    'id': product.id,
-                    'name': product.name,
-                    'description': product.description,
-                    'price': float(product.price) if product.price else None,
-                    'category_id': product.category_id,
-                    'image_url': product.image_url,
-                    'tags': json.loads(product.tags) if product.tags else [],
-                    'similarity_score': float(similarity),
-                }
-                recommendations.append((product_dict, similarity))
-            except Exception as e:
-                print(f'处理商品 {product.id} 时出错: {e}')
-                continue
-        
-        # 按相似度排序并取前limit个
-        recommendations.sort(key=lambda x: x[1], reverse=True)
-        final_recommendations = [rec[0] for rec in recommendations[:limit]]
+        # 两级缓存：商品目录或用户特征向量更新后版本号变化，旧结果自动失效
+        final_recommendations = personalized_cache.get_or_set(
+            (user_id, limit),
+            lambda: compute_user_recommendations(user, limit),
+            scopes=(CATALOG_SCOPE, user_scope(user_id))
+        )
         
         # 添加调试日志
         print(f'用户 {user_id} 推荐结果:')
@@ -142,8 +116,13 @@ def update_user_profile(user_id):
         user_feature_vector = calculate_user_preference_vector(user_interactions)
         
         # 更新用户特征向量
-        user.feature_vector = json.dumps(user_feature_vector.tolist())
+        user.set_feature_vector(user_feature_vector)
+        if UserProfileService.available():
+            # 特征向量已按本接口的规则重算，清空增量向量和，下次记录交互时按交互记录重新累加
+            user.preference_sum = None
+            user.preference_weight = None
         db.session.commit()
+        bump_user_version(user_id)
 
         return jsonify({
             'success': True,
@@ -161,6 +140,55 @@ def update_user_profile(user_id):
             'error': f'更新用户画像失败: {str(e)}'
         }), 500
 
+def compute_user_recommendations(user, limit):
+    """
+    基于用户特征向量计算推荐商品
+    使用Python层面的向量相似度计算
+    """
+    # 解析用户特征向量
+    user_vector = user.get_feature_vector()
+    
+    # 使用Python层面的向量相似度计算
+    # 使用稳定的排序策略：只使用主键ID排序，确保结果一致性
+    # 避免使用可能重复的字段（如name）导致QuickSort非确定性结果
+    products = Product.query.options(
+        Product.with_vectors(), undefer(Product.description)
+    ).filter(
+        Product.vector_filter()
+    ).order_by(
+        Product.id  # 只使用主键排序，确保稳定性
+    ).limit(min(limit * 10, 1000)).all()
+    
+    print(f'查询到 {len(products)} 个商品进行相似度计算')
+    
+    recommendations = []
+    for product in products:
+        try:
+            product_vector = product.get_embedding()
+            # 计算余弦相似度
+            similarity = np.dot(user_vector, product_vector) / (np.linalg.norm(user_vector) * np.linalg.norm(product_vector))
+            
+            product_dict = {
+                'id': product.id,
+                'name': product.name,
+                'description': product.description,
+                'price': float(product.price) if product.price else None,
+                'category_id': product.category_id,
+                'image_url': product.image_url,
+                'tags': json.loads(product.tags) if product.tags else [],
+                'similarity_score': float(similarity),
+            }
+            recommendations.append((product_dict, similarity))
+        except Exception as e:
+            print(f'处理商品 {product.id} 时出错: {e}')
+            continue
+    
+    # 按相似度排序并取前limit个
+    recommendations.sort(key=lambda x: x[1], reverse=True)
+    final_recommendations = [rec[0] for rec in recommendations[:limit]]
+    
+    return final_recommendations
+
 def calculate_user_preference_vector(user_interactions):
     """
     根据用户交互记录计算用户特征向量
@@ -169,7 +197,7 @@ def calculate_user_preference_vector(user_interactions):
     try:
         # 获取所有交互过的商品
         product_ids = [interaction.product_id for interaction in user_interactions]
-        products = Product.query.filter(Product.id.in_(product_ids)).all()
+        products = Product.query.options(Product.with_vectors()).filter(Product.id.in_(product_ids)).all()
         
         if not products:
             return None
@@ -177,9 +205,9 @@ def calculate_user_preference_vector(user_interactions):
         # 创建商品ID到向量的映射
         product_vectors = {}
         for product in products:
-            if product.embedding:
+            if product.has_vector():
                 try:
-                    product_vectors[product.id] = np.array(json.loads(product.embedding))
+                    product_vectors[product.id] = product.get_embedding()
                 except Exception as e:
                     print(f'解析商品 {product.id} 向量失败: {e}')
                     continue
@@ -11,6 +11,7 @@ from app.services.recommendation_service import RecommendationService
 import json
 import numpy as np
 from sqlalchemy import text
+from sqlalchemy.orm import undefer
 
 personalized_recommendation_bp = Blueprint('personalized_recommendation', __name__, url_prefix='/api/v1/personalized-recommendations')
 
@@ -42,7 +43,7 @@ def get_user_recommendations(user_id):
             }), 404
 
         # 检查用户是否有特征向量
-        if not user.feature_vector:
+        if not user.has_feature_vector():
             return jsonify({
                 'success': False,
                 'error': '用户尚未生成特征向量，请先进行商品交互',
@@ -54,15 +55,17 @@ def get_user_recommendations(user_id):
         limit = min(limit, 50)  # 限制最大数量
 
         # 解析用户特征向量
-        user_vector = np.array(json.loads(user.feature_vector))
+        user_vector = user.get_feature_vector()
         
         # 使用Python层面的向量相似度计算
-        products = Product.query.filter(Product.embedding.isnot(None)).limit(min(limit * 10, 1000)).all()
+        products = Product.query.options(
+            Product.with_vectors(), undefer(Product.description)
+        ).filter(Product.vector_filter()).limit(min(limit * 10, 1000)).all()
         
         recommendations = []
         for product in products:
             try:
-                product_vector = np.array(json.loads(product.embedding))
+                product_vector = product.get_embedding()
                 # 计算余弦相似度
                 similarity = np.dot(user_vector, product_vector) / (np.linalg.norm(user_vector) * np.linalg.norm(product_vector))
                 
@@ -129,7 +132,7 @@ def update_user_profile(user_id):
         user_feature_vector = calculate_user_preference_vector(user_interactions)
         
         # 更新用户特征向量
-        user.feature_vector = json.dumps(user_feature_vector.tolist())
+        user.set_feature_vector(user_feature_vector)
         db.session.commit()
 
         return jsonify({
@@ -156,7 +159,7 @@ def calculate_user_preference_vector(user_interactions):
     try:
         # 获取所有交互过的商品
         product_ids = [interaction.product_id for interaction in user_interactions]
-        products = Product.query.filter(Product.id.in_(product_ids)).all()
+        products = Product.query.options(Product.with_vectors()).filter(Product.id.in_(product_ids)).all()
         
         if not products:
             return None
@@ -164,9 +167,9 @@ def calculate_user_preference_vector(user_interactions):
         # 创建商品ID到向量的映射
         product_vectors = {}
         for product in products:
-            if product.embedding:
+            if product.has_vector():
                 try:
-                    product_vectors[product.id] = np.array(json.loads(product.embedding))
+                    product_vectors[product.id] = product.get_embedding()
                 except Exception as e:
                     print(f'解析商品 {product.id} 向量失败: {e}')
                     continue
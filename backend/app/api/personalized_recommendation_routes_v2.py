@@ -7,16 +7,25 @@
 from flask import Blueprint, jsonify, request
 from app import db
 from app.models import User, Product, UserInteraction
+from app.services.vector_index_service import ProductVectorIndex
+from app.services.user_profile_service import UserProfileService
+from app.utils.vector_codec import decode_vector, to_pgvector_text
+from app.utils.embedding_matrix import EmbeddingMatrix
+from app.utils.result_cache import TieredCache, CATALOG_SCOPE, user_scope
 import json
 import numpy as np
 from sqlalchemy import text
+from sqlalchemy.orm import undefer
 import hashlib
 import time
-from datetime import datetime
 from typing import List, Dict, Tuple, Optional
 
 personalized_recommendation_bp_v2 = Blueprint('personalized_recommendation_v2', __name__, url_prefix='/api/v2/personalized-recommendations')
 
+# 个性化推荐结果缓存（进程内LRU + Redis两级缓存）
+personalized_cache = TieredCache('personalized_v2', max_entries=5000,
+                                 max_bytes=64 * 1024 * 1024, ttl=600)
+
 class DeterministicRecommendationEngine:
     """
     确定性推荐引擎
@@ -42,9 +51,9 @@ class DeterministicRecommendationEngine:
             
             # 获取所有相关商品的特征向量
             product_ids = [interaction.product_id for interaction in interactions]
-            products = db.session.query(Product).filter(
+            products = db.session.query(Product).options(Product.with_vectors()).filter(
                 Product.id.in_(product_ids),
-                Product.embedding.isnot(None)
+                Product.vector_filter()
             ).order_by(Product.id).all()  # 使用ID排序确保稳定性
             
             if not products:
@@ -54,7 +63,7 @@ class DeterministicRecommendationEngine:
             product_vectors = {}
             for product in products:
                 try:
-                    vector = np.array(json.loads(product.embedding))
+                    vector = product.get_embedding()
                     product_vectors[product.id] = vector
                 except Exception as e:
                     print(f'解析商品 {product.id} 向量失败: {e}')
@@ -98,13 +107,11 @@ class DeterministicRecommendationEngine:
             # 使用完全确定性的查询
             # 1. 先按ID排序获取所有商品
             # 2. 使用Python层面的过滤和排序
-            products = db.session.query(Product).filter(
-                Product.embedding.isnot(None)
-            ).order_by(Product.id).all()
-            
-            # 为了性能，限制候选商品数量
-            max_candidates = min(len(products), limit * 20)  # 最多取limit*20个候选商品
-            return products[:max_candidates]
+            # 向量优先取自共享向量矩阵，这里不加载向量列；描述用于组装结果，一并加载
+            # 为了性能，限制候选商品数量：最多取limit*20个候选商品
+            return db.session.query(Product).options(undefer(Product.description)).filter(
+                Product.vector_filter()
+            ).order_by(Product.id).limit(limit * 20).all()
             
         except Exception as e:
             print(f'获取候选商品失败: {e}')
@@ -113,24 +120,42 @@ class DeterministicRecommendationEngine:
     def calculate_similarities(self, user_vector: np.ndarray, products: List[Product]) -> List[Tuple[Dict, float]]:
         """
         计算相似度 - 确定性版本
+        优先从共享向量矩阵取商品向量，未命中的商品一次性解析后做一次矩阵-向量乘积
         """
         recommendations = []
+        if not products:
+            return recommendations
+        
+        similarities = np.full(len(products), np.nan, dtype=np.float32)
+        index = ProductVectorIndex()
+        matrix = index.get_matrix()
+        if matrix is not None:
+            similarities = matrix.similarities(user_vector, [product.id for product in products])
+        
+        missing = [i for i in range(len(products)) if np.isnan(similarities[i])]
+        if missing:
+            # 矩阵未命中的商品一次查询补齐向量列（填充到会话中已有的对象上）
+            db.session.query(Product).options(Product.with_vectors()).filter(
+                Product.id.in_([products[i].id for i in missing])
+            ).all()
+            vectors = []
+            parsed = []
+            for i in missing:
+                try:
+                    vector = products[i].get_embedding()
+                    if vector is not None and vector.shape == user_vector.shape:
+                        vectors.append(vector)
+                        parsed.append(i)
+                except Exception as e:
+                    print(f'处理商品 {products[i].id} 时出错: {e}')
+            if parsed:
+                block = EmbeddingMatrix.normalize(np.vstack(vectors))
+                similarities[parsed] = block @ EmbeddingMatrix.normalize(user_vector)
         
-        for product in products:
+        for product, similarity in zip(products, similarities):
+            if np.isnan(similarity):
+                continue
             try:
-                # 解析商品向量
-                product_vector = np.array(json.loads(product.embedding))
-                
-                # 计算余弦相似度
-                dot_product = np.dot(user_vector, product_vector)
-                norm_user = np.linalg.norm(user_vector)
-                norm_product = np.linalg.norm(product_vector)
-                
-                if norm_user == 0 or norm_product == 0:
-                    similarity = 0.0
-                else:
-                    similarity = dot_product / (norm_user * norm_product)
-                
                 # 构建商品信息
                 product_dict = {
                     'id': product.id,
@@ -143,7 +168,7 @@ class DeterministicRecommendationEngine:
                     'similarity_score': float(similarity),
                 }
                 
-                recommendations.append((product_dict, similarity))
+                recommendations.append((product_dict, float(similarity)))
                 
             except Exception as e:
                 print(f'处理商品 {product.id} 时出错: {e}')
@@ -157,7 +182,7 @@ class DeterministicRecommendationEngine:
         """
         try:
             # 将用户向量转换为pgvector格式
-            user_vector_str = '[' + ','.join(map(str, user_vector.tolist())) + ']'
+            user_vector_str = to_pgvector_text(user_vector)
             
             print(f'🔍 使用pgvector计算相似度，用户向量维度: {user_vector.shape}')
             
@@ -215,6 +240,12 @@ class DeterministicRecommendationEngine:
         直接使用预计算的pgvector格式字符串，无需任何转换
         """
         try:
+            # 优先使用进程内向量索引，索引冷启动或过期时降级到pgvector
+            index_recommendations = self.calculate_similarities_with_index(user_vector_str, limit)
+            if index_recommendations is not None:
+                print(f'✅ 向量索引计算完成，返回 {len(index_recommendations)} 个推荐结果')
+                return index_recommendations
+            
             print(f'🚀 使用优化版pgvector计算相似度，用户向量长度: {len(user_vector_str)}')
             
             # 使用pgvector进行相似度计算
@@ -265,6 +296,34 @@ class DeterministicRecommendationEngine:
             traceback.print_exc()
             return []
     
+    def calculate_similarities_with_index(self, user_vector_str: str, limit: int) -> Optional[List[Dict]]:
+        """
+        使用进程内向量索引计算相似度
+        索引不可用时返回None
+        """
+        hits = ProductVectorIndex().search(decode_vector(user_vector_str), limit)
+        if hits is None:
+            return None
+        
+        rows = ProductVectorIndex.fetch_product_rows([pid for pid, _ in hits])
+        recommendations = []
+        for pid, similarity in hits:
+            row = rows.get(pid)
+            if row is None:
+                continue
+            recommendations.append({
+                'id': row.id,
+                'name': row.name,
+                'description': row.description,
+                'price': float(row.price) if row.price else None,
+                'category_id': row.category_id,
+                'image_url': row.image_url,
+                'tags': json.loads(row.tags) if row.tags else [],
+                'similarity_score': float(similarity),
+                'distance': float(1.0 - similarity)
+            })
+        return recommendations
+    
     def sort_recommendations(self, recommendations: List[Tuple[Dict, float]], limit: int) -> List[Dict]:
         """
         排序推荐结果 - 确定性版本
@@ -302,11 +361,10 @@ class DeterministicRecommendationEngine:
             if user.feature_vector_pgvector:
                 print(f'✅ 用户 {user_id} 有pgvector格式特征向量，直接使用')
                 user_vector_str = user.feature_vector_pgvector
-            elif user.feature_vector:
-                print(f'⚠️  用户 {user_id} 只有JSON格式特征向量，需要转换')
+            elif user.has_feature_vector():
+                print(f'⚠️  用户 {user_id} 只有JSON/二进制格式特征向量，需要转换')
                 try:
-                    user_vector = np.array(json.loads(user.feature_vector))
-                    user_vector_str = '[' + ','.join(map(str, user_vector.tolist())) + ']'
+                    user_vector_str = to_pgvector_text(user.get_feature_vector())
                     print(f'✅ 成功转换JSON格式为pgvector格式')
                 except Exception as e:
                     print(f'❌ 转换特征向量格式失败: {e}')
@@ -323,8 +381,12 @@ class DeterministicRecommendationEngine:
                     'recommendations': []
                 }
             
-            # 3. 使用pgvector进行相似度计算
-            recommendations = self.calculate_similarities_with_pgvector_optimized(user_vector_str, limit)
+            # 3. 使用pgvector进行相似度计算（两级缓存，商品目录或用户特征向量更新后自动失效）
+            recommendations = personalized_cache.get_or_set(
+                (user_id, limit),
+                lambda: self.calculate_similarities_with_pgvector_optimized(user_vector_str, limit),
+                scopes=(CATALOG_SCOPE, user_scope(user_id))
+            )
             if not recommendations:
                 print(f'❌ pgvector相似度计算失败')
                 return {
@@ -444,20 +506,15 @@ def update_user_profile(user_id):
                 'error': '用户不存在'
             }), 404
 
-        # 计算新的用户偏好向量
-        user_vector = recommendation_engine.calculate_user_preference_vector(user_id)
+        # 全量重建用户偏好向量（同时重置增量维护的向量和），按存储模式写入并同步pgvector格式
+        # 记录交互时特征向量已增量更新，这里用于手动纠正
+        user_vector = UserProfileService().rebuild_user(user_id)
         if user_vector is None:
             return jsonify({
                 'success': False,
                 'error': '无法计算用户偏好向量，请确保有足够的交互数据'
             }), 400
 
-        # 更新用户特征向量 - 同时存储JSON和pgvector格式
-        user.feature_vector = json.dumps(user_vector.tolist())  # JSON格式（兼容性）
-        user.feature_vector_pgvector = '[' + ','.join(map(str, user_vector.tolist())) + ']'  # pgvector格式（性能优化）
-        user.vector_updated_at = datetime.utcnow()  # 更新时间戳
-        db.session.commit()
-
         # 获取交互记录数量
         interaction_count = db.session.query(UserInteraction).filter(
             UserInteraction.user_id == user_id
@@ -13,6 +13,7 @@ from app.services.similar_product_service import SimilarProductService
 from app.services.recommendation_service import RecommendationService
 from app import db
 from app.models import Product
+from app.utils.vector_codec import to_pgvector_text
 
 logger = logging.getLogger(__name__)
 
@@ -157,7 +158,7 @@ def _find_similar_by_tag_vectors(tags: List[str], limit: int) -> List[Dict]:
         logger.info(f"成功计算查询向量，维度: {len(query_vector)}")
         
         # 转换为PostgreSQL vector格式
-        vector_str = '[' + ','.join(map(str, query_vector)) + ']'
+        vector_str = to_pgvector_text(query_vector)
         
         # 使用pgvector进行向量相似度搜索
         from sqlalchemy import text
@@ -316,7 +317,7 @@ def _find_similar_by_vector_similarity(tags: List[str], description: str, limit:
         from sqlalchemy import text
         
         # 将查询向量转换为PostgreSQL数组格式
-        vector_str = '[' + ','.join(map(str, query_vector)) + ']'
+        vector_str = to_pgvector_text(query_vector)
         
         sql_query = text("""
             SELECT 
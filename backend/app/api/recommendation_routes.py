@@ -3,8 +3,10 @@
 提供向量计算、相似商品推荐等接口
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app.services.recommendation_service import RecommendationService
+from app.utils.cache import all_cache_stats, clear_caches
+from app.utils.result_cache import RedisCacheTier
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,8 +18,20 @@ recommendation_bp = Blueprint('recommendation', __name__, url_prefix='/api/v1/re
 def precompute_tag_vectors():
     """预计算标签向量"""
     try:
+        data = request.get_json(silent=True) or {}
+        workers = data.get('workers')
+        chunk_size = data.get('chunk_size', 5000)
+        if workers is not None and (not isinstance(workers, int) or isinstance(workers, bool)
+                                    or workers <= 0 or workers > 64):
+            return jsonify({'success': False, 'error': '进程数必须是1-64之间的整数'}), 400
+        if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size <= 0 or chunk_size > 50000:
+            return jsonify({'success': False, 'error': '批次大小必须是1-50000之间的整数'}), 400
+        
         service = RecommendationService()
-        result = service.precompute_tag_vectors()
+        result = service.precompute_tag_vectors(
+            workers=workers,
+            chunk_size=chunk_size
+        )
         
         if 'error' in result:
             return jsonify({'success': False, 'error': result['error']}), 500
@@ -25,7 +39,8 @@ def precompute_tag_vectors():
         return jsonify({'success': True, 'data': {
             'message': '标签向量预计算完成',
             'success_count': result['success'],
-            'failed_count': result['failed']
+            'failed_count': result['failed'],
+            'elapsed': result.get('elapsed')
         }})
         
     except Exception as e:
@@ -36,8 +51,27 @@ def precompute_tag_vectors():
 def precompute_product_vectors():
     """预计算商品特征向量"""
     try:
+        data = request.get_json(silent=True) or {}
+        chunk_size = data.get('chunk_size', 2000)
+        if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size <= 0 or chunk_size > 50000:
+            return jsonify({'success': False, 'error': '批次大小必须是1-50000之间的整数'}), 400
+        
+        # 字符串形式的 "false" 不能按真值处理
+        flags = {}
+        for name, default in (('only_missing', True), ('resume', False)):
+            value = data.get(name, default)
+            if isinstance(value, str):
+                value = {'true': True, 'false': False}.get(value.strip().lower(), value)
+            if not isinstance(value, bool):
+                return jsonify({'success': False, 'error': f'{name} 必须是布尔值'}), 400
+            flags[name] = value
+        
         service = RecommendationService()
-        result = service.precompute_product_vectors()
+        result = service.precompute_product_vectors(
+            chunk_size=chunk_size,
+            only_missing=flags['only_missing'],
+            resume=flags['resume']
+        )
         
         if 'error' in result:
             return jsonify({'success': False, 'error': result['error']}), 500
@@ -45,13 +79,36 @@ def precompute_product_vectors():
         return jsonify({'success': True, 'data': {
             'message': '商品向量预计算完成',
             'success_count': result['success'],
-            'failed_count': result['failed']
+            'failed_count': result['failed'],
+            'elapsed': result.get('elapsed')
         }})
         
     except Exception as e:
         logger.error(f"预计算商品向量失败: {str(e)}")
         return jsonify({'success': False, 'error': f"预计算商品向量失败: {str(e)}"}), 500
 
+@recommendation_bp.route('/precompute-product-vectors/progress', methods=['GET'])
+def get_product_vector_progress():
+    """获取商品向量批量构建进度"""
+    try:
+        from app.services.vector_build_service import VectorBuildService
+        return jsonify({'success': True, 'data': VectorBuildService.get_progress()})
+        
+    except Exception as e:
+        logger.error(f"获取商品向量构建进度失败: {str(e)}")
+        return jsonify({'success': False, 'error': f"获取商品向量构建进度失败: {str(e)}"}), 500
+
+@recommendation_bp.route('/precompute-tag-vectors/progress', methods=['GET'])
+def get_tag_vector_progress():
+    """获取标签向量批量预计算进度"""
+    try:
+        from app.services.vector_build_service import VectorBuildService, TAG_VECTOR_JOB
+        return jsonify({'success': True, 'data': VectorBuildService.get_progress(TAG_VECTOR_JOB)})
+        
+    except Exception as e:
+        logger.error(f"获取标签向量预计算进度失败: {str(e)}")
+        return jsonify({'success': False, 'error': f"获取标签向量预计算进度失败: {str(e)}"}), 500
+
 @recommendation_bp.route('/similar-products/<int:product_id>', methods=['GET'])
 def get_similar_products(product_id):
     """获取相似商品"""
@@ -101,6 +158,61 @@ def semantic_search():
         logger.error(f"语义搜索失败: {str(e)}")
         return jsonify({'success': False, 'error': f"语义搜索失败: {str(e)}"}), 500
 
+@recommendation_bp.route('/vector-index/status', methods=['GET'])
+def get_vector_index_status():
+    """获取进程内向量索引状态"""
+    try:
+        from app.services.vector_index_service import ProductVectorIndex
+        return jsonify({'success': True, 'data': ProductVectorIndex().get_status()})
+        
+    except Exception as e:
+        logger.error(f"获取向量索引状态失败: {str(e)}")
+        return jsonify({'success': False, 'error': f"获取向量索引状态失败: {str(e)}"}), 500
+
+@recommendation_bp.route('/vector-index/rebuild', methods=['POST'])
+def rebuild_vector_index():
+    """后台重建进程内向量索引"""
+    try:
+        from app.services.vector_index_service import ProductVectorIndex
+        index = ProductVectorIndex()
+        if not index.enabled:
+            return jsonify({'success': False, 'error': "向量索引未启用或依赖不可用"}), 400
+        
+        index.start_background_build(current_app._get_current_object())
+        return jsonify({'success': True, 'data': {
+            'message': '向量索引重建已开始',
+            'status': index.get_status()
+        }})
+        
+    except Exception as e:
+        logger.error(f"重建向量索引失败: {str(e)}")
+        return jsonify({'success': False, 'error': f"重建向量索引失败: {str(e)}"}), 500
+
+@recommendation_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """进程内缓存统计（命中率、容量、淘汰数）"""
+    try:
+        return jsonify({'success': True, 'data': {
+            'local': all_cache_stats(),
+            'redis': RedisCacheTier().stats()
+        }})
+        
+    except Exception as e:
+        logger.error(f"获取缓存统计失败: {str(e)}")
+        return jsonify({'success': False, 'error': f"获取缓存统计失败: {str(e)}"}), 500
+
+@recommendation_bp.route('/cache/clear', methods=['POST'])
+def clear_cache():
+    """清空进程内缓存，可通过name指定单个缓存"""
+    try:
+        data = request.get_json(silent=True) or {}
+        cleared = clear_caches(data.get('name'))
+        return jsonify({'success': True, 'data': {'cleared': cleared}})
+        
+    except Exception as e:
+        logger.error(f"清空缓存失败: {str(e)}")
+        return jsonify({'success': False, 'error': f"清空缓存失败: {str(e)}"}), 500
+
 @recommendation_bp.route('/statistics', methods=['GET'])
 def get_statistics():
     """获取推荐算法统计信息"""
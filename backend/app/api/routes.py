@@ -3,6 +3,7 @@ from app.api import bp
 from app.services.recommendation_service import RecommendationService
 from app.services.product_service import ProductService
 from app.services.user_service import UserService
+from app.services.product_hydration_service import parse_fields
 
 @bp.route('/products', methods=['GET'])
 def get_products():
@@ -12,13 +13,15 @@ def get_products():
         per_page = request.args.get('per_page', 20, type=int)
         category = request.args.get('category', None)
         search = request.args.get('search', None)
+        fields = parse_fields(request.args.get('fields'))
         
         product_service = ProductService()
         products = product_service.get_products(
             page=page, 
             per_page=per_page, 
             category=category, 
-            search=search
+            search=search,
+            fields=fields
         )
         
         return jsonify({
@@ -26,6 +29,11 @@ def get_products():
             'data': products,
             'message': 'Products retrieved successfully'
         })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -36,8 +44,9 @@ def get_products():
 def get_product(product_id):
     """获取单个商品详情"""
     try:
+        fields = parse_fields(request.args.get('fields'))
         product_service = ProductService()
-        product = product_service.get_product_by_id(product_id)
+        product = product_service.get_product_by_id(product_id, fields=fields)
         
         if not product:
             return jsonify({
@@ -50,6 +59,11 @@ def get_product(product_id):
             'data': product,
             'message': 'Product retrieved successfully'
         })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -119,6 +133,7 @@ def search_products():
         query = request.args.get('q', '')
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        fields = parse_fields(request.args.get('fields'))
         
         if not query:
             return jsonify({
@@ -130,7 +145,8 @@ def search_products():
         results = product_service.search_products(
             query=query,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            fields=fields
         )
         
         return jsonify({
@@ -138,6 +154,11 @@ def search_products():
             'data': results,
             'message': 'Search completed successfully'
         })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -3,20 +3,36 @@
 提供模糊匹配和语义搜索功能
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from sqlalchemy import or_, and_, func
 from sqlalchemy.orm import joinedload
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence
 import logging
 import signal
 import time
 
-from ..models import db, Product, ProductTag, Category
+from ..models import db, Product, ProductTag
+from ..utils.result_cache import TieredCache
+from ..utils.cursor import encode_cursor, decode_cursor, fingerprint
+from ..services.product_text_search import ProductTextSearch
+from ..services.suggestion_index import SuggestionIndex
+from ..services.category_catalog_service import CategoryCatalog
+from ..services.product_hydration_service import LIST_FIELDS, hydrate_products, parse_fields
 
 logger = logging.getLogger(__name__)
 
 search_bp = Blueprint('search', __name__, url_prefix='/api/v1/search')
 
+# 搜索结果缓存（进程内LRU + Redis两级缓存，随商品目录版本失效）
+search_result_cache = TieredCache('search_results', max_entries=2000,
+                                  max_bytes=64 * 1024 * 1024, ttl=300)
+
+# 语义搜索分页游标的签名盐
+SEMANTIC_CURSOR_SALT = 'semantic-search'
+
+# 语义搜索默认返回的商品字段
+SEMANTIC_FIELDS = ('id', 'name', 'image_url', 'price', 'category_name', 'category_id', 'tags')
+
 @search_bp.route('/debug', methods=['GET'])
 def debug_search():
     """调试搜索参数"""
@@ -51,6 +67,8 @@ def search_products():
         search_type = request.args.get('type', 'fuzzy')  # fuzzy 或 semantic
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
+        cursor = request.args.get('cursor') or None  # 语义搜索的下一页游标
+        raw_fields = request.args.get('fields') or None  # 返回的商品字段（逗号分隔），特征向量需显式请求
         
         # 调试信息
         logger.info(f"原始查询参数: query='{query}', type='{search_type}', page={page}, per_page={per_page}")
@@ -80,14 +98,28 @@ def search_products():
         if per_page < 1 or per_page > 100:
             per_page = 20
         
+        try:
+            fields = parse_fields(raw_fields, SEMANTIC_FIELDS if search_type == 'semantic' else LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
         # 根据搜索类型选择搜索方法
         start_time = time.time()
         
         if search_type == 'semantic':
             # 语义搜索增加超时时间
-            results = semantic_search(query, page, per_page, timeout=30)
+            try:
+                results = search_result_cache.get_or_set(
+                    ('semantic', query, page, per_page, cursor, fields),
+                    lambda: semantic_search(query, page, per_page, timeout=30, cursor=cursor, fields=fields)
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
         else:
-            results = fuzzy_search(query, page, per_page)
+            results = search_result_cache.get_or_set(
+                ('fuzzy', query, page, per_page, fields),
+                lambda: fuzzy_search(query, page, per_page, fields=fields)
+            )
         
         # 记录查询时间
         query_time = time.time() - start_time
@@ -99,79 +131,89 @@ def search_products():
         logger.error(f"搜索失败: {e}")
         return jsonify({'success': False, 'error': f"搜索失败: {str(e)}"}), 500
 
-def fuzzy_search(query: str, page: int, per_page: int) -> Dict:
+@search_bp.route('/batch', methods=['POST'])
+def batch_search():
     """
-    模糊匹配搜索
-    在商品名称、标签中搜索关键词
+    批量语义搜索接口
+    请求体: {"queries": ["查询1", "查询2", ...], "top_k": 10}
+    返回结果与queries顺序一致
     """
     try:
-        # 构建基础查询
-        base_query = db.session.query(Product)
+        data = request.get_json(silent=True) or {}
+        queries = data.get('queries')
+        top_k = int(data.get('top_k', 10))
         
-        # 去掉分类过滤逻辑
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'success': False, 'error': "queries必须为非空列表"}), 400
         
-        # 构建搜索条件
-        search_conditions = []
+        max_queries = current_app.config.get('BATCH_SEARCH_MAX_QUERIES', 5000)
+        if len(queries) > max_queries:
+            return jsonify({'success': False, 'error': f"单次最多 {max_queries} 个查询"}), 400
+        if top_k < 1 or top_k > 100:
+            top_k = 10
         
-        # 在商品名称中搜索
-        search_conditions.append(Product.name.like(f'%{query}%'))
+        queries = [str(query).strip() for query in queries]
         
-        # 在商品标签中搜索
-        tag_subquery = db.session.query(ProductTag.product_id).filter(
-            ProductTag.tag.like(f'%{query}%')
-        ).subquery()
-        search_conditions.append(Product.id.in_(tag_subquery))
-        
-        # 组合搜索条件
-        base_query = base_query.filter(or_(*search_conditions))
+        start_time = time.time()
+        from app.services.pgvector_recommendation_service import PgVectorRecommendationService
+        recommendation_service = PgVectorRecommendationService()
+        results = recommendation_service.batch_semantic_search(queries, top_k=top_k)
+        query_time = time.time() - start_time
+        logger.info(f"批量搜索耗时: {query_time:.2f}秒, 查询数: {len(queries)}")
         
-        # 按ID排序（模糊匹配的默认排序）
-        base_query = base_query.order_by(Product.id)
+        return jsonify({'success': True, 'data': {
+            'results': [{'query': query, 'products': results.get(query, [])} for query in queries],
+            'search_info': {
+                'total_queries': len(queries),
+                'top_k': top_k,
+                'type': 'semantic_batch',
+                'query_time': round(query_time, 3)
+            }
+        }, 'message': "批量搜索完成"})
         
-        # 分页查询
-        pagination = base_query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+    except Exception as e:
+        logger.error(f"批量搜索失败: {e}")
+        return jsonify({'success': False, 'error': f"批量搜索失败: {str(e)}"}), 500
+
+def fuzzy_search(query: str, page: int, per_page: int, fields: Sequence[str] = LIST_FIELDS) -> Dict:
+    """
+    模糊匹配搜索
+    PostgreSQL上使用全文检索索引按相关度排序，其他情况在商品名称、标签中LIKE匹配
+    """
+    try:
+        ranked = None
+        if ProductTextSearch.available():
+            ranked = ProductTextSearch().search(query, limit=per_page, offset=(page - 1) * per_page)
+        
+        if ranked is not None:
+            hits, total, total_is_estimate = ranked
+            product_ids = [product_id for product_id, _ in hits]
+            match_mode = 'full_text'
+        else:
+            pagination = like_search(query, page, per_page)
+            product_ids = [row.id for row in pagination.items]
+            total, total_is_estimate = pagination.total, False
+            match_mode = 'like'
+        total_pages = (total + per_page - 1) // per_page
         
-        # 构建返回结果
-        products = []
-        for product in pagination.items:
-            # 获取商品标签
-            product_tags = db.session.query(ProductTag).filter(
-                ProductTag.product_id == product.id
-            ).all()
-            
-            # 获取分类信息
-            category = db.session.query(Category).filter(
-                Category.id == product.category_id
-            ).first()
-            
-            product_data = {
-                'id': product.id,
-                'name': product.name,
-                'image_url': product.image_url,
-                'category_id': product.category_id,
-                'category_name': category.name if category else None,
-                'tags': [tag.tag for tag in product_tags],
-                'created_at': product.created_at.isoformat() if product.created_at else None
-            }
-            products.append(product_data)
+        # 构建返回结果（商品字段、标签各一次批量查询）
+        products = hydrate_products(product_ids, fields=fields)
         
         return {
             'products': products,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_prev': pagination.has_prev,
-                'has_next': pagination.has_next
+                'total': total,
+                'total_is_estimate': total_is_estimate,
+                'pages': total_pages,
+                'has_prev': page > 1,
+                'has_next': page < total_pages
             },
             'search_info': {
                 'query': query,
-                'type': 'fuzzy'
+                'type': 'fuzzy',
+                'match_mode': match_mode
             }
         }
         
@@ -179,57 +221,96 @@ def fuzzy_search(query: str, page: int, per_page: int) -> Dict:
         logger.error(f"模糊搜索失败: {e}")
         raise
 
-def semantic_search(query: str, page: int, per_page: int, timeout: int = 30) -> Dict:
+def like_search(query: str, page: int, per_page: int):
+    """
+    LIKE匹配（未启用全文检索时使用）
+    在商品名称、标签中搜索关键词，按ID排序
+    """
+    # 构建搜索条件
+    search_conditions = []
+    
+    # 在商品名称中搜索
+    search_conditions.append(Product.name.like(f'%{query}%'))
+    
+    # 在商品标签中搜索
+    tag_subquery = db.session.query(ProductTag.product_id).filter(
+        ProductTag.tag.like(f'%{query}%')
+    ).subquery()
+    search_conditions.append(Product.id.in_(tag_subquery))
+    
+    # 组合搜索条件，按ID排序（模糊匹配的默认排序）；只查询ID，商品字段由 hydrate_products 批量组装
+    base_query = db.session.query(Product.id).filter(or_(*search_conditions)).order_by(Product.id)
+    
+    # 分页查询
+    return base_query.paginate(
+        page=page, 
+        per_page=per_page, 
+        error_out=False
+    )
+
+def semantic_search(query: str, page: int, per_page: int, timeout: int = 30,
+                    cursor: Optional[str] = None, fields: Sequence[str] = None) -> Dict:
     """
     语义搜索
-    使用pgvector进行全量向量相似度匹配
+    使用pgvector进行全量向量相似度匹配，结果按 (距离, 商品ID) 排序；
+    传入cursor时从上一页最后一条之后继续排序，深分页与首页代价相同
     """
     try:
         # 使用pgvector推荐服务进行语义搜索
-        from app.services.pgvector_recommendation_service import PgVectorRecommendationService
+        from app.services.pgvector_recommendation_service import PgVectorRecommendationService, normalize_query
         recommendation_service = PgVectorRecommendationService()
+        query_fingerprint = fingerprint(normalize_query(query))
+        
+        after = None
+        offset = (page - 1) * per_page
+        if cursor:
+            payload = decode_cursor(cursor, SEMANTIC_CURSOR_SALT)
+            if payload.get('q') != query_fingerprint:
+                raise ValueError("分页游标与查询条件不匹配")
+            try:
+                after = (float(payload['d']), int(payload['i']))
+                page = int(payload.get('p', page))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("无效的分页游标")
+            offset = 0
+        
+        page_data = recommendation_service.semantic_search_page(
+            query, limit=per_page, after=after, offset=offset
+        )
+        page_results = page_data['results']
         
-        # 使用pgvector进行全量语义搜索
-        semantic_results = recommendation_service.semantic_search(query, top_k=per_page * 3)
-        
-        if not semantic_results:
+        if not page_results and page == 1 and not cursor:
             # 如果没有语义搜索结果，降级到模糊搜索
             logger.info(f"语义搜索无结果，降级到模糊搜索: {query}")
-            return fuzzy_search(query, page, per_page)
-        
-        # 分页处理
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        page_results = semantic_results[start_idx:end_idx]
-        
-        # 构建返回结果
-        products = []
-        for result in page_results:
-            # 获取商品标签
-            product_tags = db.session.query(ProductTag).filter(
-                ProductTag.product_id == result['id']
-            ).all()
-            
-            # 获取分类信息
-            category = db.session.query(Category).filter(
-                Category.id == result['category_id']
-            ).first()
-            
-            product_data = {
-                'id': result['id'],
-                'name': result['name'],
-                'image_url': result['image_url'],
-                'price': float(result['price']) if result['price'] else 0.0,
-                'category_name': category.name if category else '未分类',
-                'category_id': result['category_id'],
-                'tags': result['tags'],
-                'similarity': result['similarity'],  # 添加相似度分数
-                'distance': result['distance']  # 添加距离分数
-            }
-            products.append(product_data)
-        
-        # 计算分页信息
-        total_results = len(semantic_results)
+            return fuzzy_search(query, page, per_page, fields=fields or LIST_FIELDS)
+        
+        # 构建返回结果（商品字段、标签各一次批量查询）
+        products = hydrate_products(
+            [result['id'] for result in page_results],
+            fields=fields or SEMANTIC_FIELDS,
+            extra={result['id']: {
+                'similarity': result['similarity'],  # 相似度分数
+                'distance': result['distance']  # 距离分数
+            } for result in page_results},
+            missing_category='未分类'
+        )
+        for product_data in products:
+            if 'price' in product_data:
+                product_data['price'] = product_data['price'] or 0.0
+        
+        # 下一页游标：记录本页最后一条的排序键
+        next_cursor = None
+        if len(page_results) == per_page:
+            last = page_results[-1]
+            next_cursor = encode_cursor({
+                'q': query_fingerprint,
+                'd': last['distance'],
+                'i': last['id'],
+                'p': page + 1
+            }, SEMANTIC_CURSOR_SALT)
+        
+        # 计算分页信息（总数为可参与排序的商品数估计值）
+        total_results = page_data['total_estimate']
         total_pages = (total_results + per_page - 1) // per_page
         
         return {
@@ -238,9 +319,11 @@ def semantic_search(query: str, page: int, per_page: int, timeout: int = 30) ->
                 'page': page,
                 'per_page': per_page,
                 'total': total_results,
+                'total_is_estimate': True,
                 'pages': total_pages,
                 'has_prev': page > 1,
-                'has_next': page < total_pages
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor
             },
             'search_info': {
                 'query': query,
@@ -285,18 +368,12 @@ def get_categories():
     获取所有商品分类
     """
     try:
-        categories = Category.query.all()
-        
-        category_list = []
-        for category in categories:
-            category_list.append({
-                'id': category.id,
-                'name': category.name,
-                'description': category.description,
-                'product_count': db.session.query(Product).filter(
-                    Product.category_id == category.id
-                ).count()
-            })
+        # 分类与商品数取自进程内分类目录；tree=true 时按 parent_id 返回分类树
+        catalog = CategoryCatalog()
+        if request.args.get('tree', 'false').lower() == 'true':
+            category_list = catalog.tree()
+        else:
+            category_list = catalog.list_with_counts()
         
         return jsonify({'success': True, 'data': category_list, 'message': "获取分类成功"})
         
@@ -304,6 +381,24 @@ def get_categories():
         logger.error(f"获取分类失败: {e}")
         return jsonify({'success': False, 'error': f"获取分类失败: {str(e)}"}), 500
 
+@search_bp.route('/categories/status', methods=['GET'])
+def get_category_catalog_status():
+    """获取分类目录状态"""
+    try:
+        return jsonify({'success': True, 'data': CategoryCatalog().get_status()})
+    except Exception as e:
+        logger.error(f"获取分类目录状态失败: {e}")
+        return jsonify({'success': False, 'error': f"获取分类目录状态失败: {str(e)}"}), 500
+
+@search_bp.route('/suggestions/status', methods=['GET'])
+def get_suggestion_index_status():
+    """获取搜索建议索引状态"""
+    try:
+        return jsonify({'success': True, 'data': SuggestionIndex().get_status()})
+    except Exception as e:
+        logger.error(f"获取搜索建议索引状态失败: {e}")
+        return jsonify({'success': False, 'error': f"获取搜索建议索引状态失败: {str(e)}"}), 500
+
 @search_bp.route('/suggestions', methods=['GET'])
 def get_search_suggestions():
     """
@@ -316,9 +411,14 @@ def get_search_suggestions():
         if not query or len(query) < 2:
             return jsonify({'success': True, 'data': [], 'message': "搜索建议为空"})
         
+        # 优先使用内存前缀索引（支持拼音），索引未就绪时查询数据库
+        suggestions = SuggestionIndex().suggest(query, tag_limit=10, product_limit=5)
+        if suggestions is not None:
+            return jsonify({'success': True, 'data': suggestions, 'message': "获取搜索建议成功"})
+        
         suggestions = []
         
-        # 从标签中获取建议
+        # 从标签中获取建议（PostgreSQL上由pg_trgm索引支持子串匹配）
         tag_suggestions = db.session.query(ProductTag.tag).filter(
             ProductTag.tag.like(f'%{query}%')
         ).distinct().limit(10).all()
@@ -329,14 +429,17 @@ def get_search_suggestions():
                 'type': 'tag'
             })
         
-        # 从商品名称中获取建议
-        product_suggestions = db.session.query(Product.name).filter(
-            Product.name.like(f'%{query}%')
-        ).distinct().limit(5).all()
+        # 从商品名称中获取建议（可用时按全文检索相关度排序）
+        if ProductTextSearch.available():
+            product_names = ProductTextSearch().suggest_names(query, limit=5)
+        else:
+            product_names = [name_tuple[0] for name_tuple in db.session.query(Product.name).filter(
+                Product.name.like(f'%{query}%')
+            ).distinct().limit(5).all()]
         
-        for name_tuple in product_suggestions:
+        for name in product_names:
             suggestions.append({
-                'text': name_tuple[0],
+                'text': name,
                 'type': 'product'
             })
         
@@ -9,6 +9,7 @@ import logging
 from typing import List, Dict
 
 from ..services.similar_product_service import SimilarProductService
+from ..services.similar_product_materializer import SimilarProductMaterializer
 
 logger = logging.getLogger(__name__)
 
@@ -48,13 +49,20 @@ def get_similar_products(product_id: int):
                 'error': 'threshold参数必须在0.0-1.0之间'
             }), 400
         
-        # 查询相似商品
-        similar_products = similar_product_service.find_similar_products(
-            product_id=product_id,
-            limit=limit,
-            threshold=threshold,
-            exclude_self=exclude_self
-        )
+        # 优先读取物化的相似列表，未物化时实时查询
+        materialized = similar_product_service.find_materialized_similar_products(
+            product_id, limit, threshold
+        ) if exclude_self else None
+        if materialized is not None:
+            similar_products, source_info = materialized
+        else:
+            similar_products = similar_product_service.find_similar_products(
+                product_id=product_id,
+                limit=limit,
+                threshold=threshold,
+                exclude_self=exclude_self
+            )
+            source_info = {'source': 'realtime', 'stale': False}
         
         return jsonify({
             'success': True,
@@ -63,7 +71,8 @@ def get_similar_products(product_id: int):
                 'similar_products': similar_products,
                 'count': len(similar_products),
                 'limit': limit,
-                'threshold': threshold
+                'threshold': threshold,
+                'source': source_info
             },
             'message': f'找到 {len(similar_products)} 个相似商品'
         })
@@ -237,6 +246,29 @@ def get_similarity_stats():
             'error': f'获取统计信息失败: {str(e)}'
         }), 500
 
+@similar_product_bp.route('/materialize/status', methods=['GET'])
+@cross_origin()
+def get_materialize_status():
+    """
+    相似商品物化状态
+    物化任务通过 POST /api/v1/jobs 提交：{"job_type": "materialize_similar_products", "params": {"full": false}}
+    """
+    try:
+        status = SimilarProductMaterializer().get_status()
+        
+        return jsonify({
+            'success': True,
+            'data': status,
+            'message': '获取物化状态成功'
+        })
+        
+    except Exception as e:
+        logger.error(f"获取物化状态失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'获取物化状态失败: {str(e)}'
+        }), 500
+
 @similar_product_bp.route('/cache/clear', methods=['POST'])
 @cross_origin()
 def clear_cache():
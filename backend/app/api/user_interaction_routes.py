@@ -5,9 +5,15 @@
 
 from flask import Blueprint, request, jsonify
 from app.services.user_service import UserService
+from app.services.interaction_ingest_service import InteractionIngestor, IngestFull
+from app.services.interaction_rollup_service import InteractionRollupService, SCOPE_CATEGORY, SCOPE_PRODUCT
 from app.models import UserInteraction, Product, Category
+from app.services.product_hydration_service import INTERACTION_PRODUCT_FIELDS, hydrate_products
+from app.utils.cursor import fingerprint
+from app.utils.keyset import keyset_paginate
 from app import db
 from sqlalchemy import text
+from sqlalchemy.orm import joinedload
 import logging
 from datetime import datetime, timedelta
 
@@ -16,6 +22,12 @@ logger = logging.getLogger(__name__)
 # 创建蓝图
 user_interaction_bp = Blueprint('user_interaction', __name__, url_prefix='/api/v1/user-interactions')
 
+# 商品交互记录分页游标的签名salt
+PRODUCT_INTERACTION_CURSOR_SALT = 'product-interactions'
+
+# 会话ID最大长度（与 user_interactions.session_id 列一致）
+SESSION_ID_MAX_LENGTH = UserInteraction.__table__.c.session_id.type.length
+
 @user_interaction_bp.route('/record', methods=['POST'])
 def record_interaction():
     """记录用户交互"""
@@ -45,6 +57,54 @@ def record_interaction():
                 'error': f'无效的交互类型: {interaction_type}'
             }), 400
         
+        # 验证会话ID（写入失败的事件会阻塞批量写入，须在接收时拒绝）
+        if session_id is not None and (not isinstance(session_id, str) or len(session_id) > SESSION_ID_MAX_LENGTH):
+            return jsonify({
+                'success': False,
+                'error': f'会话ID须为不超过{SESSION_ID_MAX_LENGTH}个字符的字符串'
+            }), 400
+        
+        # 异步批量写入：对照进程内ID集合校验，事件入队后即返回
+        ingestor = InteractionIngestor()
+        if ingestor.enabled:
+            try:
+                user_id = int(user_id)
+                product_id = int(product_id)
+                if interaction_score is not None:
+                    interaction_score = float(interaction_score)
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'error': '用户ID、商品ID或交互分数格式无效'
+                }), 400
+            if not ingestor.user_exists(user_id):
+                return jsonify({
+                    'success': False,
+                    'error': '用户不存在'
+                }), 404
+            if not ingestor.product_exists(product_id):
+                return jsonify({
+                    'success': False,
+                    'error': '商品不存在'
+                }), 404
+            try:
+                interaction = ingestor.submit(
+                    user_id=user_id,
+                    product_id=product_id,
+                    interaction_type=interaction_type,
+                    interaction_score=interaction_score,
+                    session_id=session_id
+                )
+            except IngestFull as e:
+                response = jsonify({'success': False, 'error': str(e)})
+                response.headers['Retry-After'] = '1'
+                return response, 429
+            return jsonify({
+                'success': True,
+                'data': interaction,
+                'message': '交互已接收，将批量写入'
+            }), 202
+        
         # 验证用户和商品是否存在
         from app.models import User, Product
         user = User.query.filter_by(id=user_id).first()
@@ -84,6 +144,22 @@ def record_interaction():
             'error': f'记录交互失败: {str(e)}'
         }), 500
 
+@user_interaction_bp.route('/ingest/status', methods=['GET'])
+def get_ingest_status():
+    """获取交互写入队列状态（当前工作进程）"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': InteractionIngestor().get_status(),
+            'message': '获取交互写入状态成功'
+        })
+    except Exception as e:
+        logger.error(f"获取交互写入状态失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取交互写入状态失败: {str(e)}'
+        }), 500
+
 @user_interaction_bp.route('/user/<int:user_id>', methods=['GET'])
 def get_user_interactions_by_id(user_id):
     """获取用户交互历史 - 按用户ID"""
@@ -102,24 +178,23 @@ def get_user_interactions_by_id(user_id):
         result = user_service.get_user_interactions(
             user_id=user_id,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            cursor=request.args.get('cursor') or None,
+            interaction_type=interaction_type,
+            with_total=request.args.get('with_total', 'false').lower() == 'true'
         )
         
-        # 如果指定了交互类型，进行过滤
-        if interaction_type:
-            filtered_interactions = [
-                interaction for interaction in result['interactions']
-                if interaction['interaction_type'] == interaction_type
-            ]
-            result['interactions'] = filtered_interactions
-            result['pagination']['total'] = len(filtered_interactions)
-        
         return jsonify({
             'success': True,
             'data': result,
             'message': '获取用户交互历史成功'
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"获取用户交互历史失败: {str(e)}")
         return jsonify({
@@ -208,6 +283,50 @@ def update_user_preferences(user_id):
             'error': f'更新偏好失败: {str(e)}'
         }), 500
 
+def _product_interaction_statistics(product_id: int) -> dict:
+    """商品交互统计：优先读取交互计数汇总，汇总表不可用时直接聚合交互记录"""
+    rollups = InteractionRollupService()
+    if rollups.usable():
+        totals = rollups.totals(SCOPE_PRODUCT, product_id)
+        return {
+            'total_interactions': sum(counts['count'] for counts in totals.values()),
+            'unique_users': sum(counts['new_pairs'] for counts in totals.values()),
+            'interaction_types': [
+                {
+                    'type': interaction_type,
+                    'count': counts['count'],
+                    'avg_score': counts['score_sum'] / counts['score_count'] if counts['score_count'] else 0
+                }
+                for interaction_type, counts in sorted(totals.items())
+            ]
+        }
+    
+    unique_users = db.session.query(UserInteraction.user_id).filter_by(
+        product_id=product_id
+    ).distinct().count()
+    
+    # 按交互类型统计
+    interaction_stats = db.session.query(
+        UserInteraction.interaction_type,
+        db.func.count(UserInteraction.id).label('count'),
+        db.func.avg(UserInteraction.interaction_score).label('avg_score')
+    ).filter_by(product_id=product_id).group_by(
+        UserInteraction.interaction_type
+    ).all()
+    
+    return {
+        'total_interactions': sum(stat.count for stat in interaction_stats),
+        'unique_users': unique_users,
+        'interaction_types': [
+            {
+                'type': stat.interaction_type,
+                'count': stat.count,
+                'avg_score': float(stat.avg_score) if stat.avg_score else 0
+            }
+            for stat in interaction_stats
+        ]
+    }
+
 @user_interaction_bp.route('/product/<int:product_id>/interactions', methods=['GET'])
 def get_product_interactions(product_id):
     """获取商品交互统计"""
@@ -221,19 +340,19 @@ def get_product_interactions(product_id):
         if per_page < 1 or per_page > 100:
             per_page = 20
         
-        # 查询商品交互记录
-        interactions_query = UserInteraction.query.filter_by(product_id=product_id).order_by(
-            UserInteraction.created_at.desc()
+        # 查询商品交互记录（按时间倒序键集分页）
+        interactions_query = UserInteraction.query.options(joinedload(UserInteraction.user)).filter(
+            UserInteraction.product_id == product_id
         )
         
-        pagination = interactions_query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        items, pagination = keyset_paginate(
+            interactions_query, UserInteraction.created_at, UserInteraction.id, per_page,
+            salt=PRODUCT_INTERACTION_CURSOR_SALT, scope=fingerprint('product', product_id),
+            page=page, cursor=request.args.get('cursor') or None
         )
         
         interactions = []
-        for interaction in pagination.items:
+        for interaction in items:
             interaction_dict = interaction.to_dict()
             # 添加用户信息
             if interaction.user:
@@ -244,45 +363,16 @@ def get_product_interactions(product_id):
                 }
             interactions.append(interaction_dict)
         
-        # 计算商品交互统计
-        total_interactions = UserInteraction.query.filter_by(product_id=product_id).count()
-        unique_users = db.session.query(UserInteraction.user_id).filter_by(
-            product_id=product_id
-        ).distinct().count()
-        
-        # 按交互类型统计
-        interaction_stats = db.session.query(
-            UserInteraction.interaction_type,
-            db.func.count(UserInteraction.id).label('count'),
-            db.func.avg(UserInteraction.interaction_score).label('avg_score')
-        ).filter_by(product_id=product_id).group_by(
-            UserInteraction.interaction_type
-        ).all()
-        
-        stats = {
-            'total_interactions': total_interactions,
-            'unique_users': unique_users,
-            'interaction_types': [
-                {
-                    'type': stat.interaction_type,
-                    'count': stat.count,
-                    'avg_score': float(stat.avg_score) if stat.avg_score else 0
-                }
-                for stat in interaction_stats
-            ]
-        }
+        stats = _product_interaction_statistics(product_id)
+        
+        # 交互总数同时作为分页总数
+        pagination['total'] = stats['total_interactions']
+        pagination['pages'] = (stats['total_interactions'] + per_page - 1) // per_page
         
         result = {
             'interactions': interactions,
             'statistics': stats,
-            'pagination': {
-                'page': page,
-                'pages': pagination.pages,
-                'per_page': per_page,
-                'total': pagination.total,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagination
         }
         
         return jsonify({
@@ -291,6 +381,11 @@ def get_product_interactions(product_id):
             'message': '获取商品交互统计成功'
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"获取商品交互统计失败: {str(e)}")
         return jsonify({
@@ -313,12 +408,18 @@ def get_recent_interactions():
         since_time = datetime.utcnow() - timedelta(hours=hours)
         
         # 查询最近的交互记录
-        interactions = UserInteraction.query.filter(
+        interactions = UserInteraction.query.options(joinedload(UserInteraction.user)).filter(
             UserInteraction.created_at >= since_time
         ).order_by(
             UserInteraction.created_at.desc()
         ).limit(limit).all()
         
+        # 商品信息批量组装
+        products = {product['id']: product for product in hydrate_products(
+            [interaction.product_id for interaction in interactions],
+            fields=INTERACTION_PRODUCT_FIELDS
+        )}
+        
         result = []
         for interaction in interactions:
             interaction_dict = interaction.to_dict()
@@ -330,13 +431,8 @@ def get_recent_interactions():
                     'username': interaction.user.username
                 }
             # 添加商品信息
-            if interaction.product:
-                interaction_dict['product'] = {
-                    'id': interaction.product.id,
-                    'name': interaction.product.name,
-                    'category_id': interaction.product.category_id,
-                    'category_name': interaction.product.category.name if interaction.product.category else None
-                }
+            if interaction.product_id in products:
+                interaction_dict['product'] = products[interaction.product_id]
             result.append(interaction_dict)
         
         return jsonify({
@@ -364,10 +460,13 @@ def health_check():
         # 检查数据库连接
         db.session.execute(text('SELECT 1'))
         
-        # 检查最近是否有交互记录
-        recent_count = UserInteraction.query.filter(
-            UserInteraction.created_at >= datetime.utcnow() - timedelta(hours=1)
-        ).count()
+        # 检查最近一小时的交互数（汇总表可用时起始小时的剩余部分统计交互记录，之后合计各分类的小时桶）
+        since = datetime.utcnow() - timedelta(hours=1)
+        rollups = InteractionRollupService()
+        if rollups.usable():
+            recent_count = rollups.window_count(SCOPE_CATEGORY, since)
+        else:
+            recent_count = UserInteraction.query.filter(UserInteraction.created_at >= since).count()
         
         return jsonify({
             'success': True,
@@ -412,24 +511,23 @@ def get_user_interactions_by_username(username):
         result = user_service.get_user_interactions(
             user_id=user.id,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            cursor=request.args.get('cursor') or None,
+            interaction_type=interaction_type,
+            with_total=request.args.get('with_total', 'false').lower() == 'true'
         )
         
-        # 如果指定了交互类型，进行过滤
-        if interaction_type:
-            filtered_interactions = [
-                interaction for interaction in result['interactions']
-                if interaction['interaction_type'] == interaction_type
-            ]
-            result['interactions'] = filtered_interactions
-            result['pagination']['total'] = len(filtered_interactions)
-        
         return jsonify({
             'success': True,
             'data': result,
             'message': '获取用户交互历史成功'
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"获取用户交互历史失败: {str(e)}")
         return jsonify({
@@ -6,17 +6,24 @@
 from flask import Blueprint, request, jsonify
 from app.services.user_service import UserService
 from app.models import User, UserInteraction
+from app.services.product_hydration_service import INTERACTION_PRODUCT_FIELDS, hydrate_products
+from app.utils.cursor import fingerprint
+from app.utils.keyset import keyset_paginate
 from app import db
 from sqlalchemy import text
 import logging
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
 # 创建蓝图
 user_bp = Blueprint('user', __name__, url_prefix='/api/v1/users')
 
+# 列表分页游标的签名salt
+ACTIVITY_CURSOR_SALT = 'user-activity'
+USER_SEARCH_CURSOR_SALT = 'user-search'
+
 @user_bp.route('/register', methods=['POST'])
 def register_user():
     """用户注册"""
@@ -272,36 +279,14 @@ def delete_user(user_id):
 def get_user_dashboard(user_id):
     """获取用户仪表板数据"""
     try:
-        user_service = UserService()
-        
-        # 获取用户基本信息
-        user = user_service.get_user_by_id(user_id)
-        if not user:
+        # 各部分由一次交互汇总组装，结果按用户缓存（记录新交互后失效）
+        dashboard_data = UserService().get_user_dashboard(user_id)
+        if not dashboard_data:
             return jsonify({
                 'success': False, 
                 'error': '用户不存在'
             }), 404
         
-        # 获取用户统计信息
-        statistics = user_service.get_user_statistics(user_id)
-        
-        # 获取用户偏好分析
-        preferences = user_service.get_user_preferences(user_id)
-        
-        # 获取最近的交互记录
-        recent_interactions = user_service.get_user_interactions(
-            user_id=user_id,
-            page=1,
-            per_page=10
-        )
-        
-        dashboard_data = {
-            'user': user,
-            'statistics': statistics,
-            'preferences': preferences,
-            'recent_interactions': recent_interactions['interactions'][:5]  # 只返回最近5条
-        }
-        
         return jsonify({
             'success': True,
             'data': dashboard_data,
@@ -340,41 +325,36 @@ def get_user_activity(user_id):
         # 计算时间范围
         since_time = datetime.utcnow() - timedelta(days=days)
         
-        # 查询用户活动记录
+        # 查询用户活动记录（按时间倒序键集分页）
         activities_query = UserInteraction.query.filter(
             UserInteraction.user_id == user_id,
             UserInteraction.created_at >= since_time
-        ).order_by(UserInteraction.created_at.desc())
+        )
         
-        pagination = activities_query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        items, pagination = keyset_paginate(
+            activities_query, UserInteraction.created_at, UserInteraction.id, per_page,
+            salt=ACTIVITY_CURSOR_SALT, scope=fingerprint('activity', user_id, days),
+            page=page, cursor=request.args.get('cursor') or None,
+            with_total=request.args.get('with_total', 'false').lower() == 'true'
         )
         
+        # 商品信息批量组装
+        products = {product['id']: product for product in hydrate_products(
+            [interaction.product_id for interaction in items],
+            fields=INTERACTION_PRODUCT_FIELDS
+        )}
+        
         activities = []
-        for interaction in pagination.items:
+        for interaction in items:
             activity_dict = interaction.to_dict()
             # 添加商品信息
-            if interaction.product:
-                activity_dict['product'] = {
-                    'id': interaction.product.id,
-                    'name': interaction.product.name,
-                    'category_id': interaction.product.category_id,
-                    'category_name': interaction.product.category.name if interaction.product.category else None
-                }
+            if interaction.product_id in products:
+                activity_dict['product'] = products[interaction.product_id]
             activities.append(activity_dict)
         
         result = {
             'activities': activities,
-            'pagination': {
-                'page': page,
-                'pages': pagination.pages,
-                'per_page': per_page,
-                'total': pagination.total,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            },
+            'pagination': pagination,
             'time_range': {
                 'days': days,
                 'since': since_time.isoformat()
@@ -387,6 +367,11 @@ def get_user_activity(user_id):
             'message': '获取用户活动记录成功'
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"获取用户活动记录失败: {str(e)}")
         return jsonify({
@@ -414,39 +399,38 @@ def search_users():
         if per_page < 1 or per_page > 100:
             per_page = 20
         
-        # 搜索用户
+        # 搜索用户（按注册时间倒序键集分页）
         users_query = User.query.filter(
             db.or_(
                 User.username.like(f'%{query}%'),
                 User.email.like(f'%{query}%')
             )
-        ).order_by(User.created_at.desc())
+        )
         
-        pagination = users_query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        items, pagination = keyset_paginate(
+            users_query, User.created_at, User.id, per_page,
+            salt=USER_SEARCH_CURSOR_SALT, scope=fingerprint('users', query),
+            page=page, cursor=request.args.get('cursor') or None,
+            with_total=request.args.get('with_total', 'false').lower() == 'true'
         )
         
+        # 本页用户的交互数（一次分组查询）
+        interaction_counts = dict(db.session.query(
+            UserInteraction.user_id, db.func.count(UserInteraction.id)
+        ).filter(
+            UserInteraction.user_id.in_([user.id for user in items])
+        ).group_by(UserInteraction.user_id).all()) if items else {}
+        
         users = []
-        for user in pagination.items:
+        for user in items:
             user_dict = user.to_dict()
             # 添加用户统计信息
-            user_dict['total_interactions'] = UserInteraction.query.filter_by(
-                user_id=user.id
-            ).count()
+            user_dict['total_interactions'] = interaction_counts.get(user.id, 0)
             users.append(user_dict)
         
         result = {
             'users': users,
-            'pagination': {
-                'page': page,
-                'pages': pagination.pages,
-                'per_page': per_page,
-                'total': pagination.total,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            },
+            'pagination': pagination,
             'search_info': {
                 'query': query,
                 'count': len(users)
@@ -459,6 +443,11 @@ def search_users():
             'message': '搜索用户成功'
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"搜索用户失败: {str(e)}")
         return jsonify({
@@ -1,19 +1,27 @@
 from datetime import datetime
 from app import db
+from app.utils.vector_codec import decode_vector, encode_for_storage, to_pgvector_text
+from app.utils.search_tokens import build_search_tokens, search_tokens_column_exists
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import undefer_group
 import json
 
 class Product(db.Model):
     """商品模型"""
     __tablename__ = 'products'
+    # 检索词串列不映射为ORM属性：迁移添加该列之前，ORM的写入与加载不涉及它；由下方事件在列存在时单独写入
+    __mapper_args__ = {'exclude_properties': ['search_tokens']}
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False, index=True)
-    description = db.Column(db.Text)
+    description = db.deferred(db.Column(db.Text))  # 延迟加载：列表接口不需要
     price = db.Column(db.Numeric(10, 2))
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     image_url = db.Column(db.String(500))
     tags = db.Column(db.Text)  # JSON字符串存储标签
-    embedding = db.Column(db.Text)  # 商品特征向量，JSON格式存储
+    embedding = db.deferred(db.Column(db.Text), group='vector')  # 商品特征向量，JSON格式存储（延迟加载）
+    embedding_bin = db.deferred(db.Column(db.LargeBinary), group='vector')  # 商品特征向量，float32二进制存储（延迟加载）
+    search_tokens = db.Column(db.Text)  # jieba分词后的检索词串，PostgreSQL据此生成search_vector（仅建表用，不映射）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -22,9 +30,9 @@ class Product(db.Model):
     interactions = db.relationship('UserInteraction', backref='product', lazy='dynamic')
     product_tags = db.relationship('ProductTag', backref='product', lazy='dynamic')
     
-    def to_dict(self):
-        """转换为字典格式"""
-        return {
+    def to_dict(self, include_embedding=False):
+        """转换为字典格式（特征向量默认不返回，避免加载与解码向量列）"""
+        data = {
             'id': self.id,
             'name': self.name,
             'description': self.description,
@@ -33,14 +41,60 @@ class Product(db.Model):
             'category_name': self.category.name if self.category else None,
             'image_url': self.image_url,
             'tags': json.loads(self.tags) if self.tags else [],
-            'embedding': json.loads(self.embedding) if self.embedding else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_embedding:
+            data['embedding'] = self.get_embedding().tolist() if self.has_vector() else None
+        return data
+    
+    def has_vector(self):
+        """是否已有特征向量（任一存储格式）"""
+        return bool(self.embedding_bin) or bool(self.embedding)
+    
+    @classmethod
+    def with_vectors(cls):
+        """查询选项：同时加载默认延迟的向量列（批量读取向量时使用，避免逐条补查）"""
+        return undefer_group('vector')
+    
+    @classmethod
+    def vector_filter(cls):
+        """查询条件：已有特征向量"""
+        return db.or_(cls.embedding_bin.isnot(None), cls.embedding.isnot(None))
+    
+    def get_embedding(self):
+        """读取特征向量，优先二进制列"""
+        return decode_vector(self.embedding_bin if self.embedding_bin else self.embedding)
+    
+    def set_embedding(self, vector):
+        """按存储模式写入特征向量"""
+        self.embedding, self.embedding_bin = encode_for_storage(vector)
     
     def __repr__(self):
         return f'<Product {self.id}: {self.name[:50]}...>'
 
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _refresh_search_tokens(mapper, connection, target):
+    """名称、标签或描述变更时重新生成检索词串（search_tokens 列尚未迁移时跳过）"""
+    if not search_tokens_column_exists(connection):
+        return
+    state = inspect(target)
+    if state.persistent and not any(
+        state.attrs[field].history.has_changes() for field in ('name', 'tags', 'description')
+    ):
+        return
+    if state.persistent and 'description' in state.unloaded:
+        # 描述列延迟加载，flush过程中直接用当前连接读取，不触发会话加载
+        description = connection.scalar(select(Product.description).where(Product.id == target.id))
+    else:
+        description = target.description
+    connection.execute(text("UPDATE products SET search_tokens = :tokens WHERE id = :id"), {
+        'tokens': build_search_tokens(target.name, target.tags, description),
+        'id': target.id
+    })
+
 class Category(db.Model):
     """商品分类模型"""
     __tablename__ = 'categories'
@@ -97,6 +151,7 @@ class TagVector(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tag = db.Column(db.String(100), unique=True, nullable=False)
     vector = db.Column(db.Text)  # 标签向量，JSON格式存储
+    vector_bin = db.Column(db.LargeBinary)  # 标签向量，float32二进制存储
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
@@ -104,10 +159,18 @@ class TagVector(db.Model):
         return {
             'id': self.id,
             'tag': self.tag,
-            'vector': json.loads(self.vector) if self.vector else None,
+            'vector': self.get_vector().tolist() if (self.vector_bin or self.vector) else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
+    def get_vector(self):
+        """读取标签向量，优先二进制列"""
+        return decode_vector(self.vector_bin if self.vector_bin else self.vector)
+    
+    def set_vector(self, vector):
+        """按存储模式写入标签向量"""
+        self.vector, self.vector_bin = encode_for_storage(vector)
+    
     def __repr__(self):
         return f'<TagVector {self.tag}>'
 
@@ -127,7 +190,10 @@ class User(db.Model):
     # 用户特征向量相关
     feature_vector = db.Column(db.Text)  # 用户特征向量，JSON格式存储
     feature_vector_pgvector = db.Column(db.Text)  # 用户特征向量，pgvector格式存储（性能优化）
+    feature_vector_bin = db.Column(db.LargeBinary)  # 用户特征向量，float32二进制存储
     vector_updated_at = db.Column(db.DateTime)  # 特征向量更新时间
+    preference_sum = db.deferred(db.Column(db.LargeBinary), group='preference')  # 交互商品向量的加权和，float64二进制
+    preference_weight = db.deferred(db.Column(db.Float), group='preference')  # 交互权重合计，为空表示尚未初始化
     
     # 时间戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -136,6 +202,11 @@ class User(db.Model):
     # 关系
     interactions = db.relationship('UserInteraction', backref='user', lazy=True)
     
+    # 索引（用户列表按注册时间键集分页）
+    __table_args__ = (
+        db.Index('idx_users_created_id', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         """转换为字典格式"""
         return {
@@ -144,12 +215,27 @@ class User(db.Model):
             'username': self.username,
             'email': self.email,
             'preferences': json.loads(self.preferences) if self.preferences else {},
-            'feature_vector': json.loads(self.feature_vector) if self.feature_vector else None,
+            'feature_vector': self.get_feature_vector().tolist() if self.has_feature_vector() else None,
             'vector_updated_at': self.vector_updated_at.isoformat() if self.vector_updated_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
     
+    def has_feature_vector(self):
+        """是否已有特征向量（任一存储格式）"""
+        return bool(self.feature_vector_bin) or bool(self.feature_vector) or bool(self.feature_vector_pgvector)
+    
+    def get_feature_vector(self):
+        """读取用户特征向量，优先二进制列"""
+        if self.feature_vector_bin:
+            return decode_vector(self.feature_vector_bin)
+        return decode_vector(self.feature_vector or self.feature_vector_pgvector)
+    
+    def set_feature_vector(self, vector):
+        """按存储模式写入用户特征向量（pgvector文本列始终写入，供SQL相似度查询使用）"""
+        self.feature_vector, self.feature_vector_bin = encode_for_storage(vector)
+        self.feature_vector_pgvector = to_pgvector_text(vector)
+    
     def __repr__(self):
         return f'<User {self.user_id}: {self.username}>'
 
@@ -172,6 +258,9 @@ class UserInteraction(db.Model):
         db.Index('idx_user_product', 'user_id', 'product_id'),
         db.Index('idx_interaction_type', 'interaction_type'),
         db.Index('idx_created_at', 'created_at'),
+        # 按用户、商品的时间倒序键集分页
+        db.Index('idx_interactions_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('idx_interactions_product_created', 'product_id', 'created_at', 'id'),
     )
     
     def to_dict(self):
@@ -189,6 +278,59 @@ class UserInteraction(db.Model):
     def __repr__(self):
         return f'<UserInteraction {self.user_id}-{self.product_id}: {self.interaction_type}>'
 
+class InteractionRollupColumns:
+    """交互计数汇总的列（汇总表与全量重建用的暂存表共用）"""
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # user, product, category, user_category
+    scope_id = db.Column(db.Integer, nullable=False)  # 用户、商品或分类ID（未分类为0）
+    sub_id = db.Column(db.Integer, nullable=False, default=0)  # user_category 的分类ID，其他为0
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day, total
+    bucket_start = db.Column(db.DateTime, nullable=False)  # 桶起始时间（UTC），total 桶为1970-01-01
+    interaction_type = db.Column(db.String(50), nullable=False)
+    
+    event_count = db.Column(db.Integer, nullable=False, default=0)  # 交互数
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)  # 非空交互分数之和
+    score_count = db.Column(db.Integer, nullable=False, default=0)  # 非空交互分数的个数
+    new_pairs = db.Column(db.Integer, nullable=False, default=0)  # 首次出现的用户-商品组合数（用于去重计数）
+
+
+class InteractionRollup(InteractionRollupColumns, db.Model):
+    """交互计数汇总（按用户、商品、分类的小时/天/累计桶，按交互类型细分，随交互写入增量更新）"""
+    __tablename__ = 'interaction_rollups'
+    
+    # 索引
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'scope_id', 'sub_id', 'granularity', 'bucket_start', 'interaction_type',
+                            name='uq_interaction_rollup'),
+        db.Index('idx_rollup_scope_bucket', 'scope', 'granularity', 'bucket_start'),
+    )
+    
+    def __repr__(self):
+        return f'<InteractionRollup {self.scope}:{self.scope_id} {self.granularity} {self.bucket_start}>'
+
+
+class InteractionRollupRebuild(InteractionRollupColumns, db.Model):
+    """交互计数汇总重建暂存表（全量重建写入此表，完成后一次性替换汇总表）"""
+    __tablename__ = 'interaction_rollups_rebuild'
+    
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'scope_id', 'sub_id', 'granularity', 'bucket_start', 'interaction_type',
+                            name='uq_interaction_rollup_rebuild'),
+    )
+
+
+class InteractionPair(db.Model):
+    """出现过交互的用户-商品组合（交互汇总据此原子地判断首次组合）"""
+    __tablename__ = 'interaction_pairs'
+    
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    first_at = db.Column(db.DateTime)  # 首次交互时间
+    
+    def __repr__(self):
+        return f'<InteractionPair {self.user_id}:{self.product_id}>'
+
 class RecommendationCache(db.Model):
     """推荐结果缓存模型"""
     __tablename__ = 'recommendation_cache'
@@ -220,3 +362,59 @@ class RecommendationCache(db.Model):
     def __repr__(self):
         return f'<RecommendationCache {self.cache_type}: {self.target_id}>'
 
+
+class BackgroundJob(db.Model):
+    """后台任务模型（导入、向量预计算、索引重建等）"""
+    __tablename__ = 'background_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False, index=True)  # import_products, precompute_tag_vectors等
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, running, cancelling, cancelled, completed, failed
+    params = db.Column(db.Text)  # 任务参数，JSON格式存储
+    
+    # 进度
+    total = db.Column(db.Integer)  # 预计处理总数
+    processed = db.Column(db.Integer, default=0)  # 已处理数
+    success_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    last_offset = db.Column(db.BigInteger, default=0)  # 最后提交的位置（导入为行号，商品向量为商品ID），续跑从此处开始
+    throughput = db.Column(db.Float)  # 每秒处理数
+    eta_seconds = db.Column(db.Float)  # 预计剩余秒数
+    
+    # 结果
+    error_samples = db.Column(db.Text)  # 错误样例，JSON格式存储
+    result = db.Column(db.Text)  # 任务结果，JSON格式存储
+    error = db.Column(db.Text)  # 任务失败原因
+    
+    # 时间戳
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'params': json.loads(self.params) if self.params else {},
+            'total': self.total,
+            'processed': self.processed or 0,
+            'success_count': self.success_count or 0,
+            'error_count': self.error_count or 0,
+            'last_offset': self.last_offset or 0,
+            'progress': round(self.processed / self.total * 100, 2) if self.total and self.processed else 0,
+            'throughput': self.throughput,
+            'eta_seconds': self.eta_seconds,
+            'error_samples': json.loads(self.error_samples) if self.error_samples else [],
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<BackgroundJob {self.id}: {self.job_type} {self.status}>'
@@ -0,0 +1,407 @@
+"""
+商品分类目录服务
+分类元数据（含 parent_id 层级）、各分类商品数与标签统计常驻进程内存，分类列表、
+分类树与商品统计在请求时不查询 products 表：本进程通过ORM提交的商品、标签、分类变更
+即时增量更新；导入、清空等批量写入递增商品目录版本后在后台重新统计，
+另按间隔在后台全量重建，纠正其他进程直接写库造成的偏差
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Category, Product, ProductTag
+from app.utils.result_cache import CATALOG_SCOPE, RedisCacheTier
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """分类目录快照（构建后只读，增量更新时复制后整体替换）"""
+
+    def __init__(self, categories: Dict[int, Dict], counts: Dict[Optional[int], int],
+                 total_tags: int, popular_tags: List[Dict], version: int):
+        """
+        Args:
+            categories: 分类ID -> 分类字典（与 Category.to_dict 一致）
+            counts: 分类ID（None为未分类）-> 直属商品数
+            total_tags: 商品标签总数
+            popular_tags: 最常用标签 [{'tag', 'count'}]
+            version: 构建时的商品目录版本
+        """
+        self.categories = categories
+        self.counts = counts
+        self.total_tags = total_tags
+        self.popular_tags = popular_tags
+        self.version = version
+        self.built_at = time.time()
+        self.names = {category_id: category['name'] for category_id, category in categories.items()}
+        self.children: Dict[Optional[int], List[int]] = {}
+        for category_id in sorted(categories):
+            parent_id = categories[category_id]['parent_id']
+            if parent_id not in categories:
+                parent_id = None
+            self.children.setdefault(parent_id, []).append(category_id)
+        self._subtree_counts: Dict[int, int] = {}
+
+    @property
+    def total_products(self) -> int:
+        return sum(self.counts.values())
+
+    def subtree_count(self, category_id: int) -> int:
+        """分类及其全部子孙分类的商品数"""
+        cached = self._subtree_counts.get(category_id)
+        if cached is not None:
+            return cached
+        total = 0
+        stack, seen = [category_id], set()
+        while stack:
+            current = stack.pop()
+            if current in seen:  # 防御 parent_id 成环
+                continue
+            seen.add(current)
+            total += self.counts.get(current, 0)
+            stack.extend(self.children.get(current, ()))
+        self._subtree_counts[category_id] = total
+        return total
+
+    def with_changes(self, count_deltas: Dict[Optional[int], int], tag_delta: int) -> 'CatalogSnapshot':
+        """应用增量后的新快照"""
+        counts = dict(self.counts)
+        for category_id, delta in count_deltas.items():
+            counts[category_id] = max(0, counts.get(category_id, 0) + delta)
+        snapshot = CatalogSnapshot(self.categories, counts, max(0, self.total_tags + tag_delta),
+                                   self.popular_tags, self.version)
+        snapshot.built_at = self.built_at
+        return snapshot
+
+
+class CategoryCatalog:
+    """商品分类目录（进程级单例）"""
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(CategoryCatalog, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.enabled = True
+            self.refresh_interval = 600  # 秒，后台全量重建的间隔
+            self.popular_tag_limit = 20
+
+            self._snapshot: Optional[CatalogSnapshot] = None
+            self._categories_stale = False
+            self._generation = 0  # 本进程提交变更的计数，用于识别构建期间发生的变更
+            self._lock = threading.RLock()
+            self._build_thread = None
+            self._build_time = 0.0
+            self._app = None
+
+            self._initialized = True
+
+    def configure(self, app):
+        """从应用配置读取目录参数"""
+        self._app = app
+        self.enabled = app.config.get('CATEGORY_CATALOG_ENABLED', True)
+        self.refresh_interval = app.config.get('CATEGORY_CATALOG_REFRESH_INTERVAL', 600)
+        self.popular_tag_limit = app.config.get('CATEGORY_CATALOG_POPULAR_TAGS', 20)
+
+    # ------------------------------------------------------------------
+    # 构建与同步
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load_categories() -> Dict[int, Dict]:
+        return {category.id: category.to_dict() for category in db.session.query(Category).order_by(Category.id)}
+
+    def _load(self, with_counts: bool = True) -> CatalogSnapshot:
+        """
+        从数据库统计分类目录（分类表、按分类分组计数、标签计数）
+
+        Args:
+            with_counts: 为False时只读取分类表（商品数与标签统计为空），供只需分类名称的调用使用
+        """
+        version = RedisCacheTier().get_version(CATALOG_SCOPE)
+        if not with_counts:
+            return CatalogSnapshot(self._load_categories(), {}, 0, [], version)
+        counts = {
+            category_id: int(count) for category_id, count in db.session.query(
+                Product.category_id, func.count(Product.id)
+            ).group_by(Product.category_id)
+        }
+        popular_tags = [
+            {'tag': tag, 'count': int(count)} for tag, count in db.session.query(
+                ProductTag.tag, func.count(ProductTag.id)
+            ).group_by(ProductTag.tag).order_by(func.count(ProductTag.id).desc()).limit(self.popular_tag_limit)
+        ]
+        total_tags = db.session.query(func.count(ProductTag.id)).scalar() or 0
+        return CatalogSnapshot(self._load_categories(), counts, int(total_tags), popular_tags, version)
+
+    def build(self) -> bool:
+        """从数据库全量构建目录（需在应用上下文中调用）"""
+        start_time = time.time()
+        generation = self._generation
+        try:
+            snapshot = self._load()
+            with self._lock:
+                if self._generation != generation:
+                    # 统计期间本进程提交了变更，无法确定是否已计入：仍使用该快照，但标记为过期，下次读取时再次重建
+                    snapshot.built_at = 0.0
+                self._snapshot = snapshot
+                self._categories_stale = False
+                self._build_time = time.time() - start_time
+            logger.info(f"分类目录构建完成: 分类 {len(snapshot.categories)} 个, "
+                        f"商品 {snapshot.total_products} 个, 耗时 {self._build_time:.2f}s")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"构建分类目录失败: {e}")
+            return False
+
+    def start_background_build(self, app=None):
+        """在后台线程中重建目录，重建期间继续使用当前快照"""
+        app = app or self._app
+        if not self.enabled or app is None:
+            return
+        with self._lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return
+
+            def _run():
+                with app.app_context():
+                    self.build()
+                    db.session.remove()
+
+            self._build_thread = threading.Thread(target=_run, name='category-catalog-build', daemon=True)
+            self._build_thread.start()
+
+    def wait_for_build(self, timeout: Optional[float] = None) -> bool:
+        """等待后台构建结束"""
+        thread = self._build_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self._snapshot is not None
+
+    def after_fork(self):
+        """工作进程fork后重置锁与构建线程状态"""
+        self._lock = threading.RLock()
+        self._build_thread = None
+
+    def apply_changes(self, count_deltas: Dict[Optional[int], int], tag_delta: int = 0,
+                      categories_changed: bool = False, resync: bool = False):
+        """
+        应用本进程提交的变更
+
+        Args:
+            count_deltas: 分类ID -> 商品数增量
+            tag_delta: 标签数增量
+            categories_changed: 分类表有变更（下次读取时重新加载分类表）
+            resync: 无法确定增量（如变更前的分类未加载），后台全量重建
+        """
+        with self._lock:
+            self._generation += 1
+            if self._snapshot is None:
+                return
+            if count_deltas or tag_delta:
+                self._snapshot = self._snapshot.with_changes(count_deltas, tag_delta)
+            if categories_changed:
+                self._categories_stale = True
+        if resync:
+            self.start_background_build()
+
+    def _current(self, with_counts: bool = True) -> CatalogSnapshot:
+        """
+        当前快照：冷启动时同步构建一次；商品目录版本变化或到达重建间隔时后台重建，
+        期间继续返回当前快照；分类表有变更时只重新加载分类表
+
+        Args:
+            with_counts: 未启用目录（或构建失败）时是否统计商品数与标签；只需分类信息时传False，只查询分类表
+        """
+        if not self.enabled:
+            return self._load(with_counts)
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.build()
+                snapshot = self._snapshot
+            if snapshot is None:
+                return self._load(with_counts)
+        if self._categories_stale:
+            with self._lock:
+                if self._categories_stale:
+                    categories = self._load_categories()
+                    fresh = CatalogSnapshot(categories, self._snapshot.counts, self._snapshot.total_tags,
+                                            self._snapshot.popular_tags, self._snapshot.version)
+                    fresh.built_at = self._snapshot.built_at
+                    self._snapshot = fresh
+                    self._categories_stale = False
+                snapshot = self._snapshot
+        if (RedisCacheTier().get_version(CATALOG_SCOPE) != snapshot.version
+                or time.time() - snapshot.built_at > self.refresh_interval):
+            self.start_background_build()
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def categories(self) -> List[Dict]:
+        """全部分类（与 Category.to_dict 一致，按ID排序）"""
+        return [dict(category) for category in self._current(with_counts=False).categories.values()]
+
+    def get_category(self, category_id: int) -> Optional[Dict]:
+        """单个分类"""
+        category = self._current(with_counts=False).categories.get(category_id)
+        return dict(category) if category else None
+
+    def category_names(self) -> Dict[int, str]:
+        """分类ID -> 分类名称（只读，调用方不应修改）"""
+        return self._current(with_counts=False).names
+
+    def _with_counts(self, snapshot: CatalogSnapshot, category_id: int) -> Dict:
+        category = snapshot.categories[category_id]
+        return {
+            'id': category_id,
+            'name': category['name'],
+            'description': category['description'],
+            'parent_id': category['parent_id'],
+            'product_count': snapshot.counts.get(category_id, 0),
+            'total_product_count': snapshot.subtree_count(category_id)
+        }
+
+    def list_with_counts(self) -> List[Dict]:
+        """
+        分类列表及商品数
+
+        Returns:
+            [{'id', 'name', 'description', 'parent_id', 'product_count', 'total_product_count'}]，
+            product_count 为直属商品数，total_product_count 含全部子孙分类
+        """
+        snapshot = self._current()
+        return [self._with_counts(snapshot, category_id) for category_id in snapshot.categories]
+
+    def tree(self) -> List[Dict]:
+        """按 parent_id 组织的分类树（父分类不存在的分类视为根分类）"""
+        snapshot = self._current()
+
+        def _node(category_id: int, path: frozenset) -> Dict:
+            node = self._with_counts(snapshot, category_id)
+            node['children'] = [
+                _node(child_id, path | {child_id})
+                for child_id in snapshot.children.get(category_id, ()) if child_id not in path
+            ]
+            return node
+
+        return [_node(category_id, frozenset([category_id])) for category_id in snapshot.children.get(None, ())]
+
+    def statistics(self) -> Dict:
+        """商品统计（与 DataProcessingService.get_product_statistics 的返回格式一致）"""
+        snapshot = self._current()
+        return {
+            'total_products': snapshot.total_products,
+            'total_tags': snapshot.total_tags,
+            'category_stats': [
+                {'category_id': category_id, 'count': count}
+                for category_id, count in snapshot.counts.items() if count > 0
+            ],
+            'popular_tags': [dict(tag) for tag in snapshot.popular_tags]
+        }
+
+    def get_status(self) -> Dict:
+        """目录状态信息"""
+        snapshot = self._snapshot
+        return {
+            'enabled': self.enabled,
+            'ready': snapshot is not None,
+            'building': self._build_thread is not None and self._build_thread.is_alive(),
+            'categories': len(snapshot.categories) if snapshot else 0,
+            'products': snapshot.total_products if snapshot else 0,
+            'version': snapshot.version if snapshot else None,
+            'built_at': datetime.utcfromtimestamp(snapshot.built_at).isoformat() if snapshot else None,
+            'build_time': round(self._build_time, 3)
+        }
+
+
+# ----------------------------------------------------------------------
+# ORM写入同步：本进程提交的商品、标签、分类变更实时更新目录
+# ----------------------------------------------------------------------
+
+_PENDING_KEY = 'category_catalog_pending'
+
+
+def _pending(session) -> Dict:
+    return session.info.setdefault(_PENDING_KEY, {
+        'counts': {}, 'tags': 0, 'categories': False, 'resync': False
+    })
+
+
+def _add(pending: Dict, category_id: Optional[int], delta: int):
+    pending['counts'][category_id] = pending['counts'].get(category_id, 0) + delta
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_catalog_changes(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Product):
+            _add(_pending(session), obj.category_id, 1)
+        elif isinstance(obj, ProductTag):
+            _pending(session)['tags'] += 1
+        elif isinstance(obj, Category):
+            _pending(session)['categories'] = True
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            history = inspect(obj).attrs.category_id.history
+            if not history.has_changes():
+                continue
+            pending = _pending(session)
+            if not history.deleted:
+                pending['resync'] = True  # 变更前的分类未加载，无法计算增量
+                continue
+            _add(pending, history.deleted[0], -1)
+            _add(pending, history.added[0] if history.added else None, 1)
+        elif isinstance(obj, Category):
+            _pending(session)['categories'] = True
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            state = inspect(obj)
+            pending = _pending(session)
+            if 'category_id' in state.dict:
+                _add(pending, state.dict['category_id'], -1)
+            else:
+                pending['resync'] = True
+        elif isinstance(obj, ProductTag):
+            _pending(session)['tags'] -= 1
+        elif isinstance(obj, Category):
+            _pending(session)['categories'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_catalog_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    try:
+        CategoryCatalog().apply_changes(
+            {category_id: delta for category_id, delta in pending['counts'].items() if delta},
+            tag_delta=pending['tags'],
+            categories_changed=pending['categories'],
+            resync=pending['resync']
+        )
+    except Exception as e:
+        logger.error(f"同步分类目录失败: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_changes(session):
+    session.info.pop(_PENDING_KEY, None)
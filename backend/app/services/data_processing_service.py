@@ -9,12 +9,12 @@ import jieba
 import jieba.posseg as pseg
 from typing import List, Dict, Tuple, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
 import logging
-from datetime import datetime
 
 from ..models import db, Product, Category, ProductTag, TagVector
 from ..utils.text_processing import TextProcessor
+from ..utils.result_cache import bump_catalog_version
+from .category_catalog_service import CategoryCatalog
 
 logger = logging.getLogger(__name__)
 
@@ -225,80 +225,21 @@ class DataProcessingService:
             logger.error(f"分类确定失败: {e}, 标题: {title}, 标签: {tags}")
             return None
     
-    def import_products_from_file(self, file_path: str, batch_size: int = 100) -> Dict:
+    def import_products_from_file(self, file_path: str, batch_size: int = 2000,
+                                  workers: Optional[int] = None) -> Dict:
         """
         从文件导入商品数据
+        流式读取，解析/分词/分类在进程池中并行，COPY批量写入，错误按行记录
         """
         try:
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"文件不存在: {file_path}")
             
-            total_count = 0
-            success_count = 0
-            error_count = 0
-            batch_count = 0
-            
-            logger.info(f"开始导入商品数据: {file_path}")
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                batch_products = []
-                
-                for line_num, line in enumerate(f, 1):
-                    if not line.strip():
-                        continue
-                    
-                    # 解析商品数据
-                    product_data = self.parse_product_data(line)
-                    if not product_data:
-                        error_count += 1
-                        continue
-                    
-                    # 提取标签
-                    tags = self.extract_tags_from_title(product_data['title'])
-                    
-                    # 确定分类
-                    if not product_data['category_id']:
-                        product_data['category_id'] = self.determine_category(
-                            product_data['title'], tags
-                        )
-                    
-                    # 添加到批次
-                    batch_products.append({
-                        'product_data': product_data,
-                        'tags': tags
-                    })
-                    
-                    total_count += 1
-                    
-                    # 批量处理
-                    if len(batch_products) >= batch_size:
-                        batch_success = self._save_batch_to_database(batch_products)
-                        success_count += batch_success
-                        error_count += (len(batch_products) - batch_success)
-                        batch_count += 1
-                        
-                        logger.info(f"已处理批次 {batch_count}, 成功: {batch_success}, 总数: {total_count}")
-                        batch_products = []
-                
-                # 处理最后一批
-                if batch_products:
-                    batch_success = self._save_batch_to_database(batch_products)
-                    success_count += batch_success
-                    error_count += (len(batch_products) - batch_success)
-                    batch_count += 1
-            
-            result = {
-                'total_count': total_count,
-                'success_count': success_count,
-                'error_count': error_count,
-                'batch_count': batch_count,
-                'status': 'completed'
-            }
-            
-            logger.info(f"商品数据导入完成: {result}")
-            return result
+            from .product_import_service import ProductImportService
+            return ProductImportService(self).import_file(file_path, batch_size=batch_size, workers=workers)
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"导入商品数据失败: {e}")
             return {
                 'total_count': 0,
@@ -309,59 +250,6 @@ class DataProcessingService:
                 'error': str(e)
             }
     
-    def _save_batch_to_database(self, batch_products: List[Dict]) -> int:
-        """
-        批量保存商品数据到数据库
-        """
-        success_count = 0
-        
-        try:
-            for item in batch_products:
-                product_data = item['product_data']
-                tags = item['tags']
-                
-                # 创建商品记录
-                product = Product(
-                    id=product_data['id'],
-                    name=product_data['title'],
-                    description=f"商品ID: {product_data['id']}, 品牌: {product_data['brand_id']}, 店铺: {product_data['shop_id']}",
-                    price=None,  # 价格信息在原始数据中不可用
-                    category_id=product_data['category_id'],
-                    image_url=product_data['image_url'],
-                    tags=json.dumps(tags, ensure_ascii=False),
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow()
-                )
-                
-                # 保存商品
-                db.session.add(product)
-                
-                # 保存商品标签
-                for tag in tags:
-                    product_tag = ProductTag(
-                        product_id=product_data['id'],
-                        tag=tag,
-                        weight=1.0,  # 默认权重
-                        created_at=datetime.utcnow()
-                    )
-                    db.session.add(product_tag)
-                
-                success_count += 1
-            
-            # 提交事务
-            db.session.commit()
-            
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logger.error(f"保存商品数据到数据库失败: {e}")
-            success_count = 0
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"保存商品数据时发生未知错误: {e}")
-            success_count = 0
-        
-        return success_count
-    
     def get_import_progress(self) -> Dict:
         """
         获取导入进度信息
@@ -398,6 +286,7 @@ class DataProcessingService:
             
             # 提交事务
             db.session.commit()
+            bump_catalog_version()
             
             logger.info("所有商品数据已清空")
             return True
@@ -412,38 +301,8 @@ class DataProcessingService:
         获取商品数据统计信息
         """
         try:
-            # 商品总数
-            total_products = db.session.query(Product).count()
-            
-            # 标签总数
-            total_tags = db.session.query(ProductTag).count()
-            
-            # 分类统计
-            category_stats = db.session.query(
-                Product.category_id,
-                db.func.count(Product.id).label('count')
-            ).group_by(Product.category_id).all()
-            
-            # 标签统计（前20个最常用标签）
-            popular_tags = db.session.query(
-                ProductTag.tag,
-                db.func.count(ProductTag.id).label('count')
-            ).group_by(ProductTag.tag).order_by(
-                db.func.count(ProductTag.id).desc()
-            ).limit(20).all()
-            
-            return {
-                'total_products': total_products,
-                'total_tags': total_tags,
-                'category_stats': [
-                    {'category_id': cat_id, 'count': count} 
-                    for cat_id, count in category_stats
-                ],
-                'popular_tags': [
-                    {'tag': tag, 'count': count} 
-                    for tag, count in popular_tags
-                ]
-            }
+            # 商品总数、分类统计与常用标签取自进程内分类目录，不在请求时分组统计
+            return CategoryCatalog().statistics()
             
         except Exception as e:
             logger.error(f"获取商品统计信息失败: {e}")
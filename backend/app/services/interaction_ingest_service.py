@@ -0,0 +1,576 @@
+"""
+交互事件异步批量写入服务（write-behind）
+记录交互接口不再逐条查询校验并同步提交：用户、商品ID对照进程内ID集合校验，事件追加到
+本进程的落盘分段文件并放入有界缓冲区后即返回；后台线程每隔 INTERACTION_FLUSH_INTERVAL_MS
+或缓冲达到 INTERACTION_FLUSH_BATCH 条时一次写入整批事件（PostgreSQL用COPY，其他数据库
+用多行INSERT），并在同一事务内批量更新用户特征向量与交互计数汇总。分段文件在其事件提交后才删除，
+进程异常退出留下的分段由其他进程或重启后的进程重放，语义为至少一次（at-least-once）。
+整批连续写入失败 INTERACTION_FLUSH_MAX_RETRIES 次的分段改为逐条写入（每条一个保存点），
+无法写入的事件移入死信文件，不再阻塞后续分段
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # 分段文件加锁；不可用时（Windows）按文件名中的进程号判断分段是否仍被占用
+except ImportError:
+    fcntl = None
+
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Product, User, UserInteraction
+from app.services.interaction_rollup_service import InteractionRollupService
+from app.services.user_profile_service import UserProfileService
+from app.utils.pg_copy import copy_rows
+from app.utils.result_cache import bump_user_data_version, bump_user_version
+
+logger = logging.getLogger(__name__)
+
+# 写入 user_interactions 的列（事件字典的键与之相同）
+INTERACTION_COLUMNS = ('user_id', 'product_id', 'interaction_type', 'interaction_score', 'session_id', 'created_at')
+SEGMENT_PREFIX = 'interactions-'
+SEGMENT_SUFFIX = '.jsonl'
+# 死信文件（落盘目录下）：逐条写入仍失败的事件，每行一个JSON，需人工处理
+DEAD_LETTER_FILE = 'dead-letter.jsonl'
+
+
+class IngestFull(Exception):
+    """缓冲区已满（写入速度跟不上接收速度），调用方应稍后重试"""
+
+
+class IdSet:
+    """整数ID集合：批量加载的有序数组（二分查找）加上之后确认存在的新ID"""
+
+    def __init__(self, ids: np.ndarray):
+        self._ids = ids
+        self._recent: Set[int] = set()
+
+    def __contains__(self, value: int) -> bool:
+        if value in self._recent:
+            return True
+        index = int(np.searchsorted(self._ids, value))
+        return index < len(self._ids) and int(self._ids[index]) == value
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._recent)
+
+    def add(self, value: int):
+        self._recent.add(value)
+
+
+def _to_epoch(value: datetime) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+class SpoolSegment:
+    """
+    落盘分段：追加写入本进程接收的事件（每行一个JSON），事件提交入库后删除。
+    文件在删除前一直持有排他锁，其他进程只重放拿得到锁的分段
+    """
+
+    def __init__(self, path: Optional[str], handle=None, events: Optional[List[Dict]] = None):
+        self.path = path
+        self._file = handle
+        self.events: List[Dict] = events or []
+        self.first_at = _to_epoch(self.events[0]['created_at']) if self.events else None
+        self.failures = 0  # 连续写入失败次数
+
+    @classmethod
+    def create(cls, spool_dir: Optional[str], sequence: int) -> 'SpoolSegment':
+        """新建本进程的分段（spool_dir 为空时只保存在内存中）"""
+        if not spool_dir:
+            return cls(None)
+        path = os.path.join(spool_dir, f"{SEGMENT_PREFIX}{os.getpid()}-{int(time.time() * 1000)}-{sequence}"
+                                       f"{SEGMENT_SUFFIX}")
+        handle = open(path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return cls(path, handle)
+
+    @classmethod
+    def claim(cls, path: str) -> Optional['SpoolSegment']:
+        """
+        接管其他进程遗留的分段并读取其中的事件
+
+        Returns:
+            分段仍被占用或已被删除时返回None
+        """
+        if fcntl is None:
+            try:
+                pid = int(os.path.basename(path)[len(SEGMENT_PREFIX):].split('-')[0])
+                os.kill(pid, 0)
+                if pid != os.getpid():
+                    return None  # 写入进程仍在运行
+            except (ValueError, ProcessLookupError):
+                pass
+            except OSError:
+                return None
+        try:
+            handle = open(path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return None
+        if os.fstat(handle.fileno()).st_nlink == 0:
+            # 拿到锁之前写入进程已提交并删除了该分段
+            handle.close()
+            return None
+
+        events = []
+        for line_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+                event['created_at'] = datetime.fromisoformat(event['created_at'])
+            except (ValueError, KeyError, TypeError) as e:
+                # 进程在写入中途退出时最后一行可能不完整
+                logger.warning(f"跳过分段 {path} 第 {line_number} 行无法解析的事件: {e}")
+                continue
+            events.append(event)
+        return cls(path, handle, events)
+
+    def append(self, event: Dict, fsync: bool = False):
+        if self._file is not None:
+            record = dict(event, created_at=event['created_at'].isoformat())
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+            if fsync:
+                os.fsync(self._file.fileno())
+        if not self.events:
+            self.first_at = _to_epoch(event['created_at'])
+        self.events.append(event)
+
+    def discard(self):
+        """事件已入库：删除文件并释放锁"""
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class InteractionIngestor:
+    """交互事件写入队列（进程级单例）"""
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(InteractionIngestor, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.enabled = False
+            self.flush_interval = 0.2  # 秒
+            self.flush_batch = 500
+            self.max_buffer = 20000
+            self.enqueue_timeout = 0.05  # 秒，缓冲区满时等待空间的最长时间
+            self.spool_dir = None
+            self.spool_fsync = False
+            self.id_refresh_interval = 300  # 秒
+            self.recover_interval = 60  # 秒
+            self.max_retries = 3  # 整批写入连续失败该次数后改为逐条写入
+
+            self._app = None
+            self._id_sets: Dict[str, IdSet] = {}
+            self._reset_state()
+            self._atexit_registered = False
+            self._initialized = True
+
+    def _reset_state(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)  # 通知写入线程有整批事件
+        self._space = threading.Condition(self._lock)  # 通知等待中的请求缓冲区已有空间
+        self._flush_lock = threading.Lock()
+        self._active: Optional[SpoolSegment] = None
+        self._sealed: Deque[SpoolSegment] = deque()
+        self._pending = 0  # 尚未入库的事件数（含已封存待写入的分段）
+        self._sequence = 0
+        self._thread = None
+        self._stopping = False
+        self._stats = {
+            'flushed_total': 0, 'dropped_total': 0, 'rejected_total': 0, 'recovered_total': 0,
+            'dead_letter_total': 0,
+            'failed_flushes': 0, 'last_flush_at': None, 'last_flush_size': 0, 'last_flush_time': 0.0,
+            'last_flush_lag': 0.0, 'last_error': None
+        }
+
+    def configure(self, app):
+        """从应用配置读取写入参数"""
+        self._app = app
+        self.enabled = app.config.get('INTERACTION_WRITE_BEHIND', True)
+        self.flush_interval = app.config.get('INTERACTION_FLUSH_INTERVAL_MS', 200) / 1000.0
+        self.flush_batch = app.config.get('INTERACTION_FLUSH_BATCH', 500)
+        self.max_buffer = app.config.get('INTERACTION_BUFFER_MAX', 20000)
+        self.enqueue_timeout = app.config.get('INTERACTION_ENQUEUE_TIMEOUT_MS', 50) / 1000.0
+        self.spool_dir = app.config.get('INTERACTION_SPOOL_DIR') or None
+        self.spool_fsync = app.config.get('INTERACTION_SPOOL_FSYNC', False)
+        self.id_refresh_interval = app.config.get('INTERACTION_ID_REFRESH_INTERVAL', 300)
+        self.recover_interval = app.config.get('INTERACTION_SPOOL_RECOVER_INTERVAL', 60)
+        self.max_retries = app.config.get('INTERACTION_FLUSH_MAX_RETRIES', 3)
+        if self.enabled and self.spool_dir:
+            try:
+                os.makedirs(self.spool_dir, exist_ok=True)
+            except OSError as e:
+                logger.error(f"创建交互事件落盘目录 {self.spool_dir} 失败，事件只保存在内存中: {e}")
+                self.spool_dir = None
+
+    def after_fork(self):
+        """工作进程fork后重置锁、缓冲区与写入线程（ID集合以写时复制方式共享）"""
+        self._reset_state()
+
+    # ------------------------------------------------------------------
+    # ID校验
+    # ------------------------------------------------------------------
+
+    def _load_ids(self):
+        """批量加载用户、商品ID（只读主键列）"""
+        for name, model in (('users', User), ('products', Product)):
+            ids = np.fromiter((row[0] for row in db.session.query(model.id).order_by(model.id)), dtype=np.int64)
+            self._id_sets[name] = IdSet(ids)
+        logger.info(f"交互写入ID集合加载完成: 用户 {len(self._id_sets['users'])} 个, "
+                    f"商品 {len(self._id_sets['products'])} 个")
+
+    def _exists(self, name: str, model, value: int) -> bool:
+        ids = self._id_sets.get(name)
+        if ids is not None and value in ids:
+            return True
+        # ID集合尚未加载或为之后新建的记录：查询数据库，存在则加入集合
+        exists = db.session.query(model.id).filter(model.id == value).first() is not None
+        if exists and ids is not None:
+            ids.add(value)
+        return exists
+
+    def user_exists(self, user_id: int) -> bool:
+        return self._exists('users', User, user_id)
+
+    def product_exists(self, product_id: int) -> bool:
+        return self._exists('products', Product, product_id)
+
+    # ------------------------------------------------------------------
+    # 接收
+    # ------------------------------------------------------------------
+
+    def submit(self, user_id: int, product_id: int, interaction_type: str,
+               interaction_score=1.0, session_id: Optional[str] = None) -> Dict:
+        """
+        接收一条交互事件（写入分段文件并放入缓冲区，由后台线程批量入库）
+
+        Returns:
+            事件字典（与 UserInteraction.to_dict 一致，id 为 None）
+
+        Raises:
+            IngestFull: 等待 enqueue_timeout 后缓冲区仍已满
+        """
+        event = {
+            'user_id': user_id,
+            'product_id': product_id,
+            'interaction_type': interaction_type,
+            'interaction_score': interaction_score,
+            'session_id': session_id,
+            'created_at': datetime.utcnow()
+        }
+        self._ensure_started()
+        deadline = time.time() + self.enqueue_timeout
+        with self._lock:
+            while self._pending >= self.max_buffer:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._stats['rejected_total'] += 1
+                    raise IngestFull(f"交互写入缓冲区已满（{self._pending} 条待写入），请稍后重试")
+                self._space.wait(remaining)
+            if self._active is None:
+                self._sequence += 1
+                self._active = SpoolSegment.create(self.spool_dir, self._sequence)
+            self._active.append(event, fsync=self.spool_fsync)
+            self._pending += 1
+            if len(self._active.events) >= self.flush_batch:
+                self._ready.notify()
+        return dict(event, id=None, created_at=event['created_at'].isoformat())
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def _write(self, events: List[Dict], row_by_row: bool = False) -> Tuple[int, int, List[Tuple[Dict, str]]]:
+        """
+        写入一批事件并更新用户特征向量（一个事务）
+
+        Args:
+            events: 事件列表
+            row_by_row: 逐条写入（每条一个保存点），单条失败只拒绝该条；数据库连接类错误仍整体抛出
+
+        Returns:
+            (写入数, 因用户或商品已不存在而丢弃的事件数, 被拒绝的 (事件, 错误信息))
+        """
+        user_ids = {event['user_id'] for event in events}
+        product_ids = {event['product_id'] for event in events}
+        existing_users = {row[0] for row in db.session.query(User.id).filter(User.id.in_(user_ids))}
+        existing_products = {row[0] for row in db.session.query(Product.id).filter(Product.id.in_(product_ids))}
+        valid = [event for event in events
+                 if event['user_id'] in existing_users and event['product_id'] in existing_products]
+        dropped = len(events) - len(valid)
+        if dropped:
+            logger.warning(f"丢弃 {dropped} 条用户或商品已不存在的交互事件")
+        if not valid:
+            return 0, dropped, []
+
+        rejected = []
+        if row_by_row:
+            accepted = []
+            for event in valid:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(UserInteraction.__table__.insert(),
+                                           {column: event.get(column) for column in INTERACTION_COLUMNS})
+                except OperationalError:
+                    raise
+                except Exception as e:
+                    rejected.append((event, str(e)))
+                    continue
+                accepted.append(event)
+            valid = accepted
+            if not valid:
+                db.session.commit()
+                return 0, dropped, rejected
+        elif db.engine.dialect.name == 'postgresql':
+            copy_rows(db.session.connection(), UserInteraction.__tablename__, INTERACTION_COLUMNS,
+                      [tuple(event[column] for column in INTERACTION_COLUMNS) for event in valid])
+        else:
+            db.session.execute(UserInteraction.__table__.insert(),
+                               [{column: event[column] for column in INTERACTION_COLUMNS} for event in valid])
+
+        # 在同一事务内批量更新用户特征向量与交互计数汇总；失败时只回滚到保存点，交互照常写入
+        updated = []
+        try:
+            with db.session.begin_nested():
+                updated = UserProfileService().apply_interactions(
+                    [(event['user_id'], event['product_id'], event['interaction_score']) for event in valid]
+                )
+        except Exception as e:
+            logger.error(f"批量更新用户特征向量失败: {e}")
+        try:
+            with db.session.begin_nested():
+                InteractionRollupService().apply(valid)
+        except Exception as e:
+            logger.error(f"批量更新交互计数汇总失败: {e}")
+        db.session.commit()
+        bump_user_data_version(*{event['user_id'] for event in valid})
+        for user_id in updated:
+            bump_user_version(user_id)
+        return len(valid), dropped, rejected
+
+    def _dead_letter(self, rejected: List[Tuple[Dict, str]]):
+        """将无法写入的事件追加到死信文件（未配置落盘目录时只记录日志）"""
+        failed_at = datetime.utcnow().isoformat()
+        lines = [
+            json.dumps({'event': dict(event, created_at=event['created_at'].isoformat()),
+                        'error': error, 'failed_at': failed_at}, ensure_ascii=False, default=str)
+            for event, error in rejected
+        ]
+        if not self.spool_dir:
+            for line in lines:
+                logger.error(f"交互事件无法写入，已丢弃: {line}")
+            return
+        with open(os.path.join(self.spool_dir, DEAD_LETTER_FILE), 'a', encoding='utf-8') as handle:
+            handle.write('\n'.join(lines) + '\n')
+            handle.flush()
+            os.fsync(handle.fileno())
+        logger.error(f"{len(rejected)} 条交互事件无法写入，已移入死信文件 {DEAD_LETTER_FILE}")
+
+    def flush(self) -> int:
+        """
+        封存当前分段并按顺序写入全部待写入分段（需在应用上下文中调用）；
+        写入失败的分段保留在队列与磁盘上，下次重试，连续失败 max_retries 次后逐条写入，
+        无法写入的事件移入死信文件
+
+        Returns:
+            本次写入的事件数
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._active is not None and self._active.events:
+                    self._sealed.append(self._active)
+                    self._active = None
+                pending = list(self._sealed)
+
+            written = 0
+            for segment in pending:
+                start_time = time.time()
+                try:
+                    count, dropped, rejected = self._write(
+                        segment.events, row_by_row=segment.failures >= self.max_retries
+                    )
+                except Exception as e:
+                    db.session.rollback()
+                    segment.failures += 1
+                    self._stats['failed_flushes'] += 1
+                    self._stats['last_error'] = str(e)
+                    logger.error(f"写入交互事件失败（{len(segment.events)} 条，第 {segment.failures} 次，稍后重试）: {e}")
+                    break
+                if rejected:
+                    self._dead_letter(rejected)
+                    self._stats['dead_letter_total'] += len(rejected)
+                segment.discard()
+                now = time.time()
+                with self._lock:
+                    self._sealed.popleft()
+                    self._pending -= len(segment.events)
+                    self._space.notify_all()
+                self._stats['flushed_total'] += count
+                self._stats['dropped_total'] += dropped
+                self._stats['last_flush_at'] = datetime.utcfromtimestamp(now).isoformat()
+                self._stats['last_flush_size'] = count
+                self._stats['last_flush_time'] = now - start_time
+                self._stats['last_flush_lag'] = now - segment.first_at if segment.first_at else 0.0
+                self._stats['last_error'] = None
+                written += count
+            return written
+
+    def recover(self) -> int:
+        """
+        接管已退出进程遗留的分段，排入写入队列
+
+        Returns:
+            接管的事件数
+        """
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return 0
+        with self._lock:
+            owned = {segment.path for segment in self._sealed}
+            if self._active is not None:
+                owned.add(self._active.path)
+        recovered = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if not name.startswith(SEGMENT_PREFIX) or not name.endswith(SEGMENT_SUFFIX) or path in owned:
+                continue
+            segment = SpoolSegment.claim(path)
+            if segment is None:
+                continue
+            if not segment.events:
+                segment.discard()
+                continue
+            with self._lock:
+                self._sealed.append(segment)
+                self._pending += len(segment.events)
+            recovered += len(segment.events)
+            logger.info(f"接管交互事件分段 {name}: {len(segment.events)} 条")
+        self._stats['recovered_total'] += recovered
+        return recovered
+
+    def _run(self):
+        """后台写入线程：按间隔或整批写入，定期刷新ID集合并接管遗留分段"""
+        with self._app.app_context():
+            next_ids = next_recover = 0.0
+            while True:
+                now = time.time()
+                try:
+                    if now >= next_ids:
+                        next_ids = now + self.id_refresh_interval
+                        self._load_ids()
+                    if now >= next_recover:
+                        next_recover = now + self.recover_interval
+                        self.recover()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"刷新交互写入ID集合或接管分段失败: {e}")
+
+                with self._lock:
+                    if not self._stopping and (self._active is None or len(self._active.events) < self.flush_batch):
+                        self._ready.wait(self.flush_interval)
+                    stopping = self._stopping
+                try:
+                    self.flush()
+                finally:
+                    db.session.remove()
+                if stopping:
+                    return
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._stopping or (self._thread is not None and self._thread.is_alive()):
+                return
+            if self._app is None:
+                raise RuntimeError("InteractionIngestor 未配置（需先调用 configure）")
+            self._thread = threading.Thread(target=self._run, name='interaction-ingest', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+    def shutdown(self, timeout: float = 10.0):
+        """停止写入线程并写入缓冲区中的剩余事件（未能写入的分段留在磁盘上，由其他进程接管）"""
+        with self._lock:
+            self._stopping = True
+            self._ready.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        elif self._pending and self._app is not None:
+            with self._app.app_context():
+                self.flush()
+                db.session.remove()
+        with self._lock:
+            for segment in list(self._sealed) + ([self._active] if self._active is not None else []):
+                segment.close()
+
+    # ------------------------------------------------------------------
+    # 状态
+    # ------------------------------------------------------------------
+
+    def get_status(self) -> Dict:
+        """写入队列状态（本进程），flush_lag 为最早一条未入库事件已等待的秒数"""
+        now = time.time()
+        with self._lock:
+            segments = list(self._sealed) + ([self._active] if self._active is not None else [])
+            buffered = len(self._active.events) if self._active is not None else 0
+            pending = self._pending
+        oldest = min((segment.first_at for segment in segments if segment.events), default=None)
+        spool_segments = 0
+        if self.spool_dir and os.path.isdir(self.spool_dir):
+            spool_segments = sum(1 for name in os.listdir(self.spool_dir)
+                                 if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        stats = dict(self._stats)
+        stats['last_flush_time'] = round(stats['last_flush_time'], 4)
+        stats['last_flush_lag'] = round(stats['last_flush_lag'], 4)
+        return {
+            'enabled': self.enabled,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'pid': os.getpid(),
+            'buffered': buffered,
+            'pending': pending,
+            'max_buffer': self.max_buffer,
+            'flush_lag': round(now - oldest, 4) if oldest is not None else 0.0,
+            'spool_dir': self.spool_dir,
+            'spool_segments': spool_segments,
+            'id_sets': {name: len(ids) for name, ids in self._id_sets.items()},
+            **stats
+        }
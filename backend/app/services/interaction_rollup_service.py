@@ -0,0 +1,552 @@
+"""
+交互计数汇总服务
+按用户、商品、分类维护小时/天/累计三种粒度的交互计数（按交互类型细分，另有用户×分类的累计计数），
+在写入交互的事务内按批合并后以 INSERT ... ON CONFLICT 累加；统计接口读取固定数量的汇总行，
+不再扫描交互记录。小时桶与天桶按保留期清理，累计桶长期保留；全量重建用于首次启用与纠正偏差
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from flask import current_app
+from sqlalchemy import and_, case, exists, func, inspect, or_, select, text, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import InteractionPair, InteractionRollup, InteractionRollupRebuild, Product, UserInteraction
+
+logger = logging.getLogger(__name__)
+
+# 汇总维度
+SCOPE_USER = 'user'
+SCOPE_PRODUCT = 'product'
+SCOPE_CATEGORY = 'category'
+SCOPE_USER_CATEGORY = 'user_category'
+
+# 时间粒度，累计桶的起始时间固定
+GRANULARITY_HOUR = 'hour'
+GRANULARITY_DAY = 'day'
+GRANULARITY_TOTAL = 'total'
+TOTAL_BUCKET = datetime(1970, 1, 1)
+
+_KEY_COLUMNS = ('scope', 'scope_id', 'sub_id', 'granularity', 'bucket_start', 'interaction_type')
+_VALUE_COLUMNS = ('event_count', 'score_sum', 'score_count', 'new_pairs')
+
+# 未分类商品的分类ID
+UNCATEGORIZED = 0
+# 每条语句写入的用户-商品组合数
+PAIR_INSERT_BATCH = 1000
+
+
+def _hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _dialect_insert():
+    """支持 ON CONFLICT 的数据库返回对应方言的insert，其他数据库返回None"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+class InteractionRollupService:
+    """交互计数汇总服务"""
+
+    # 各数据库URL是否已创建汇总表（进程内缓存，迁移后需重启生效）
+    _availability: Dict[str, bool] = {}
+    # 本进程上次清理过期桶的时间
+    _last_prune = 0.0
+
+    def __init__(self):
+        self.enabled = current_app.config.get('INTERACTION_ROLLUP_ENABLED', True)
+        self.hour_retention_days = current_app.config.get('INTERACTION_ROLLUP_HOUR_RETENTION_DAYS', 32)
+        self.day_retention_days = current_app.config.get('INTERACTION_ROLLUP_DAY_RETENTION_DAYS', 400)
+        self.prune_interval = current_app.config.get('INTERACTION_ROLLUP_PRUNE_INTERVAL', 3600)
+
+    @classmethod
+    def available(cls) -> bool:
+        """数据库中是否已有汇总表与用户-商品组合表"""
+        url = str(db.engine.url)
+        if url not in cls._availability:
+            try:
+                # 用当前会话的连接检查：单连接的sqlite在归还连接时会回滚调用方尚未提交的写入
+                inspector = inspect(db.session.connection())
+                cls._availability[url] = (inspector.has_table(InteractionRollup.__tablename__)
+                                          and inspector.has_table(InteractionPair.__tablename__))
+            except Exception as e:
+                logger.warning(f"检查交互汇总表失败: {e}")
+                return False
+            if not cls._availability[url]:
+                logger.warning("缺少交互汇总表，统计接口继续直接聚合交互记录（执行 flask rebuild-interaction-rollups 后启用）")
+        return cls._availability[url]
+
+    def usable(self) -> bool:
+        return self.enabled and self.available()
+
+    # ------------------------------------------------------------------
+    # 累加
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _add(counters: Dict[Tuple, List], user_id: int, product_id: int, category_id: int,
+             interaction_type: str, interaction_score, created_at: Optional[datetime], new_pair: bool,
+             hour_cutoff: Optional[datetime] = None, day_cutoff: Optional[datetime] = None):
+        """将一次交互计入各维度的桶（created_at 为空或早于保留期时只计入累计桶）"""
+        buckets = [(GRANULARITY_TOTAL, TOTAL_BUCKET)]
+        if created_at is not None:
+            if hour_cutoff is None or created_at >= hour_cutoff:
+                buckets.append((GRANULARITY_HOUR, _hour(created_at)))
+            if day_cutoff is None or created_at >= day_cutoff:
+                buckets.append((GRANULARITY_DAY, _day(created_at)))
+        has_score = interaction_score is not None
+        for scope, scope_id, sub_id, pair_counted in (
+            (SCOPE_USER, user_id, 0, True),
+            (SCOPE_PRODUCT, product_id, 0, True),
+            (SCOPE_CATEGORY, category_id, 0, False),
+        ):
+            for granularity, bucket_start in buckets:
+                counter = counters.setdefault(
+                    (scope, scope_id, sub_id, granularity, bucket_start, interaction_type), [0, 0.0, 0, 0]
+                )
+                counter[0] += 1
+                if has_score:
+                    counter[1] += interaction_score
+                    counter[2] += 1
+                if new_pair and pair_counted:
+                    counter[3] += 1
+        counter = counters.setdefault(
+            (SCOPE_USER_CATEGORY, user_id, category_id, GRANULARITY_TOTAL, TOTAL_BUCKET, interaction_type),
+            [0, 0.0, 0, 0]
+        )
+        counter[0] += 1
+        if has_score:
+            counter[1] += interaction_score
+            counter[2] += 1
+
+    def _upsert(self, counters: Dict[Tuple, List], table=None):
+        """按键顺序累加到汇总表或重建暂存表（固定加锁顺序，避免并发批次死锁）"""
+        if not counters:
+            return
+        rows = [
+            dict(zip(_KEY_COLUMNS, key), **dict(zip(_VALUE_COLUMNS, counters[key])))
+            for key in sorted(counters)
+        ]
+        if table is None:
+            table = InteractionRollup.__table__
+        insert = _dialect_insert()
+        if insert is not None:
+            statement = insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=list(_KEY_COLUMNS),
+                set_={column: table.c[column] + statement.excluded[column] for column in _VALUE_COLUMNS}
+            )
+            db.session.execute(statement, rows)
+            return
+
+        # 其他数据库：逐行先更新，不存在时插入
+        for row in rows:
+            condition = and_(*(table.c[column] == row[column] for column in _KEY_COLUMNS))
+            result = db.session.execute(table.update().where(condition).values(
+                **{column: table.c[column] + row[column] for column in _VALUE_COLUMNS}
+            ))
+            if result.rowcount == 0:
+                db.session.execute(table.insert().values(**row))
+
+    @staticmethod
+    def _new_pair_events(events: List[Dict]) -> set:
+        """
+        本批中首次出现的用户-商品组合：每个组合以批内最早的一条写入 interaction_pairs
+        （INSERT ... ON CONFLICT DO NOTHING RETURNING），实际插入的即为新组合。
+        并发批次写入同一组合时在唯一键上等待先写入的事务结束，只有一个批次插入成功
+
+        Returns:
+            事件在列表中的下标集合
+        """
+        first_index: Dict[Tuple[int, int], int] = {}
+        for index, event in enumerate(events):
+            pair = (event['user_id'], event['product_id'])
+            first = first_index.get(pair)
+            if first is None or (event['created_at'] or datetime.min) < (events[first]['created_at'] or datetime.min):
+                first_index[pair] = index
+        # 按键顺序写入（固定加锁顺序，避免并发批次死锁）
+        rows = [
+            {'user_id': user_id, 'product_id': product_id, 'first_at': events[index]['created_at']}
+            for (user_id, product_id), index in sorted(first_index.items())
+        ]
+        table = InteractionPair.__table__
+        inserted = set()
+        insert = _dialect_insert()
+        if insert is not None:
+            for start in range(0, len(rows), PAIR_INSERT_BATCH):
+                statement = insert(table).values(rows[start:start + PAIR_INSERT_BATCH]).on_conflict_do_nothing(
+                    index_elements=['user_id', 'product_id']
+                ).returning(table.c.user_id, table.c.product_id)
+                inserted.update((row.user_id, row.product_id) for row in db.session.execute(statement))
+        else:
+            # 其他数据库：逐个在保存点内插入，违反主键即为已有组合
+            for row in rows:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(table.insert().values(**row))
+                except IntegrityError:
+                    continue
+                inserted.add((row['user_id'], row['product_id']))
+        return {first_index[pair] for pair in inserted}
+
+    @staticmethod
+    def _record_pairs(*conditions):
+        """将满足条件的交互的用户-商品组合补入 interaction_pairs（已有的跳过）"""
+        table = InteractionPair.__table__
+        pairs = select(
+            UserInteraction.user_id, UserInteraction.product_id, func.min(UserInteraction.created_at)
+        ).where(*conditions).group_by(UserInteraction.user_id, UserInteraction.product_id)
+        insert = _dialect_insert()
+        if insert is not None:
+            statement = insert(table).from_select(['user_id', 'product_id', 'first_at'], pairs).on_conflict_do_nothing(
+                index_elements=['user_id', 'product_id']
+            )
+        else:
+            statement = table.insert().from_select(['user_id', 'product_id', 'first_at'], pairs.where(~exists().where(
+                table.c.user_id == UserInteraction.user_id, table.c.product_id == UserInteraction.product_id
+            )))
+        db.session.execute(statement)
+
+    def apply(self, events: List[Dict]) -> int:
+        """
+        将一批已写入的交互计入汇总（在写入交互的事务内调用，由调用方提交）
+
+        Args:
+            events: [{'user_id', 'product_id', 'interaction_type', 'interaction_score', 'created_at'}]
+
+        Returns:
+            更新的汇总行数
+        """
+        if not events or not self.usable():
+            return 0
+        product_ids = {event['product_id'] for event in events}
+        categories = dict(db.session.query(Product.id, Product.category_id).filter(Product.id.in_(product_ids)))
+        new_pairs = self._new_pair_events(events)
+
+        counters: Dict[Tuple, List] = {}
+        for index, event in enumerate(events):
+            self._add(counters, event['user_id'], event['product_id'],
+                      categories.get(event['product_id']) or UNCATEGORIZED,
+                      event['interaction_type'], event['interaction_score'], event['created_at'],
+                      index in new_pairs)
+        self._upsert(counters)
+        self._maybe_prune()
+        return len(counters)
+
+    # ------------------------------------------------------------------
+    # 清理与重建
+    # ------------------------------------------------------------------
+
+    def prune(self) -> int:
+        """删除超过保留期的小时桶与天桶"""
+        now = datetime.utcnow()
+        deleted = db.session.query(InteractionRollup).filter(or_(
+            and_(InteractionRollup.granularity == GRANULARITY_HOUR,
+                 InteractionRollup.bucket_start < _hour(now - timedelta(days=self.hour_retention_days))),
+            and_(InteractionRollup.granularity == GRANULARITY_DAY,
+                 InteractionRollup.bucket_start < _day(now - timedelta(days=self.day_retention_days))),
+        )).delete(synchronize_session=False)
+        return deleted
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - InteractionRollupService._last_prune < self.prune_interval:
+            return
+        InteractionRollupService._last_prune = now
+        deleted = self.prune()
+        if deleted:
+            logger.info(f"清理过期交互汇总桶 {deleted} 行")
+
+    @staticmethod
+    def _lock_interactions():
+        """
+        以SHARE模式锁住交互表直到本事务结束：等待已写入交互的事务（及其汇总累加）提交，
+        并阻塞新的交互写入。sqlite在本事务的首个写操作时已持有库级写锁
+        """
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text(f'LOCK TABLE {UserInteraction.__tablename__} IN SHARE MODE'))
+
+    def _count_interactions(self, counters: Dict[Tuple, List], rows, known_pairs=None,
+                            hour_cutoff: Optional[datetime] = None, day_cutoff: Optional[datetime] = None) -> int:
+        """
+        将按用户、商品、时间排序的交互计入 counters，每个用户-商品组合最早的一条记为首次组合
+        （known_pairs 中已出现过的组合除外）
+
+        Returns:
+            计入的交互数
+        """
+        processed = 0
+        previous_pair = None
+        for row in rows:
+            pair = (row.user_id, row.product_id)
+            new_pair = pair != previous_pair and (known_pairs is None or pair not in known_pairs)
+            self._add(counters, row.user_id, row.product_id, row.category_id or UNCATEGORIZED,
+                      row.interaction_type, row.interaction_score, row.created_at, new_pair,
+                      hour_cutoff=hour_cutoff, day_cutoff=day_cutoff)
+            previous_pair = pair
+            processed += 1
+        return processed
+
+    @staticmethod
+    def _interaction_rows(*conditions):
+        return db.session.query(
+            UserInteraction.user_id, UserInteraction.product_id, UserInteraction.interaction_type,
+            UserInteraction.interaction_score, UserInteraction.created_at, Product.category_id
+        ).outerjoin(Product, Product.id == UserInteraction.product_id).filter(
+            *conditions
+        ).order_by(UserInteraction.user_id, UserInteraction.product_id,
+                   UserInteraction.created_at, UserInteraction.id)
+
+    def rebuild(self, batch_size: int = 500, chunk_size: int = 50000,
+                progress_callback: Optional[Callable[[Dict], None]] = None,
+                should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """
+        按交互记录全量重建汇总表，重建期间汇总表保持原内容可读、交互照常累加：
+
+        1. 短事务内锁住交互表取交互ID高水位，此时ID不超过高水位的交互均已提交，之后写入的都大于高水位
+        2. 按用户ID分批读取ID不超过高水位的交互（批内按商品、时间排序以识别首次组合），
+           计入暂存表，累计的键达到 chunk_size 个时写入并提交（内存占用有界）
+        3. 一个事务内再次锁住交互表，补入高于高水位的交互（重建期间写入的），用暂存表替换汇总表
+        4. 删除 interaction_pairs 中已没有交互的组合（第2步逐批补齐了已有交互的组合）
+
+        每条交互只计入一次；中止时丢弃暂存表，汇总表不变。同一时间只应运行一个重建
+
+        Returns:
+            {'interactions': 处理的交互数, 'rows': 汇总行数, 'stopped': 是否被中止}
+        """
+        now = datetime.utcnow()
+        hour_cutoff = _hour(now - timedelta(days=self.hour_retention_days))
+        day_cutoff = _day(now - timedelta(days=self.day_retention_days))
+        staging = InteractionRollupRebuild.__table__
+        staging.create(db.session.connection(), checkfirst=True)
+        db.session.commit()
+
+        # 清空暂存表（sqlite在此取得写锁），锁住交互表后取高水位
+        db.session.execute(staging.delete())
+        self._lock_interactions()
+        high_water = db.session.query(func.max(UserInteraction.id)).scalar() or 0
+        total = db.session.query(func.count(UserInteraction.id)).filter(
+            UserInteraction.id <= high_water
+        ).scalar() or 0
+        db.session.commit()
+
+        processed = 0
+        counters: Dict[Tuple, List] = {}
+        last_id = 0
+        stopped = False
+        while True:
+            if should_stop is not None and should_stop():
+                stopped = True
+                break
+            user_ids = [row[0] for row in db.session.query(UserInteraction.user_id).filter(
+                UserInteraction.user_id > last_id, UserInteraction.id <= high_water
+            ).distinct().order_by(UserInteraction.user_id).limit(batch_size)]
+            if not user_ids:
+                break
+            processed += self._count_interactions(
+                counters,
+                self._interaction_rows(UserInteraction.user_id.in_(user_ids), UserInteraction.id <= high_water),
+                hour_cutoff=hour_cutoff, day_cutoff=day_cutoff
+            )
+            # 同时补齐这批用户的用户-商品组合（首次启用时组合表为空），立即提交以免长时间锁住组合行
+            self._record_pairs(UserInteraction.user_id.in_(user_ids), UserInteraction.id <= high_water)
+            db.session.commit()
+            last_id = user_ids[-1]
+            if len(counters) >= chunk_size:
+                self._upsert(counters, staging)
+                db.session.commit()
+                counters = {}
+            if progress_callback is not None:
+                progress_callback({'processed': processed, 'total': int(total)})
+
+        if stopped:
+            db.session.execute(staging.delete())
+            db.session.commit()
+            logger.info(f"交互汇总重建中止: 已处理交互 {processed} 条，汇总表保持不变")
+            return {'interactions': processed, 'rows': 0, 'stopped': True}
+
+        self._upsert(counters, staging)
+        db.session.commit()
+
+        # 替换：锁住交互表后补入重建期间写入的交互，这些交互此前累加到的旧汇总行随替换丢弃
+        live = InteractionRollup.__table__
+        self._lock_interactions()
+        db.session.execute(live.delete())
+        late = self._interaction_rows(UserInteraction.id > high_water).all()
+        if late:
+            late_pairs = list({(row.user_id, row.product_id) for row in late})
+            known_pairs = set()
+            for start in range(0, len(late_pairs), batch_size):
+                known_pairs.update(db.session.query(UserInteraction.user_id, UserInteraction.product_id).filter(
+                    tuple_(UserInteraction.user_id, UserInteraction.product_id).in_(late_pairs[start:start + batch_size]),
+                    UserInteraction.id <= high_water
+                ).distinct())
+            counters = {}
+            processed += self._count_interactions(counters, late, known_pairs=known_pairs,
+                                                  hour_cutoff=hour_cutoff, day_cutoff=day_cutoff)
+            self._upsert(counters, staging)
+        columns = list(_KEY_COLUMNS + _VALUE_COLUMNS)
+        db.session.execute(live.insert().from_select(columns, select(*(staging.c[column] for column in columns))))
+        db.session.execute(staging.delete())
+        db.session.commit()
+
+        # 清理已没有交互的用户-商品组合（交互已删除的用户、商品）
+        db.session.query(InteractionPair).filter(~exists().where(
+            UserInteraction.user_id == InteractionPair.user_id,
+            UserInteraction.product_id == InteractionPair.product_id
+        )).delete(synchronize_session=False)
+        db.session.commit()
+
+        rows_count = db.session.query(func.count(InteractionRollup.id)).scalar() or 0
+        logger.info(f"交互汇总重建完成: 交互 {processed} 条（重建期间新增 {len(late)} 条）, 汇总 {rows_count} 行")
+        return {'interactions': processed, 'rows': int(rows_count), 'stopped': False}
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def totals(self, scope: str, scope_id: int) -> Dict[str, Dict]:
+        """
+        维度对象的累计计数
+
+        Returns:
+            交互类型 -> {'count', 'score_sum', 'score_count', 'new_pairs'}
+        """
+        rows = db.session.query(
+            InteractionRollup.interaction_type, InteractionRollup.event_count, InteractionRollup.score_sum,
+            InteractionRollup.score_count, InteractionRollup.new_pairs
+        ).filter(
+            InteractionRollup.scope == scope,
+            InteractionRollup.scope_id == scope_id,
+            InteractionRollup.sub_id == 0,
+            InteractionRollup.granularity == GRANULARITY_TOTAL,
+            InteractionRollup.bucket_start == TOTAL_BUCKET
+        )
+        return {
+            row.interaction_type: {
+                'count': row.event_count, 'score_sum': row.score_sum,
+                'score_count': row.score_count, 'new_pairs': row.new_pairs
+            }
+            for row in rows
+        }
+
+    def user_category_totals(self, user_id: int) -> Dict[int, Dict]:
+        """
+        用户在各分类下的累计计数（分类取交互发生时商品所属分类，未分类为0）
+
+        Returns:
+            分类ID -> {'count', 'score_sum'}
+        """
+        rows = db.session.query(
+            InteractionRollup.sub_id,
+            func.sum(InteractionRollup.event_count).label('count'),
+            func.sum(InteractionRollup.score_sum).label('score_sum')
+        ).filter(
+            InteractionRollup.scope == SCOPE_USER_CATEGORY,
+            InteractionRollup.scope_id == user_id,
+            InteractionRollup.granularity == GRANULARITY_TOTAL,
+            InteractionRollup.bucket_start == TOTAL_BUCKET
+        ).group_by(InteractionRollup.sub_id)
+        return {row.sub_id: {'count': int(row.count or 0), 'score_sum': float(row.score_sum or 0.0)} for row in rows}
+
+    def window_count(self, scope: str, since: datetime, scope_id: Optional[int] = None) -> int:
+        """
+        since 至今的交互数：since 所在小时的剩余部分直接统计交互记录，之后到当天结束读小时桶，
+        之后的整天读天桶
+
+        Args:
+            scope: 维度
+            since: 起始时间（UTC）
+            scope_id: 维度对象ID，为空时合计该维度的全部对象
+        """
+        return self.window_counts(scope, [since], scope_id=scope_id)[0]
+
+    def window_counts(self, scope: str, sinces: Sequence[datetime], scope_id: Optional[int] = None) -> List[int]:
+        """多个起始时间至今的交互数（一次查询读取所需的桶，规则同 window_count）"""
+        if not sinces:
+            return []
+        windows = []
+        for since in sinces:
+            start = _hour(since)
+            if start < since:
+                start += timedelta(hours=1)
+            edge = _day(since)
+            if edge < since:
+                edge += timedelta(days=1)
+            windows.append((since, start, edge))
+        conditions = [
+            and_(InteractionRollup.granularity == GRANULARITY_HOUR,
+                 InteractionRollup.bucket_start >= start,
+                 InteractionRollup.bucket_start < edge)
+            for _, start, edge in windows if start < edge
+        ]
+        conditions.append(and_(InteractionRollup.granularity == GRANULARITY_DAY,
+                               InteractionRollup.bucket_start >= min(edge for _, _, edge in windows)))
+        query = db.session.query(
+            InteractionRollup.granularity, InteractionRollup.bucket_start,
+            func.sum(InteractionRollup.event_count)
+        ).filter(
+            InteractionRollup.scope == scope,
+            InteractionRollup.sub_id == 0,
+            or_(*conditions)
+        )
+        if scope_id is not None:
+            query = query.filter(InteractionRollup.scope_id == scope_id)
+        buckets = query.group_by(InteractionRollup.granularity, InteractionRollup.bucket_start).all()
+        partial = self._partial_hour_counts(scope, [(since, start) for since, start, _ in windows], scope_id)
+
+        counts = []
+        for (since, start, edge), partial_count in zip(windows, partial):
+            counts.append(partial_count + int(sum(
+                count or 0 for granularity, bucket_start, count in buckets
+                if (granularity == GRANULARITY_HOUR and start <= bucket_start < edge)
+                or (granularity == GRANULARITY_DAY and bucket_start >= edge)
+            )))
+        return counts
+
+    @staticmethod
+    def _partial_hour_counts(scope: str, ranges: Sequence[Tuple[datetime, datetime]],
+                             scope_id: Optional[int] = None) -> List[int]:
+        """
+        各 [起始时间, 下一个整点) 区间内的交互数（直接统计交互记录，每个区间不超过一小时）。
+        分类维度按商品当前所属分类统计
+        """
+        counts = [0] * len(ranges)
+        pending = [index for index, (since, start) in enumerate(ranges) if since < start]
+        if not pending:
+            return counts
+        query = db.session.query(*(
+            func.count(case((and_(UserInteraction.created_at >= ranges[index][0],
+                                  UserInteraction.created_at < ranges[index][1]), 1)))
+            for index in pending
+        )).filter(
+            UserInteraction.created_at >= min(ranges[index][0] for index in pending),
+            UserInteraction.created_at < max(ranges[index][1] for index in pending)
+        )
+        if scope_id is not None:
+            if scope == SCOPE_USER:
+                query = query.filter(UserInteraction.user_id == scope_id)
+            elif scope == SCOPE_PRODUCT:
+                query = query.filter(UserInteraction.product_id == scope_id)
+            elif scope == SCOPE_CATEGORY:
+                query = query.outerjoin(Product, Product.id == UserInteraction.product_id).filter(
+                    Product.category_id.is_(None) if scope_id == UNCATEGORIZED else Product.category_id == scope_id
+                )
+        for index, count in zip(pending, query.one()):
+            counts[index] = int(count or 0)
+        return counts
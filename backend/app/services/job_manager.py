@@ -0,0 +1,520 @@
+"""
+后台任务管理服务
+导入、向量预计算与索引重建等耗时操作以后台任务运行，不占用Web工作进程的请求线程；
+任务状态持久化到 background_jobs 表，支持进度查询、取消与从最后提交的位置续跑
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_CANCELLING = 'cancelling'
+STATUS_CANCELLED = 'cancelled'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+RESUMABLE_STATUSES = (STATUS_CANCELLED, STATUS_FAILED)
+
+# 任务中保留的错误样例数
+MAX_JOB_ERROR_SAMPLES = 20
+# 取消标记的数据库检查间隔（秒），取消请求可能落在其他工作进程
+CANCEL_CHECK_INTERVAL = 2.0
+
+
+class JobContext:
+    """任务执行上下文：提供参数、续跑位置、进度上报与取消检查"""
+
+    def __init__(self, manager: 'JobManager', job: BackgroundJob):
+        self.manager = manager
+        self.job_id = job.id
+        self.params = json.loads(job.params) if job.params else {}
+        self.offset = job.last_offset or 0
+        # 续跑时累加到上一轮的计数上
+        self._base = {
+            'processed': job.processed or 0,
+            'success_count': job.success_count or 0,
+            'error_count': job.error_count or 0,
+        }
+        self._started = time.time()
+        self._last_cancel_check = 0.0
+        self._cancelled = False
+        self.error_samples = json.loads(job.error_samples) if job.error_samples else []
+
+    def is_cancelled(self) -> bool:
+        """是否已请求取消（本进程内标记或数据库状态）"""
+        if self._cancelled or self.manager.is_cancel_requested(self.job_id):
+            self._cancelled = True
+            return True
+        now = time.time()
+        if now - self._last_cancel_check >= CANCEL_CHECK_INTERVAL:
+            self._last_cancel_check = now
+            with Session(db.engine) as session:
+                job = session.get(BackgroundJob, self.job_id)
+                self._cancelled = job is not None and job.status == STATUS_CANCELLING
+        return self._cancelled
+
+    def report(self, processed: int = 0, success_count: int = 0, error_count: int = 0,
+               total: Optional[int] = None, offset: Optional[int] = None, error_samples: Optional[List] = None):
+        """
+        上报本轮运行的进度（计数为本轮累计值，续跑时自动加上之前的计数）
+
+        Args:
+            offset: 已提交的位置，取消或失败后从此处续跑
+        """
+        elapsed = time.time() - self._started
+        throughput = processed / elapsed if elapsed > 0 and processed else None
+        values = {
+            'processed': self._base['processed'] + processed,
+            'success_count': self._base['success_count'] + success_count,
+            'error_count': self._base['error_count'] + error_count,
+            'throughput': round(throughput, 2) if throughput else None,
+        }
+        if total is not None:
+            values['total'] = self._base['processed'] + total
+        if offset is not None:
+            values['last_offset'] = offset
+            self.offset = offset
+        if error_samples:
+            room = MAX_JOB_ERROR_SAMPLES - len(self.error_samples)
+            if room > 0:
+                self.error_samples.extend(error_samples[:room])
+                values['error_samples'] = json.dumps(self.error_samples, ensure_ascii=False)
+        if throughput and total is not None:
+            values['eta_seconds'] = round(max(total - processed, 0) / throughput, 1)
+        self.manager.update_job(self.job_id, **values)
+
+
+# ----------------------------------------------------------------------
+# 内置任务
+# ----------------------------------------------------------------------
+
+def _count_lines(file_path: str) -> int:
+    count = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            count += block.count(b'\n')
+    return count
+
+
+def run_import_products(context: JobContext) -> Dict:
+    """导入商品文件，从最后提交的行号续跑"""
+    from app.services.product_import_service import ProductImportService
+
+    file_path = context.params['file_path']
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    start_line = context.offset
+    total = max(_count_lines(file_path) - start_line, 0)
+    sampled = [0]
+
+    def _on_progress(state: Dict):
+        new_samples = state['errors'][sampled[0]:]
+        sampled[0] = len(state['errors'])
+        context.report(processed=state['total_count'], success_count=state['success_count'],
+                       error_count=state['error_count'], total=total, offset=state['last_line'],
+                       error_samples=new_samples)
+
+    result = ProductImportService().import_file(
+        file_path,
+        batch_size=context.params.get('batch_size', 2000),
+        workers=context.params.get('workers'),
+        start_line=start_line,
+        progress_callback=_on_progress,
+        should_stop=context.is_cancelled
+    )
+    result.pop('errors', None)
+    return result
+
+
+def run_precompute_tag_vectors(context: JobContext) -> Dict:
+    """预计算缺失的标签向量（缺失标签由数据库反连接得出，重跑即续跑）"""
+    from app.services.vector_build_service import VectorBuildService
+
+    def _on_progress(state: Dict):
+        context.report(processed=state['processed'], success_count=state['success'],
+                       error_count=state['failed'], total=state['total'])
+
+    return VectorBuildService().build_tag_vectors(
+        workers=context.params.get('workers'),
+        chunk_size=context.params.get('chunk_size', 5000),
+        progress_callback=_on_progress,
+        should_stop=context.is_cancelled
+    )
+
+
+def run_precompute_product_vectors(context: JobContext) -> Dict:
+    """批量重算商品向量，从最后提交的商品ID续跑"""
+    from app.services.vector_build_service import VectorBuildService
+
+    def _on_progress(state: Dict):
+        context.report(processed=state['processed'], success_count=state['success'],
+                       error_count=state['failed'], total=state['total'], offset=state['last_product_id'])
+
+    result = VectorBuildService().build_product_vectors(
+        chunk_size=context.params.get('chunk_size', 2000),
+        only_missing=context.params.get('only_missing', True),
+        start_after_id=context.offset or None,
+        progress_callback=_on_progress,
+        should_stop=context.is_cancelled
+    )
+    # 已启用相似商品物化时，向量更新完成后增量刷新相似列表
+    if result.get('status') == STATUS_COMPLETED and result.get('success') and \
+            current_app.config.get('SIMILAR_MATERIALIZE_AFTER_VECTOR_BUILD', True):
+        from app.services.similar_product_materializer import SimilarProductMaterializer
+        materializer = SimilarProductMaterializer()
+        if materializer.load_meta() is not None:
+            result['materialize'] = materializer.materialize(should_stop=context.is_cancelled)
+    return result
+
+
+def run_materialize_similar_products(context: JobContext) -> Dict:
+    """物化相似商品列表（默认增量，未完成的商品在下次运行时继续处理）"""
+    from app.services.similar_product_materializer import SimilarProductMaterializer
+
+    def _on_progress(state: Dict):
+        context.report(processed=state['processed'], success_count=state['processed'], total=state['total'])
+
+    return SimilarProductMaterializer().materialize(
+        full=context.params.get('full', False),
+        top_n=context.params.get('top_n'),
+        batch_size=context.params.get('batch_size', 2000),
+        progress_callback=_on_progress,
+        should_stop=context.is_cancelled
+    )
+
+
+def run_rebuild_user_vectors(context: JobContext) -> Dict:
+    """按交互记录全量重建用户特征向量（纠正增量更新的累积误差）"""
+    from app.services.user_profile_service import UserProfileService
+
+    def _on_progress(state: Dict):
+        context.report(processed=state['processed'], success_count=state['processed'], total=state['total'])
+
+    return UserProfileService().rebuild_all(
+        batch_size=context.params.get('batch_size', 500),
+        progress_callback=_on_progress,
+        should_stop=context.is_cancelled
+    )
+
+
+def run_rebuild_interaction_rollups(context: JobContext) -> Dict:
+    """按交互记录全量重建交互计数汇总"""
+    from app.services.interaction_rollup_service import InteractionRollupService
+
+    service = InteractionRollupService()
+    if not service.available():
+        return {'error': '交互汇总表不存在（先执行 flask rebuild-interaction-rollups）'}
+
+    def _on_progress(state: Dict):
+        context.report(processed=state['processed'], success_count=state['processed'], total=state['total'])
+
+    return service.rebuild(
+        batch_size=context.params.get('batch_size', 500),
+        progress_callback=_on_progress,
+        should_stop=context.is_cancelled
+    )
+
+
+def run_rebuild_vector_index(context: JobContext) -> Dict:
+    """重建本进程的商品向量索引（其他工作进程按刷新间隔同步）"""
+    from app.services.vector_index_service import ProductVectorIndex
+
+    index = ProductVectorIndex()
+    if not index.enabled:
+        return {'error': '向量索引未启用或依赖不可用'}
+    if not index.build():
+        return {'error': '向量索引构建失败'}
+    status = index.get_status()
+    context.report(processed=status.get('size', 0), success_count=status.get('size', 0))
+    return status
+
+
+JOB_HANDLERS: Dict[str, Callable[[JobContext], Dict]] = {
+    'import_products': run_import_products,
+    'precompute_tag_vectors': run_precompute_tag_vectors,
+    'precompute_product_vectors': run_precompute_product_vectors,
+    'rebuild_vector_index': run_rebuild_vector_index,
+    'materialize_similar_products': run_materialize_similar_products,
+    'rebuild_user_vectors': run_rebuild_user_vectors,
+    'rebuild_interaction_rollups': run_rebuild_interaction_rollups,
+}
+
+
+class JobFull(Exception):
+    """排队任务数已达上限"""
+
+
+class JobManager:
+    """后台任务管理器（进程级单例）"""
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(JobManager, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.max_workers = 2
+            self.max_pending = 10
+            self.stale_seconds = 600  # running状态超过该时间未更新视为进程已退出，允许续跑
+
+            self._app = None
+            self._executor = None  # 首次提交时创建，gunicorn preload模式下不会在主进程中创建线程
+            self._lock = threading.Lock()
+            self._active = set()
+            self._cancel_requested = set()
+
+            self._initialized = True
+
+    def configure(self, app):
+        """从应用配置读取任务池参数"""
+        self._app = app
+        self.max_workers = app.config.get('JOB_WORKERS', 2)
+        self.max_pending = app.config.get('JOB_MAX_PENDING', 10)
+        self.stale_seconds = app.config.get('JOB_STALE_SECONDS', 600)
+
+    def after_fork(self):
+        """工作进程fork后重置线程池与锁"""
+        self._executor = None
+        self._lock = threading.Lock()
+        self._active = set()
+        self._cancel_requested = set()
+
+    # ------------------------------------------------------------------
+    # 任务状态
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def get_job(job_id: int) -> Optional[BackgroundJob]:
+        return db.session.get(BackgroundJob, job_id)
+
+    @staticmethod
+    def list_jobs(job_type: Optional[str] = None, status: Optional[str] = None,
+                  limit: int = 20) -> List[BackgroundJob]:
+        query = BackgroundJob.query
+        if job_type:
+            query = query.filter(BackgroundJob.job_type == job_type)
+        if status:
+            query = query.filter(BackgroundJob.status == status)
+        return query.order_by(BackgroundJob.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def update_job(job_id: int, **values):
+        """在独立会话中更新任务状态，不影响任务本身的事务"""
+        with Session(db.engine) as session:
+            job = session.get(BackgroundJob, job_id)
+            if job is None:
+                return
+            for key, value in values.items():
+                setattr(job, key, value)
+            job.updated_at = datetime.utcnow()
+            session.commit()
+
+    def is_cancel_requested(self, job_id: int) -> bool:
+        return job_id in self._cancel_requested
+
+    # ------------------------------------------------------------------
+    # 提交、取消与续跑
+    # ------------------------------------------------------------------
+
+    def submit(self, job_type: str, params: Optional[Dict] = None) -> BackgroundJob:
+        """
+        创建并提交任务
+
+        Raises:
+            ValueError: 未知任务类型
+            JobFull: 本进程排队与运行中的任务数已达上限
+        """
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"未知任务类型: {job_type}")
+        job = BackgroundJob(job_type=job_type, status=STATUS_PENDING,
+                            params=json.dumps(params or {}, ensure_ascii=False))
+        db.session.add(job)
+        db.session.commit()
+        try:
+            self._dispatch(job.id)
+        except JobFull as e:
+            job.status = STATUS_FAILED
+            job.error = str(e)
+            db.session.commit()
+            raise
+        return job
+
+    def submit_if_idle(self, job_type: str, params: Optional[Dict] = None,
+                       min_interval: float = 0) -> Optional[BackgroundJob]:
+        """
+        同类型任务没有排队、运行中（未失效）的，且最近 min_interval 秒内没有创建过时才提交。
+        检查与创建在同一条语句中完成（PostgreSQL另加事务级咨询锁），多个进程同时调用只会创建一个任务
+
+        Returns:
+            提交的任务；已有同类任务时返回None
+
+        Raises:
+            ValueError: 未知任务类型
+            JobFull: 本进程排队与运行中的任务数已达上限
+        """
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"未知任务类型: {job_type}")
+        now = datetime.utcnow()
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                               {'key': f'background_jobs:{job_type}'})
+        row = db.session.execute(text("""
+            INSERT INTO background_jobs (job_type, status, params, processed, success_count, error_count,
+                                         last_offset, created_at, updated_at)
+            SELECT :job_type, :pending, :params, 0, 0, 0, 0, :now, :now
+            WHERE NOT EXISTS (
+                SELECT 1 FROM background_jobs
+                WHERE job_type = :job_type
+                  AND (status = :pending
+                       OR (status IN (:running, :cancelling) AND updated_at >= :stale_before)
+                       OR created_at >= :created_after)
+            )
+            RETURNING id
+        """), {
+            'job_type': job_type,
+            'params': json.dumps(params or {}, ensure_ascii=False),
+            'pending': STATUS_PENDING,
+            'running': STATUS_RUNNING,
+            'cancelling': STATUS_CANCELLING,
+            'now': now,
+            'stale_before': now - timedelta(seconds=self.stale_seconds),
+            'created_after': now - timedelta(seconds=min_interval),
+        }).fetchone()
+        db.session.commit()
+        if row is None:
+            return None
+        job = self.get_job(row.id)
+        try:
+            self._dispatch(job.id)
+        except JobFull as e:
+            job.status = STATUS_FAILED
+            job.error = str(e)
+            db.session.commit()
+            raise
+        return job
+
+    def cancel(self, job_id: int) -> Optional[BackgroundJob]:
+        """
+        请求取消任务：排队中的任务直接取消，运行中的任务在下一次提交后停止
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        if job.status == STATUS_PENDING:
+            job.status = STATUS_CANCELLED
+            job.finished_at = datetime.utcnow()
+        elif job.status == STATUS_RUNNING:
+            job.status = STATUS_CANCELLING
+        else:
+            return job
+        db.session.commit()
+        self._cancel_requested.add(job_id)
+        logger.info(f"已请求取消任务 {job_id}")
+        return job
+
+    def is_stale(self, job: BackgroundJob) -> bool:
+        """运行中但长时间未更新（执行进程已退出）"""
+        return job.status in (STATUS_RUNNING, STATUS_CANCELLING) and job.updated_at is not None \
+            and datetime.utcnow() - job.updated_at > timedelta(seconds=self.stale_seconds)
+
+    def resume(self, job_id: int) -> Optional[BackgroundJob]:
+        """
+        从最后提交的位置续跑已取消、失败或执行进程已退出的任务
+
+        Raises:
+            ValueError: 任务状态不允许续跑
+            JobFull: 排队任务数已达上限
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        if job.status not in RESUMABLE_STATUSES and not self.is_stale(job):
+            raise ValueError(f"任务状态为 {job.status}，不能续跑")
+        job.status = STATUS_PENDING
+        job.error = None
+        job.finished_at = None
+        db.session.commit()
+        self._cancel_requested.discard(job_id)
+        self._dispatch(job.id)
+        logger.info(f"任务 {job_id} 从位置 {job.last_offset} 续跑")
+        return job
+
+    def _dispatch(self, job_id: int):
+        with self._lock:
+            if len(self._active) >= self.max_workers + self.max_pending:
+                raise JobFull(f"排队任务已达上限（{self.max_workers + self.max_pending}），请稍后再试")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='background-job')
+            self._active.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    def _run(self, job_id: int):
+        app = self._app
+        try:
+            with app.app_context():
+                try:
+                    self._execute(job_id)
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+                self._cancel_requested.discard(job_id)
+
+    def _execute(self, job_id: int):
+        job = db.session.get(BackgroundJob, job_id)
+        if job is None or job.status != STATUS_PENDING:
+            # 排队期间已被取消
+            return
+        job.status = STATUS_RUNNING
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+        job_type = job.job_type
+        context = JobContext(self, job)
+        db.session.close()
+
+        logger.info(f"后台任务开始: {job_id} ({job_type})")
+        try:
+            result = JOB_HANDLERS[job_type](context) or {}
+            if 'error' in result:
+                status, error = STATUS_FAILED, result['error']
+            elif result.get('status') == STATUS_CANCELLED or context.is_cancelled():
+                status, error = STATUS_CANCELLED, None
+            else:
+                status, error = STATUS_COMPLETED, None
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"后台任务 {job_id} 失败: {e}")
+            result, status, error = None, STATUS_FAILED, str(e)
+
+        values = {'status': status, 'error': error, 'finished_at': datetime.utcnow()}
+        if status == STATUS_COMPLETED:
+            values['eta_seconds'] = 0
+        if result is not None:
+            values['result'] = json.dumps(result, ensure_ascii=False, default=str)
+        self.update_job(job_id, **values)
+        logger.info(f"后台任务结束: {job_id} ({job_type}), 状态: {status}")
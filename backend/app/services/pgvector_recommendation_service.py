@@ -4,18 +4,85 @@
 去除随机采样，实现全量商品向量搜索
 """
 
+import os
+import re
 import json
+import time
 import logging
+import unicodedata
+import multiprocessing
 import numpy as np
-from typing import List, Dict, Optional
+from collections import Counter
+from typing import Iterable, List, Dict, Optional, Tuple
+from flask import current_app, has_app_context
 from sqlalchemy import text
 from app import db
 from app.models import Product, Category, ProductTag
 from app.utils.text_processing import TextProcessor
 from app.utils.hybrid_text_processing import HybridVectorTextProcessor
+from app.services.vector_index_service import ProductVectorIndex
+from app.utils.vector_codec import to_pgvector_text
+from app.utils.cache import get_cache
+from app.utils.worker_pool import SharedPool, create_pool
 
 logger = logging.getLogger(__name__)
 
+# 批量搜索：查询数低于该值时串行分词（进程池启动开销大于收益）
+BATCH_PARALLEL_THRESHOLD = 64
+# 批量搜索降级到SQL时，每条LATERAL查询包含的查询向量数
+BATCH_SQL_CHUNK_SIZE = 500
+# 批量分词等待进程池结果的最长时间（秒），超时（如子进程被终止）时丢弃进程池并改为串行
+BATCH_SEGMENT_TIMEOUT = 60
+
+# 批量分词进程池子进程中的服务实例（由 _init_batch_segmenter 创建，词向量与jieba词典在子进程中各自加载）
+_batch_segmenter = None
+
+
+def _init_batch_segmenter():
+    global _batch_segmenter
+    _batch_segmenter = PgVectorRecommendationService()
+
+
+def _segment_in_worker(query: str) -> List[str]:
+    return _batch_segmenter.segment_query(query)
+
+
+# 批量分词进程池（进程内首次批量搜索时创建，之后各请求复用）
+segment_pool = SharedPool(initializer=_init_batch_segmenter, preload=(__name__,))
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """查询文本规范化（全角转半角、合并空白），作为查询向量缓存的键"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8')
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', query)).strip()
+
+
+class QueryVector:
+    """查询向量（float32）及其pgvector文本（首次使用时生成并缓存）"""
+
+    __slots__ = ('array', '_literal')
+
+    def __init__(self, array: Optional[np.ndarray]):
+        self.array = array
+        self._literal = None
+
+    @property
+    def literal(self) -> Optional[str]:
+        if self._literal is None and self.array is not None:
+            self._literal = to_pgvector_text(self.array)
+        return self._literal
+
+
+def query_vector_cache():
+    """进程内查询向量缓存（规范化查询 -> QueryVector），无法计算向量的查询同样缓存"""
+    max_entries = current_app.config.get('QUERY_VECTOR_CACHE_SIZE', 20000) if has_app_context() else 20000
+    return get_cache('query_vectors', max_entries=max_entries)
+
+
 class PgVectorRecommendationService:
     """基于pgvector的推荐服务"""
     
@@ -25,10 +92,11 @@ class PgVectorRecommendationService:
         self.word_vectors = self.load_word_vectors()
         self.hybrid_processor = None
         
-        # 如果词向量加载成功，初始化混合分词器
+        # 如果词向量加载成功，复用RecommendationService的混合分词器（preload模式下由主进程创建，工作进程共享）
         if self.word_vectors:
-            self.hybrid_processor = HybridVectorTextProcessor(self.word_vectors)
-            logger.info("混合分词器初始化完成")
+            from app.services.recommendation_service import RecommendationService
+            self.hybrid_processor = RecommendationService().hybrid_processor or \
+                HybridVectorTextProcessor(self.word_vectors)
         
         logger.info("PgVector推荐服务初始化完成")
     
@@ -57,30 +125,52 @@ class PgVectorRecommendationService:
             logger.error(f"加载词向量模型失败: {e}")
             return {}
     
+    def get_query_vector(self, query: str) -> QueryVector:
+        """获取查询向量（按规范化查询缓存，重复查询不再分词与求平均）"""
+        query = normalize_query(query)
+        cache = query_vector_cache()
+        cached = cache.get(query)
+        if cached is not None:
+            return cached
+        vector = self._compute_query_vector(query)
+        cached = QueryVector(None if vector is None else np.asarray(vector, dtype=np.float32))
+        # 词向量未加载时不缓存，加载后可重新计算
+        if self.word_vectors:
+            cache.set(query, cached)
+        return cached
+    
     def calculate_query_vector(self, query: str) -> Optional[str]:
-        """计算查询向量"""
+        """计算查询向量（pgvector文本格式）"""
+        return self.get_query_vector(query).literal
+    
+    def segment_query(self, query: str) -> List[str]:
+        """查询分词，返回有意义的词"""
+        # 确保查询字符串是UTF-8编码
+        if isinstance(query, bytes):
+            query = query.decode('utf-8')
+        
+        # 使用混合分词器处理查询
+        if self.hybrid_processor:
+            words = self.hybrid_processor.segment_text(query)
+            logger.info(f"混合分词结果: {words}")
+            return words  # 混合分词器已经过滤了有意义的词
+        
+        # 降级到原始分词器
+        words = self.text_processor.segment_text(query)
+        logger.info(f"原始分词结果: {words}")
+        
+        # 过滤有意义的词
+        return [word for word in words if self.text_processor._is_meaningful_word(word)]
+    
+    def calculate_query_vector_array(self, query: str) -> Optional[np.ndarray]:
+        """计算查询向量（numpy数组）"""
+        return self.get_query_vector(query).array
+    
+    def _compute_query_vector(self, query: str) -> Optional[np.ndarray]:
+        """分词并对词向量求平均"""
         try:
-            # 确保查询字符串是UTF-8编码
-            if isinstance(query, bytes):
-                query = query.decode('utf-8')
-            
             logger.info(f"计算查询向量: '{query}'")
-            
-            # 使用混合分词器处理查询
-            if self.hybrid_processor:
-                words = self.hybrid_processor.segment_text(query)
-                logger.info(f"混合分词结果: {words}")
-                meaningful_words = words  # 混合分词器已经过滤了有意义的词
-            else:
-                # 降级到原始分词器
-                words = self.text_processor.segment_text(query)
-                logger.info(f"原始分词结果: {words}")
-                
-                # 过滤有意义的词
-                meaningful_words = []
-                for word in words:
-                    if self.text_processor._is_meaningful_word(word):
-                        meaningful_words.append(word)
+            meaningful_words = self.segment_query(query)
             
             logger.info(f"有意义的词: {meaningful_words}")
             
@@ -103,11 +193,8 @@ class PgVectorRecommendationService:
             
             # 计算平均向量
             avg_vector = np.mean(vectors, axis=0)
-            
-            # 转换为PostgreSQL vector格式
-            vector_str = '[' + ','.join(map(str, avg_vector)) + ']'
             logger.info(f"查询向量计算完成，长度: {len(avg_vector)}")
-            return vector_str
+            return avg_vector
             
         except Exception as e:
             logger.error(f"计算查询向量失败: {e}")
@@ -119,11 +206,19 @@ class PgVectorRecommendationService:
             logger.info(f"开始语义搜索: query='{query}', top_k={top_k}")
             
             # 计算查询向量
-            query_vector = self.calculate_query_vector(query)
-            if not query_vector:
+            query_cached = self.get_query_vector(query)
+            query_array = query_cached.array
+            if query_array is None:
                 logger.warning("无法计算查询向量")
                 return []
             
+            # 优先使用进程内向量索引，索引冷启动或过期时降级到pgvector
+            index_results = self._search_with_index(query_array, top_k)
+            if index_results is not None:
+                logger.info(f"语义搜索完成(向量索引)，返回 {len(index_results)} 条结果")
+                return index_results
+            
+            query_vector = query_cached.literal
             logger.info(f"查询向量计算完成，长度: {len(query_vector)}")
             
             # 使用pgvector进行相似度搜索
@@ -174,21 +269,116 @@ class PgVectorRecommendationService:
             logger.error(f"语义搜索失败: {e}")
             return []
     
+    def semantic_search_page(self, query: str, limit: int = 20, after: Optional[Tuple[float, int]] = None,
+                             offset: int = 0) -> Dict:
+        """
+        语义搜索分页：结果按 (余弦距离, 商品ID) 全序排列
+        
+        Args:
+            query: 查询文本
+            limit: 每页数量
+            after: 上一页最后一条的 (距离, 商品ID)，从该位置之后继续排序（游标分页）
+            offset: 跳过的条数（页码分页，与after同时使用时在after之后跳过）
+            
+        Returns:
+            {'results': 结果列表（含原始distance）, 'total_estimate': 可参与排序的商品数估计}
+        """
+        query_cached = self.get_query_vector(query)
+        if query_cached.array is None:
+            return {'results': [], 'total_estimate': 0}
+        
+        index = ProductVectorIndex()
+        matrix = index.get_matrix()
+        if matrix is not None:
+            scores = matrix.scores(query_cached.array)
+            ids = matrix.ids
+            hits = self._page_from_scores(ids, 1.0 - scores.astype(np.float64), limit, after, offset)
+            total = len(ids)
+            rows = ProductVectorIndex.fetch_product_rows([pid for pid, _ in hits])
+        else:
+            after_clause = ""
+            params = {'query_vector': query_cached.literal, 'limit': limit, 'offset': offset}
+            if after is not None:
+                after_clause = "AND (product_vector <=> CAST(:query_vector AS vector), id) > (:last_distance, :last_id)"
+                params.update(last_distance=float(after[0]), last_id=int(after[1]))
+            sql = text(f"""
+                SELECT id, name, description, price, category_id, image_url, tags,
+                       product_vector <=> CAST(:query_vector AS vector) AS distance
+                FROM products
+                WHERE product_vector IS NOT NULL {after_clause}
+                ORDER BY distance, id
+                LIMIT :limit OFFSET :offset
+            """)
+            result_rows = db.session.execute(sql, params).fetchall()
+            hits = [(row.id, float(row.distance)) for row in result_rows]
+            rows = {row.id: row for row in result_rows}
+            total = self._vector_count_estimate()
+        
+        results = []
+        for pid, distance in hits:
+            if pid not in rows:
+                continue
+            result = self._format_search_result(rows[pid], 1.0 - distance)
+            # 保留原始距离，作为下一页游标的排序键
+            result['distance'] = distance
+            results.append(result)
+        return {'results': results, 'total_estimate': total}
+    
+    @staticmethod
+    def _page_from_scores(ids: np.ndarray, distances: np.ndarray, limit: int,
+                          after: Optional[Tuple[float, int]], offset: int) -> List[Tuple[int, float]]:
+        """从全量距离中按 (距离, ID) 顺序取after之后的第 offset ~ offset+limit 条"""
+        candidates = np.arange(len(ids))
+        if after is not None:
+            last_distance, last_id = float(after[0]), int(after[1])
+            candidates = np.nonzero((distances > last_distance) |
+                                    ((distances == last_distance) & (ids > last_id)))[0]
+        need = offset + limit
+        if need <= 0 or not len(candidates):
+            return []
+        if len(candidates) > need:
+            # 先按距离取前need个，再补上与第need个距离相同的记录，保证按ID排序时不漏
+            kth = np.partition(distances[candidates], need - 1)[need - 1]
+            candidates = candidates[distances[candidates] <= kth]
+        order = np.lexsort((ids[candidates], distances[candidates]))
+        rows = candidates[order][offset:need]
+        return [(int(ids[row]), float(distances[row])) for row in rows]
+    
+    @staticmethod
+    def _vector_count_estimate() -> int:
+        """有向量商品数的估计值（缓存5分钟）"""
+        cache = get_cache('catalog_counts', max_entries=100, ttl=300)
+        count = cache.get('vector_products')
+        if count is None:
+            count = int(db.session.execute(text(
+                "SELECT COUNT(*) FROM products WHERE product_vector IS NOT NULL"
+            )).scalar() or 0)
+            cache.set('vector_products', count)
+        return count
+    
+    def _search_with_index(self, query_vector: np.ndarray, top_k: int) -> Optional[List[Dict]]:
+        """使用进程内向量索引搜索，索引不可用时返回None"""
+        hits = ProductVectorIndex().search(query_vector, top_k)
+        if hits is None:
+            return None
+        
+        rows = ProductVectorIndex.fetch_product_rows([pid for pid, _ in hits])
+        return [self._format_search_result(rows[pid], similarity) for pid, similarity in hits if pid in rows]
+    
     def get_similar_products(self, product_id: int, top_k: int = 10) -> List[Dict]:
         """获取相似商品"""
         try:
             logger.info(f"获取相似商品: product_id={product_id}, top_k={top_k}")
             
             # 获取目标商品的向量
-            product = Product.query.filter_by(id=product_id).first()
-            if not product or not product.embedding:
+            product = Product.query.options(Product.with_vectors()).filter_by(id=product_id).first()
+            if not product or not product.has_vector():
                 logger.warning(f"商品 {product_id} 不存在或没有向量数据")
                 return []
             
             # 将embedding转换为vector格式
             try:
-                vector_data = json.loads(product.embedding)
-                product_vector = '[' + ','.join(map(str, vector_data)) + ']'
+                product_vector = to_pgvector_text(product.get_embedding())
             except:
                 logger.error(f"商品 {product_id} 的向量数据格式错误")
                 return []
@@ -306,21 +496,218 @@ class PgVectorRecommendationService:
             logger.error(f"获取分类推荐失败: {e}")
             return []
     
-    def batch_semantic_search(self, queries: List[str], top_k: int = 10) -> Dict[str, List[Dict]]:
-        """批量语义搜索"""
+    def batch_semantic_search(self, queries: List[str], top_k: int = 10,
+                              workers: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """
+        批量语义搜索
+        并行分词 -> 一次性构建查询矩阵 -> 一次矩阵乘积（向量矩阵可用时）或一条LATERAL查询得到全部top-k
+        
+        Returns:
+            {查询: 结果列表}，无法计算向量的查询结果为空列表
+        """
         try:
-            logger.info(f"开始批量语义搜索: {len(queries)} 个查询")
-            
-            results = {}
-            for query in queries:
-                results[query] = self.semantic_search(query, top_k)
-            
-            logger.info("批量语义搜索完成")
+            unique_queries = list(dict.fromkeys(q for q in queries if q))
+            logger.info(f"开始批量语义搜索: {len(queries)} 个查询（去重后 {len(unique_queries)} 个）")
+            if not unique_queries or not self.word_vectors:
+                return {query: [] for query in unique_queries}
+            
+            start_time = time.time()
+            query_vectors = self.get_query_vectors(unique_queries, workers)
+            segment_time = time.time() - start_time
+            
+            valid_queries = [q for q, vector in zip(unique_queries, query_vectors) if vector.array is not None]
+            query_matrix = np.stack([vector.array for vector in query_vectors if vector.array is not None]) \
+                if valid_queries else None
+            hits_per_query = self._batch_top_k(query_matrix, top_k) if valid_queries else []
+            
+            # 一次性加载全部命中商品的展示字段
+            product_ids = list({pid for hits in hits_per_query for pid, _ in hits})
+            rows = {}
+            for i in range(0, len(product_ids), 5000):
+                rows.update(ProductVectorIndex.fetch_product_rows(product_ids[i:i + 5000]))
+            
+            results = {query: [] for query in unique_queries}
+            for query, hits in zip(valid_queries, hits_per_query):
+                results[query] = [
+                    self._format_search_result(rows[pid], similarity)
+                    for pid, similarity in hits if pid in rows
+                ]
+            
+            logger.info(f"批量语义搜索完成: 有效查询 {len(valid_queries)}/{len(unique_queries)}, "
+                        f"分词 {segment_time:.2f}s, 总耗时 {(time.time() - start_time):.2f}s")
             return results
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"批量语义搜索失败: {e}")
-            return {}
+            raise
+    
+    def get_query_vectors(self, queries: List[str], workers: Optional[int] = None,
+                          shared_pool: bool = True) -> List[QueryVector]:
+        """
+        批量获取查询向量：缓存未命中的查询并行分词、一次性构建查询矩阵后写入缓存
+        
+        Args:
+            shared_pool: 是否使用进程内复用的分词进程池（一次性任务传False，用完即关闭）
+        
+        Returns:
+            与queries顺序一致的QueryVector列表
+        """
+        normalized = [normalize_query(query) for query in queries]
+        cache = query_vector_cache()
+        found = {}
+        missing = []
+        for query in dict.fromkeys(normalized):
+            cached = cache.get(query)
+            if cached is None:
+                missing.append(query)
+            else:
+                found[query] = cached
+        
+        if missing and self.word_vectors:
+            token_lists = self.segment_queries(missing, workers, shared_pool=shared_pool)
+            query_matrix, valid = self.build_query_matrix(token_lists)
+            rows = iter(query_matrix)
+            for query, ok in zip(missing, valid):
+                # 复制行，避免缓存条目引用整个批次矩阵
+                found[query] = QueryVector(np.array(next(rows), dtype=np.float32) if ok else None)
+                cache.set(query, found[query])
+        return [found.get(query) or QueryVector(None) for query in normalized]
+    
+    def warm_query_vectors(self, queries: Iterable[str], limit: int = 10000,
+                           workers: Optional[int] = None) -> int:
+        """
+        预热查询向量缓存：按出现次数取最高频的limit个查询批量计算
+        
+        Returns:
+            预热的查询数
+        """
+        if not self.word_vectors:
+            logger.warning("词向量模型未加载，跳过查询向量预热")
+            return 0
+        counts = Counter(normalize_query(query) for query in queries)
+        counts.pop('', None)
+        top_queries = [query for query, _ in counts.most_common(limit)]
+        start_time = time.time()
+        # 预热在启动时执行一次（preload模式下在主进程），不保留进程池
+        vectors = self.get_query_vectors(top_queries, workers, shared_pool=False)
+        valid = sum(1 for vector in vectors if vector.array is not None)
+        logger.info(f"查询向量预热完成: {len(top_queries)} 个查询（有效 {valid}），耗时 {(time.time() - start_time):.2f}s")
+        return len(top_queries)
+    
+    def warm_query_vectors_from_log(self, path: str, limit: int = 10000) -> int:
+        """从查询日志（每行一个查询，重复出现表示频次）预热查询向量缓存"""
+        if not os.path.exists(path):
+            logger.warning(f"查询日志不存在: {path}")
+            return 0
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            return self.warm_query_vectors((line.rstrip('\n') for line in f), limit=limit)
+    
+    def segment_queries(self, queries: List[str], workers: Optional[int] = None,
+                        shared_pool: bool = True) -> List[List[str]]:
+        """
+        并行分词（forkserver进程池，子进程各自加载词向量与jieba词典）
+        
+        Args:
+            shared_pool: 使用进程内复用的进程池；为False时创建一次性进程池，用完即关闭
+        """
+        if workers is None:
+            workers = current_app.config.get('BATCH_SEARCH_WORKERS') if has_app_context() else None
+            workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(queries) < BATCH_PARALLEL_THRESHOLD:
+            return [self.segment_query(query) for query in queries]
+        
+        try:
+            if shared_pool:
+                pool, workers = segment_pool.get(workers)
+            else:
+                pool = create_pool(workers, initializer=_init_batch_segmenter, preload=(__name__,))
+        except (AssertionError, OSError) as e:
+            # 守护进程中不能再创建子进程等情况，降级为串行
+            logger.warning(f"并行分词不可用，降级为串行: {e}")
+            return [self.segment_query(query) for query in queries]
+        
+        chunksize = max(1, len(queries) // (workers * 4))
+        try:
+            return pool.map_async(_segment_in_worker, queries, chunksize=chunksize).get(BATCH_SEGMENT_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            logger.warning(f"并行分词超过 {BATCH_SEGMENT_TIMEOUT}s 未完成，重建进程池并改为串行")
+            if shared_pool:
+                segment_pool.discard(pool)
+            return [self.segment_query(query) for query in queries]
+        finally:
+            if not shared_pool:
+                pool.terminate()
+                pool.join()
+    
+    def build_query_matrix(self, token_lists: List[List[str]]):
+        """
+        由分词结果构建查询矩阵：一次gather取出全部词向量，再用reduceat按查询求平均
+        
+        Returns:
+            (查询矩阵, 有效标记)，矩阵只包含有效查询的行
+        """
+        word_indices = []
+        counts = np.zeros(len(token_lists), dtype=np.int64)
+        for i, words in enumerate(token_lists):
+            for word in words:
+                index = self.word_vectors.get_index(word, None)
+                if index is not None:
+                    word_indices.append(index)
+                    counts[i] += 1
+        
+        valid = counts > 0
+        if not word_indices:
+            return np.empty((0, self.word_vectors.vector_size), dtype=np.float32), valid
+        
+        gathered = np.asarray(self.word_vectors.vectors[np.asarray(word_indices)], dtype=np.float32)
+        valid_counts = counts[valid]
+        offsets = np.concatenate(([0], np.cumsum(valid_counts)[:-1]))
+        query_matrix = np.add.reduceat(gathered, offsets, axis=0) / valid_counts[:, None]
+        return query_matrix, valid
+    
+    def _batch_top_k(self, query_matrix: np.ndarray, top_k: int) -> List[List[tuple]]:
+        """批量求top-k：优先内存向量矩阵乘积，否则一条LATERAL查询"""
+        index = ProductVectorIndex()
+        matrix = index.get_matrix()
+        if matrix is not None:
+            ids, scores = matrix.top_k_batch(query_matrix, top_k)
+            return [list(zip(row_ids.tolist(), row_scores.tolist())) for row_ids, row_scores in zip(ids, scores)]
+        
+        sql = text("""
+            SELECT q.ord, p.id, p.distance
+            FROM unnest(CAST(:vectors AS vector[])) WITH ORDINALITY AS q(vec, ord)
+            CROSS JOIN LATERAL (
+                SELECT id, product_vector <=> q.vec AS distance
+                FROM products
+                WHERE product_vector IS NOT NULL
+                ORDER BY product_vector <=> q.vec
+                LIMIT :top_k
+            ) p
+            ORDER BY q.ord, p.distance
+        """)
+        hits = [[] for _ in range(len(query_matrix))]
+        for start in range(0, len(query_matrix), BATCH_SQL_CHUNK_SIZE):
+            chunk = query_matrix[start:start + BATCH_SQL_CHUNK_SIZE]
+            vectors = '{' + ','.join(f'"{to_pgvector_text(vector)}"' for vector in chunk) + '}'
+            for row in db.session.execute(sql, {'vectors': vectors, 'top_k': top_k}):
+                hits[start + row.ord - 1].append((row.id, 1.0 - float(row.distance)))
+        return hits
+    
+    @staticmethod
+    def _format_search_result(row, similarity: float) -> Dict:
+        """格式化单条搜索结果（与 semantic_search 返回格式一致）"""
+        return {
+            'id': row.id,
+            'name': row.name,
+            'description': row.description,
+            'price': row.price,
+            'category_id': row.category_id,
+            'image_url': row.image_url,
+            'tags': json.loads(row.tags) if row.tags else [],
+            'similarity': float(similarity),
+            'distance': float(1.0 - similarity)
+        }
     
     def get_search_statistics(self) -> Dict:
         """获取搜索统计信息"""
@@ -329,7 +716,7 @@ class PgVectorRecommendationService:
             total_products = Product.query.count()
             
             # 获取有向量的商品数
-            products_with_vectors = Product.query.filter(Product.embedding.isnot(None)).count()
+            products_with_vectors = Product.query.filter(Product.vector_filter()).count()
             
             # 获取分类数
             total_categories = Category.query.count()
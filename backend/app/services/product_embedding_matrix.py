@@ -0,0 +1,120 @@
+"""
+商品特征向量矩阵服务
+进程内保存一份由 products.embedding_bin / embedding 构建的归一化向量矩阵，
+相似商品计算直接在该矩阵上完成；按带向量商品的数量与最大 updated_at 检测变更后重新加载
+"""
+
+import logging
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import text
+
+from app import db
+from app.utils.embedding_matrix import EmbeddingMatrix
+from app.utils.vector_codec import decode_vector
+
+logger = logging.getLogger(__name__)
+
+
+class ProductEmbeddingMatrix:
+    """商品特征向量矩阵（进程级单例）"""
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ProductEmbeddingMatrix, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.dimension = 200
+            self.load_batch_size = 5000
+
+            # 矩阵加载后不再修改，变更时整体替换，使用方无需加锁
+            self._matrix: Optional[EmbeddingMatrix] = None
+            self._signature = None  # 加载时的 (商品数, 最大updated_at)
+            self._last_check = 0.0
+            self._load_lock = threading.Lock()  # 同时只有一个线程加载
+
+            self._initialized = True
+
+    @property
+    def check_interval(self) -> int:
+        """检查商品变更的最小间隔（秒）"""
+        return current_app.config.get('VECTOR_INDEX_REFRESH_INTERVAL', 30) if has_app_context() else 30
+
+    def after_fork(self):
+        """工作进程fork后重置加载锁"""
+        self._load_lock = threading.Lock()
+
+    @staticmethod
+    def _catalog_signature() -> Tuple[int, Optional[datetime]]:
+        """带特征向量商品的数量与最大更新时间"""
+        row = db.session.execute(text("""
+            SELECT COUNT(*) AS total, MAX(updated_at) AS last_updated
+            FROM products
+            WHERE embedding_bin IS NOT NULL OR embedding IS NOT NULL
+        """)).fetchone()
+        return int(row.total or 0), row.last_updated
+
+    def _load(self, signature: Tuple[int, Optional[datetime]]):
+        """按主键分页读取全部商品向量，逐页写入新矩阵后替换当前矩阵"""
+        start_time = time.time()
+        matrix = EmbeddingMatrix(self.dimension, capacity=max(signature[0], 1))
+        sql = text("""
+            SELECT id, embedding_bin, embedding
+            FROM products
+            WHERE (embedding_bin IS NOT NULL OR embedding IS NOT NULL) AND id > :after_id
+            ORDER BY id
+            LIMIT :limit
+        """)
+        after_id = 0
+        while True:
+            rows = db.session.execute(sql, {'after_id': after_id, 'limit': self.load_batch_size}).fetchall()
+            if not rows:
+                break
+            block = np.empty((len(rows), self.dimension), dtype=np.float32)
+            block_ids = []
+            for row in rows:
+                try:
+                    raw = row.embedding_bin if row.embedding_bin else row.embedding
+                    block[len(block_ids)] = decode_vector(raw, self.dimension)
+                except (ValueError, TypeError):
+                    continue
+                block_ids.append(row.id)
+            matrix.upsert(block_ids, block[:len(block_ids)])
+            after_id = rows[-1].id
+
+        self._matrix = matrix
+        self._signature = signature
+        logger.info(f"商品特征向量矩阵加载完成: {len(matrix)} 个向量, 耗时 {(time.time() - start_time):.2f}s")
+
+    def get(self) -> EmbeddingMatrix:
+        """
+        获取商品特征向量矩阵（需在应用上下文中调用）
+
+        首次调用时加载；之后每隔 check_interval 秒检查一次商品变更，有变化时由一个线程重新加载，
+        其间其他线程继续使用当前矩阵
+        """
+        matrix = self._matrix
+        if matrix is not None and time.time() - self._last_check <= self.check_interval:
+            return matrix
+        # 已有矩阵时不等待其他线程的加载
+        if not self._load_lock.acquire(blocking=matrix is None):
+            return matrix
+        try:
+            if self._matrix is not None and time.time() - self._last_check <= self.check_interval:
+                return self._matrix
+            self._last_check = time.time()
+            signature = self._catalog_signature()
+            if self._matrix is None or signature != self._signature:
+                self._load(signature)
+            return self._matrix
+        finally:
+            self._load_lock.release()
@@ -0,0 +1,152 @@
+"""
+商品结果组装服务
+按商品ID列表批量生成列表接口使用的商品字典：商品字段只查询需要的列（一次IN查询），
+标签一次IN查询，分类名称取自进程内分类目录（见 category_catalog_service），
+一页结果最多两次数据库查询
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app import db
+from app.models import Product, ProductTag
+from app.services.category_catalog_service import CategoryCatalog
+from app.utils.vector_codec import decode_vector
+
+logger = logging.getLogger(__name__)
+
+# 列表接口默认返回的字段
+LIST_FIELDS = ('id', 'name', 'price', 'category_id', 'category_name', 'image_url', 'tags', 'created_at')
+# 交互记录中附带的商品字段
+INTERACTION_PRODUCT_FIELDS = ('id', 'name', 'category_id', 'category_name')
+# 商品详情字段（与 Product.to_dict 一致，不含特征向量）
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'category_id', 'category_name', 'image_url',
+                  'tags', 'created_at', 'updated_at')
+# 全部可选字段（特征向量需通过 fields 参数显式请求）
+DETAIL_FIELDS = PRODUCT_FIELDS + ('embedding',)
+
+# 字段 -> 需要查询的商品列；tags 与 category_name 另行组装
+_FIELD_COLUMNS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'price': ('price',),
+    'category_id': ('category_id',),
+    'category_name': ('category_id',),
+    'image_url': ('image_url',),
+    'tags': (),
+    'embedding': ('embedding', 'embedding_bin'),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+}
+
+
+def parse_fields(raw: Optional[str], default: Sequence[str] = PRODUCT_FIELDS) -> Tuple[str, ...]:
+    """
+    解析请求中的 fields 参数（逗号分隔），结果总是包含 id
+
+    Args:
+        raw: 请求参数值，为空时返回默认字段
+        default: 默认字段
+
+    Raises:
+        ValueError: 包含不支持的字段
+    """
+    if not raw:
+        return tuple(default)
+    fields = ['id']
+    for field in raw.split(','):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in _FIELD_COLUMNS:
+            raise ValueError(f"不支持的商品字段: {field}（可选: {', '.join(DETAIL_FIELDS)}）")
+        fields.append(field)
+    return tuple(fields)
+
+
+def category_names() -> Dict[int, str]:
+    """分类ID -> 分类名称（取自进程内分类目录）"""
+    return CategoryCatalog().category_names()
+
+
+class ProductHydrator:
+    """商品结果组装"""
+
+    def __init__(self, fields: Sequence[str] = LIST_FIELDS, missing_category: Optional[str] = None):
+        """
+        Args:
+            fields: 返回的字段（可选值见 DETAIL_FIELDS）
+            missing_category: 商品没有分类或分类不存在时的 category_name
+        """
+        unknown = [field for field in fields if field not in _FIELD_COLUMNS]
+        if unknown:
+            raise ValueError(f"不支持的商品字段: {', '.join(unknown)}")
+        self.fields = tuple(fields)
+        self.missing_category = missing_category
+        column_names = ['id']
+        for field in self.fields:
+            for column in _FIELD_COLUMNS[field]:
+                if column not in column_names:
+                    column_names.append(column)
+        self._columns = [getattr(Product, column) for column in column_names]
+
+    def load_tags(self, product_ids: Iterable[int]) -> Dict[int, List[str]]:
+        """批量读取商品标签（一次IN查询）"""
+        tags: Dict[int, List[str]] = {}
+        rows = db.session.query(ProductTag.product_id, ProductTag.tag).filter(
+            ProductTag.product_id.in_(list(product_ids))
+        ).order_by(ProductTag.product_id, ProductTag.id)
+        for product_id, tag in rows:
+            tags.setdefault(product_id, []).append(tag)
+        return tags
+
+    def hydrate(self, product_ids: Sequence[int], extra: Optional[Dict[int, Dict]] = None) -> List[Dict]:
+        """
+        组装商品字典
+
+        Args:
+            product_ids: 商品ID列表（结果保持该顺序，不存在的商品被跳过）
+            extra: 商品ID -> 需要合并到结果中的附加字段（如相似度）
+
+        Returns:
+            商品字典列表
+        """
+        ids = list(dict.fromkeys(product_ids))
+        if not ids:
+            return []
+        rows = {row.id: row for row in db.session.query(*self._columns).filter(Product.id.in_(ids))}
+        tags = self.load_tags(rows.keys()) if 'tags' in self.fields and rows else {}
+        categories = category_names() if 'category_name' in self.fields else {}
+
+        results = []
+        for product_id in ids:
+            row = rows.get(product_id)
+            if row is None:
+                continue
+            item = {}
+            for field in self.fields:
+                if field == 'tags':
+                    item['tags'] = tags.get(product_id, [])
+                elif field == 'category_name':
+                    item['category_name'] = categories.get(row.category_id, self.missing_category)
+                elif field == 'price':
+                    item['price'] = float(row.price) if row.price else None
+                elif field == 'embedding':
+                    raw = row.embedding_bin or row.embedding
+                    item['embedding'] = decode_vector(raw).tolist() if raw else None
+                elif field in ('created_at', 'updated_at'):
+                    value = getattr(row, field)
+                    item[field] = value.isoformat() if value else None
+                else:
+                    item[field] = getattr(row, field)
+            if extra and product_id in extra:
+                item.update(extra[product_id])
+            results.append(item)
+        return results
+
+
+def hydrate_products(product_ids: Sequence[int], fields: Sequence[str] = LIST_FIELDS,
+                     extra: Optional[Dict[int, Dict]] = None, missing_category: Optional[str] = None) -> List[Dict]:
+    """按ID列表组装商品字典（见 ProductHydrator.hydrate）"""
+    return ProductHydrator(fields, missing_category=missing_category).hydrate(product_ids, extra=extra)
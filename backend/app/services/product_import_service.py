@@ -0,0 +1,386 @@
+"""
+商品流式导入服务
+逐块读取商品文件，解析、分词与分类在进程池（forkserver启动）中并行，
+写入端以 COPY FROM STDIN 载入临时表后合并到 products / product_tags，错误按行记录
+"""
+
+import os
+import json
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import jieba
+from flask import current_app, has_app_context
+from sqlalchemy import text, bindparam
+
+from app import db
+from app.utils.pg_copy import copy_rows
+from app.utils.result_cache import bump_catalog_version
+from app.utils.search_tokens import build_search_tokens, search_tokens_column_exists
+from app.utils.worker_pool import create_pool
+
+logger = logging.getLogger(__name__)
+
+# 与表结构一致的字段长度上限，超长的行记为错误而不是让整批写入失败
+MAX_NAME_LENGTH = 200
+MAX_IMAGE_URL_LENGTH = 500
+MAX_TAG_LENGTH = 100
+
+# 写入 products 的列（search_tokens 在迁移添加该列之前不写入）
+PRODUCT_COLUMNS = ('id', 'name', 'description', 'category_id', 'image_url', 'tags', 'search_tokens')
+
+# 结果中保留的错误样例数（完整错误写入错误报告文件）
+MAX_ERROR_SAMPLES = 100
+ERROR_REPORT_DIR = 'import_errors'
+
+# 导入进程池子进程中的服务实例（由 _init_import_worker 创建）
+_import_worker = None
+
+
+def _init_import_worker():
+    global _import_worker
+    _import_worker = ProductImportService()
+    jieba.dt.check_initialized()
+
+
+def _process_block_in_worker(block: List[Tuple[int, str]]) -> List[Dict]:
+    return _import_worker.process_lines(block)
+
+
+class ProductImportService:
+    """商品流式导入服务"""
+
+    def __init__(self, processor=None):
+        """
+        Args:
+            processor: DataProcessingService 实例，提供解析、标签提取与分类规则
+        """
+        if processor is None:
+            from app.services.data_processing_service import DataProcessingService
+            processor = DataProcessingService()
+        self.processor = processor
+
+    # ------------------------------------------------------------------
+    # 读取与解析
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def read_blocks(file_path: str, block_size: int, start_line: int = 0) -> Iterator[List[Tuple[int, str]]]:
+        """按块读取文件，返回 (行号, 内容) 列表；跳过空行与 start_line 及之前的行"""
+        block = []
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line_num, line in enumerate(f, 1):
+                if line_num <= start_line or not line.strip():
+                    continue
+                block.append((line_num, line))
+                if len(block) >= block_size:
+                    yield block
+                    block = []
+        if block:
+            yield block
+
+    def process_lines(self, block: List[Tuple[int, str]]) -> List[Dict]:
+        """
+        解析一块数据行：解析字段、提取标签、确定分类（在工作进程中执行）
+
+        Returns:
+            每行一条记录，成功为 {'line', 'product', 'tags'}，失败为 {'line', 'error', 'content'}
+        """
+        records = []
+        for line_num, line in block:
+            try:
+                product_data = self.processor.parse_product_data(line)
+                if not product_data:
+                    records.append(self._error_record(line_num, '无法解析商品数据', line))
+                    continue
+                if len(product_data['title']) > MAX_NAME_LENGTH:
+                    records.append(self._error_record(line_num, f'商品标题超过{MAX_NAME_LENGTH}个字符', line))
+                    continue
+                if len(product_data['image_url']) > MAX_IMAGE_URL_LENGTH:
+                    records.append(self._error_record(line_num, f'图片链接超过{MAX_IMAGE_URL_LENGTH}个字符', line))
+                    continue
+
+                tags = [tag for tag in self.processor.extract_tags_from_title(product_data['title'])
+                        if len(tag) <= MAX_TAG_LENGTH]
+                if not product_data['category_id']:
+                    product_data['category_id'] = self.processor.determine_category(product_data['title'], tags)
+                # 检索词串在工作进程中生成，写入端只负责入库
+                search_tokens = build_search_tokens(product_data['title'], tags, self._description(product_data))
+                records.append({'line': line_num, 'product': product_data, 'tags': tags,
+                                'search_tokens': search_tokens})
+            except Exception as e:
+                records.append(self._error_record(line_num, f'处理失败: {e}', line))
+        return records
+
+    @staticmethod
+    def _error_record(line_num: int, error: str, line: str) -> Dict:
+        return {'line': line_num, 'error': error, 'content': line.strip()[:200]}
+
+    def _resolve_workers(self, workers: Optional[int]) -> int:
+        if workers is None:
+            workers = current_app.config.get('IMPORT_WORKERS') if has_app_context() else None
+            workers = workers or os.cpu_count() or 1
+        return max(1, workers)
+
+    def process_blocks(self, blocks: Iterator[List[Tuple[int, str]]], workers: int) -> Iterator[List[Dict]]:
+        """
+        按原顺序产出解析结果
+
+        多进程时最多同时提交 workers*2 块，读取速度受写入速度约束，内存占用与文件大小无关
+        """
+        if workers <= 1:
+            for block in blocks:
+                yield self.process_lines(block)
+            return
+
+        try:
+            # 子进程各自创建服务实例并加载jieba词典（解析规则来自默认的 DataProcessingService）
+            pool = create_pool(workers, initializer=_init_import_worker, preload=(__name__,))
+        except (AssertionError, OSError) as e:
+            # 守护进程中不能再创建子进程等情况，降级为串行
+            logger.warning(f"并行解析不可用，降级为串行: {e}")
+            for block in blocks:
+                yield self.process_lines(block)
+            return
+
+        try:
+            pending = deque()
+            for block in blocks:
+                pending.append(pool.apply_async(_process_block_in_worker, (block,)))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load_category_ids() -> set:
+        return {row.id for row in db.session.execute(text("SELECT id FROM categories"))}
+
+    @staticmethod
+    def _description(product_data: Dict) -> str:
+        return f"商品ID: {product_data['id']}, 品牌: {product_data['brand_id']}, 店铺: {product_data['shop_id']}"
+
+    @staticmethod
+    def _product_columns(connection) -> Tuple[str, ...]:
+        return PRODUCT_COLUMNS if search_tokens_column_exists(connection) else PRODUCT_COLUMNS[:-1]
+
+    @classmethod
+    def _product_row(cls, record: Dict) -> tuple:
+        product_data = record['product']
+        return (
+            product_data['id'],
+            product_data['title'],
+            cls._description(product_data),
+            product_data['category_id'],
+            product_data['image_url'],
+            json.dumps(record['tags'], ensure_ascii=False),
+            record['search_tokens'],
+        )
+
+    def _copy_merge(self, records: List[Dict]) -> set:
+        """PostgreSQL：COPY载入临时表，一条语句合并到正式表，返回实际写入的商品ID"""
+        connection = db.session.connection()
+        for sql in (
+            "CREATE TEMP TABLE IF NOT EXISTS staging_products ("
+            "id INTEGER, name VARCHAR(200), description TEXT, category_id INTEGER, "
+            "image_url VARCHAR(500), tags TEXT, search_tokens TEXT) ON COMMIT DELETE ROWS",
+            "CREATE TEMP TABLE IF NOT EXISTS staging_product_tags ("
+            "product_id INTEGER, tag VARCHAR(100)) ON COMMIT DELETE ROWS",
+        ):
+            connection.execute(text(sql))
+
+        columns = self._product_columns(connection)
+        product_rows = [self._product_row(r)[:len(columns)] for r in records]
+        tag_rows = [(r['product']['id'], tag) for r in records for tag in r['tags']]
+        copy_rows(connection, 'staging_products', columns, product_rows)
+        if tag_rows:
+            copy_rows(connection, 'staging_product_tags', ('product_id', 'tag'), tag_rows)
+
+        column_list = ', '.join(columns)
+        result = connection.execute(text(f"""
+            WITH inserted AS (
+                INSERT INTO products ({column_list}, created_at, updated_at)
+                SELECT {column_list}, :now, :now
+                FROM staging_products
+                ON CONFLICT (id) DO NOTHING
+                RETURNING id
+            ), inserted_tags AS (
+                INSERT INTO product_tags (product_id, tag, weight, created_at)
+                SELECT st.product_id, st.tag, 1.0, :now
+                FROM staging_product_tags st
+                JOIN inserted i ON i.id = st.product_id
+            )
+            SELECT id FROM inserted
+        """), {'now': datetime.utcnow()})
+        return {row.id for row in result}
+
+    def _insert_rows(self, records: List[Dict]) -> set:
+        """通用写入（非PostgreSQL与逐行重试时使用），返回实际写入的商品ID"""
+        ids = [r['product']['id'] for r in records]
+        existing = {row.id for row in db.session.execute(
+            text("SELECT id FROM products WHERE id IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': ids}
+        )}
+        records = [r for r in records if r['product']['id'] not in existing]
+        if not records:
+            return set()
+
+        now = datetime.utcnow()
+        columns = self._product_columns(db.session.connection())
+        db.session.execute(text(f"""
+            INSERT INTO products ({', '.join(columns)}, created_at, updated_at)
+            VALUES ({', '.join(':' + column for column in columns)}, :now, :now)
+        """), [dict(zip(columns, self._product_row(r)), now=now) for r in records])
+        tag_params = [{'product_id': r['product']['id'], 'tag': tag, 'now': now}
+                      for r in records for tag in r['tags']]
+        if tag_params:
+            db.session.execute(text("""
+                INSERT INTO product_tags (product_id, tag, weight, created_at)
+                VALUES (:product_id, :tag, 1.0, :now)
+            """), tag_params)
+        return {r['product']['id'] for r in records}
+
+    def write_records(self, records: List[Dict], category_ids: set) -> Tuple[int, List[Dict]]:
+        """
+        写入一块解析结果并提交
+
+        Returns:
+            (成功数, 行错误列表)
+        """
+        errors = [r for r in records if 'error' in r]
+        valid, seen = [], set()
+        for record in records:
+            if 'error' in record:
+                continue
+            product_data = record['product']
+            if product_data['id'] in seen:
+                errors.append(self._error_record(record['line'], f"商品ID {product_data['id']} 在文件中重复", ''))
+                continue
+            seen.add(product_data['id'])
+            if category_ids and product_data['category_id'] not in category_ids:
+                # 分类表中不存在的分类ID置空，避免外键错误
+                product_data['category_id'] = None
+            valid.append(record)
+        if not valid:
+            return 0, errors
+
+        try:
+            if db.engine.dialect.name == 'postgresql':
+                inserted = self._copy_merge(valid)
+            else:
+                inserted = self._insert_rows(valid)
+            db.session.commit()
+        except Exception as e:
+            # 整批写入失败时逐行重试，只有出错的行记为失败
+            db.session.rollback()
+            logger.warning(f"批量写入失败，逐行重试: {e}")
+            inserted = set()
+            for record in valid:
+                try:
+                    with db.session.begin_nested():
+                        inserted |= self._insert_rows([record])
+                except Exception as row_error:
+                    errors.append(self._error_record(record['line'], f'写入失败: {row_error}', ''))
+            db.session.commit()
+
+        failed_lines = {error['line'] for error in errors}
+        for record in valid:
+            if record['product']['id'] not in inserted and record['line'] not in failed_lines:
+                errors.append(self._error_record(record['line'], f"商品ID {record['product']['id']} 已存在", ''))
+        return len(inserted), errors
+
+    # ------------------------------------------------------------------
+    # 导入
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _error_report_path(file_path: str) -> str:
+        directory = os.path.join(current_app.instance_path, ERROR_REPORT_DIR)
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        return os.path.join(directory, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+    def import_file(self, file_path: str, batch_size: int = 2000, workers: Optional[int] = None,
+                    start_line: int = 0, progress_callback: Optional[Callable[[Dict], None]] = None,
+                    should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """
+        流式导入商品文件
+
+        Args:
+            file_path: 商品数据文件
+            batch_size: 每块行数（解析与写入的单位，每块提交一次）
+            workers: 解析进程数，默认取配置 IMPORT_WORKERS 或CPU核数
+            start_line: 跳过该行号及之前的行（从已提交的位置继续）
+            progress_callback: 每块提交后以当前进度调用
+            should_stop: 每块提交后调用，返回True时停止导入（状态为cancelled，可从 last_line 继续）
+
+        Returns:
+            导入结果，包含成功数、错误数、错误样例与错误报告文件路径
+        """
+        start_time = time.time()
+        workers = self._resolve_workers(workers)
+        category_ids = self._load_category_ids()
+        error_report = self._error_report_path(file_path)
+
+        state = {
+            'total_count': 0,
+            'success_count': 0,
+            'error_count': 0,
+            'batch_count': 0,
+            'last_line': start_line,
+            'errors': [],
+            'error_report': None,
+            'status': 'running',
+        }
+        logger.info(f"开始流式导入商品数据: {file_path}, 每块 {batch_size} 行, {workers} 个解析进程")
+
+        with open(error_report, 'w', encoding='utf-8') as report:
+            blocks = self.read_blocks(file_path, batch_size, start_line)
+            processed = self.process_blocks(blocks, workers)
+            for records in processed:
+                success, errors = self.write_records(records, category_ids)
+                for error in errors:
+                    report.write(json.dumps(error, ensure_ascii=False) + '\n')
+                if errors and len(state['errors']) < MAX_ERROR_SAMPLES:
+                    state['errors'].extend(errors[:MAX_ERROR_SAMPLES - len(state['errors'])])
+
+                state['total_count'] += len(records)
+                state['success_count'] += success
+                state['error_count'] += len(errors)
+                state['batch_count'] += 1
+                state['last_line'] = records[-1]['line']
+                elapsed = time.time() - start_time
+                state['rows_per_second'] = round(state['total_count'] / elapsed, 1) if elapsed else None
+                if progress_callback:
+                    progress_callback(dict(state))
+                logger.info(f"已处理批次 {state['batch_count']}, 成功: {state['success_count']}, "
+                            f"错误: {state['error_count']}, 总数: {state['total_count']}")
+                if should_stop and should_stop():
+                    state['status'] = 'cancelled'
+                    logger.info(f"商品数据导入已取消，已提交到第 {state['last_line']} 行")
+                    break
+            # 提前停止时立即结束解析进程池
+            processed.close()
+
+        if state['error_count']:
+            state['error_report'] = error_report
+        else:
+            os.remove(error_report)
+        state['elapsed'] = round(time.time() - start_time, 2)
+        if state['status'] == 'running':
+            state['status'] = 'completed'
+        if state['success_count']:
+            bump_catalog_version()
+        logger.info(f"商品数据导入结束: 成功 {state['success_count']}, 错误 {state['error_count']}, "
+                    f"耗时 {state['elapsed']}s")
+        return state
@@ -1,10 +1,13 @@
 from flask import current_app
 from app import db
 from app.models import Product, Category
+from app.utils.cache import get_cache
+from app.services.product_text_search import ProductTextSearch
+from app.services.product_hydration_service import PRODUCT_FIELDS, hydrate_products
+from app.services.category_catalog_service import CategoryCatalog
 from sqlalchemy import or_, and_, func, text
 import json
 import os
-import time
 from functools import lru_cache
 
 class ProductService:
@@ -12,12 +15,12 @@ class ProductService:
     
     def __init__(self):
         self.per_page = current_app.config.get('POSTS_PER_PAGE', 20)
-        # 查询缓存
-        self._query_cache = {}
-        self._cache_ttl = 300  # 5分钟缓存
+        # 查询缓存（进程内共享；ProductService按请求创建，缓存不能放在实例上）
+        self._query_cache = get_cache('product_search', max_entries=1000,
+                                      max_bytes=64 * 1024 * 1024, ttl=300)
     
-    def get_products(self, page=1, per_page=None, category=None, search=None):
-        """获取商品列表"""
+    def get_products(self, page=1, per_page=None, category=None, search=None, fields=PRODUCT_FIELDS):
+        """获取商品列表（fields 为返回的商品字段，见 parse_fields）"""
         if per_page is None:
             per_page = self.per_page
             
@@ -37,14 +40,14 @@ class ProductService:
                 )
             )
         
-        # 分页
-        pagination = query.paginate(
+        # 分页（只查询ID，商品字段由 hydrate_products 批量组装）
+        pagination = query.with_entities(Product.id).paginate(
             page=page, 
             per_page=per_page, 
             error_out=False
         )
         
-        products = [product.to_dict() for product in pagination.items]
+        products = hydrate_products([row.id for row in pagination.items], fields=fields)
         
         return {
             'products': products,
@@ -58,84 +61,43 @@ class ProductService:
             }
         }
     
-    def get_product_by_id(self, product_id):
-        """根据ID获取商品详情"""
-        product = Product.query.filter_by(id=product_id).first()
-        return product.to_dict() if product else None
+    def get_product_by_id(self, product_id, fields=PRODUCT_FIELDS):
+        """根据ID获取商品详情（只查询所需字段）"""
+        products = hydrate_products([product_id], fields=fields)
+        return products[0] if products else None
     
     def get_product_by_product_id(self, product_id):
         """根据商品ID获取商品详情"""
         product = Product.query.filter_by(product_id=product_id).first()
         return product.to_dict() if product else None
     
-    def search_products(self, query, page=1, per_page=None):
+    def search_products(self, query, page=1, per_page=None, fields=PRODUCT_FIELDS):
         """搜索商品 - 优化版本"""
         if per_page is None:
             per_page = self.per_page
         
         # 检查缓存
-        cache_key = f"search_{query}_{page}_{per_page}"
-        current_time = time.time()
-        
-        if cache_key in self._query_cache:
-            cached_data, cache_time = self._query_cache[cache_key]
-            if current_time - cache_time < self._cache_ttl:
-                return cached_data
-        
-        # 优化查询：使用更精确的搜索条件
-        search_term = f"%{query}%"
-        
-        # 使用原生SQL优化查询性能
-        sql_query = text("""
-            SELECT p.id, p.name, p.description, p.price, p.category_id, 
-                   p.image_url, p.tags, p.embedding, p.created_at, p.updated_at,
-                   c.name as category_name
-            FROM products p
-            LEFT JOIN categories c ON p.category_id = c.id
-            WHERE p.name LIKE :search_term 
-               OR p.description LIKE :search_term
-               OR p.tags LIKE :search_term
-            ORDER BY p.id
-            LIMIT :limit OFFSET :offset
-        """)
+        cache_key = f"search_{query}_{page}_{per_page}_{','.join(fields)}"
+        cached_data = self._query_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
         offset = (page - 1) * per_page
+        total_is_estimate = False
         
-        # 执行查询
-        result = db.session.execute(sql_query, {
-            'search_term': search_term,
-            'limit': per_page,
-            'offset': offset
-        })
-        
-        products = []
-        for row in result:
-            product_data = {
-                'id': row.id,
-                'name': row.name,
-                'description': row.description,
-                'price': float(row.price) if row.price else None,
-                'category_id': row.category_id,
-                'category_name': row.category_name,
-                'image_url': row.image_url,
-                'tags': json.loads(row.tags) if row.tags else [],
-                'embedding': json.loads(row.embedding) if row.embedding else None,
-                'created_at': row.created_at.isoformat() if row.created_at else None,
-                'updated_at': row.updated_at.isoformat() if row.updated_at else None
-            }
-            products.append(product_data)
+        # 全文检索：索引匹配并按相关度排序，总数超过上限时为估计值
+        ranked = None
+        if ProductTextSearch.available():
+            ranked = ProductTextSearch().search(query, limit=per_page, offset=offset)
         
-        # 获取总数（优化版本）
-        count_query = text("""
-            SELECT COUNT(*) as total
-            FROM products p
-            WHERE p.name LIKE :search_term 
-               OR p.description LIKE :search_term
-               OR p.tags LIKE :search_term
-        """)
+        if ranked is not None:
+            hits, total, total_is_estimate = ranked
+            product_ids = [product_id for product_id, _ in hits]
+        else:
+            product_ids, total = self._like_search(query, per_page, offset)
         
-        total_result = db.session.execute(count_query, {'search_term': search_term})
-        total = total_result.fetchone().total
+        # 只查询请求的字段（特征向量需显式请求）
+        products = hydrate_products(product_ids, fields=fields)
         
         # 计算分页信息
         pages = (total + per_page - 1) // per_page
@@ -148,25 +110,54 @@ class ProductService:
                 'pages': pages,
                 'per_page': per_page,
                 'total': total,
+                'total_is_estimate': total_is_estimate,
                 'has_next': page < pages,
                 'has_prev': page > 1
             }
         }
         
         # 缓存结果
-        self._query_cache[cache_key] = (result_data, current_time)
+        self._query_cache.set(cache_key, result_data)
         
         return result_data
     
+    @staticmethod
+    def _like_search(query, limit, offset):
+        """LIKE匹配（未启用全文检索时使用），返回 (商品ID列表, 总数)"""
+        search_term = f"%{query}%"
+        
+        sql_query = text("""
+            SELECT p.id
+            FROM products p
+            WHERE p.name LIKE :search_term 
+               OR p.description LIKE :search_term
+               OR p.tags LIKE :search_term
+            ORDER BY p.id
+            LIMIT :limit OFFSET :offset
+        """)
+        result = db.session.execute(sql_query, {
+            'search_term': search_term,
+            'limit': limit,
+            'offset': offset
+        }).fetchall()
+        
+        count_query = text("""
+            SELECT COUNT(*) as total
+            FROM products p
+            WHERE p.name LIKE :search_term 
+               OR p.description LIKE :search_term
+               OR p.tags LIKE :search_term
+        """)
+        total = db.session.execute(count_query, {'search_term': search_term}).fetchone().total
+        return [row.id for row in result], total
+    
     def get_categories(self):
         """获取所有分类"""
-        categories = Category.query.all()
-        return [category.to_dict() for category in categories]
+        return CategoryCatalog().categories()
     
     def get_category_by_id(self, category_id):
         """根据ID获取分类"""
-        category = Category.query.filter_by(id=category_id).first()
-        return category.to_dict() if category else None
+        return CategoryCatalog().get_category(category_id)
     
     def create_product(self, product_data):
         """创建新商品"""
@@ -212,20 +203,20 @@ class ProductService:
         db.session.commit()
         return True
     
-    def get_products_by_category(self, category_id, page=1, per_page=None):
+    def get_products_by_category(self, category_id, page=1, per_page=None, fields=PRODUCT_FIELDS):
         """根据分类获取商品"""
         if per_page is None:
             per_page = self.per_page
             
         products_query = Product.query.filter_by(category_id=category_id)
         
-        pagination = products_query.paginate(
+        pagination = products_query.with_entities(Product.id).paginate(
             page=page, 
             per_page=per_page, 
             error_out=False
         )
         
-        products = [product.to_dict() for product in pagination.items]
+        products = hydrate_products([row.id for row in pagination.items], fields=fields)
         
         return {
             'products': products,
@@ -0,0 +1,145 @@
+"""
+商品全文检索服务
+PostgreSQL 上使用 products.search_vector（jieba分词词串生成的tsvector，GIN索引）
+做索引匹配与相关度排序，总数在超过上限时改用查询计划估计值；
+其他数据库或尚未执行迁移时由调用方降级为 LIKE 匹配
+"""
+
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import inspect, text
+
+from app import db
+from app.utils.search_tokens import build_tsquery
+
+logger = logging.getLogger(__name__)
+
+# 参与排序的候选匹配：GIN索引不提供相关度顺序，先取名称中命中全部查询词的商品（权重A，排序最靠前），
+# 不足 :candidates 条时再取其余匹配补足；匹配数不超过 :candidates 时即为全部匹配
+CANDIDATES_SQL = """
+    name_matches AS (
+        SELECT {columns}, search_vector
+        FROM products
+        WHERE search_vector @@ to_tsquery('simple', :name_tsquery)
+        LIMIT :candidates
+    ),
+    matches AS (
+        SELECT * FROM name_matches
+        UNION ALL (
+            SELECT {columns}, search_vector
+            FROM products
+            WHERE search_vector @@ to_tsquery('simple', :tsquery)
+              AND NOT search_vector @@ to_tsquery('simple', :name_tsquery)
+            LIMIT GREATEST(:candidates - (SELECT COUNT(*) FROM name_matches), 0)
+        )
+    )
+"""
+
+
+class ProductTextSearch:
+    """商品全文检索"""
+
+    # 各数据库URL是否具备 search_vector 列（进程内缓存，迁移后需重启生效）
+    _availability: Dict[str, bool] = {}
+
+    def __init__(self):
+        self.rank_candidates = current_app.config.get('SEARCH_RANK_CANDIDATES', 5000)
+        self.exact_count_limit = current_app.config.get('SEARCH_EXACT_COUNT_LIMIT', 1000)
+
+    @classmethod
+    def available(cls) -> bool:
+        """当前数据库是否可以使用全文检索"""
+        if not current_app.config.get('FULL_TEXT_SEARCH_ENABLED', True):
+            return False
+        if db.engine.dialect.name != 'postgresql':
+            return False
+        url = str(db.engine.url)
+        if url not in cls._availability:
+            try:
+                columns = {column['name'] for column in inspect(db.engine).get_columns('products')}
+                cls._availability[url] = 'search_vector' in columns
+            except Exception as e:
+                logger.warning(f"检查全文检索列失败: {e}")
+                return False
+            if not cls._availability[url]:
+                logger.warning("products.search_vector 列不存在，搜索使用LIKE匹配（执行 flask migrate-search-index 后启用全文检索）")
+        return cls._availability[url]
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Optional[Tuple[List[Tuple[int, float]], int, bool]]:
+        """
+        按相关度检索商品
+
+        匹配数很多时只对 rank_candidates 条候选匹配计算相关度，避免宽泛查询对全部匹配行排序。
+        候选优先取名称命中的商品，因此匹配数超过候选数时排序是近似的：名称命中的商品本身
+        超过候选数，或名称未命中的商品因标签、描述多次命中而得分更高时，可能漏掉个别结果
+
+        Returns:
+            ([(商品ID, 相关度)], 总数, 总数是否为估计值)；查询中没有可检索的词时返回None
+        """
+        tsquery = build_tsquery(query)
+        if tsquery is None:
+            return None
+        rows = db.session.execute(text(f"""
+            WITH {CANDIDATES_SQL.format(columns='id')}
+            SELECT id, ts_rank_cd(search_vector, to_tsquery('simple', :tsquery)) AS rank
+            FROM matches
+            ORDER BY rank DESC, id
+            LIMIT :limit OFFSET :offset
+        """), {
+            'tsquery': tsquery,
+            'name_tsquery': build_tsquery(query, weights='A'),
+            'candidates': max(self.rank_candidates, offset + limit),
+            'limit': limit,
+            'offset': offset
+        }).fetchall()
+        total, is_estimate = self.count(tsquery)
+        return [(row.id, float(row.rank)) for row in rows], total, is_estimate
+
+    def count(self, tsquery: str) -> Tuple[int, bool]:
+        """
+        匹配总数：不超过 exact_count_limit 时精确计数，否则取查询计划的行数估计
+
+        Returns:
+            (总数, 是否为估计值)
+        """
+        exact = db.session.execute(text("""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM products
+                WHERE search_vector @@ to_tsquery('simple', :tsquery)
+                LIMIT :cap
+            ) AS capped
+        """), {'tsquery': tsquery, 'cap': self.exact_count_limit + 1}).scalar() or 0
+        if exact <= self.exact_count_limit:
+            return int(exact), False
+
+        plan = db.session.execute(text("""
+            EXPLAIN (FORMAT JSON)
+            SELECT 1 FROM products WHERE search_vector @@ to_tsquery('simple', :tsquery)
+        """), {'tsquery': tsquery}).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        return max(estimate, int(exact)), True
+
+    def suggest_names(self, query: str, limit: int = 5) -> List[str]:
+        """按相关度返回匹配的商品名称（去重，候选方式同 search）"""
+        tsquery = build_tsquery(query)
+        if tsquery is None:
+            return []
+        rows = db.session.execute(text(f"""
+            WITH {CANDIDATES_SQL.format(columns='name')}
+            SELECT name, MAX(ts_rank_cd(search_vector, to_tsquery('simple', :tsquery))) AS rank
+            FROM matches
+            GROUP BY name
+            ORDER BY rank DESC, name
+            LIMIT :limit
+        """), {
+            'tsquery': tsquery,
+            'name_tsquery': build_tsquery(query, weights='A'),
+            'candidates': self.rank_candidates,
+            'limit': limit
+        }).fetchall()
+        return [row.name for row in rows]
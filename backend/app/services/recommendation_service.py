@@ -4,14 +4,12 @@
 """
 
 import os
-import json
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 from gensim.models import KeyedVectors
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine, text
 import logging
-import hashlib
 from functools import lru_cache
 import time
 
@@ -19,6 +17,12 @@ from app import db
 from app.models import Product, ProductTag, TagVector, Category
 from app.utils.text_processing import TextProcessor
 from app.utils.hybrid_text_processing import HybridVectorTextProcessor
+from app.utils.pruned_word_vectors import PrunedWordVectors
+from app.utils.vector_codec import to_pgvector_text
+from app.utils.cache import clear_caches
+from app.utils.result_cache import TieredCache
+from app.services.product_embedding_matrix import ProductEmbeddingMatrix
+from app.services.vector_build_service import VectorBuildService
 
 logger = logging.getLogger(__name__)
 
@@ -38,15 +42,17 @@ class RecommendationService:
             # 从backend/app/services向上三级到项目根目录
             project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
             self.model_path = os.path.join(project_root, 'model', 'Tencent_AILab_ChineseEmbedding.bin')
+            # 裁剪后的词表（build_pruned_vocab.py 生成），存在时优先加载
+            self.pruned_model_path = os.environ.get('WORD_VECTOR_PRUNED_PATH') or \
+                os.path.join(project_root, 'model', 'pruned_vocab')
             self.word_vectors = None
             self.text_processor = TextProcessor()
             self.hybrid_processor = None  # 将在词向量加载后初始化
             self.vector_dim = 200  # Tencent词向量维度
             
-            # 查询结果缓存
-            self.search_cache = {}
-            self.cache_max_size = 100
-            self.cache_ttl = 300  # 5分钟缓存时间
+            # 查询结果缓存（进程内LRU + Redis两级缓存，随商品目录版本失效）
+            self.search_cache = TieredCache('semantic_search', max_entries=1000,
+                                            max_bytes=64 * 1024 * 1024, ttl=300)
             
             # 在初始化时加载词向量模型
             logger.info("初始化推荐服务，正在加载词向量模型...")
@@ -54,21 +60,30 @@ class RecommendationService:
             
             self._initialized = True
         
-    def load_word_vectors(self) -> bool:
-        """加载词向量模型"""
+    def load_word_vectors(self, force: bool = False) -> bool:
+        """加载词向量模型（已加载时直接返回，force=True 强制重新加载）"""
+        if self.word_vectors is not None and not force:
+            return True
         try:
-            if not os.path.exists(self.model_path):
-                logger.error(f"词向量模型文件不存在: {self.model_path}")
-                return False
-                
-            logger.info("正在加载Tencent词向量模型...")
-            self.word_vectors = KeyedVectors.load(self.model_path, mmap='r')
+            if PrunedWordVectors.exists(self.pruned_model_path):
+                logger.info(f"正在加载裁剪词向量: {self.pruned_model_path}")
+                self.word_vectors = PrunedWordVectors(self.pruned_model_path)
+            else:
+                if not os.path.exists(self.model_path):
+                    logger.error(f"词向量模型文件不存在: {self.model_path}")
+                    return False
+                    
+                logger.info("正在加载Tencent词向量模型...")
+                self.word_vectors = KeyedVectors.load(self.model_path, mmap='r')
             logger.info(f"词向量模型加载成功，词汇量: {len(self.word_vectors)}")
             
             # 初始化混合分词器
             self.hybrid_processor = HybridVectorTextProcessor(self.word_vectors)
             logger.info("混合分词器初始化完成")
             
+            # 词向量变化后已缓存的查询向量失效
+            clear_caches('query_vectors')
+            
             return True
             
         except Exception as e:
@@ -76,41 +91,19 @@ class RecommendationService:
             return False
     
     def _get_cache_key(self, query: str, top_k: int) -> str:
-        """生成缓存键"""
-        return hashlib.md5(f"{query}_{top_k}".encode()).hexdigest()
+        """生成缓存键（带商品目录版本）"""
+        return self.search_cache.key((query, top_k))
     
     def _get_from_cache(self, cache_key: str) -> Optional[List[Dict]]:
         """从缓存获取结果"""
-        if cache_key in self.search_cache:
-            cached_data = self.search_cache[cache_key]
-            if time.time() - cached_data['timestamp'] < self.cache_ttl:
-                logger.debug(f"从缓存获取查询结果: {cache_key}")
-                return cached_data['results']
-            else:
-                # 缓存过期，删除
-                del self.search_cache[cache_key]
-        return None
+        results = self.search_cache.get(cache_key)
+        if results is not None:
+            logger.debug(f"从缓存获取查询结果: {cache_key}")
+        return results
     
     def _save_to_cache(self, cache_key: str, results: List[Dict]):
         """保存结果到缓存"""
-        # 清理过期缓存
-        current_time = time.time()
-        expired_keys = [k for k, v in self.search_cache.items() 
-                       if current_time - v['timestamp'] > self.cache_ttl]
-        for key in expired_keys:
-            del self.search_cache[key]
-        
-        # 限制缓存大小
-        if len(self.search_cache) >= self.cache_max_size:
-            # 删除最旧的缓存
-            oldest_key = min(self.search_cache.keys(), 
-                           key=lambda k: self.search_cache[k]['timestamp'])
-            del self.search_cache[oldest_key]
-        
-        self.search_cache[cache_key] = {
-            'results': results,
-            'timestamp': current_time
-        }
+        self.search_cache.set(cache_key, results)
         logger.debug(f"保存查询结果到缓存: {cache_key}")
     
     @lru_cache(maxsize=10000)
@@ -164,63 +157,10 @@ class RecommendationService:
             logger.error(f"计算标签向量失败: {str(e)}")
             return None
     
-    def precompute_tag_vectors(self) -> Dict[str, int]:
-        """预计算所有标签的向量"""
+    def precompute_tag_vectors(self, workers: Optional[int] = None, chunk_size: int = 5000) -> Dict[str, int]:
+        """预计算所有标签的向量（反连接找出缺失标签，进程池分词，批量写入）"""
         logger.info("开始预计算标签向量...")
-        
-        if not self.load_word_vectors():
-            return {"success": 0, "failed": 0, "error": "词向量模型加载失败"}
-        
-        # 获取所有唯一的标签
-        unique_tags = db.session.query(ProductTag.tag).distinct().all()
-        unique_tags = [tag[0] for tag in unique_tags]
-        
-        logger.info(f"发现 {len(unique_tags)} 个唯一标签")
-        
-        success_count = 0
-        failed_count = 0
-        
-        for tag in unique_tags:
-            try:
-                # 检查是否已经计算过
-                existing_vector = TagVector.query.filter_by(tag=tag).first()
-                if existing_vector:
-                    logger.debug(f"标签 '{tag}' 的向量已存在，跳过")
-                    continue
-                
-                # 计算标签向量
-                tag_vector = self.calculate_tag_vector(tag)
-                if tag_vector is not None:
-                    # 保存到数据库
-                    tag_vector_obj = TagVector(
-                        tag=tag,
-                        vector=json.dumps(tag_vector.tolist())
-                    )
-                    db.session.add(tag_vector_obj)
-                    success_count += 1
-                    
-                    if success_count % 100 == 0:
-                        db.session.commit()
-                        logger.info(f"已处理 {success_count} 个标签向量")
-                        
-                else:
-                    failed_count += 1
-                    logger.debug(f"标签 '{tag}' 向量计算失败")
-                    
-            except Exception as e:
-                failed_count += 1
-                logger.error(f"处理标签 '{tag}' 时出错: {str(e)}")
-        
-        # 提交剩余的更改
-        try:
-            db.session.commit()
-            logger.info(f"标签向量预计算完成: 成功 {success_count}, 失败 {failed_count}")
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"提交标签向量时出错: {str(e)}")
-            return {"success": 0, "failed": 0, "error": str(e)}
-        
-        return {"success": success_count, "failed": failed_count}
+        return VectorBuildService().build_tag_vectors(workers=workers, chunk_size=chunk_size)
     
     def calculate_product_vector(self, product_id: int) -> Optional[np.ndarray]:
         """计算商品的特征向量（基于标签向量的加权平均）"""
@@ -241,7 +181,7 @@ class RecommendationService:
             for product_tag in product_tags:
                 tag_vector_obj = TagVector.query.filter_by(tag=product_tag.tag).first()
                 if tag_vector_obj:
-                    vector = np.array(json.loads(tag_vector_obj.vector))
+                    vector = tag_vector_obj.get_vector()
                     tag_vectors.append(vector)
                     weights.append(float(product_tag.weight) if product_tag.weight else 1.0)
             
@@ -265,53 +205,13 @@ class RecommendationService:
             logger.error(f"计算商品 {product_id} 向量失败: {str(e)}")
             return None
     
-    def precompute_product_vectors(self) -> Dict[str, int]:
-        """预计算所有商品的特征向量"""
+    def precompute_product_vectors(self, chunk_size: int = 2000, only_missing: bool = True,
+                                   resume: bool = False) -> Dict[str, int]:
+        """预计算所有商品的特征向量（按批稀疏矩阵乘法，支持断点续算）"""
         logger.info("开始预计算商品特征向量...")
-        
-        # 获取所有商品
-        products = Product.query.all()
-        logger.info(f"发现 {len(products)} 个商品")
-        
-        success_count = 0
-        failed_count = 0
-        
-        for product in products:
-            try:
-                # 检查是否已经计算过
-                if product.embedding:
-                    logger.debug(f"商品 {product.id} 的向量已存在，跳过")
-                    continue
-                
-                # 计算商品向量
-                product_vector = self.calculate_product_vector(product.id)
-                if product_vector is not None:
-                    # 保存到数据库
-                    product.embedding = json.dumps(product_vector.tolist())
-                    success_count += 1
-                    
-                    if success_count % 100 == 0:
-                        db.session.commit()
-                        logger.info(f"已处理 {success_count} 个商品向量")
-                        
-                else:
-                    failed_count += 1
-                    logger.debug(f"商品 {product.id} 向量计算失败")
-                    
-            except Exception as e:
-                failed_count += 1
-                logger.error(f"处理商品 {product.id} 时出错: {str(e)}")
-        
-        # 提交剩余的更改
-        try:
-            db.session.commit()
-            logger.info(f"商品向量预计算完成: 成功 {success_count}, 失败 {failed_count}")
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"提交商品向量时出错: {str(e)}")
-            return {"success": 0, "failed": 0, "error": str(e)}
-        
-        return {"success": success_count, "failed": failed_count}
+        return VectorBuildService().build_product_vectors(
+            chunk_size=chunk_size, only_missing=only_missing, resume=resume
+        )
     
     def calculate_similarity(self, vector1: np.ndarray, vector2: np.ndarray) -> float:
         """计算两个向量的余弦相似度"""
@@ -334,39 +234,25 @@ class RecommendationService:
     def find_similar_products(self, product_id: int, top_k: int = 10) -> List[Dict]:
         """找到与指定商品相似的商品"""
         try:
-            # 获取目标商品的向量
-            target_product = Product.query.get(product_id)
-            if not target_product or not target_product.embedding:
+            # 与其他相似度计算一致，使用 embedding_bin/embedding 构建的进程内矩阵
+            matrix = ProductEmbeddingMatrix().get()
+            if product_id not in matrix:
                 logger.warning(f"商品 {product_id} 没有特征向量")
                 return []
-            
-            target_vector = np.array(json.loads(target_product.embedding))
-            
-            # 获取所有有向量的商品
-            products_with_vectors = Product.query.filter(
-                Product.embedding.isnot(None),
-                Product.id != product_id
-            ).all()
-            
-            similarities = []
-            for product in products_with_vectors:
-                try:
-                    product_vector = np.array(json.loads(product.embedding))
-                    similarity = self.calculate_similarity(target_vector, product_vector)
-                    
-                    similarities.append({
-                        'product_id': product.id,
-                        'product_name': product.name,
-                        'similarity': similarity
-                    })
-                except Exception as e:
-                    logger.error(f"计算商品 {product.id} 相似度失败: {str(e)}")
-                    continue
-            
-            # 按相似度排序
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            return similarities[:top_k]
+            hits = matrix.top_k(matrix.get_vector(product_id), top_k, exclude_ids=(product_id,))
+
+            names = dict(db.session.query(Product.id, Product.name).filter(
+                Product.id.in_([hit_id for hit_id, _ in hits])
+            ).all()) if hits else {}
+
+            return [
+                {
+                    'product_id': hit_id,
+                    'product_name': names.get(hit_id),
+                    'similarity': similarity
+                }
+                for hit_id, similarity in hits
+            ]
             
         except Exception as e:
             logger.error(f"查找相似商品失败: {str(e)}")
@@ -421,7 +307,7 @@ class RecommendationService:
             query_vector = np.mean(query_vectors, axis=0)
             
             # 转换为PostgreSQL vector格式
-            vector_str = '[' + ','.join(map(str, query_vector)) + ']'
+            vector_str = to_pgvector_text(query_vector)
             
             # 使用pgvector进行全量向量相似度搜索
             from sqlalchemy import text
@@ -524,7 +410,7 @@ class RecommendationService:
         """获取推荐算法统计信息"""
         try:
             total_products = Product.query.count()
-            products_with_vectors = Product.query.filter(Product.embedding.isnot(None)).count()
+            products_with_vectors = Product.query.filter(Product.vector_filter()).count()
             total_tags = ProductTag.query.count()
             unique_tags = db.session.query(ProductTag.tag).distinct().count()
             tag_vectors_count = TagVector.query.count()
@@ -0,0 +1,456 @@
+"""
+相似商品物化服务
+按批用矩阵乘积计算每个商品的top-N相似商品，写入 recommendation_cache
+（每个商品一行：相似商品ID数组 + 相似度数组），查询时按 cache_key 一次索引查找即可返回；
+商品或向量变更后只重算受影响的列表
+"""
+
+import json
+import time
+import threading
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, inspect, text
+
+from app import db
+from app.utils.embedding_matrix import EmbeddingMatrix
+from app.utils.vector_codec import decode_vector
+
+logger = logging.getLogger(__name__)
+
+CACHE_TYPE = 'similar_products'
+META_CACHE_TYPE = 'similar_products_meta'
+META_CACHE_KEY = 'similar_products:meta'
+
+# 变更商品占比超过该值时直接全量重算
+FULL_REFRESH_RATIO = 0.2
+# 相似度保留的小数位数（增量合并时与列表最低分比较，精度过低会在边界处漏掉候选）
+SCORE_DECIMALS = 6
+# 计算块中每个相似度元素占用的字节：float32分数、取负的临时数组、argpartition的int64行号
+BYTES_PER_SCORE = 16
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    """SQLite的文本查询返回字符串时间，统一转换为datetime"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def cache_key(product_id: int) -> str:
+    """商品相似列表在 recommendation_cache 中的键"""
+    return f'{CACHE_TYPE}:{product_id}'
+
+
+class SimilarProductMaterializer:
+    """相似商品列表物化服务"""
+
+    # 最近一次物化进度在进程内共享，供状态接口查询
+    _progress: Dict = {'status': 'idle'}
+    # 同一进程内同时只运行一个物化任务
+    _run_lock = threading.Lock()
+    # 各数据库URL的商品表是否有 product_vector 列（进程内缓存，迁移后需重启生效）
+    _pgvector_columns: Dict[str, bool] = {}
+
+    def __init__(self, dimension: int = 200, load_batch_size: int = 5000, compute_batch_size: int = 512):
+        self.dimension = dimension
+        self.load_batch_size = load_batch_size
+        self.compute_batch_size = compute_batch_size
+
+    @staticmethod
+    def _config(key: str, default):
+        return current_app.config.get(key, default) if has_app_context() else default
+
+    @property
+    def default_top_n(self) -> int:
+        return self._config('SIMILAR_MATERIALIZE_TOP_N', 60)
+
+    @property
+    def ttl(self) -> timedelta:
+        return timedelta(days=self._config('SIMILAR_MATERIALIZE_TTL_DAYS', 7))
+
+    def chunk_size(self, columns: int) -> int:
+        """每块计算的查询数：相似度块（块行数 × columns）不超过 SIMILAR_MATERIALIZE_BLOCK_MB，且不超过 compute_batch_size"""
+        budget = self._config('SIMILAR_MATERIALIZE_BLOCK_MB', 256) * 1024 * 1024
+        return int(max(1, min(self.compute_batch_size, budget // (BYTES_PER_SCORE * max(columns, 1)))))
+
+    @classmethod
+    def uses_product_vector(cls) -> bool:
+        """
+        是否从 product_vector 列读取向量：实时查询（ProductVectorIndex 与pgvector检索）只使用该列，
+        有该列时物化使用同一列，两条路径的相似度一致；没有该列的数据库读取 embedding_bin / embedding
+        """
+        url = str(db.engine.url)
+        if url not in cls._pgvector_columns:
+            columns = inspect(db.session.connection()).get_columns('products')
+            cls._pgvector_columns[url] = any(column['name'] == 'product_vector' for column in columns)
+        return cls._pgvector_columns[url]
+
+    @classmethod
+    def get_progress(cls) -> Dict:
+        return dict(cls._progress)
+
+    @classmethod
+    def _set_progress(cls, state: Dict):
+        cls._progress = dict(state)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def load_matrix(self, synced_until: Optional[datetime] = None
+                    ) -> Tuple[EmbeddingMatrix, np.ndarray, Optional[datetime]]:
+        """
+        按主键分页读取全部商品向量（与实时查询同一列，见 uses_product_vector），逐页写入归一化矩阵（不保留中间副本）
+
+        Args:
+            synced_until: 上次物化的同步位置，updated_at 晚于它的商品记为变更
+
+        Returns:
+            (向量矩阵, 变更商品ID数组, 最大updated_at)
+        """
+        pgvector = self.uses_product_vector()
+        if pgvector:
+            columns, condition = 'product_vector AS vector', 'product_vector IS NOT NULL'
+        else:
+            columns, condition = 'embedding_bin, embedding', '(embedding_bin IS NOT NULL OR embedding IS NOT NULL)'
+        total = db.session.execute(text(f"SELECT COUNT(*) FROM products WHERE {condition}")).scalar() or 0
+        matrix = EmbeddingMatrix(self.dimension, capacity=max(int(total), 1))
+        sql = text(f"""
+            SELECT id, {columns}, updated_at
+            FROM products
+            WHERE {condition} AND id > :after_id
+            ORDER BY id
+            LIMIT :limit
+        """)
+        changed = []
+        max_updated = None
+        after_id = 0
+        while True:
+            rows = db.session.execute(sql, {'after_id': after_id, 'limit': self.load_batch_size}).fetchall()
+            if not rows:
+                break
+            block = np.empty((len(rows), self.dimension), dtype=np.float32)
+            block_ids = []
+            for row in rows:
+                try:
+                    if pgvector:
+                        raw = row.vector
+                    else:
+                        raw = row.embedding_bin if row.embedding_bin else row.embedding
+                    block[len(block_ids)] = decode_vector(raw, self.dimension)
+                except (ValueError, TypeError):
+                    continue
+                block_ids.append(row.id)
+                updated_at = _as_datetime(row.updated_at)
+                if updated_at is not None:
+                    if synced_until is None or updated_at > synced_until:
+                        changed.append(row.id)
+                    max_updated = updated_at if max_updated is None else max(max_updated, updated_at)
+            matrix.upsert(block_ids, block[:len(block_ids)])
+            after_id = rows[-1].id
+        return matrix, np.asarray(changed, dtype=np.int64), max_updated
+
+    @staticmethod
+    def load_meta() -> Optional[Dict]:
+        """读取最近一次物化的元信息（同步位置、top_n等）"""
+        row = db.session.execute(text("""
+            SELECT recommendations FROM recommendation_cache WHERE cache_key = :key
+        """), {'key': META_CACHE_KEY}).fetchone()
+        return json.loads(row.recommendations) if row else None
+
+    def iter_lists(self, with_lists: bool = True) -> Iterator[List[Tuple[int, Optional[List[int]], Optional[List[float]]]]]:
+        """
+        按主键分页读取已物化的相似列表，每次返回一页，不在内存中保留全部列表
+
+        Args:
+            with_lists: 为False时只读取商品ID（列表与相似度为None）
+        """
+        columns = 'id, target_id, recommendations, similarity_scores' if with_lists else 'id, target_id'
+        sql = text(f"""
+            SELECT {columns}
+            FROM recommendation_cache
+            WHERE cache_type = :cache_type AND id > :after_id
+            ORDER BY id
+            LIMIT :limit
+        """)
+        after_id = 0
+        while True:
+            rows = db.session.execute(sql, {'cache_type': CACHE_TYPE, 'after_id': after_id,
+                                            'limit': self.load_batch_size}).fetchall()
+            if not rows:
+                return
+            after_id = rows[-1].id
+            if with_lists:
+                yield [(int(row.target_id), json.loads(row.recommendations), json.loads(row.similarity_scores or '[]'))
+                       for row in rows]
+            else:
+                yield [(int(row.target_id), None, None) for row in rows]
+
+    def get_similar(self, product_id: int) -> Optional[Dict]:
+        """
+        读取商品的物化相似列表（按 cache_key 一次索引查找）
+
+        Returns:
+            {'ids', 'scores', 'materialized_at', 'expires_at', 'stale'}，未物化时返回None
+        """
+        row = db.session.execute(text("""
+            SELECT rc.recommendations, rc.similarity_scores, rc.created_at, rc.expires_at,
+                   p.updated_at AS product_updated_at
+            FROM recommendation_cache rc
+            LEFT JOIN products p ON p.id = :product_id
+            WHERE rc.cache_key = :key
+        """), {'key': cache_key(product_id), 'product_id': product_id}).fetchone()
+        if row is None:
+            return None
+        created_at = _as_datetime(row.created_at)
+        expires_at = _as_datetime(row.expires_at)
+        product_updated_at = _as_datetime(row.product_updated_at)
+        stale = bool(
+            (expires_at is not None and expires_at < datetime.utcnow())
+            or (product_updated_at is not None and created_at is not None and product_updated_at > created_at)
+        )
+        return {
+            'ids': json.loads(row.recommendations),
+            'scores': json.loads(row.similarity_scores or '[]'),
+            'materialized_at': created_at,
+            'expires_at': expires_at,
+            'stale': stale
+        }
+
+    # ------------------------------------------------------------------
+    # 计算与写入
+    # ------------------------------------------------------------------
+
+    def compute_lists(self, matrix: EmbeddingMatrix, product_ids: np.ndarray,
+                      top_n: int) -> Dict[int, Tuple[List[int], List[float]]]:
+        """批量计算指定商品的top-N相似列表（排除自身），每块查询数按商品总数确定"""
+        queries = matrix.vectors[matrix.rows(product_ids)]
+        neighbour_ids, neighbour_scores = matrix.top_k_batch(queries, top_n + 1,
+                                                             chunk_size=self.chunk_size(len(matrix)))
+        lists = {}
+        for pid, ids, scores in zip(product_ids, neighbour_ids, neighbour_scores):
+            keep = ids != pid
+            lists[int(pid)] = (ids[keep][:top_n].tolist(),
+                               np.round(scores[keep][:top_n].astype(np.float64), SCORE_DECIMALS).tolist())
+        return lists
+
+    def merge_changed(self, matrix: EmbeddingMatrix, stored: List[Tuple[int, List[int], List[float]]],
+                      changed_ids: np.ndarray, top_n: int) -> Dict[int, Tuple[List[int], List[float]]]:
+        """
+        将变更商品合并进未受影响商品的已有列表（一页 [(商品ID, 相似ID列表, 相似度列表)]）：
+        只有与变更商品的相似度超过列表中最低分（或列表未满）时才需要更新
+        """
+        merged = {}
+        if not stored or not len(changed_ids):
+            return merged
+        changed_vectors = matrix.vectors[matrix.rows(changed_ids)]
+        chunk_size = self.chunk_size(len(changed_ids))
+        for start in range(0, len(stored), chunk_size):
+            chunk = stored[start:start + chunk_size]
+            block = matrix.vectors[matrix.rows(pid for pid, _, _ in chunk)] @ changed_vectors.T
+            floors = np.array([scores[-1] if len(scores) >= top_n else -np.inf for _, _, scores in chunk],
+                              dtype=np.float32)
+            # 已存分数经过舍入，按舍入误差放宽比较，避免边界候选被漏掉
+            hits = block >= floors[:, None] - 0.5 * 10 ** -SCORE_DECIMALS
+            for row in np.nonzero(hits.any(axis=1))[0]:
+                pid, ids, scores = chunk[row]
+                candidates = list(zip(scores, ids))
+                candidates.extend((round(float(block[row, col]), SCORE_DECIMALS), int(changed_ids[col]))
+                                  for col in np.nonzero(hits[row])[0])
+                candidates.sort(key=lambda item: (-item[0], item[1]))
+                candidates = candidates[:top_n]
+                merged[pid] = ([pid_ for _, pid_ in candidates], [score for score, _ in candidates])
+        return merged
+
+    def _write_lists(self, lists: Dict[int, Tuple[List[int], List[float]]]):
+        """写入（覆盖）相似列表"""
+        if not lists:
+            return
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        params = [{
+            'cache_key': cache_key(pid),
+            'cache_type': CACHE_TYPE,
+            'target_id': str(pid),
+            'recommendations': json.dumps(ids, separators=(',', ':')),
+            'similarity_scores': json.dumps(scores, separators=(',', ':')),
+            'expires_at': expires_at,
+            'created_at': now
+        } for pid, (ids, scores) in lists.items()]
+        db.session.execute(text("""
+            INSERT INTO recommendation_cache
+                (cache_key, cache_type, target_id, recommendations, similarity_scores, expires_at, created_at)
+            VALUES (:cache_key, :cache_type, :target_id, :recommendations, :similarity_scores, :expires_at, :created_at)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                recommendations = excluded.recommendations,
+                similarity_scores = excluded.similarity_scores,
+                expires_at = excluded.expires_at,
+                created_at = excluded.created_at
+        """), params)
+
+    @staticmethod
+    def _delete_lists(product_ids: List[int]):
+        """删除已无向量（或已删除）商品的相似列表"""
+        if not product_ids:
+            return
+        sql = text("DELETE FROM recommendation_cache WHERE cache_key IN :keys") \
+            .bindparams(bindparam('keys', expanding=True))
+        for start in range(0, len(product_ids), 1000):
+            db.session.execute(sql, {'keys': [cache_key(pid) for pid in product_ids[start:start + 1000]]})
+
+    def _save_meta(self, meta: Dict):
+        now = datetime.utcnow()
+        db.session.execute(text("""
+            INSERT INTO recommendation_cache
+                (cache_key, cache_type, target_id, recommendations, expires_at, created_at)
+            VALUES (:cache_key, :cache_type, 'meta', :meta, :expires_at, :created_at)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                recommendations = excluded.recommendations,
+                expires_at = excluded.expires_at,
+                created_at = excluded.created_at
+        """), {'cache_key': META_CACHE_KEY, 'cache_type': META_CACHE_TYPE,
+               'meta': json.dumps(meta, ensure_ascii=False, default=str),
+               'expires_at': now + self.ttl, 'created_at': now})
+
+    # ------------------------------------------------------------------
+    # 物化任务
+    # ------------------------------------------------------------------
+
+    def materialize(self, full: bool = False, top_n: Optional[int] = None, batch_size: int = 2000,
+                    progress_callback: Optional[Callable[[Dict], None]] = None,
+                    should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """
+        物化全部商品的相似列表
+
+        增量模式下只重算：新增或向量变更的商品、列表中含有变更/删除商品的商品；
+        其余商品仅在变更商品进入其top-N时合并更新
+
+        Args:
+            full: 是否全量重算
+            top_n: 每个商品保存的相似商品数，默认 SIMILAR_MATERIALIZE_TOP_N
+            batch_size: 每批计算并提交的商品数
+            progress_callback: 每批提交后的进度回调
+            should_stop: 每批提交后检查，返回True时停止（下次运行会继续处理未完成的商品）
+
+        Returns:
+            物化结果统计
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {"error": "相似商品物化任务正在进行中"}
+        start_time = time.time()
+        try:
+            top_n = top_n or self.default_top_n
+            meta = None if full else self.load_meta()
+            if meta is None or meta.get('top_n') != top_n:
+                full = True
+            synced_until = None
+            if not full and meta.get('synced_until'):
+                synced_until = datetime.fromisoformat(meta['synced_until'])
+            matrix, changed, max_updated = self.load_matrix(synced_until)
+            ids = matrix.ids
+            if not full and len(changed) > FULL_REFRESH_RATIO * max(len(ids), 1):
+                full = True
+
+            removed, merged_count = [], 0
+            if full:
+                dirty = ids
+                changed = np.empty(0, dtype=np.int64)
+            else:
+                # 第一遍只读商品ID：已删除商品，以及还没有列表的商品（需计算）
+                dirty_mask = np.ones(len(ids), dtype=bool)
+                for page in self.iter_lists(with_lists=False):
+                    rows = matrix.rows(pid for pid, _, _ in page)
+                    dirty_mask[rows[rows >= 0]] = False
+                    removed.extend(pid for (pid, _, _), row in zip(page, rows) if row < 0)
+                dirty_mask[matrix.rows(changed)] = True
+
+                # 第二遍逐页读取列表：含有变更/删除商品的列表重算，其余列表合并进入其top-N的变更商品
+                affected = set(changed.tolist()) | set(removed)
+                if affected:
+                    for page in self.iter_lists():
+                        rows = matrix.rows(pid for pid, _, _ in page)
+                        clean = []
+                        for item, row in zip(page, rows):
+                            if row < 0 or dirty_mask[row]:
+                                continue
+                            if affected.isdisjoint(item[1]):
+                                clean.append(item)
+                            else:
+                                dirty_mask[row] = True
+                        merged = self.merge_changed(matrix, clean, changed, top_n)
+                        if merged:
+                            self._write_lists(merged)
+                            db.session.commit()
+                            merged_count += len(merged)
+                dirty = ids[dirty_mask]
+
+            state = {
+                'status': 'running',
+                'mode': 'full' if full else 'incremental',
+                'top_n': top_n,
+                'total': int(len(dirty)),
+                'processed': 0,
+                'changed': int(len(changed)),
+                'removed': len(removed),
+                'merged': merged_count,
+                'started_at': datetime.utcnow().isoformat()
+            }
+            self._set_progress(state)
+            logger.info(f"开始物化相似商品: 模式 {state['mode']}, 商品 {len(ids)}, 需重算 {len(dirty)}, "
+                        f"变更 {len(changed)}, 删除 {len(removed)}")
+
+            if removed:
+                self._delete_lists(removed)
+            db.session.commit()
+
+            for start in range(0, len(dirty), batch_size):
+                batch = dirty[start:start + batch_size]
+                self._write_lists(self.compute_lists(matrix, batch, top_n))
+                db.session.commit()
+                state['processed'] += len(batch)
+                state['elapsed'] = round(time.time() - start_time, 2)
+                self._set_progress(state)
+                if progress_callback:
+                    progress_callback(dict(state))
+                if should_stop and should_stop() and state['processed'] < len(dirty):
+                    state['status'] = 'cancelled'
+                    break
+
+            if state['status'] == 'running':
+                state['status'] = 'completed'
+                # 只有全部完成才推进同步位置，取消后下次运行仍会处理剩余商品
+                self._save_meta({
+                    'top_n': top_n,
+                    'synced_until': max_updated.isoformat() if max_updated else None,
+                    'product_count': int(len(ids)),
+                    'completed_at': datetime.utcnow().isoformat()
+                })
+                db.session.commit()
+            state['elapsed'] = round(time.time() - start_time, 2)
+            self._set_progress(state)
+            logger.info(f"相似商品物化结束({state['status']}): 重算 {state['processed']}, "
+                        f"合并 {state['merged']}, 删除 {len(removed)}, 耗时 {state['elapsed']}s")
+            return dict(state)
+
+        except Exception as e:
+            db.session.rollback()
+            self._set_progress(dict(self._progress, status='failed', error=str(e)))
+            logger.error(f"相似商品物化失败: {e}")
+            return {"error": str(e)}
+        finally:
+            self._run_lock.release()
+
+    def get_status(self) -> Dict:
+        """物化状态：最近一次完成的元信息、已物化数量、当前进度"""
+        count = db.session.execute(text("""
+            SELECT COUNT(*) FROM recommendation_cache WHERE cache_type = :cache_type
+        """), {'cache_type': CACHE_TYPE}).scalar()
+        return {
+            'meta': self.load_meta(),
+            'materialized_count': int(count or 0),
+            'progress': self.get_progress()
+        }
@@ -9,10 +9,15 @@ from typing import List, Dict, Optional, Tuple
 from sqlalchemy.orm import sessionmaker
 import logging
 import time
+from datetime import datetime
 from functools import lru_cache
 
 from app import db
 from app.models import Product
+from app.services.vector_index_service import ProductVectorIndex
+from app.services.similar_product_materializer import SimilarProductMaterializer
+from app.utils.cache import get_cache
+from app.utils.result_cache import TieredCache
 
 logger = logging.getLogger(__name__)
 
@@ -22,19 +27,24 @@ class SimilarProductService:
     def __init__(self):
         self.vector_dimension = 200  # 腾讯词向量维度
         self.cache_size = 1000  # 缓存大小
-        self._vector_cache = {}  # 向量缓存
+        # 向量缓存（进程内共享的LRU+TTL缓存，商品向量更新后最多10分钟内生效）
+        self._vector_cache = get_cache('product_vectors', max_entries=self.cache_size, ttl=600)
+        # 相似商品结果缓存（进程内LRU + Redis两级缓存，随商品目录版本失效）
+        self._result_cache = TieredCache('similar_products', max_entries=5000,
+                                         max_bytes=64 * 1024 * 1024, ttl=600)
         
     def _get_product_vector(self, product_id: int) -> Optional[np.ndarray]:
         """获取商品向量"""
         try:
             # 先检查缓存
-            if product_id in self._vector_cache:
-                return self._vector_cache[product_id]
+            vector = self._vector_cache.get(product_id)
+            if vector is not None:
+                return vector
             
             # 从数据库获取
-            product = db.session.query(Product).filter(
+            product = db.session.query(Product).options(Product.with_vectors()).filter(
                 Product.id == product_id,
-                Product.embedding.isnot(None)
+                Product.vector_filter()
             ).first()
             
             if not product:
@@ -42,16 +52,13 @@ class SimilarProductService:
                 return None
             
             # 解析向量
-            embedding_data = json.loads(product.embedding)
-            if not isinstance(embedding_data, list) or len(embedding_data) != self.vector_dimension:
-                logger.warning(f"商品 {product_id} 向量格式错误: {type(embedding_data)}, 长度: {len(embedding_data) if isinstance(embedding_data, list) else 'N/A'}")
+            vector = product.get_embedding()
+            if vector is None or len(vector) != self.vector_dimension:
+                logger.warning(f"商品 {product_id} 向量格式错误, 长度: {len(vector) if vector is not None else 'N/A'}")
                 return None
             
-            vector = np.array(embedding_data, dtype=np.float32)
-            
             # 缓存向量
-            if len(self._vector_cache) < self.cache_size:
-                self._vector_cache[product_id] = vector
+            self._vector_cache.set(product_id, vector)
             
             return vector
             
@@ -112,6 +119,28 @@ class SimilarProductService:
                             threshold: float = 0.0,
                             exclude_self: bool = True) -> List[Dict]:
         """
+        查找相似商品（带两级结果缓存）
+        
+        Args:
+            product_id: 目标商品ID
+            limit: 返回数量限制
+            threshold: 相似度阈值
+            exclude_self: 是否排除自身
+            
+        Returns:
+            相似商品列表，包含商品信息和相似度
+        """
+        return self._result_cache.get_or_set(
+            (product_id, limit, threshold, exclude_self),
+            lambda: self._find_similar_products(product_id, limit, threshold, exclude_self)
+        )
+    
+    def _find_similar_products(self, 
+                               product_id: int, 
+                               limit: int = 10, 
+                               threshold: float = 0.0,
+                               exclude_self: bool = True) -> List[Dict]:
+        """
         查找相似商品 - 使用pgvector进行全量向量搜索
         
         Args:
@@ -127,18 +156,27 @@ class SimilarProductService:
         
         try:
             # 获取目标商品信息
-            target_product = db.session.query(Product).filter(Product.id == product_id).first()
+            target_product = db.session.query(Product).options(Product.with_vectors()).filter(
+                Product.id == product_id
+            ).first()
             if not target_product:
                 logger.warning(f"商品 {product_id} 不存在")
                 return []
             
             # 检查目标商品是否有向量数据
-            if not target_product.embedding:
+            if not target_product.has_vector():
                 logger.warning(f"商品 {product_id} 没有向量数据")
                 return []
             
             logger.info(f"开始查找商品 {product_id} 的相似商品，限制: {limit}, 阈值: {threshold}")
             
+            # 优先使用进程内向量索引，索引冷启动或过期时降级到pgvector
+            index_results = self._find_similar_from_index(product_id, limit, threshold, exclude_self)
+            if index_results is not None:
+                query_time = (time.time() - start_time) * 1000
+                logger.info(f"相似商品查询完成(向量索引): 商品 {product_id}, 找到 {len(index_results)} 个结果, 耗时 {query_time:.2f}ms")
+                return index_results
+            
             # 使用pgvector进行全量向量相似度搜索
             from sqlalchemy import text
             
@@ -214,6 +252,66 @@ class SimilarProductService:
             logger.error(f"查找相似商品失败: {e}")
             return []
     
+    def _find_similar_from_index(self, product_id: int, limit: int, threshold: float,
+                                 exclude_self: bool) -> Optional[List[Dict]]:
+        """使用进程内向量索引查找相似商品，索引不可用时返回None"""
+        hits = ProductVectorIndex().search_by_product(product_id, limit, exclude_self=exclude_self)
+        if hits is None:
+            return None
+        
+        hits = [(pid, similarity) for pid, similarity in hits if similarity >= threshold]
+        return self._format_hits(hits)
+    
+    def find_materialized_similar_products(self, product_id: int, limit: int = 10,
+                                           threshold: float = 0.0) -> Optional[Tuple[List[Dict], Dict]]:
+        """
+        从物化的相似列表读取相似商品（排除自身）
+        
+        列表中已删除的商品在读取时跳过；跳过后不足limit、且列表内没有低于阈值的商品
+        （即阈值以上的商品可能不止列表中这些）时结果不完整，返回None由调用方实时查询
+        
+        Returns:
+            (相似商品列表, 物化信息)；未物化或可用数量不足limit时返回None
+        """
+        materialized = SimilarProductMaterializer().get_similar(product_id)
+        if materialized is None or len(materialized['ids']) < limit:
+            return None
+        
+        hits = [(pid, score) for pid, score in zip(materialized['ids'], materialized['scores'])
+                if score >= threshold]
+        similar = self._format_hits(hits)[:limit]
+        if len(similar) < limit and len(hits) == len(materialized['ids']):
+            return None
+        materialized_at = materialized['materialized_at']
+        info = {
+            'source': 'materialized',
+            'materialized_at': materialized_at.isoformat() if materialized_at else None,
+            'age_seconds': int((datetime.utcnow() - materialized_at).total_seconds()) if materialized_at else None,
+            'stale': materialized['stale']
+        }
+        return similar, info
+    
+    def _format_hits(self, hits: List[Tuple[int, float]]) -> List[Dict]:
+        """按 [(商品ID, 相似度)] 批量加载商品信息并格式化"""
+        rows = ProductVectorIndex.fetch_product_rows([pid for pid, _ in hits])
+        
+        similarities = []
+        for pid, similarity in hits:
+            row = rows.get(pid)
+            if row is None:
+                continue
+            similarities.append({
+                'product_id': row.id,
+                'name': row.name,
+                'description': row.description,
+                'price': float(row.price) if row.price else None,
+                'category_id': row.category_id,
+                'image_url': self._clean_image_url(row.image_url),
+                'similarity': float(round(similarity, 4)),
+                'tags': json.loads(row.tags) if row.tags else []
+            })
+        return similarities
+    
     def batch_find_similar_products(self, 
                                   product_ids: List[int], 
                                   limit: int = 10, 
@@ -233,6 +331,10 @@ class SimilarProductService:
         
         for product_id in product_ids:
             try:
+                materialized = self.find_materialized_similar_products(product_id, limit, threshold)
+                if materialized is not None:
+                    results[product_id] = materialized[0]
+                    continue
                 similar_products = self.find_similar_products(
                     product_id=product_id,
                     limit=limit,
@@ -278,7 +380,7 @@ class SimilarProductService:
             # 统计有向量的商品数量
             total_products = db.session.query(Product).count()
             products_with_vectors = db.session.query(Product).filter(
-                Product.embedding.isnot(None)
+                Product.vector_filter()
             ).count()
             
             # 检查pgvector列的数据
@@ -295,7 +397,9 @@ class SimilarProductService:
                 'vector_dimension': self.vector_dimension,
                 'cache_size': len(self._vector_cache),
                 'max_cache_size': self.cache_size,
-                'implementation': 'pgvector_full_search'  # 标识当前实现方式
+                'cache_stats': self._vector_cache.stats(),
+                'implementation': 'vector_index' if ProductVectorIndex().is_ready() else 'pgvector_full_search',  # 标识当前实现方式
+                'vector_index': ProductVectorIndex().get_status()
             }
             
         except Exception as e:
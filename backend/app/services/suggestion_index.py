@@ -0,0 +1,435 @@
+"""
+搜索建议前缀索引
+标签与商品名称按热度排序后编号，检索键（原文、按词切出的后缀、拼音全拼与首字母）
+排序存放在数组中，前缀查询为二分定位区间后取区间内编号最小（最热门）的条目；
+三个字符以内的短前缀在构建时预先算好top-k。索引在后台线程构建，
+之后按间隔增量加载新增/更新的商品，变化过多或检测到删除时后台全量重建
+"""
+
+import json
+import time
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import jieba
+import numpy as np
+from sqlalchemy import text
+
+from app import db
+
+try:
+    from pypinyin import Style, lazy_pinyin  # 可选依赖，未安装时不支持拼音检索
+except ImportError:
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)
+
+TAG_TYPE = 'tag'
+PRODUCT_TYPE = 'product'
+
+
+def normalize_prefix(value: str) -> str:
+    """检索键规范化：全半角统一、小写、去除空白"""
+    return ''.join(unicodedata.normalize('NFKC', value).lower().split())
+
+
+class PrefixIndex:
+    """
+    只读前缀索引
+
+    条目按热度降序编号，编号越小越热门；每个检索键记录其条目编号，
+    区间内的top-k即为编号最小的k个不同条目
+    """
+
+    def __init__(self, terms: Dict[str, int], max_suffixes: int = 3, with_pinyin: bool = True,
+                 top_k: int = 10, top_prefix_length: int = 3):
+        """
+        Args:
+            terms: {文本: 热度}
+            max_suffixes: 每个条目按词边界切出的后缀键数（使中间的词也能前缀命中）
+            with_pinyin: 是否生成拼音全拼与首字母键
+            top_k: 预计算的top-k数量
+            top_prefix_length: 预计算top-k的前缀最大长度
+        """
+        ordered = sorted(terms.items(), key=lambda item: (-item[1], item[0]))
+        self.texts = [term for term, _ in ordered]
+        self.popularity = np.asarray([count for _, count in ordered], dtype=np.int64)
+        self.top_k = top_k
+        self.top_prefix_length = top_prefix_length
+
+        pairs = []
+        use_pinyin = with_pinyin and lazy_pinyin is not None
+        for entry, term in enumerate(self.texts):
+            for key in self._term_keys(term, max_suffixes, use_pinyin):
+                pairs.append((key, entry))
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._entries = np.asarray([entry for _, entry in pairs], dtype=np.int32)
+        self._top = self._precompute_top()
+
+    @staticmethod
+    def _term_keys(term: str, max_suffixes: int, use_pinyin: bool) -> set:
+        normalized = normalize_prefix(term)
+        if not normalized:
+            return set()
+        keys = {normalized}
+        if max_suffixes > 0 or use_pinyin:
+            words = [normalize_prefix(word) for word in jieba.cut(term, HMM=False)]
+            words = [word for word in words if word]
+            spelled = [_word_pinyin(word) for word in words] if use_pinyin else None
+            for i in range(min(len(words), max_suffixes + 1)):
+                if i:
+                    keys.add(''.join(words[i:]))
+                if spelled:
+                    # 全拼键较长，只为整个条目生成；首字母键为每个后缀生成
+                    if not i:
+                        keys.add(''.join(full for full, _ in spelled))
+                    keys.add(''.join(initials for _, initials in spelled[i:]))
+        return keys
+
+    def _precompute_top(self) -> Dict[str, Tuple[int, ...]]:
+        """预计算短前缀的top-k条目"""
+        top = {}
+        for length in range(1, self.top_prefix_length + 1):
+            prefixes = {key[:length] for key in self._keys if len(key) >= length}
+            for prefix in prefixes:
+                top[prefix] = tuple(self._range_top(*self._range(prefix), self.top_k))
+        return top
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + '\U0010ffff', lo)
+        return lo, hi
+
+    def _range_top(self, lo: int, hi: int, k: int) -> List[int]:
+        """区间内编号最小的k个不同条目"""
+        if hi <= lo:
+            return []
+        entries = self._entries[lo:hi]
+        m = min(len(entries), k * 4)
+        while True:
+            candidates = np.partition(entries, m - 1)[:m] if m < len(entries) else entries
+            unique = np.unique(candidates)[:k]
+            # 同一条目的多个键可能占满候选，不同条目不足k个时扩大候选范围
+            if len(unique) >= k or m >= len(entries):
+                return unique.tolist()
+            m = min(len(entries), m * 4)
+
+    def lookup(self, prefix: str, k: int) -> List[Tuple[str, int]]:
+        """前缀查询，返回 [(文本, 热度)]，按热度降序"""
+        if k <= 0 or not prefix:
+            return []
+        if k <= self.top_k and prefix in self._top:
+            entries = self._top[prefix][:k]
+        else:
+            entries = self._range_top(*self._range(prefix), k)
+        return [(self.texts[entry], int(self.popularity[entry])) for entry in entries]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def key_count(self) -> int:
+        return len(self._keys)
+
+
+@lru_cache(maxsize=200000)
+def _word_pinyin(word: str) -> Tuple[str, str]:
+    """词的拼音全拼与首字母（按词转换以区分多音字，结果缓存）"""
+    return (''.join(lazy_pinyin(word)).lower(),
+            ''.join(lazy_pinyin(word, style=Style.FIRST_LETTER)).lower())
+
+
+def _merge_hits(*hit_lists: List[Tuple[str, int]], k: int) -> List[Tuple[str, int]]:
+    merged: Dict[str, int] = {}
+    for hits in hit_lists:
+        for term, count in hits:
+            merged[term] = max(count, merged.get(term, 0))
+    return sorted(merged.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+class SuggestionIndex:
+    """搜索建议索引管理器（进程级单例）"""
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SuggestionIndex, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.enabled = True
+            self.max_names = 50000  # 参与建议的商品名称数上限（按热度）
+            self.max_suffixes = 3
+            self.with_pinyin = True
+            self.refresh_interval = 30  # 秒，检查商品变更的最小间隔
+            self.rebuild_interval = 3600  # 秒，定期全量重建（合并增量、清理已删除条目）
+            self.max_pending = 20000  # 增量商品数超过该值时改为全量重建
+
+            self._indexes: Optional[Dict[str, PrefixIndex]] = None
+            self._delta: Dict[str, PrefixIndex] = {}
+            self._pending: Dict[str, Dict[str, int]] = {TAG_TYPE: {}, PRODUCT_TYPE: {}}
+            self._lock = threading.RLock()
+            self._build_thread = None
+            self._refresh_thread = None
+            self._generation = 0  # 每次全量构建递增，增量同步据此丢弃构建前读取的结果
+            self._built_at = None
+            self._build_time = 0.0
+            self._synced_until = None
+            self._product_count = 0
+            self._last_check = 0.0
+            self._app = None
+
+            self._initialized = True
+
+    def configure(self, app):
+        """从应用配置读取索引参数"""
+        self._app = app
+        self.enabled = app.config.get('SUGGESTION_INDEX_ENABLED', True)
+        self.max_names = app.config.get('SUGGESTION_MAX_NAMES', 50000)
+        self.with_pinyin = app.config.get('SUGGESTION_PINYIN', True)
+        self.refresh_interval = app.config.get('SUGGESTION_REFRESH_INTERVAL', 30)
+        self.rebuild_interval = app.config.get('SUGGESTION_REBUILD_INTERVAL', 3600)
+        if self.with_pinyin and lazy_pinyin is None:
+            logger.warning("未安装pypinyin，搜索建议不支持拼音检索")
+
+    # ------------------------------------------------------------------
+    # 构建与同步
+    # ------------------------------------------------------------------
+
+    def _load_terms(self) -> Tuple[Dict[str, int], Dict[str, int], int, Optional[datetime]]:
+        """读取标签与商品名称的热度，返回 (标签, 商品名称, 商品数, 最大updated_at)"""
+        tags = {row.tag: int(row.products) for row in db.session.execute(text("""
+            SELECT tag, COUNT(*) AS products FROM product_tags GROUP BY tag
+        """))}
+        # 商品名称热度 = 同名商品数 + 交互次数
+        names = {row.name: int(row.popularity) for row in db.session.execute(text("""
+            SELECT p.name, COUNT(*) + COALESCE(SUM(i.interactions), 0) AS popularity
+            FROM products p
+            LEFT JOIN (
+                SELECT product_id, COUNT(*) AS interactions
+                FROM user_interactions
+                GROUP BY product_id
+            ) i ON i.product_id = p.id
+            GROUP BY p.name
+            ORDER BY popularity DESC
+            LIMIT :limit
+        """), {'limit': self.max_names})}
+        total, last_updated = self._catalog_signature()
+        return tags, names, total, last_updated
+
+    @staticmethod
+    def _catalog_signature() -> Tuple[int, Optional[datetime]]:
+        row = db.session.execute(text(
+            "SELECT COUNT(*) AS total, MAX(updated_at) AS last_updated FROM products"
+        )).fetchone()
+        return int(row.total or 0), _as_datetime(row.last_updated)
+
+    def build(self) -> bool:
+        """从数据库全量构建索引（需在应用上下文中调用）"""
+        if not self.enabled:
+            return False
+        start_time = time.time()
+        try:
+            tags, names, total, last_updated = self._load_terms()
+            indexes = {
+                TAG_TYPE: PrefixIndex(tags, max_suffixes=self.max_suffixes, with_pinyin=self.with_pinyin),
+                PRODUCT_TYPE: PrefixIndex(names, max_suffixes=self.max_suffixes, with_pinyin=self.with_pinyin),
+            }
+            with self._lock:
+                self._generation += 1
+                self._indexes = indexes
+                self._delta = {}
+                self._pending = {TAG_TYPE: {}, PRODUCT_TYPE: {}}
+                self._built_at = datetime.utcnow()
+                self._build_time = time.time() - start_time
+                self._synced_until = last_updated
+                self._product_count = total
+                self._last_check = time.time()
+            logger.info(f"搜索建议索引构建完成: 标签 {len(tags)} 个, 商品名称 {len(names)} 个, "
+                        f"耗时 {self._build_time:.2f}s")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"构建搜索建议索引失败: {e}")
+            return False
+
+    def start_background_build(self, app=None):
+        """在后台线程中构建索引，构建期间建议查询走数据库"""
+        app = app or self._app
+        if not self.enabled or app is None:
+            return
+        with self._lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return
+
+            def _run():
+                with app.app_context():
+                    self.build()
+                    db.session.remove()
+
+            self._build_thread = threading.Thread(target=_run, name='suggestion-index-build', daemon=True)
+            self._build_thread.start()
+
+    def wait_for_build(self, timeout: Optional[float] = None) -> bool:
+        """等待后台构建结束"""
+        thread = self._build_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self._indexes is not None
+
+    def after_fork(self):
+        """工作进程fork后重置锁与构建、同步线程状态"""
+        self._lock = threading.RLock()
+        self._build_thread = None
+        self._refresh_thread = None
+
+    def start_background_refresh(self, app=None):
+        """在后台线程中同步增量，同步期间查询继续使用当前索引"""
+        app = app or self._app
+        if not self.enabled or app is None:
+            return
+        with self._lock:
+            self._last_check = time.time()
+            for thread in (self._build_thread, self._refresh_thread):
+                if thread is not None and thread.is_alive():
+                    return
+
+            def _run():
+                with app.app_context():
+                    self.refresh()
+                    db.session.remove()
+
+            self._refresh_thread = threading.Thread(target=_run, name='suggestion-index-refresh', daemon=True)
+            self._refresh_thread.start()
+
+    def refresh(self):
+        """
+        增量加载新增/更新的商品；检测到删除、增量过多或到达重建间隔时后台全量重建。
+        查询与增量索引的构建在锁外进行，完成后一次替换（期间发生了全量构建则丢弃本次结果）
+        """
+        self._last_check = time.time()
+        try:
+            with self._lock:
+                generation = self._generation
+                synced_until = self._synced_until
+                pending = {term_type: dict(terms) for term_type, terms in self._pending.items()}
+            total, last_updated = self._catalog_signature()
+            if total < self._product_count or (
+                self._built_at and (datetime.utcnow() - self._built_at).total_seconds() > self.rebuild_interval
+            ):
+                self.start_background_build()
+                return
+            if last_updated is None or (synced_until is not None and last_updated <= synced_until):
+                return
+
+            since = synced_until or datetime.min
+            changed = db.session.execute(text(
+                "SELECT COUNT(*) FROM products WHERE updated_at > :since"
+            ), {'since': since}).scalar() or 0
+            pending_count = len(pending[PRODUCT_TYPE]) + changed
+            if pending_count > self.max_pending:
+                logger.info(f"搜索建议增量商品过多（{pending_count}），触发全量重建")
+                self.start_background_build()
+                return
+
+            rows = db.session.execute(text(
+                "SELECT name, tags FROM products WHERE updated_at > :since"
+            ), {'since': since}).fetchall()
+            for row in rows:
+                names = pending[PRODUCT_TYPE]
+                names[row.name] = names.get(row.name, 0) + 1
+                for tag in _parse_tags(row.tags):
+                    pending[TAG_TYPE][tag] = pending[TAG_TYPE].get(tag, 0) + 1
+            delta = {
+                term_type: PrefixIndex(terms, max_suffixes=self.max_suffixes, with_pinyin=self.with_pinyin)
+                for term_type, terms in pending.items() if terms
+            }
+            with self._lock:
+                if self._generation != generation:
+                    return
+                self._pending = pending
+                self._delta = delta
+                self._synced_until = last_updated
+                self._product_count = total
+            logger.debug(f"搜索建议索引增量同步 {len(rows)} 个商品")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"同步搜索建议索引失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def is_ready(self) -> bool:
+        """索引已构建；冷启动时顺带触发后台构建，到达间隔时在后台同步增量（不阻塞查询）"""
+        if not self.enabled:
+            return False
+        if self._indexes is None:
+            self.start_background_build()
+            return False
+        if time.time() - self._last_check > self.refresh_interval:
+            self.start_background_refresh()
+        return True
+
+    def suggest(self, query: str, tag_limit: int = 10, product_limit: int = 5) -> Optional[List[Dict]]:
+        """
+        前缀建议
+
+        Returns:
+            [{'text', 'type'}]，标签在前、商品名称在后；索引不可用时返回None，调用方应降级到数据库
+        """
+        if not self.is_ready():
+            return None
+        prefix = normalize_prefix(query)
+        indexes, delta = self._indexes, self._delta
+        suggestions = []
+        for term_type, limit in ((TAG_TYPE, tag_limit), (PRODUCT_TYPE, product_limit)):
+            hits = indexes[term_type].lookup(prefix, limit)
+            if term_type in delta:
+                hits = _merge_hits(hits, delta[term_type].lookup(prefix, limit), k=limit)
+            suggestions.extend({'text': term, 'type': term_type} for term, _ in hits)
+        return suggestions
+
+    def get_status(self) -> Dict:
+        """索引状态信息"""
+        indexes = self._indexes or {}
+        return {
+            'enabled': self.enabled,
+            'ready': self._indexes is not None,
+            'building': self._build_thread is not None and self._build_thread.is_alive(),
+            'refreshing': self._refresh_thread is not None and self._refresh_thread.is_alive(),
+            'pinyin': self.with_pinyin and lazy_pinyin is not None,
+            'tags': len(indexes[TAG_TYPE]) if TAG_TYPE in indexes else 0,
+            'product_names': len(indexes[PRODUCT_TYPE]) if PRODUCT_TYPE in indexes else 0,
+            'keys': sum(index.key_count for index in indexes.values()),
+            'pending_products': len(self._pending[PRODUCT_TYPE]),
+            'built_at': self._built_at.isoformat() if self._built_at else None,
+            'build_time': round(self._build_time, 3),
+            'synced_until': self._synced_until.isoformat() if self._synced_until else None
+        }
+
+
+def _parse_tags(raw) -> List[str]:
+    if not raw:
+        return []
+    try:
+        tags = json.loads(raw)
+    except ValueError:
+        return []
+    return [str(tag) for tag in tags] if isinstance(tags, list) else []
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    """sqlite原生查询返回的时间为字符串"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
@@ -0,0 +1,333 @@
+"""
+用户画像服务
+用户特征向量为交互过的商品向量按交互分数加权的平均值。每个用户保存加权向量和与权重合计，
+记录交互时在同一事务内以 O(维度) 更新并立即刷新特征向量（含pgvector格式），
+交互批量写入时一批只锁定一次用户、读取一次商品向量；
+全量重建按交互记录重新累加，用于初始化以及定期纠正浮点累积误差与商品向量重算后的偏差
+（按 USER_VECTOR_REBUILD_INTERVAL 自动提交后台任务）
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.orm import undefer_group
+
+from app import db
+from app.models import BackgroundJob, Product, User
+from app.utils.result_cache import bump_user_version
+from app.utils.vector_codec import decode_vector
+
+logger = logging.getLogger(__name__)
+
+REBUILD_JOB_TYPE = 'rebuild_user_vectors'
+# 各进程检查是否需要定期全量重建的最长间隔（秒）
+REBUILD_CHECK_INTERVAL = 300
+
+
+def interaction_weight(score) -> float:
+    """
+    交互权重（与全量计算规则一致）：分数为空的交互不计入，分数为0按1计，负分按0计
+    """
+    if score is None:
+        return 0.0
+    return max(0.0, float(score or 1.0))
+
+
+class UserProfileService:
+    """用户画像服务"""
+
+    # 各数据库URL是否已添加向量和列（进程内缓存，迁移后需重启生效）
+    _availability: Dict[str, bool] = {}
+    # 定期全量重建调度线程（每进程一个）
+    _scheduler_lock = threading.Lock()
+    _scheduler_thread: Optional[threading.Thread] = None
+
+    def __init__(self):
+        self.incremental = current_app.config.get('USER_VECTOR_INCREMENTAL', True)
+        self.rebuild_interval = current_app.config.get('USER_VECTOR_REBUILD_INTERVAL', 86400)
+
+    @classmethod
+    def available(cls) -> bool:
+        """用户表是否具备向量和、权重合计列"""
+        url = str(db.engine.url)
+        if url not in cls._availability:
+            try:
+                # 用当前会话的连接检查：单连接的sqlite在归还连接时会回滚调用方尚未提交的写入
+                columns = {column['name'] for column in inspect(db.session.connection()).get_columns('users')}
+            except Exception as e:
+                logger.warning(f"检查用户向量和列失败: {e}")
+                return False
+            cls._availability[url] = {'preference_sum', 'preference_weight'} <= columns
+            if not cls._availability[url]:
+                logger.warning("users表缺少向量和列，记录交互时不增量更新用户特征向量（执行 flask rebuild-user-vectors 后启用）")
+        return cls._availability[url]
+
+    # ------------------------------------------------------------------
+    # 存取
+    # ------------------------------------------------------------------
+
+    def _lock_users(self, user_ids: List[int]) -> List[User]:
+        """加行锁读取用户（刷新会话中已加载的对象，保证读到最新的向量和）"""
+        query = db.session.query(User)
+        if self.available():
+            query = query.options(undefer_group('preference'))
+        # 按用户ID顺序加锁，避免并发的批量更新之间死锁
+        return query.filter(User.id.in_(user_ids)).order_by(User.id).populate_existing().with_for_update().all()
+
+    @staticmethod
+    def _product_vectors(product_ids) -> Dict[int, np.ndarray]:
+        """批量读取商品向量（一次IN查询，没有向量的商品不在结果中）"""
+        rows = db.session.query(Product.id, Product.embedding_bin, Product.embedding).filter(
+            Product.id.in_(list(product_ids))
+        )
+        return {
+            row.id: decode_vector(row.embedding_bin or row.embedding)
+            for row in rows if row.embedding_bin or row.embedding
+        }
+
+    def _store(self, user: User, weighted_sum: Optional[np.ndarray], total_weight: float):
+        """保存向量和与权重合计（未迁移时只写特征向量），并刷新特征向量"""
+        if self.available():
+            user.preference_weight = float(total_weight)
+            user.preference_sum = weighted_sum.astype(np.float64).tobytes() if weighted_sum is not None else None
+        if weighted_sum is not None and total_weight > 0:
+            user.set_feature_vector((weighted_sum / total_weight).astype(np.float32))
+            user.vector_updated_at = datetime.utcnow()
+
+    @staticmethod
+    def _accumulate(user_ids: List[int]) -> Dict[int, Tuple[np.ndarray, float]]:
+        """按交互记录累加用户的加权向量和（一次查询读取这些用户的全部交互与商品向量）"""
+        rows = db.session.execute(text("""
+            SELECT ui.user_id, ui.product_id, ui.interaction_score, p.embedding_bin, p.embedding
+            FROM user_interactions ui
+            JOIN products p ON p.id = ui.product_id
+            WHERE ui.user_id IN :user_ids
+              AND ui.interaction_score IS NOT NULL
+              AND (p.embedding_bin IS NOT NULL OR p.embedding IS NOT NULL)
+        """).bindparams(bindparam('user_ids', expanding=True)), {'user_ids': list(user_ids)})
+
+        vectors: Dict[int, np.ndarray] = {}
+        grouped: Dict[int, Tuple[List[float], List[np.ndarray]]] = {}
+        for row in rows:
+            weight = interaction_weight(row.interaction_score)
+            if weight <= 0:
+                continue
+            vector = vectors.get(row.product_id)
+            if vector is None:
+                vector = decode_vector(row.embedding_bin or row.embedding)
+                vectors[row.product_id] = vector
+            weights, stacked = grouped.setdefault(row.user_id, ([], []))
+            weights.append(weight)
+            stacked.append(vector)
+
+        result = {}
+        for user_id, (weights, stacked) in grouped.items():
+            weights_array = np.asarray(weights, dtype=np.float64)
+            result[user_id] = (weights_array @ np.vstack(stacked).astype(np.float64), float(weights_array.sum()))
+        return result
+
+    def _rebuild(self, user: User) -> Optional[np.ndarray]:
+        accumulated = self._accumulate([user.id]).get(user.id)
+        if accumulated is None:
+            self._store(user, None, 0.0)
+            return None
+        weighted_sum, total_weight = accumulated
+        self._store(user, weighted_sum, total_weight)
+        return (weighted_sum / total_weight).astype(np.float32)
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def apply_interaction(self, user_id: int, product_id: int, interaction_score) -> bool:
+        """
+        将一次交互计入用户特征向量（在记录交互的事务内调用，由调用方提交）
+
+        Returns:
+            特征向量是否已更新
+        """
+        return bool(self.apply_interactions([(user_id, product_id, interaction_score)]))
+
+    def apply_interactions(self, interactions: List[Tuple[int, int, object]]) -> List[int]:
+        """
+        将一批交互计入用户特征向量（在写入交互的事务内调用，由调用方提交）：
+        一次锁定涉及的用户、一次读取涉及的商品向量；向量和尚未初始化的用户按交互记录全量累加
+
+        Args:
+            interactions: [(user_id, product_id, interaction_score)]
+
+        Returns:
+            特征向量已更新的用户ID
+        """
+        if not self.incremental or not self.available():
+            return []
+        self._maybe_schedule_rebuild()
+        grouped: Dict[int, List[Tuple[int, float]]] = {}
+        for user_id, product_id, interaction_score in interactions:
+            weight = interaction_weight(interaction_score)
+            if weight > 0:
+                grouped.setdefault(user_id, []).append((product_id, weight))
+        if not grouped:
+            return []
+
+        users = self._lock_users(list(grouped))
+        vectors = self._product_vectors({product_id for items in grouped.values() for product_id, _ in items})
+        updated, rebuild = [], []
+        for user in users:
+            if user.preference_weight is None:
+                # 尚未初始化向量和：全量累加（已包含本批交互）
+                rebuild.append(user)
+                continue
+            weighted_sum = np.frombuffer(user.preference_sum, dtype=np.float64) if user.preference_sum else None
+            total_weight = user.preference_weight
+            changed = False
+            for product_id, weight in grouped[user.id]:
+                vector = vectors.get(product_id)
+                if vector is None:
+                    continue
+                if weighted_sum is None:
+                    weighted_sum = np.zeros(vector.shape, dtype=np.float64)
+                elif weighted_sum.shape != vector.shape:
+                    logger.warning(f"用户 {user.id} 的向量和维度与商品向量不一致，改为全量重建")
+                    rebuild.append(user)
+                    changed = False
+                    break
+                weighted_sum = weighted_sum + weight * vector.astype(np.float64)
+                total_weight += weight
+                changed = True
+            if changed:
+                self._store(user, weighted_sum, total_weight)
+                updated.append(user.id)
+
+        if rebuild:
+            accumulated = self._accumulate([user.id for user in rebuild])
+            for user in rebuild:
+                weighted_sum, total_weight = accumulated.get(user.id, (None, 0.0))
+                self._store(user, weighted_sum, total_weight)
+                if weighted_sum is not None:
+                    updated.append(user.id)
+        return updated
+
+    def rebuild_user(self, user_id: int) -> Optional[np.ndarray]:
+        """
+        全量重建单个用户的特征向量并提交
+
+        Returns:
+            新的特征向量；用户不存在或没有可计入的交互时返回None
+        """
+        users = self._lock_users([user_id])
+        if not users:
+            return None
+        vector = self._rebuild(users[0])
+        db.session.commit()
+        bump_user_version(user_id)
+        return vector
+
+    def rebuild_all(self, batch_size: int = 500,
+                    progress_callback: Optional[Callable[[Dict], None]] = None,
+                    should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """
+        全量重建所有有交互记录的用户（按用户ID分批，每批一次提交）
+
+        Returns:
+            {'users': 处理的用户数, 'updated': 生成了特征向量的用户数, 'stopped': 是否被中止}
+        """
+        total = db.session.execute(text(
+            "SELECT COUNT(DISTINCT user_id) FROM user_interactions"
+        )).scalar() or 0
+        processed = updated = 0
+        last_id = 0
+        while True:
+            if should_stop is not None and should_stop():
+                return {'users': processed, 'updated': updated, 'stopped': True}
+            user_ids = [row.user_id for row in db.session.execute(text("""
+                SELECT DISTINCT user_id FROM user_interactions
+                WHERE user_id > :last_id
+                ORDER BY user_id
+                LIMIT :batch_size
+            """), {'last_id': last_id, 'batch_size': batch_size})]
+            if not user_ids:
+                break
+            # 先锁定用户行再读取交互，与并发的增量更新串行
+            users = self._lock_users(user_ids)
+            accumulated = self._accumulate(user_ids)
+            for user in users:
+                weighted_sum, total_weight = accumulated.get(user.id, (None, 0.0))
+                self._store(user, weighted_sum, total_weight)
+                updated += weighted_sum is not None
+            db.session.commit()
+            for user in users:
+                bump_user_version(user.id)
+            processed += len(user_ids)
+            last_id = user_ids[-1]
+            if progress_callback is not None:
+                progress_callback({'processed': processed, 'total': int(total)})
+            logger.info(f"用户特征向量重建: {processed}/{total}")
+        return {'users': processed, 'updated': updated, 'stopped': False}
+
+    # ------------------------------------------------------------------
+    # 定期全量重建
+    # ------------------------------------------------------------------
+
+    def _maybe_schedule_rebuild(self):
+        """
+        确保本进程的定期全量重建调度线程已启动（只启动一次，不占用、也不提交调用方的事务）
+        """
+        if self.rebuild_interval <= 0:
+            return
+        thread = UserProfileService._scheduler_thread
+        if thread is not None and thread.is_alive():
+            return
+        with UserProfileService._scheduler_lock:
+            thread = UserProfileService._scheduler_thread
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(
+                target=self._schedule_loop,
+                args=(current_app._get_current_object(), self.rebuild_interval),
+                name='user-vector-rebuild-schedule', daemon=True)
+            UserProfileService._scheduler_thread = thread
+            thread.start()
+
+    @classmethod
+    def after_fork(cls):
+        """工作进程fork后重置调度线程（线程不会随fork复制）"""
+        cls._scheduler_lock = threading.Lock()
+        cls._scheduler_thread = None
+
+    @classmethod
+    def _schedule_loop(cls, app, interval: float):
+        """调度线程：每隔 min(interval, REBUILD_CHECK_INTERVAL) 秒检查一次是否需要提交全量重建任务"""
+        while True:
+            with app.app_context():
+                try:
+                    cls.schedule_rebuild(interval)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"提交用户特征向量定期重建任务失败: {e}")
+                finally:
+                    db.session.remove()
+            time.sleep(min(interval, REBUILD_CHECK_INTERVAL))
+
+    @staticmethod
+    def schedule_rebuild(interval: float) -> Optional[BackgroundJob]:
+        """
+        最近 interval 秒内没有创建过全量重建任务、也没有排队或运行中的重建任务时提交一个（需在应用上下文中调用）。
+        由 JobManager.submit_if_idle 按 background_jobs 行状态原子地判断并创建，
+        多个工作进程同时检查时只会提交一个任务
+
+        Returns:
+            提交的任务；无需重建时返回None
+        """
+        from app.services.job_manager import JobManager
+
+        job = JobManager().submit_if_idle(REBUILD_JOB_TYPE, min_interval=interval)
+        if job is not None:
+            logger.info(f"已提交用户特征向量定期重建任务: {job.id}")
+        return job
@@ -1,12 +1,31 @@
 from flask import current_app
 from app import db
-from app.models import User, UserInteraction, Product
+from app.models import InteractionPair, InteractionRollup, User, UserInteraction, Product
+from app.services.product_hydration_service import PRODUCT_FIELDS, hydrate_products
+from app.services.category_catalog_service import CategoryCatalog
+from app.services.interaction_rollup_service import (
+    InteractionRollupService, SCOPE_USER, SCOPE_USER_CATEGORY
+)
+from app.services.user_profile_service import UserProfileService
+from app.utils.cursor import fingerprint
+from app.utils.keyset import keyset_paginate
+from app.utils.result_cache import (
+    CATALOG_SCOPE, TieredCache, bump_user_data_version, bump_user_version, user_data_scope, user_scope
+)
+from sqlalchemy import case
 from datetime import datetime, timedelta
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 交互历史分页游标的签名salt
+INTERACTION_CURSOR_SALT = 'user-interactions'
+
+# 用户仪表板缓存：键中带用户数据版本，记录交互或修改用户资料后旧结果自动失效
+dashboard_cache = TieredCache('user_dashboard', max_entries=5000,
+                              max_bytes=32 * 1024 * 1024, ttl=300)
+
 class UserService:
     """用户服务类"""
     
@@ -51,39 +70,52 @@ class UserService:
                     setattr(user, key, value)
         
         db.session.commit()
+        bump_user_data_version(user_id)
         return user.to_dict()
     
-    def get_user_interactions(self, user_id: int, page: int = 1, per_page: int = 20):
-        """获取用户交互历史"""
-        interactions_query = UserInteraction.query.filter_by(user_id=user_id).order_by(
-            UserInteraction.created_at.desc()
-        )
+    def get_user_interactions(self, user_id: int, page: int = 1, per_page: int = 20,
+                              cursor: str = None, interaction_type: str = None, with_total: bool = False):
+        """
+        获取用户交互历史（按时间倒序键集分页，见 app.utils.keyset）
+
+        Args:
+            cursor: 上一页返回的 next_cursor，传入时忽略 page 的定位
+            interaction_type: 只返回该类型的交互
+            with_total: 是否计算总数（超过上限时为估计值）
+
+        Raises:
+            ValueError: 游标无效
+        """
+        interactions_query = UserInteraction.query.filter(UserInteraction.user_id == user_id)
+        if interaction_type:
+            interactions_query = interactions_query.filter(UserInteraction.interaction_type == interaction_type)
         
-        pagination = interactions_query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        items, pagination = keyset_paginate(
+            interactions_query, UserInteraction.created_at, UserInteraction.id, per_page,
+            salt=INTERACTION_CURSOR_SALT, scope=fingerprint('user', user_id, interaction_type),
+            page=page, cursor=cursor, with_total=with_total
         )
         
+        return {
+            'interactions': self._with_products(items),
+            'pagination': pagination
+        }
+    
+    @staticmethod
+    def _with_products(items):
+        """交互记录转为字典并批量组装商品信息"""
+        products = {product['id']: product for product in hydrate_products(
+            [interaction.product_id for interaction in items], fields=PRODUCT_FIELDS
+        )}
+        
         interactions = []
-        for interaction in pagination.items:
+        for interaction in items:
             interaction_dict = interaction.to_dict()
             # 添加商品信息
-            if interaction.product:
-                interaction_dict['product'] = interaction.product.to_dict()
+            if interaction.product_id in products:
+                interaction_dict['product'] = products[interaction.product_id]
             interactions.append(interaction_dict)
-        
-        return {
-            'interactions': interactions,
-            'pagination': {
-                'page': page,
-                'pages': pagination.pages,
-                'per_page': per_page,
-                'total': pagination.total,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
-        }
+        return interactions
     
     def record_interaction(self, user_id: int, product_id: int, interaction_type: str, 
                           interaction_score: float = 1.0, session_id: str = None):
@@ -97,7 +129,30 @@ class UserService:
         )
         
         db.session.add(interaction)
+        db.session.flush()
+        
+        # 在同一事务内增量更新用户特征向量与交互计数汇总；失败时只回滚到保存点，交互照常记录
+        profile_updated = False
+        try:
+            with db.session.begin_nested():
+                profile_updated = UserProfileService().apply_interaction(user_id, product_id, interaction_score)
+        except Exception as e:
+            logger.error(f"增量更新用户 {user_id} 特征向量失败: {e}")
+        try:
+            with db.session.begin_nested():
+                InteractionRollupService().apply([{
+                    'user_id': user_id,
+                    'product_id': product_id,
+                    'interaction_type': interaction_type,
+                    'interaction_score': interaction.interaction_score,
+                    'created_at': interaction.created_at
+                }])
+        except Exception as e:
+            logger.error(f"更新交互计数汇总失败: {e}")
         db.session.commit()
+        bump_user_data_version(user_id)
+        if profile_updated:
+            bump_user_version(user_id)
         
         return interaction.to_dict()
     
@@ -107,41 +162,7 @@ class UserService:
         if not user:
             return None
         
-        # 获取用户交互统计
-        interactions = UserInteraction.query.filter_by(user_id=user_id).all()
-        
-        # 分析交互类型分布
-        interaction_types = {}
-        for interaction in interactions:
-            interaction_type = interaction.interaction_type
-            if interaction_type not in interaction_types:
-                interaction_types[interaction_type] = 0
-            interaction_types[interaction_type] += 1
-        
-        # 分析偏好分类
-        category_preferences = {}
-        for interaction in interactions:
-            if interaction.product and interaction.product.category:
-                category_name = interaction.product.category.name
-                if category_name not in category_preferences:
-                    category_preferences[category_name] = 0
-                category_preferences[category_name] += interaction.interaction_score
-        
-        # 获取最近活跃度
-        recent_interactions = UserInteraction.query.filter(
-            UserInteraction.user_id == user_id,
-            UserInteraction.created_at >= datetime.utcnow() - timedelta(days=30)
-        ).count()
-        
-        preferences = {
-            'interaction_types': interaction_types,
-            'category_preferences': category_preferences,
-            'recent_activity': recent_interactions,
-            'total_interactions': len(interactions),
-            'preferences': json.loads(user.preferences) if user.preferences else {}
-        }
-        
-        return preferences
+        return self._format_preferences(user, self._interaction_summary(user.id))
     
     def update_user_preferences(self, user_id: int, preferences: dict):
         """更新用户偏好"""
@@ -151,6 +172,7 @@ class UserService:
         
         user.preferences = json.dumps(preferences)
         db.session.commit()
+        bump_user_data_version(user_id)
         
         return user.to_dict()
     
@@ -160,33 +182,121 @@ class UserService:
         if not user:
             return None
         
-        # 基础统计
-        total_interactions = UserInteraction.query.filter_by(user_id=user_id).count()
-        unique_products = db.session.query(UserInteraction.product_id).filter_by(
-            user_id=user_id
-        ).distinct().count()
-        
-        # 最近7天活动
-        recent_week = datetime.utcnow() - timedelta(days=7)
-        recent_interactions = UserInteraction.query.filter(
-            UserInteraction.user_id == user_id,
-            UserInteraction.created_at >= recent_week
-        ).count()
-        
-        # 最常交互的商品类型
-        top_categories = db.session.query(
+        return self._format_statistics(user, self._interaction_summary(user.id))
+    
+    def get_user_dashboard(self, user_id: int, recent_limit: int = 5):
+        """
+        获取用户仪表板数据（用户信息、统计、偏好分析与最近交互）
+
+        用户只加载一次，统计与偏好共用一次交互汇总；结果按用户缓存，
+        记录新交互、修改用户资料、特征向量或商品目录变化时失效
+        """
+        return dashboard_cache.get_or_set(
+            (user_id, recent_limit),
+            lambda: self._build_dashboard(user_id, recent_limit),
+            scopes=(CATALOG_SCOPE, user_scope(user_id), user_data_scope(user_id))
+        )
+    
+    def _build_dashboard(self, user_id: int, recent_limit: int):
+        user = User.query.filter_by(id=user_id).first()
+        if not user:
+            return None
+        
+        summary = self._interaction_summary(user.id)
+        recent = UserInteraction.query.filter(UserInteraction.user_id == user.id).order_by(
+            UserInteraction.created_at.desc(), UserInteraction.id.desc()
+        ).limit(recent_limit).all()
+        return {
+            'user': user.to_dict(),
+            'statistics': self._format_statistics(user, summary),
+            'preferences': self._format_preferences(user, summary),
+            'recent_interactions': self._with_products(recent)
+        }
+    
+    @staticmethod
+    def _interaction_summary(user_id: int) -> dict:
+        """
+        用户交互汇总：优先读取交互计数汇总（3次查询），否则对交互记录一次分组聚合加一次去重计数
+
+        Returns:
+            {'types': 类型 -> 次数, 'categories': 分类ID（未分类为None） -> {'count', 'score_sum'},
+             'unique_products', 'recent_week', 'recent_month'}
+        """
+        now = datetime.utcnow()
+        recent_week = now - timedelta(days=7)
+        recent_month = now - timedelta(days=30)
+        
+        rollups = InteractionRollupService()
+        if rollups.usable():
+            # 分类取交互发生时商品所属分类
+            totals = rollups.totals(SCOPE_USER, user_id)
+            week_count, month_count = rollups.window_counts(
+                SCOPE_USER, [recent_week, recent_month], scope_id=user_id
+            )
+            return {
+                'types': {interaction_type: counts['count'] for interaction_type, counts in totals.items()},
+                'categories': {
+                    category_id or None: counts
+                    for category_id, counts in rollups.user_category_totals(user_id).items()
+                },
+                'unique_products': sum(counts['new_pairs'] for counts in totals.values()),
+                'recent_week': week_count,
+                'recent_month': month_count
+            }
+        
+        rows = db.session.query(
+            UserInteraction.interaction_type,
             Product.category_id,
-            db.func.count(UserInteraction.id).label('count')
-        ).join(UserInteraction).filter(
+            db.func.count(UserInteraction.id),
+            db.func.sum(UserInteraction.interaction_score),
+            db.func.sum(case((UserInteraction.created_at >= recent_week, 1), else_=0)),
+            db.func.sum(case((UserInteraction.created_at >= recent_month, 1), else_=0))
+        ).outerjoin(Product, Product.id == UserInteraction.product_id).filter(
             UserInteraction.user_id == user_id
-        ).group_by(Product.category_id).order_by(
-            db.desc('count')
-        ).limit(5).all()
-        
-        statistics = {
-            'total_interactions': total_interactions,
-            'unique_products_viewed': unique_products,
-            'recent_week_activity': recent_interactions,
+        ).group_by(UserInteraction.interaction_type, Product.category_id).all()
+        unique_products = db.session.query(
+            db.func.count(db.distinct(UserInteraction.product_id))
+        ).filter(UserInteraction.user_id == user_id).scalar() or 0
+        
+        summary = {'types': {}, 'categories': {}, 'unique_products': int(unique_products),
+                   'recent_week': 0, 'recent_month': 0}
+        for interaction_type, category_id, count, score_sum, week_count, month_count in rows:
+            summary['types'][interaction_type] = summary['types'].get(interaction_type, 0) + count
+            category = summary['categories'].setdefault(category_id, {'count': 0, 'score_sum': 0.0})
+            category['count'] += count
+            category['score_sum'] += float(score_sum or 0.0)
+            summary['recent_week'] += int(week_count or 0)
+            summary['recent_month'] += int(month_count or 0)
+        return summary
+    
+    @staticmethod
+    def _format_preferences(user: User, summary: dict) -> dict:
+        """偏好分析：交互类型分布、各分类的评分合计与近30天活跃度"""
+        names = CategoryCatalog().category_names()
+        category_preferences = {}
+        for category_id, counts in summary['categories'].items():
+            if category_id in names:
+                name = names[category_id]
+                category_preferences[name] = category_preferences.get(name, 0) + counts['score_sum']
+        return {
+            'interaction_types': dict(summary['types']),
+            'category_preferences': category_preferences,
+            'recent_activity': summary['recent_month'],
+            'total_interactions': sum(summary['types'].values()),
+            'preferences': json.loads(user.preferences) if user.preferences else {}
+        }
+    
+    @staticmethod
+    def _format_statistics(user: User, summary: dict) -> dict:
+        """用户统计：交互总数、浏览商品数、近7天活动与最常交互的分类"""
+        top_categories = sorted(
+            ((category_id, counts['count']) for category_id, counts in summary['categories'].items()),
+            key=lambda item: item[1], reverse=True
+        )[:5]
+        return {
+            'total_interactions': sum(summary['types'].values()),
+            'unique_products_viewed': summary['unique_products'],
+            'recent_week_activity': summary['recent_week'],
             'top_categories': [
                 {'category_id': cat_id, 'interaction_count': count}
                 for cat_id, count in top_categories
@@ -194,8 +304,6 @@ class UserService:
             'account_created': user.created_at.isoformat() if user.created_at else None,
             'last_updated': user.updated_at.isoformat() if user.updated_at else None
         }
-        
-        return statistics
     
     def delete_user(self, user_id: int):
         """删除用户"""
@@ -203,11 +311,18 @@ class UserService:
         if not user:
             return False
         
-        # 删除用户相关的交互记录
+        # 删除用户相关的交互记录与用户维度的计数汇总（商品、分类维度的计数在全量重建时纠正）
         UserInteraction.query.filter_by(user_id=user_id).delete()
+        if InteractionRollupService().usable():
+            InteractionRollup.query.filter(
+                InteractionRollup.scope.in_([SCOPE_USER, SCOPE_USER_CATEGORY]),
+                InteractionRollup.scope_id == user_id
+            ).delete(synchronize_session=False)
+            InteractionPair.query.filter_by(user_id=user_id).delete(synchronize_session=False)
         
         # 删除用户
         db.session.delete(user)
         db.session.commit()
+        bump_user_data_version(user_id)
         
         return True
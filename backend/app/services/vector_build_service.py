@@ -0,0 +1,505 @@
+"""
+向量批量构建服务
+以矩阵运算批量计算标签向量与商品向量，替代逐标签、逐商品查询的计算方式
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+import numpy as np
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from scipy.sparse import csr_matrix
+from sqlalchemy import text, bindparam, inspect
+from flask import current_app, has_app_context
+
+from app import db
+from app.utils.vector_codec import decode_vector, encode_for_storage, to_pgvector_text
+from app.services.vector_index_service import ProductVectorIndex
+from app.utils.result_cache import bump_catalog_version
+from app.utils.text_processing import TextProcessor
+from app.utils.worker_pool import create_pool
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = 'vector_build'
+PRODUCT_CHECKPOINT_FILE = 'product_vectors.json'
+
+PRODUCT_VECTOR_JOB = 'product_vectors'
+TAG_VECTOR_JOB = 'tag_vectors'
+
+# 标签数低于该值时串行分词（进程池启动开销大于收益）
+TAG_PARALLEL_THRESHOLD = 200
+
+# 标签分词进程池子进程中的分词器（由 _init_tag_segmenter 创建；子进程只分词，词表查找在调用进程中进行）
+_tag_segmenter = None
+
+
+def _init_tag_segmenter():
+    global _tag_segmenter
+    _tag_segmenter = TextProcessor()
+
+
+def _segment_tag_in_worker(tag: str) -> List[str]:
+    return _tag_segmenter.segment_text(tag)
+
+
+class VectorBuildService:
+    """向量批量构建服务"""
+
+    # 各构建任务的进度在进程内共享，供进度接口查询
+    _progress: Dict[str, Dict] = {}
+    # 同一进程内同时只运行一个构建任务（商品向量依赖标签向量）
+    _run_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 进度与断点
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def get_progress(cls, job: str = PRODUCT_VECTOR_JOB) -> Dict:
+        """获取当前（或最近一次）构建进度"""
+        progress = dict(cls._progress.get(job, {'status': 'idle'}))
+        if job == PRODUCT_VECTOR_JOB and progress.get('status') == 'idle':
+            checkpoint = cls._load_checkpoint()
+            if checkpoint:
+                progress['checkpoint'] = checkpoint
+        return progress
+
+    @classmethod
+    def _set_progress(cls, job: str, state: Dict):
+        cls._progress[job] = dict(state)
+
+    @staticmethod
+    def _checkpoint_path() -> str:
+        directory = os.path.join(current_app.instance_path, CHECKPOINT_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, PRODUCT_CHECKPOINT_FILE)
+
+    @classmethod
+    def _load_checkpoint(cls) -> Optional[Dict]:
+        try:
+            path = cls._checkpoint_path()
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取商品向量构建断点失败: {e}")
+            return None
+
+    @classmethod
+    def _save_checkpoint(cls, state: Dict):
+        path = cls._checkpoint_path()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------
+    # 数据加载
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def load_tag_matrix() -> Tuple[Dict[str, int], Optional[np.ndarray]]:
+        """
+        一次读取全部标签向量
+
+        Returns:
+            (标签 -> 行号, float32矩阵)，无标签向量时矩阵为None
+        """
+        tag_rows = {}
+        vectors = []
+        result = db.session.execute(text("SELECT tag, vector_bin, vector FROM tag_vectors"))
+        while True:
+            rows = result.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                vector = decode_vector(row.vector_bin if row.vector_bin is not None else row.vector)
+                if vector is None or not len(vector) or row.tag in tag_rows:
+                    continue
+                tag_rows[row.tag] = len(vectors)
+                vectors.append(vector)
+        if not vectors:
+            return tag_rows, None
+        return tag_rows, np.vstack(vectors).astype(np.float32, copy=False)
+
+    @staticmethod
+    def _next_product_ids(after_id: int, chunk_size: int, only_missing: bool) -> List[int]:
+        """按主键顺序取下一批商品ID"""
+        missing_clause = "AND embedding IS NULL AND embedding_bin IS NULL" if only_missing else ""
+        rows = db.session.execute(text(f"""
+            SELECT id FROM products
+            WHERE id > :after_id {missing_clause}
+            ORDER BY id
+            LIMIT :chunk_size
+        """), {'after_id': after_id, 'chunk_size': chunk_size}).fetchall()
+        return [row.id for row in rows]
+
+    @staticmethod
+    def _count_products(after_id: int, only_missing: bool) -> int:
+        missing_clause = "AND embedding IS NULL AND embedding_bin IS NULL" if only_missing else ""
+        return db.session.execute(text(
+            f"SELECT COUNT(*) FROM products WHERE id > :after_id {missing_clause}"
+        ), {'after_id': after_id}).scalar() or 0
+
+    @staticmethod
+    def _has_pgvector_column() -> bool:
+        """PostgreSQL下products表存在pgvector列时同步写入"""
+        if db.engine.dialect.name != 'postgresql':
+            return False
+        columns = {column['name'] for column in inspect(db.engine).get_columns('products')}
+        return 'product_vector' in columns
+
+    # ------------------------------------------------------------------
+    # 商品向量
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def compute_product_vectors(product_ids: List[int], tag_rows: Dict[str, int],
+                                tag_matrix: np.ndarray) -> Dict[int, np.ndarray]:
+        """
+        计算一批商品的标签向量加权平均
+
+        读取这批商品的全部标签，构造 商品×标签 的稀疏权重矩阵W，
+        商品向量 = (W @ 标签矩阵) / 每行权重和；没有有效标签向量的商品不返回
+        """
+        if not product_ids:
+            return {}
+        result = db.session.execute(text("""
+            SELECT product_id, tag, weight FROM product_tags
+            WHERE product_id IN :ids
+            ORDER BY product_id
+        """).bindparams(bindparam('ids', expanding=True)), {'ids': product_ids})
+
+        positions = {pid: i for i, pid in enumerate(product_ids)}
+        row_index, col_index, weights = [], [], []
+        for product_id, tag, weight in result:
+            tag_row = tag_rows.get(tag)
+            if tag_row is None:
+                continue
+            row_index.append(positions[product_id])
+            col_index.append(tag_row)
+            weights.append(float(weight) if weight else 1.0)
+        if not weights:
+            return {}
+
+        # 重复的(商品, 标签)权重会被累加，与逐条计算时重复计入一致
+        weight_matrix = csr_matrix(
+            (np.asarray(weights, dtype=np.float64), (row_index, col_index)),
+            shape=(len(product_ids), len(tag_matrix))
+        )
+        weight_sums = np.asarray(weight_matrix.sum(axis=1)).ravel()
+        valid = np.flatnonzero(weight_sums > 0)
+        if not len(valid):
+            return {}
+        vectors = np.asarray(weight_matrix[valid] @ tag_matrix) / weight_sums[valid, None]
+        return {product_ids[i]: vectors[n] for n, i in enumerate(valid)}
+
+    @staticmethod
+    def _write_product_vectors(vectors: Dict[int, np.ndarray], with_pgvector: bool):
+        """executemany 批量写回商品向量"""
+        now = datetime.utcnow()
+        pgvector_clause = ", product_vector = CAST(:vector AS vector)" if with_pgvector else ""
+        update_sql = text(f"""
+            UPDATE products
+            SET embedding = :embedding, embedding_bin = :embedding_bin{pgvector_clause}, updated_at = :now
+            WHERE id = :id
+        """)
+        params = []
+        for product_id, vector in vectors.items():
+            embedding, embedding_bin = encode_for_storage(vector)
+            item = {'id': product_id, 'embedding': embedding, 'embedding_bin': embedding_bin, 'now': now}
+            if with_pgvector:
+                item['vector'] = to_pgvector_text(vector)
+            params.append(item)
+        db.session.execute(update_sql, params)
+
+    def build_product_vectors(self, chunk_size: int = 2000, only_missing: bool = True,
+                              resume: bool = False, start_after_id: Optional[int] = None,
+                              progress_callback: Optional[Callable[[Dict], None]] = None,
+                              should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """
+        批量重算商品向量
+
+        Args:
+            chunk_size: 每批商品数
+            only_missing: 只计算尚无向量的商品
+            resume: 从上次中断的断点继续
+            start_after_id: 从该商品ID之后开始（优先于断点文件，由后台任务传入已提交的位置）
+            progress_callback: 每批提交后以当前进度调用
+            should_stop: 每批提交后调用，返回True时停止（状态为cancelled）
+
+        Returns:
+            {"success": 成功数, "failed": 失败数, ...}，出错时包含 "error"
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {"success": 0, "failed": 0, "error": "向量构建任务正在进行中"}
+
+        try:
+            start_time = time.time()
+            after_id, success_count, failed_count = 0, 0, 0
+            checkpoint = self._load_checkpoint() if resume and start_after_id is None else None
+            if start_after_id:
+                after_id = start_after_id
+                logger.info(f"从商品ID {after_id} 之后继续构建商品向量")
+            elif checkpoint and checkpoint.get('status') != 'completed':
+                after_id = checkpoint.get('last_product_id', 0)
+                success_count = checkpoint.get('success', 0)
+                failed_count = checkpoint.get('failed', 0)
+                only_missing = checkpoint.get('only_missing', only_missing)
+                logger.info(f"从断点继续构建商品向量: last_product_id={after_id}")
+
+            tag_rows, tag_matrix = self.load_tag_matrix()
+            if tag_matrix is None:
+                return {"success": 0, "failed": 0, "error": "没有可用的标签向量，请先预计算标签向量"}
+            logger.info(f"已加载 {len(tag_rows)} 个标签向量")
+
+            with_pgvector = self._has_pgvector_column()
+            total = self._count_products(after_id, only_missing)
+            processed = 0
+            state = {
+                'status': 'running',
+                'total': total,
+                'processed': processed,
+                'success': success_count,
+                'failed': failed_count,
+                'last_product_id': after_id,
+                'only_missing': only_missing,
+                'chunk_size': chunk_size,
+                'started_at': datetime.utcnow().isoformat()
+            }
+            self._set_progress(PRODUCT_VECTOR_JOB, state)
+            logger.info(f"开始批量构建商品向量: 待处理 {total} 个商品, 每批 {chunk_size}")
+
+            while True:
+                product_ids = self._next_product_ids(after_id, chunk_size, only_missing)
+                if not product_ids:
+                    break
+
+                vectors = self.compute_product_vectors(product_ids, tag_rows, tag_matrix)
+                if vectors:
+                    self._write_product_vectors(vectors, with_pgvector)
+                db.session.commit()
+                # 索引内容取自 product_vector 列：原始SQL写入该列后直接同步本进程的向量索引
+                if with_pgvector:
+                    ProductVectorIndex().apply_changes(vectors, ())
+
+                after_id = product_ids[-1]
+                processed += len(product_ids)
+                success_count += len(vectors)
+                failed_count += len(product_ids) - len(vectors)
+
+                state.update({
+                    'processed': processed,
+                    'success': success_count,
+                    'failed': failed_count,
+                    'last_product_id': after_id,
+                    'updated_at': datetime.utcnow().isoformat()
+                })
+                self._save_checkpoint(state)
+                self._set_progress(PRODUCT_VECTOR_JOB, state)
+                if progress_callback:
+                    progress_callback(dict(state))
+                logger.info(f"商品向量构建进度: {processed}/{total}, 成功 {success_count}, 失败 {failed_count}")
+                if should_stop and should_stop():
+                    state['status'] = 'cancelled'
+                    break
+
+            if state['status'] == 'running':
+                state['status'] = 'completed'
+            state['elapsed'] = round(time.time() - start_time, 2)
+            self._save_checkpoint(state)
+            self._set_progress(PRODUCT_VECTOR_JOB, state)
+            if success_count:
+                bump_catalog_version()
+            logger.info(f"商品向量批量构建结束({state['status']}): 成功 {success_count}, 失败 {failed_count}, "
+                        f"耗时 {state['elapsed']}s")
+            return {"success": success_count, "failed": failed_count, "status": state['status'],
+                    "last_product_id": after_id, "elapsed": state['elapsed']}
+
+        except Exception as e:
+            db.session.rollback()
+            self._set_progress(PRODUCT_VECTOR_JOB, dict(self.get_progress(PRODUCT_VECTOR_JOB),
+                                                        status='failed', error=str(e)))
+            # 失败前已提交的批次同样需要让结果缓存失效
+            bump_catalog_version()
+            logger.error(f"批量构建商品向量失败: {e}")
+            return {"success": 0, "failed": 0, "error": str(e)}
+        finally:
+            self._run_lock.release()
+
+    # ------------------------------------------------------------------
+    # 标签向量
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def find_missing_tags() -> List[str]:
+        """一次反连接找出尚无向量的标签"""
+        rows = db.session.execute(text("""
+            SELECT DISTINCT pt.tag
+            FROM product_tags pt
+            LEFT JOIN tag_vectors tv ON tv.tag = pt.tag
+            WHERE tv.id IS NULL
+            ORDER BY pt.tag
+        """)).fetchall()
+        return [row.tag for row in rows if row.tag]
+
+    @property
+    def recommender(self):
+        """词向量与分词器来自RecommendationService单例"""
+        from app.services.recommendation_service import RecommendationService
+        return RecommendationService()
+
+    def tag_word_indices(self, tag: str) -> List[int]:
+        """标签分词后各词在词向量矩阵中的行号"""
+        return self.word_indices(self.recommender.text_processor.segment_text(tag))
+
+    def word_indices(self, words: List[str]) -> List[int]:
+        """各词在词向量矩阵中的行号（不在词表中的词回退小写形式，仍找不到则忽略）"""
+        word_vectors = self.recommender.word_vectors
+        indices = []
+        for word in words:
+            index = word_vectors.get_index(word, None)
+            if index is None:
+                index = word_vectors.get_index(word.lower(), None)
+            if index is not None:
+                indices.append(index)
+        return indices
+
+    def _open_tag_pool(self, workers: Optional[int], tag_count: int):
+        """创建标签分词进程池，返回 (进程池, 进程数)；不适用或不可用时进程池为None（串行分词）"""
+        if workers is None:
+            workers = current_app.config.get('VECTOR_BUILD_WORKERS') if has_app_context() else None
+            workers = workers or os.cpu_count() or 1
+        if workers <= 1 or tag_count < TAG_PARALLEL_THRESHOLD:
+            return None, 1
+
+        try:
+            return create_pool(workers, initializer=_init_tag_segmenter, preload=(__name__,)), workers
+        except (AssertionError, OSError) as e:
+            # 守护进程中不能再创建子进程等情况，降级为串行
+            logger.warning(f"并行分词不可用，降级为串行: {e}")
+            return None, 1
+
+    def compute_tag_vectors(self, index_lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        一次gather取出全部词向量，再用reduceat按标签求平均
+
+        Returns:
+            (标签向量矩阵, 有效标记)，矩阵只包含有效标签的行
+        """
+        word_vectors = self.recommender.word_vectors
+        counts = np.fromiter((len(indices) for indices in index_lists), dtype=np.int64, count=len(index_lists))
+        valid = counts > 0
+        if not valid.any():
+            return np.empty((0, word_vectors.vector_size), dtype=np.float32), valid
+
+        flat = np.fromiter((i for indices in index_lists for i in indices), dtype=np.int64, count=int(counts.sum()))
+        gathered = np.asarray(word_vectors.vectors[flat], dtype=np.float32)
+        valid_counts = counts[valid]
+        offsets = np.concatenate(([0], np.cumsum(valid_counts)[:-1]))
+        return np.add.reduceat(gathered, offsets, axis=0) / valid_counts[:, None], valid
+
+    @staticmethod
+    def _insert_tag_vectors(tags: List[str], vectors: np.ndarray):
+        """批量写入标签向量，已存在的标签（并发写入）跳过"""
+        now = datetime.utcnow()
+        params = []
+        for tag, vector in zip(tags, vectors):
+            vector_text, vector_bin = encode_for_storage(vector)
+            params.append({'tag': tag, 'vector': vector_text, 'vector_bin': vector_bin, 'created_at': now})
+        db.session.execute(text("""
+            INSERT INTO tag_vectors (tag, vector, vector_bin, created_at)
+            VALUES (:tag, :vector, :vector_bin, :created_at)
+            ON CONFLICT (tag) DO NOTHING
+        """), params)
+
+    def build_tag_vectors(self, workers: Optional[int] = None, chunk_size: int = 5000,
+                          progress_callback: Optional[Callable[[Dict], None]] = None,
+                          should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """
+        批量预计算缺失的标签向量
+
+        Args:
+            workers: 分词进程数，默认取配置 VECTOR_BUILD_WORKERS 或CPU核数
+            chunk_size: 每批写入的标签数
+            progress_callback: 每批提交后以当前进度调用
+            should_stop: 每批提交后调用，返回True时停止（状态为cancelled，重新执行即继续）
+
+        Returns:
+            {"success": 成功数, "failed": 失败数, ...}，出错时包含 "error"
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {"success": 0, "failed": 0, "error": "向量构建任务正在进行中"}
+
+        pool = None
+        try:
+            start_time = time.time()
+            if not self.recommender.load_word_vectors():
+                return {"success": 0, "failed": 0, "error": "词向量模型加载失败"}
+
+            tags = self.find_missing_tags()
+            state = {
+                'status': 'running',
+                'total': len(tags),
+                'processed': 0,
+                'success': 0,
+                'failed': 0,
+                'chunk_size': chunk_size,
+                'started_at': datetime.utcnow().isoformat()
+            }
+            self._set_progress(TAG_VECTOR_JOB, state)
+            logger.info(f"发现 {len(tags)} 个缺少向量的标签")
+
+            pool, workers = self._open_tag_pool(workers, len(tags))
+            for start in range(0, len(tags), chunk_size):
+                chunk = tags[start:start + chunk_size]
+                if pool is not None:
+                    index_lists = [self.word_indices(words) for words in pool.map(
+                        _segment_tag_in_worker, chunk, chunksize=max(1, len(chunk) // (workers * 4))
+                    )]
+                else:
+                    index_lists = [self.tag_word_indices(tag) for tag in chunk]
+
+                vectors, valid = self.compute_tag_vectors(index_lists)
+                if len(vectors):
+                    self._insert_tag_vectors([tag for tag, ok in zip(chunk, valid) if ok], vectors)
+                db.session.commit()
+
+                state['processed'] += len(chunk)
+                state['success'] += int(valid.sum())
+                state['failed'] += len(chunk) - int(valid.sum())
+                state['updated_at'] = datetime.utcnow().isoformat()
+                self._set_progress(TAG_VECTOR_JOB, state)
+                if progress_callback:
+                    progress_callback(dict(state))
+                logger.info(f"标签向量构建进度: {state['processed']}/{state['total']}, "
+                            f"成功 {state['success']}, 失败 {state['failed']}")
+                if should_stop and should_stop():
+                    state['status'] = 'cancelled'
+                    break
+
+            if state['status'] == 'running':
+                state['status'] = 'completed'
+            state['elapsed'] = round(time.time() - start_time, 2)
+            self._set_progress(TAG_VECTOR_JOB, state)
+            logger.info(f"标签向量预计算结束({state['status']}): 成功 {state['success']}, 失败 {state['failed']}, "
+                        f"耗时 {state['elapsed']}s")
+            return {"success": state['success'], "failed": state['failed'], "status": state['status'],
+                    "elapsed": state['elapsed']}
+
+        except Exception as e:
+            db.session.rollback()
+            self._set_progress(TAG_VECTOR_JOB, dict(self.get_progress(TAG_VECTOR_JOB),
+                                                    status='failed', error=str(e)))
+            logger.error(f"批量预计算标签向量失败: {e}")
+            return {"success": 0, "failed": 0, "error": str(e)}
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            self._run_lock.release()
@@ -0,0 +1,482 @@
+"""
+进程内商品向量索引服务
+在进程内存中维护 products.product_vector 的近似最近邻索引，
+索引未就绪（冷启动/过期）时由调用方降级到pgvector SQL查询
+"""
+
+import logging
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import text, bindparam, event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.utils.embedding_matrix import EmbeddingMatrix
+from app.utils.vector_codec import decode_vector
+
+try:
+    import hnswlib  # 可选依赖，未安装时索引不可用，统一走pgvector
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+
+class BaseVectorIndex:
+    """向量索引后端基类"""
+
+    name = 'base'
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        """使用全量数据构建索引"""
+        raise NotImplementedError
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray):
+        """插入或更新向量"""
+        raise NotImplementedError
+
+    def remove(self, ids: Iterable[int]):
+        """删除向量"""
+        raise NotImplementedError
+
+    def get_vector(self, product_id: int) -> Optional[np.ndarray]:
+        """获取已索引的商品向量"""
+        raise NotImplementedError
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """返回 [(商品ID, 余弦相似度)]，按相似度降序"""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class HnswVectorIndex(BaseVectorIndex):
+    """基于hnswlib的HNSW索引后端"""
+
+    name = 'hnsw'
+
+    def __init__(self, dimension: int, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        super().__init__(dimension)
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+        self._live_ids = set()
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        index = hnswlib.Index(space='cosine', dim=self.dimension)
+        index.init_index(
+            max_elements=max(int(len(ids) * 1.2), 1000),
+            ef_construction=self.ef_construction,
+            M=self.m
+        )
+        if len(ids):
+            index.add_items(vectors, ids)
+        index.set_ef(self.ef_search)
+        self._index = index
+        self._live_ids = set(int(i) for i in ids)
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray):
+        required = self._index.get_current_count() + len(ids)
+        if required > self._index.get_max_elements():
+            self._index.resize_index(int(required * 1.2))
+        # 已存在的ID会被原地更新（若曾被标记删除则自动恢复）
+        self._index.add_items(vectors, ids)
+        self._live_ids.update(int(i) for i in ids)
+
+    def remove(self, ids: Iterable[int]):
+        for product_id in ids:
+            if product_id in self._live_ids:
+                self._index.mark_deleted(product_id)
+                self._live_ids.discard(product_id)
+
+    def get_vector(self, product_id: int) -> Optional[np.ndarray]:
+        if product_id not in self._live_ids:
+            return None
+        return np.asarray(self._index.get_items([product_id])[0], dtype=np.float32)
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        k = min(k, len(self._live_ids))
+        if k <= 0:
+            return []
+        self._index.set_ef(max(self.ef_search, k))
+        labels, distances = self._index.knn_query(np.asarray(vector, dtype=np.float32), k=k)
+        # hnswlib的cosine距离为 1 - cos，与pgvector的 <=> 一致
+        return [(int(label), float(1.0 - distance)) for label, distance in zip(labels[0], distances[0])]
+
+    def __len__(self) -> int:
+        return len(self._live_ids)
+
+
+class ExactVectorIndex(BaseVectorIndex):
+    """基于连续向量矩阵的精确检索后端（暴力矩阵乘积，无额外依赖）"""
+
+    name = 'exact'
+
+    def __init__(self, dimension: int):
+        super().__init__(dimension)
+        self.matrix = EmbeddingMatrix(dimension)
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        self.matrix = EmbeddingMatrix.from_arrays(ids, vectors) if len(ids) else EmbeddingMatrix(self.dimension)
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray):
+        self.matrix.upsert(ids, vectors)
+
+    def remove(self, ids: Iterable[int]):
+        self.matrix.remove(ids)
+
+    def get_vector(self, product_id: int) -> Optional[np.ndarray]:
+        return self.matrix.get_vector(product_id)
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        return self.matrix.top_k(vector, k)
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+
+# 可用的索引后端，按名称注册
+INDEX_BACKENDS = {
+    HnswVectorIndex.name: HnswVectorIndex,
+    ExactVectorIndex.name: ExactVectorIndex,
+}
+
+
+def _backend_available(backend_name: str) -> bool:
+    """检查索引后端依赖是否可用"""
+    if backend_name == HnswVectorIndex.name:
+        return hnswlib is not None
+    return backend_name in INDEX_BACKENDS
+
+
+class ProductVectorIndex:
+    """商品向量索引管理器（进程级单例）"""
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ProductVectorIndex, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.enabled = True
+            self.backend_name = HnswVectorIndex.name
+            self.dimension = 200  # Tencent词向量维度
+            self.refresh_interval = 30  # 秒，检查数据库变更的最小间隔
+            self.export_batch_size = 5000
+
+            # 索引与矩阵构建完成后不再原地修改，更新时整体重建后替换，查询无需加锁
+            self._index = None
+            self._matrix = None  # 全量向量矩阵，供精确计算与批量查询使用
+            self._removed = frozenset()  # 构建后在本进程删除的商品，查询时过滤，下次重建后清除
+            self._lock = threading.RLock()  # 只保护替换与删除集合的更新
+            self._refresh_lock = threading.Lock()  # 同时只有一个后台同步线程
+            self._build_thread = None
+            self._built_at = None
+            self._signature = None  # 构建时的 (商品数, 最大updated_at)
+            self._last_check = 0.0
+            self._app = None
+
+            self._initialized = True
+
+    def configure(self, app):
+        """从应用配置读取索引参数"""
+        self._app = app
+        self.enabled = app.config.get('VECTOR_INDEX_ENABLED', True)
+        self.backend_name = app.config.get('VECTOR_INDEX_BACKEND', HnswVectorIndex.name)
+        self.refresh_interval = app.config.get('VECTOR_INDEX_REFRESH_INTERVAL', 30)
+        if self.enabled and not _backend_available(self.backend_name):
+            logger.warning(f"向量索引后端 '{self.backend_name}' 不可用，改用精确矩阵检索")
+            self.backend_name = ExactVectorIndex.name
+
+    # ------------------------------------------------------------------
+    # 构建与同步
+    # ------------------------------------------------------------------
+
+    def _new_backend(self) -> BaseVectorIndex:
+        backend_cls = INDEX_BACKENDS[self.backend_name]
+        return backend_cls(self.dimension)
+
+    def _export_vectors(self) -> Tuple[np.ndarray, np.ndarray, Optional[datetime]]:
+        """批量导出商品向量，返回 (ids, vectors, 最大updated_at)"""
+        result = db.session.execute(text("""
+            SELECT id, product_vector AS vector, updated_at
+            FROM products
+            WHERE product_vector IS NOT NULL
+            ORDER BY id
+        """))
+        ids = []
+        chunks = []
+        max_updated = None
+        while True:
+            rows = result.fetchmany(self.export_batch_size)
+            if not rows:
+                break
+            block = np.empty((len(rows), self.dimension), dtype=np.float32)
+            for i, row in enumerate(rows):
+                ids.append(row.id)
+                # 已注册pgvector类型转换时直接得到数组，否则为文本
+                block[i] = decode_vector(row.vector)
+                if row.updated_at and (max_updated is None or row.updated_at > max_updated):
+                    max_updated = row.updated_at
+            chunks.append(block)
+
+        vectors = np.vstack(chunks) if chunks else np.empty((0, self.dimension), dtype=np.float32)
+        return np.asarray(ids, dtype=np.int64), vectors, max_updated
+
+    def _catalog_signature(self) -> Tuple[int, Optional[datetime]]:
+        """获取当前带向量商品的数量与最大更新时间"""
+        row = db.session.execute(text("""
+            SELECT COUNT(*) AS total, MAX(updated_at) AS last_updated
+            FROM products
+            WHERE product_vector IS NOT NULL
+        """)).fetchone()
+        return int(row.total or 0), row.last_updated
+
+    def build(self) -> bool:
+        """从数据库全量构建新索引，完成后整体替换当前索引（需在应用上下文中调用）"""
+        if not self.enabled:
+            return False
+        start_time = time.time()
+        try:
+            ids, vectors, max_updated = self._export_vectors()
+            index = self._new_backend()
+            index.build(ids, vectors)
+            # 精确后端本身就是向量矩阵，其他后端另外保留一份矩阵
+            matrix = getattr(index, 'matrix', None)
+            if matrix is None:
+                matrix = EmbeddingMatrix.from_arrays(ids, vectors) if len(ids) else EmbeddingMatrix(self.dimension)
+
+            with self._lock:
+                self._index = index
+                self._matrix = matrix
+                # 导出之后才删除的商品仍在新索引中，继续过滤
+                self._removed = frozenset(pid for pid in self._removed if pid in matrix)
+                self._built_at = datetime.utcnow()
+                self._signature = (len(ids), max_updated)
+                self._last_check = time.time()
+
+            logger.info(f"商品向量索引构建完成: {len(ids)} 个向量, 后端: {self.backend_name}, "
+                        f"耗时 {(time.time() - start_time):.2f}s")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"构建商品向量索引失败: {e}")
+            return False
+
+    def start_background_build(self, app=None):
+        """在后台线程中构建索引，构建期间查询走pgvector"""
+        app = app or self._app
+        if not self.enabled or app is None:
+            return
+        with self._lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return
+
+            def _run():
+                with app.app_context():
+                    self.build()
+                    db.session.remove()
+
+            self._build_thread = threading.Thread(target=_run, name='product-vector-index-build', daemon=True)
+            self._build_thread.start()
+
+    def wait_for_build(self, timeout: Optional[float] = None) -> bool:
+        """等待后台构建结束（gunicorn preload模式下在fork前调用，使索引由工作进程共享）"""
+        thread = self._build_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self._index is not None
+
+    def after_fork(self):
+        """工作进程fork后重置锁与构建线程状态（父进程中的线程不会被复制到子进程）"""
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._build_thread = None
+
+    def start_background_refresh(self, app=None):
+        """在后台线程中检查商品变更，已有同步或构建在进行时直接返回"""
+        app = app or self._app
+        if not self.enabled or app is None or self._index is None:
+            return
+        if self._build_thread is not None and self._build_thread.is_alive():
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def _run():
+            try:
+                with app.app_context():
+                    self.refresh()
+                    db.session.remove()
+            finally:
+                self._refresh_lock.release()
+
+        try:
+            threading.Thread(target=_run, name='product-vector-index-refresh', daemon=True).start()
+        except Exception:
+            self._refresh_lock.release()
+            raise
+
+    def refresh(self) -> bool:
+        """
+        检查带向量商品的数量与最大更新时间，有变化时全量构建新索引后替换；
+        构建期间查询继续使用当前索引
+        """
+        if self._index is None:
+            return False
+        try:
+            total, last_updated = self._catalog_signature()
+            if self._signature == (total, last_updated):
+                return True
+            logger.info(f"商品向量有变更（索引 {self._signature}, 数据库 {(total, last_updated)}），重建索引")
+            return self.build()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"同步商品向量索引失败: {e}")
+            return False
+
+    def apply_changes(self, upserts: Dict[int, np.ndarray], deletes: Iterable[int]):
+        """
+        应用本进程内提交的商品写入：删除的商品立即从查询结果中过滤，
+        写入的向量在后台重建后生效（当前索引不原地修改）
+        """
+        if self._index is None:
+            return
+        deletes = [int(pid) for pid in deletes]
+        if deletes:
+            with self._lock:
+                self._removed = self._removed | frozenset(deletes)
+        self._last_check = 0.0
+        self.start_background_refresh()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def is_ready(self) -> bool:
+        """索引已构建；到达检查间隔时在后台同步（不阻塞查询）"""
+        if not self.enabled or self._index is None:
+            return False
+        if time.time() - self._last_check > self.refresh_interval:
+            self._last_check = time.time()
+            self.start_background_refresh()
+        return True
+
+    def _ensure_ready(self) -> bool:
+        """索引未就绪时返回False，冷启动时顺带触发后台构建"""
+        if self.is_ready():
+            return True
+        if self.enabled and self._index is None:
+            self.start_background_build()
+        return False
+
+    def search(self, vector: np.ndarray, k: int, exclude_ids: Iterable[int] = ()) -> Optional[List[Tuple[int, float]]]:
+        """
+        查询top-k相似商品
+
+        Returns:
+            [(商品ID, 相似度)] 列表；索引不可用时返回None，调用方应降级到SQL
+        """
+        if not self._ensure_ready():
+            return None
+        index, removed = self._index, self._removed
+        exclude_ids = set(exclude_ids) | removed
+        try:
+            hits = index.search(vector, k + len(exclude_ids))
+            return [hit for hit in hits if hit[0] not in exclude_ids][:k]
+        except Exception as e:
+            logger.error(f"向量索引查询失败，降级到pgvector: {e}")
+            return None
+
+    def search_by_product(self, product_id: int, k: int, exclude_self: bool = True) -> Optional[List[Tuple[int, float]]]:
+        """以已索引商品的向量为查询向量"""
+        if not self._ensure_ready():
+            return None
+        vector = self._index.get_vector(product_id)
+        if vector is None:
+            return None
+        return self.search(vector, k, exclude_ids=(product_id,) if exclude_self else ())
+
+    def get_matrix(self) -> Optional[EmbeddingMatrix]:
+        """
+        获取全量商品向量矩阵，索引不可用时返回None；矩阵构建后不再修改，无需加锁。
+        构建后删除的商品仍在矩阵中，由调用方加载商品信息时过滤
+        """
+        if not self._ensure_ready():
+            return None
+        return self._matrix
+
+    def get_status(self) -> Dict:
+        """索引状态信息"""
+        return {
+            'enabled': self.enabled,
+            'backend': self.backend_name,
+            'ready': self._index is not None,
+            'building': self._build_thread is not None and self._build_thread.is_alive(),
+            'refreshing': self._refresh_lock.locked(),
+            'size': len(self._index) - len(self._removed) if self._index is not None else 0,
+            'built_at': self._built_at.isoformat() if self._built_at else None,
+            'synced_until': self._signature[1].isoformat() if self._signature and self._signature[1] else None
+        }
+
+    @staticmethod
+    def fetch_product_rows(product_ids: List[int]) -> Dict[int, object]:
+        """按ID批量加载商品基础字段（一次IN查询）"""
+        if not product_ids:
+            return {}
+        sql = text("""
+            SELECT id, name, description, price, category_id, image_url, tags
+            FROM products
+            WHERE id IN :ids
+        """).bindparams(bindparam('ids', expanding=True))
+        return {row.id: row for row in db.session.execute(sql, {'ids': list(product_ids)}).fetchall()}
+
+
+# ----------------------------------------------------------------------
+# 商品删除同步：通过ORM提交的商品删除实时从本进程索引中移除。
+# 索引内容取自 product_vector 列，ORM 不映射该列（只由向量批量计算以SQL写入），
+# 因此 embedding 的ORM写入不同步到索引，向量更新由 refresh() 按数量与 updated_at 检测后重建，
+# 索引与数据库始终按同一条件（product_vector IS NOT NULL）比较
+# ----------------------------------------------------------------------
+
+_PENDING_KEY = 'product_vector_index_pending'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    from app.models import Product
+
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Product)]
+    if deleted:
+        session.info.setdefault(_PENDING_KEY, set()).update(deleted)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_product_changes(session):
+    deletes = session.info.pop(_PENDING_KEY, None)
+    if not deletes:
+        return
+    index = ProductVectorIndex()
+    if index._index is None:
+        return
+    try:
+        index.apply_changes({}, deletes)
+    except Exception as e:
+        logger.error(f"同步商品向量索引失败: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop(_PENDING_KEY, None)
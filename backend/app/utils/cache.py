@@ -0,0 +1,213 @@
+"""
+进程内缓存模块
+O(1) 的LRU+TTL淘汰，支持按条目数与字节数限制容量，线程安全，
+并提供命中、未命中、淘汰计数；同名缓存在进程内共享（get_cache）
+"""
+
+import sys
+import time
+import threading
+import logging
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """估算对象占用的字节数（数组取nbytes，容器递归估算，深度有限）"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item, _depth + 1)
+    return size
+
+
+class LRUCache:
+    """
+    LRU+TTL缓存
+
+    条目按访问顺序保存在OrderedDict中，读写、淘汰均为O(1)；
+    过期条目在读取时或位于LRU末端时被清除
+    """
+
+    def __init__(self, name: str, max_entries: int = 1000, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, sizeof: Callable[[Any], int] = estimate_size):
+        """
+        Args:
+            name: 缓存名称（用于统计）
+            max_entries: 最大条目数
+            max_bytes: 最大字节数（按 sizeof 估算），None表示不限制
+            ttl: 默认过期时间（秒），None表示不过期
+            sizeof: 估算值大小的函数
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key: Hashable) -> tuple:
+        entry = self._data.pop(key)
+        self._bytes -= entry[2]
+        return entry
+
+    def _evict(self):
+        """淘汰最久未使用的条目，直到满足容量限制（调用方持有锁）"""
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
+
+    def _purge_expired_head(self, now: float):
+        """清除LRU末端已过期的条目（均摊O(1)）"""
+        while self._data:
+            key = next(iter(self._data))
+            expires_at = self._data[key][1]
+            if expires_at is None or expires_at > now:
+                return
+            self._remove(key)
+            self.expirations += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，未命中或已过期返回default"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            if entry[1] is not None and entry[1] <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存，ttl为None时使用默认过期时间"""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # 单个值超过容量上限，不缓存
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, now + ttl if ttl else None, size)
+            self._bytes += size
+            self._purge_expired_head(now)
+            self._evict()
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """读取缓存，未命中时调用factory计算并写入（factory返回None时不缓存）"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = factory()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            if key not in self._data:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (entry[1] is None or entry[1] > time.time())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        """命中率与容量统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes if self.max_bytes is not None else None,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+
+# ----------------------------------------------------------------------
+# 进程内缓存注册表
+# ----------------------------------------------------------------------
+
+_registry: Dict[str, LRUCache] = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache(name: str, max_entries: int = 1000, max_bytes: Optional[int] = None,
+              ttl: Optional[float] = None) -> LRUCache:
+    """获取（首次调用时创建）指定名称的进程内缓存，后续调用的容量参数被忽略"""
+    cache = _registry.get(name)
+    if cache is None:
+        with _registry_lock:
+            cache = _registry.get(name)
+            if cache is None:
+                cache = LRUCache(name, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+                _registry[name] = cache
+    return cache
+
+
+def all_cache_stats() -> Dict[str, Dict]:
+    """全部已注册缓存的统计信息"""
+    return {name: cache.stats() for name, cache in list(_registry.items())}
+
+
+def clear_caches(name: Optional[str] = None) -> int:
+    """清空指定缓存（name为None时清空全部），返回清空的缓存数"""
+    caches = [_registry[name]] if name in _registry else ([] if name else list(_registry.values()))
+    for cache in caches:
+        cache.clear()
+    logger.info(f"已清空缓存: {name or '全部'}")
+    return len(caches)
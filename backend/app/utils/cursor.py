@@ -0,0 +1,35 @@
+"""
+分页游标模块
+游标记录上一页最后一条记录的排序键，以签名后的URL安全字符串返回给客户端；
+服务端无需保存分页状态，签名防止客户端伪造排序位置
+"""
+
+import hashlib
+from typing import Dict
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+
+def _serializer(salt: str) -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=salt)
+
+
+def encode_cursor(payload: Dict, salt: str) -> str:
+    """生成签名游标"""
+    return _serializer(salt).dumps(payload)
+
+
+def decode_cursor(token: str, salt: str) -> Dict:
+    """校验并解析游标，签名无效时抛出ValueError"""
+    try:
+        payload = _serializer(salt).loads(token)
+    except BadSignature:
+        raise ValueError("无效的分页游标")
+    if not isinstance(payload, dict):
+        raise ValueError("无效的分页游标")
+    return payload
+
+
+def fingerprint(*parts) -> str:
+    """查询条件指纹，写入游标以保证游标只用于生成它的查询"""
+    return hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:12]
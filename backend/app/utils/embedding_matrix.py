@@ -0,0 +1,175 @@
+"""
+商品向量矩阵模块
+将全部商品向量保存为一个L2归一化的连续float32矩阵，
+通过矩阵-向量乘积 + argpartition 完成精确top-k检索
+"""
+
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class EmbeddingMatrix:
+    """L2归一化的连续float32向量矩阵 + ID数组"""
+
+    def __init__(self, dimension: int, capacity: int = 1024):
+        """
+        初始化向量矩阵
+
+        Args:
+            dimension: 向量维度
+            capacity: 初始容量（行数），写入超出时按倍数扩容
+        """
+        self.dimension = dimension
+        self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+        self._id_to_row: Dict[int, int] = {}
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, vectors: np.ndarray) -> 'EmbeddingMatrix':
+        """由ID数组和向量矩阵构建"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        matrix = cls(vectors.shape[1] if vectors.ndim == 2 else 0, capacity=max(len(ids), 1))
+        matrix._vectors[:len(ids)] = cls.normalize(vectors)
+        matrix._ids[:len(ids)] = ids
+        matrix._size = len(ids)
+        matrix._id_to_row = {int(product_id): row for row, product_id in enumerate(ids)}
+        return matrix
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """按行L2归一化，零向量保持为零"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._id_to_row
+
+    def rows(self, ids: Iterable[int]) -> np.ndarray:
+        """ID对应的行号数组，不存在的ID为-1"""
+        return np.array([self._id_to_row.get(int(i), -1) for i in ids], dtype=np.int64)
+
+    def get_vector(self, product_id: int) -> Optional[np.ndarray]:
+        """获取归一化后的向量"""
+        row = self._id_to_row.get(product_id)
+        return None if row is None else self._vectors[row]
+
+    def _reserve(self, required: int):
+        """确保容量足够"""
+        capacity = len(self._ids)
+        if required <= capacity:
+            return
+        new_capacity = max(required, capacity * 2)
+        vectors = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        ids = np.zeros(new_capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors = vectors
+        self._ids = ids
+
+    def upsert(self, ids: Iterable[int], vectors: np.ndarray):
+        """插入或更新向量"""
+        vectors = self.normalize(np.atleast_2d(vectors))
+        ids = [int(i) for i in ids]
+        self._reserve(self._size + len(ids))
+        for product_id, vector in zip(ids, vectors):
+            row = self._id_to_row.get(product_id)
+            if row is None:
+                row = self._size
+                self._ids[row] = product_id
+                self._id_to_row[product_id] = row
+                self._size += 1
+            self._vectors[row] = vector
+
+    def remove(self, ids: Iterable[int]):
+        """删除向量（用最后一行填补空位，保持矩阵连续）"""
+        for product_id in ids:
+            row = self._id_to_row.pop(int(product_id), None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._id_to_row[int(self._ids[row])] = row
+            self._size = last
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """查询向量与全部向量的余弦相似度"""
+        query = self.normalize(query)
+        return self.vectors @ query
+
+    def similarities(self, query: np.ndarray, ids: Iterable[int]) -> np.ndarray:
+        """查询向量与指定ID向量的余弦相似度，不存在的ID返回nan"""
+        rows = self.rows(ids)
+        result = np.full(len(rows), np.nan, dtype=np.float32)
+        found = rows >= 0
+        if found.any():
+            result[found] = self._vectors[rows[found]] @ self.normalize(query)
+        return result
+
+    @staticmethod
+    def _select_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """从一维分数中选出top-k行号（按分数降序）"""
+        if k >= len(scores):
+            return np.argsort(-scores, kind='stable')
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    def top_k(self, query: np.ndarray, k: int, exclude_ids: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """
+        单个查询的精确top-k
+
+        Returns:
+            [(ID, 余弦相似度)]，按相似度降序
+        """
+        if self._size == 0 or k <= 0:
+            return []
+        scores = self.scores(query)
+        for product_id in exclude_ids:
+            row = self._id_to_row.get(int(product_id))
+            if row is not None:
+                scores[row] = -np.inf
+        rows = self._select_top_k(scores, min(k, self._size))
+        return [(int(self._ids[row]), float(scores[row])) for row in rows if np.isfinite(scores[row])]
+
+    def top_k_batch(self, queries: np.ndarray, k: int, chunk_size: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量查询的精确top-k，按块做矩阵-矩阵乘积控制内存
+
+        Returns:
+            (ids, scores)，形状均为 (查询数, k)，按相似度降序
+        """
+        queries = self.normalize(np.atleast_2d(queries))
+        k = min(k, self._size)
+        all_ids = np.zeros((len(queries), k), dtype=np.int64)
+        all_scores = np.zeros((len(queries), k), dtype=np.float32)
+        if k == 0:
+            return all_ids, all_scores
+
+        vectors = self.vectors
+        for start in range(0, len(queries), chunk_size):
+            block = queries[start:start + chunk_size] @ vectors.T
+            if k < self._size:
+                candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.tile(np.arange(self._size), (len(block), 1))
+            candidate_scores = np.take_along_axis(block, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1, kind='stable')
+            rows = np.take_along_axis(candidates, order, axis=1)
+            all_ids[start:start + len(block)] = self._ids[rows]
+            all_scores[start:start + len(block)] = np.take_along_axis(candidate_scores, order, axis=1)
+        return all_ids, all_scores
@@ -19,15 +19,18 @@ class HybridVectorTextProcessor:
         初始化混合分词器
         
         Args:
-            word_vectors: 词向量模型对象
+            word_vectors: 词向量模型对象（KeyedVectors 或 PrunedWordVectors）
         """
         self.word_vectors = word_vectors
-        self.vocab_set = set(word_vectors.index_to_key)
         
         # 预定义商品相关词汇
         self.product_vocab = self._load_product_vocab()
         
-        logger.info(f"混合分词器初始化完成，词汇量: {len(self.vocab_set)}")
+        logger.info(f"混合分词器初始化完成，词汇量: {len(self.word_vectors)}")
+    
+    def in_vocab(self, word: str) -> bool:
+        """词是否在词向量模型中（直接查询模型的哈希索引，不额外构建词汇集合）"""
+        return word in self.word_vectors
     
     def _load_product_vocab(self) -> Set[str]:
         """加载商品相关词汇"""
@@ -54,7 +57,7 @@ class HybridVectorTextProcessor:
         }
         
         # 只保留在词向量模型中的词汇
-        valid_vocab = {word for word in product_keywords if word in self.vocab_set}
+        valid_vocab = {word for word in product_keywords if self.in_vocab(word)}
         logger.info(f"加载商品词汇: {len(valid_vocab)} 个")
         
         return valid_vocab
@@ -75,7 +78,7 @@ class HybridVectorTextProcessor:
         logger.info(f"开始混合分词: '{text}'")
         
         # 步骤1: 优先检查整体词
-        if text in self.vocab_set:
+        if self.in_vocab(text):
             logger.info(f"整体词匹配: '{text}'")
             return [text]
         
@@ -162,7 +165,7 @@ class HybridVectorTextProcessor:
         valid_words = []
         
         for word in words:
-            if word in self.vocab_set:
+            if self.in_vocab(word):
                 valid_words.append(word)
                 logger.debug(f"✓ '{word}' 在词向量模型中")
             else:
@@ -178,7 +181,7 @@ class HybridVectorTextProcessor:
         for i in range(len(text)):
             for j in range(i+1, len(text)+1):
                 subword = text[i:j]
-                if subword in self.vocab_set and len(subword) >= 2:
+                if len(subword) >= 2 and self.in_vocab(subword):
                     words.append(subword)
                     logger.debug(f"降级分词找到: '{subword}'")
                     break
@@ -190,7 +193,7 @@ class HybridVectorTextProcessor:
         words = []
         
         for char in text:
-            if char in self.vocab_set:
+            if self.in_vocab(char):
                 words.append(char)
                 logger.debug(f"单字匹配: '{char}'")
         
@@ -199,7 +202,7 @@ class HybridVectorTextProcessor:
     def get_vocab_stats(self) -> dict:
         """获取词汇统计信息"""
         return {
-            'total_vocab_size': len(self.vocab_set),
+            'total_vocab_size': len(self.word_vectors),
             'product_vocab_size': len(self.product_vocab),
             'product_vocab': list(self.product_vocab)
         }
@@ -0,0 +1,49 @@
+"""
+响应JSON序列化模块
+安装orjson时用其替换Flask默认的json编码器：列表、搜索等接口一次返回上百个商品字典，
+标准库json的编码在大响应上占比明显；未安装时保持Flask默认行为
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # 可选依赖，未安装时使用Flask默认编码器
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """基于orjson的JSON编码器，输出与 DefaultJSONProvider 保持一致"""
+
+    # 日期交给 DefaultJSONProvider.default 处理（HTTP日期格式），numpy数组与标量直接序列化
+    _base_option = 0 if orjson is None else (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+    def _option(self, pretty: bool = False) -> int:
+        option = self._base_option
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs) -> str:
+        # 带自定义参数（如 indent、cls）的调用交给标准库json
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """生成JSON响应（直接写入orjson输出的字节，省去一次解码再编码）"""
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._option(pretty))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
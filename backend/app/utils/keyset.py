@@ -0,0 +1,134 @@
+"""
+键集分页模块
+列表按 (created_at, id) 倒序分页（created_at 为空的记录排在最后）：下一页从上一页最后一条的排序键之后继续（WHERE 代替 OFFSET），
+配合 (过滤列, created_at, id) 复合索引，深分页与首页代价相同；
+总数只在请求时计算，超过上限时在PostgreSQL上取查询计划的估计值
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from app import db
+from app.utils.cursor import decode_cursor, encode_cursor
+
+# 精确计数的上限，超过后总数为估计值
+EXACT_COUNT_LIMIT = 1000
+
+
+def count_estimate(query, id_column, exact_limit: int = EXACT_COUNT_LIMIT) -> Tuple[int, bool]:
+    """
+    查询结果数：不超过 exact_limit 时精确计数（计数在达到上限后即停止扫描），
+    超过时PostgreSQL取查询计划的估计行数，其他数据库完整计数
+
+    Returns:
+        (总数, 是否为估计值)
+    """
+    query = query.order_by(None).with_entities(id_column)
+    exact = db.session.query(func.count()).select_from(
+        query.limit(exact_limit + 1).subquery()
+    ).scalar() or 0
+    if exact <= exact_limit:
+        return int(exact), False
+    if db.engine.dialect.name != 'postgresql':
+        return int(query.count()), False
+
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    return max(estimate, int(exact)), True
+
+
+def keyset_paginate(query, created_column, id_column, per_page: int, salt: str, scope: str,
+                    page: int = 1, cursor: Optional[str] = None, with_total: bool = False) -> Tuple[List, Dict]:
+    """
+    按 (created_column, id_column) 倒序分页，created_column 为空的记录排在最后（按 id_column 倒序）
+
+    Args:
+        query: 已加过滤条件的ORM查询（原有排序被替换）
+        created_column: 时间列
+        id_column: 主键列（时间相同时的次序）
+        per_page: 每页条数
+        salt: 游标签名salt（各列表接口不同）
+        scope: 查询条件指纹，游标只能用于生成它的查询
+        page: 页码；未传游标时按 OFFSET 定位（兼容旧客户端），传游标时只用于返回值
+        cursor: 上一页返回的 next_cursor
+        with_total: 是否计算总数
+
+    Returns:
+        (本页记录, 分页信息)
+
+    Raises:
+        ValueError: 游标无效或与查询条件不匹配
+    """
+    after = None
+    if cursor:
+        payload = decode_cursor(cursor, salt)
+        if payload.get('q') != scope:
+            raise ValueError("分页游标与查询条件不匹配")
+        try:
+            created_at = payload['t']
+            after = (datetime.fromisoformat(created_at) if created_at is not None else None, int(payload['i']))
+            page = int(payload.get('p', page))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("无效的分页游标")
+
+    limit = per_page + 1
+    query = query.order_by(None)
+    if after is None and page > 1:
+        # 按页码定位与游标分页顺序相同：时间为空的记录排在最后
+        rows = query.order_by(created_column.desc().nulls_last(), id_column.desc()).offset(
+            (page - 1) * per_page
+        ).limit(limit).all()
+    else:
+        # 先取时间不为空的记录，不足一页时接着取时间为空的记录（按ID倒序），两段查询都可使用复合索引
+        rows = []
+        if after is None or after[0] is not None:
+            dated = query.filter(created_column.isnot(None))
+            if after is not None:
+                # 首个条件可直接用于索引范围扫描
+                dated = dated.filter(and_(
+                    created_column <= after[0],
+                    or_(created_column < after[0], id_column < after[1])
+                ))
+            rows = dated.order_by(created_column.desc(), id_column.desc()).limit(limit).all()
+        if len(rows) < limit:
+            undated = query.filter(created_column.is_(None))
+            if after is not None and after[0] is None:
+                undated = undated.filter(id_column < after[1])
+            rows += undated.order_by(id_column.desc()).limit(limit - len(rows)).all()
+
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        created_at = getattr(last, created_column.key)
+        next_cursor = encode_cursor({
+            'q': scope,
+            't': created_at.isoformat() if created_at is not None else None,
+            'i': getattr(last, id_column.key),
+            'p': page + 1
+        }, salt)
+
+    pagination = {
+        'page': page,
+        'per_page': per_page,
+        'has_next': len(rows) > per_page,
+        'has_prev': page > 1,
+        'next_cursor': next_cursor,
+        'total': None,
+        'pages': None,
+        'total_is_estimate': False
+    }
+    if with_total:
+        total, is_estimate = count_estimate(query, id_column)
+        pagination['total'] = total
+        pagination['pages'] = (total + per_page - 1) // per_page
+        pagination['total_is_estimate'] = is_estimate
+    return items, pagination
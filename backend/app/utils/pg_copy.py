@@ -0,0 +1,42 @@
+"""
+PostgreSQL COPY 写入工具
+将行数据编码为 COPY ... FROM STDIN WITH (FORMAT csv) 的输入，商品导入与交互事件批量写入共用
+"""
+
+import io
+from typing import Iterable, Sequence
+
+
+def csv_field(value) -> str:
+    """COPY CSV字段：None写为不加引号的空值（即NULL），其余值一律加引号"""
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def csv_rows(rows: Iterable[tuple]) -> io.StringIO:
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(csv_field(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(connection, table: str, columns: Sequence[str], rows: Iterable[tuple]):
+    """
+    以 COPY 写入行（使用 SQLAlchemy 连接所在的事务，由调用方提交）
+
+    Args:
+        connection: SQLAlchemy Connection（底层驱动需为 psycopg2）
+        table: 表名
+        columns: 列名，与行中值的顺序一致
+        rows: 行数据
+    """
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", csv_rows(rows)
+        )
+    finally:
+        cursor.close()
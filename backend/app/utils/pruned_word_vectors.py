@@ -0,0 +1,153 @@
+"""
+裁剪词向量模块
+只保留商品标签、jieba词典与历史查询可能用到的词，
+向量、词表与哈希表均为内存映射的只读文件，多个工作进程共享同一份物理内存
+"""
+
+import os
+import json
+import zlib
+import logging
+import numpy as np
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+VECTORS_FILE = 'vectors.npy'
+WORDS_FILE = 'words.bin'
+OFFSETS_FILE = 'offsets.npy'
+HASH_TABLE_FILE = 'hash_table.npy'
+
+EMPTY_SLOT = -1
+
+
+def _word_hash(word_bytes: bytes) -> int:
+    return zlib.crc32(word_bytes)
+
+
+def _table_size(count: int) -> int:
+    """哈希表大小：不小于词数2倍的2的幂，保证装载因子不超过0.5"""
+    size = 1
+    while size < count * 2:
+        size <<= 1
+    return max(size, 2)
+
+
+class PrunedWordVectors:
+    """
+    内存映射的裁剪词向量
+
+    提供与gensim KeyedVectors一致的常用接口：
+    `word in wv`、`wv[word]`、`len(wv)`、`vector_size`
+    """
+
+    def __init__(self, path: str):
+        """
+        打开裁剪词向量目录
+
+        Args:
+            path: build() 生成的目录
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode='r')
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        self._table = np.load(os.path.join(path, HASH_TABLE_FILE), mmap_mode='r')
+        self._words = np.memmap(os.path.join(path, WORDS_FILE), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(path, WORDS_FILE)) else np.zeros(0, dtype=np.uint8)
+        self._mask = len(self._table) - 1
+        self.vector_size = int(self.meta['dimension'])
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return bool(path) and os.path.exists(os.path.join(path, META_FILE))
+
+    def _word_at(self, index: int) -> bytes:
+        return self._words[self._offsets[index]:self._offsets[index + 1]].tobytes()
+
+    def get_index(self, word: str, default: Optional[int] = None) -> Optional[int]:
+        """查找词的行号（开放寻址线性探测）"""
+        word_bytes = word.encode('utf-8')
+        slot = _word_hash(word_bytes) & self._mask
+        while True:
+            index = int(self._table[slot])
+            if index == EMPTY_SLOT:
+                return default
+            if self._word_at(index) == word_bytes:
+                return index
+            slot = (slot + 1) & self._mask
+
+    def __contains__(self, word: str) -> bool:
+        return self.get_index(word) is not None
+
+    def __getitem__(self, word: str) -> np.ndarray:
+        index = self.get_index(word)
+        if index is None:
+            raise KeyError(f"词 '{word}' 不在词表中")
+        return self.vectors[index]
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def index_to_key(self) -> List[str]:
+        """全部词（按需解码，仅用于调试与统计）"""
+        return [self._word_at(i).decode('utf-8') for i in range(len(self))]
+
+    @classmethod
+    def build(cls, word_vectors, words: Iterable[str], path: str, source: str = None) -> int:
+        """
+        从完整词向量中裁剪出指定词并写入目录
+
+        Args:
+            word_vectors: 完整词向量（gensim KeyedVectors）
+            words: 候选词，不在完整词向量中的词会被忽略
+            path: 输出目录
+            source: 来源模型路径，记录在 meta.json 中
+
+        Returns:
+            实际写入的词数
+        """
+        os.makedirs(path, exist_ok=True)
+        kept = sorted({word for word in words if word and word in word_vectors})
+        dimension = int(word_vectors.vector_size)
+
+        vectors = np.lib.format.open_memmap(
+            os.path.join(path, VECTORS_FILE), mode='w+', dtype=np.float32, shape=(len(kept), dimension)
+        )
+        offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+        table = np.full(_table_size(len(kept)), EMPTY_SLOT, dtype=np.int32)
+        mask = len(table) - 1
+
+        with open(os.path.join(path, WORDS_FILE), 'wb') as words_file:
+            position = 0
+            for index, word in enumerate(kept):
+                vectors[index] = word_vectors[word]
+                word_bytes = word.encode('utf-8')
+                words_file.write(word_bytes)
+                position += len(word_bytes)
+                offsets[index + 1] = position
+
+                slot = _word_hash(word_bytes) & mask
+                while table[slot] != EMPTY_SLOT:
+                    slot = (slot + 1) & mask
+                table[slot] = index
+
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(path, OFFSETS_FILE), offsets)
+        np.save(os.path.join(path, HASH_TABLE_FILE), table)
+        with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                'dimension': dimension,
+                'count': len(kept),
+                'table_size': len(table),
+                'source': source,
+                'created_at': datetime.utcnow().isoformat()
+            }, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"裁剪词向量写入完成: {len(kept)} 个词, 目录: {path}")
+        return len(kept)
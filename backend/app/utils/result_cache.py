@@ -0,0 +1,295 @@
+"""
+两级结果缓存
+L1为进程内LRU缓存（app.utils.cache），L2为各工作进程共享的Redis。
+L2的值以msgpack编码，numpy浮点数组按float32存储；缓存键中带有商品目录版本、
+用户向量版本与用户数据版本，数据变更时递增版本号即可让旧结果整体失效，无需逐键删除
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import numpy as np
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence
+
+from app.utils.cache import get_cache
+
+try:
+    import msgpack  # 可选依赖，未安装时只使用进程内缓存
+except ImportError:
+    msgpack = None
+
+try:
+    import redis  # 可选依赖，未安装时只使用进程内缓存
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'recommand:'
+CATALOG_SCOPE = 'catalog'
+_NDARRAY_EXT = 1
+
+
+def user_scope(user_id: int) -> str:
+    """用户向量版本的作用域名"""
+    return f'user:{user_id}'
+
+
+def user_data_scope(user_id: int) -> str:
+    """用户资料与交互记录版本的作用域名"""
+    return f'user_data:{user_id}'
+
+
+# ----------------------------------------------------------------------
+# msgpack 编解码
+# ----------------------------------------------------------------------
+
+def _pack_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        array = obj.astype(np.float32) if obj.dtype.kind == 'f' else obj
+        array = np.ascontiguousarray(array)
+        payload = msgpack.packb([array.dtype.str, list(array.shape), array.tobytes()], use_bin_type=True)
+        return msgpack.ExtType(_NDARRAY_EXT, payload)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+def _unpack_ext(code: int, data: bytes) -> Any:
+    if code == _NDARRAY_EXT:
+        dtype, shape, buffer = msgpack.unpackb(data, raw=False)
+        return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+    return msgpack.ExtType(code, data)
+
+
+def pack(value: Any) -> bytes:
+    """编码缓存值（numpy浮点数组转为float32）"""
+    return msgpack.packb(value, default=_pack_default, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    """解码缓存值"""
+    return msgpack.unpackb(data, ext_hook=_unpack_ext, raw=False, strict_map_key=False)
+
+
+# ----------------------------------------------------------------------
+# Redis层
+# ----------------------------------------------------------------------
+
+class RedisCacheTier:
+    """Redis缓存层与数据版本号（进程级单例）"""
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RedisCacheTier, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.enabled = False
+            self.url = None
+            self.socket_timeout = 0.2  # 秒，Redis不可用时不应拖慢请求
+            self.retry_seconds = 30  # 连接失败后暂停使用Redis的时间
+            self.version_check_interval = 1.0  # 秒，版本号在进程内的缓存时间
+
+            self._client = None
+            self._retry_at = 0.0
+            self._lock = threading.Lock()
+            # 版本号缓存，超过 version_check_interval 后重新从Redis读取
+            self._versions = get_cache('cache_versions', max_entries=10000,
+                                       ttl=self.version_check_interval)
+            # Redis不可用时的本地版本号
+            self._local_versions: Dict[str, int] = {}
+            self.errors = 0
+
+            self._initialized = True
+
+    def configure(self, app):
+        """从应用配置读取Redis参数"""
+        self.enabled = app.config.get('REDIS_CACHE_ENABLED', True)
+        self.url = app.config.get('REDIS_URL')
+        self.socket_timeout = app.config.get('REDIS_SOCKET_TIMEOUT', 0.2)
+        self.retry_seconds = app.config.get('REDIS_RETRY_SECONDS', 30)
+        self.version_check_interval = app.config.get('CACHE_VERSION_CHECK_INTERVAL', 1.0)
+        self._versions.ttl = self.version_check_interval
+        if self.enabled and (redis is None or msgpack is None):
+            logger.warning("未安装redis或msgpack，结果缓存只使用进程内缓存")
+            self.enabled = False
+
+    def set_client(self, client):
+        """指定Redis客户端（如本地Redis替身），None表示重新按配置连接"""
+        with self._lock:
+            self._client = client
+            self._retry_at = 0.0
+            if client is not None:
+                self.enabled = msgpack is not None
+
+    @property
+    def client(self):
+        """可用的Redis客户端，未启用或处于失败退避期时返回None"""
+        if not self.enabled or time.time() < self._retry_at:
+            return None
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = redis.Redis.from_url(
+                        self.url,
+                        socket_timeout=self.socket_timeout,
+                        socket_connect_timeout=self.socket_timeout
+                    )
+        return self._client
+
+    def mark_failure(self, error: Exception):
+        """Redis访问失败，在退避期内跳过L2"""
+        self.errors += 1
+        self._retry_at = time.time() + self.retry_seconds
+        logger.warning(f"Redis缓存不可用，{self.retry_seconds}秒内只使用进程内缓存: {error}")
+
+    def get_version(self, scope: str) -> int:
+        """读取作用域的当前版本号"""
+        version = self._versions.get(scope)
+        if version is not None:
+            return version
+        version = self._local_versions.get(scope, 0)
+        client = self.client
+        if client is not None:
+            try:
+                raw = client.get(KEY_PREFIX + 'version:' + scope)
+                version = max(int(raw or 0), version)
+            except Exception as e:
+                self.mark_failure(e)
+        self._versions.set(scope, version)
+        return version
+
+    def bump_version(self, *scopes: str):
+        """递增作用域版本号，使该作用域下的缓存结果失效"""
+        client = self.client
+        for scope in scopes:
+            version = None
+            if client is not None:
+                try:
+                    version = int(client.incr(KEY_PREFIX + 'version:' + scope))
+                except Exception as e:
+                    self.mark_failure(e)
+                    client = None
+            if version is None:
+                version = self.get_version(scope) + 1
+            self._local_versions[scope] = max(version, self._local_versions.get(scope, 0))
+            self._versions.set(scope, self._local_versions[scope])
+        logger.debug(f"缓存版本已递增: {', '.join(scopes)}")
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'available': self.client is not None,
+            'errors': self.errors,
+            'catalog_version': self.get_version(CATALOG_SCOPE)
+        }
+
+
+def bump_catalog_version():
+    """商品目录（商品、向量）变更后调用"""
+    RedisCacheTier().bump_version(CATALOG_SCOPE)
+
+
+def bump_user_version(user_id: int):
+    """用户特征向量变更后调用"""
+    RedisCacheTier().bump_version(user_scope(user_id))
+
+
+def bump_user_data_version(*user_ids: int):
+    """用户资料变更或记录新交互后调用"""
+    if user_ids:
+        RedisCacheTier().bump_version(*(user_data_scope(user_id) for user_id in user_ids))
+
+
+# ----------------------------------------------------------------------
+# 两级缓存
+# ----------------------------------------------------------------------
+
+class TieredCache:
+    """
+    L1进程内 + L2 Redis 的两级缓存
+
+    键由调用方的键组成部分与各作用域的当前版本号共同生成；
+    L2未命中或Redis不可用时只使用L1
+    """
+
+    def __init__(self, name: str, max_entries: int = 1000, max_bytes: Optional[int] = None,
+                 ttl: float = 300, redis_ttl: Optional[float] = None):
+        """
+        Args:
+            name: 缓存名称（L1缓存名与Redis键前缀）
+            max_entries: L1最大条目数
+            max_bytes: L1最大字节数
+            ttl: L1过期时间（秒）
+            redis_ttl: L2过期时间（秒），默认与ttl相同
+        """
+        self.name = name
+        self.local = get_cache(name, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.redis_ttl = int(redis_ttl or ttl)
+        self.tier = RedisCacheTier()
+
+    def key(self, parts: Sequence[Hashable], scopes: Sequence[str] = (CATALOG_SCOPE,)) -> str:
+        """生成带版本号的缓存键"""
+        versions = ','.join(f'{scope}={self.tier.get_version(scope)}' for scope in scopes)
+        digest = hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+        return f'{self.name}:{versions}:{digest}'
+
+    def get(self, key: str) -> Any:
+        """依次读取L1、L2，L2命中时回填L1；未命中返回None"""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        client = self.tier.client
+        if client is None:
+            return None
+        try:
+            data = client.get(KEY_PREFIX + key)
+        except Exception as e:
+            self.tier.mark_failure(e)
+            return None
+        if data is None:
+            return None
+        try:
+            value = unpack(data)
+        except Exception as e:
+            logger.warning(f"缓存值解码失败 {key}: {e}")
+            return None
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any):
+        """同时写入L1与L2"""
+        self.local.set(key, value)
+        client = self.tier.client
+        if client is None:
+            return
+        try:
+            client.set(KEY_PREFIX + key, pack(value), ex=self.redis_ttl)
+        except TypeError as e:
+            logger.warning(f"缓存值无法编码，只写入进程内缓存 {key}: {e}")
+        except Exception as e:
+            self.tier.mark_failure(e)
+
+    def get_or_set(self, parts: Sequence[Hashable], factory: Callable[[], Any],
+                   scopes: Sequence[str] = (CATALOG_SCOPE,)) -> Any:
+        """读取缓存，未命中时调用factory计算并写入（结果为空时不缓存）"""
+        key = self.key(parts, scopes)
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = factory()
+        if value:
+            self.set(key, value)
+        return value
@@ -0,0 +1,93 @@
+"""
+全文检索分词模块
+商品写入时用jieba搜索引擎模式分词，生成以空格分隔的词串写入 products.search_tokens；
+PostgreSQL 的 search_vector 列由该词串生成（'simple' 配置不再做词形处理），
+查询端用同样的分词规则生成 tsquery，保证两端切分一致
+"""
+
+import re
+import json
+from typing import Dict, Iterable, List, Optional, Union
+
+import jieba
+from sqlalchemy import inspect
+
+# 名称、标签、描述三段之间的分隔符，search_vector 按段设置权重（A/B/D）
+FIELD_SEPARATOR = ' | '
+
+# 只保留包含字母、数字或汉字的词；tsquery中的特殊字符一律去除
+_WORD_PATTERN = re.compile(r'\w', re.UNICODE)
+_STRIP_PATTERN = re.compile(r"[|&!():*<>'\"\\\s]+")
+
+# 各数据库URL的 products 表是否已有 search_tokens 列（进程内缓存，迁移后需重启生效）
+_column_present: Dict[str, bool] = {}
+
+
+def _clean(token: str) -> str:
+    return _STRIP_PATTERN.sub('', token).lower()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """搜索引擎模式分词（长词同时输出其中的短词），去重并保持顺序"""
+    if not text:
+        return []
+    tokens = []
+    seen = set()
+    for token in jieba.cut_for_search(text):
+        token = _clean(token)
+        if token and _WORD_PATTERN.search(token) and token not in seen:
+            seen.add(token)
+            tokens.append(token)
+    return tokens
+
+
+def build_search_tokens(name: Optional[str], tags: Union[str, Iterable[str], None],
+                        description: Optional[str]) -> str:
+    """
+    生成商品的检索词串
+
+    Args:
+        name: 商品名称
+        tags: 标签列表或JSON字符串
+        description: 商品描述
+    """
+    if isinstance(tags, str):
+        try:
+            tags = json.loads(tags)
+        except ValueError:
+            tags = [tags]
+    tag_text = ' '.join(str(tag) for tag in tags or [])
+    return FIELD_SEPARATOR.join(' '.join(tokenize(part)) for part in (name, tag_text, description))
+
+
+def search_tokens_column_exists(connection) -> bool:
+    """products.search_tokens 列是否存在（由 flask migrate-search-index 添加，迁移前写入时跳过）"""
+    url = str(connection.engine.url)
+    if url not in _column_present:
+        columns = {column['name'] for column in inspect(connection).get_columns('products')}
+        _column_present[url] = 'search_tokens' in columns
+    return _column_present[url]
+
+
+def build_tsquery(query: str, weights: str = '') -> Optional[str]:
+    """
+    将用户查询转为 to_tsquery('simple', ...) 的参数
+
+    各词之间为AND关系，最后一个词按前缀匹配（用户可能还未输入完整）；
+    查询中没有可检索的词时返回None
+
+    Args:
+        weights: 限定匹配的权重（如 'A' 只匹配名称段），默认不限
+    """
+    tokens = []
+    for token in jieba.cut(query):
+        token = _clean(token)
+        if token and _WORD_PATTERN.search(token) and token not in tokens:
+            tokens.append(token)
+    if not tokens:
+        return None
+    terms = [f"'{token}'" for token in tokens]
+    terms[-1] += ':*'
+    if weights:
+        terms = [term + (weights if term.endswith(':*') else ':' + weights) for term in terms]
+    return ' & '.join(terms)
@@ -0,0 +1,189 @@
+"""
+向量编解码模块
+统一处理向量在JSON文本、pgvector文本与float32二进制三种存储格式之间的转换，
+所有服务读写向量时都应通过本模块，避免各自 json.loads / ','.join 解析
+"""
+
+import json
+import logging
+import numpy as np
+from typing import List, Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DTYPE = np.float32
+
+# 向量存储模式：json 写文本列（兼容旧数据）；binary 写float32二进制列
+STORAGE_MODE_JSON = 'json'
+STORAGE_MODE_BINARY = 'binary'
+
+
+def get_storage_mode() -> str:
+    """当前向量存储模式（应用上下文外默认json）"""
+    if has_app_context():
+        return current_app.config.get('VECTOR_STORAGE_MODE', STORAGE_MODE_JSON)
+    return STORAGE_MODE_JSON
+
+
+def encode_vector(vector) -> Optional[bytes]:
+    """编码为float32小端字节串"""
+    if vector is None:
+        return None
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def _parse_vector_text(value: str) -> np.ndarray:
+    """
+    解析 '[0.1,0.2,...]' 格式的文本（JSON数组与pgvector文本格式相同）
+
+    Raises:
+        ValueError: 含有不能解析为数值的元素
+    """
+    body = value.strip().strip('[]').strip()
+    if not body:
+        return np.empty(0, dtype=VECTOR_DTYPE)
+    # 逐个元素转换：格式错误时报错，而不是像 np.fromstring 那样在出错处截断
+    return np.array(body.split(','), dtype=VECTOR_DTYPE)
+
+
+def decode_vector(value, dimension: Optional[int] = None) -> Optional[np.ndarray]:
+    """
+    解码任意存储格式的向量
+
+    Args:
+        value: float32字节串 / memoryview、JSON或pgvector文本、列表、ndarray
+        dimension: 期望的维度，给出时长度不符报错
+
+    Returns:
+        float32数组；二进制输入为零拷贝的只读视图
+
+    Raises:
+        ValueError: 文本格式错误、二进制长度不是4的倍数或维度不符
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        if len(value) == 0:
+            return None
+        vector = np.frombuffer(value, dtype='<f4')
+    elif isinstance(value, str):
+        if not value.strip():
+            return None
+        vector = _parse_vector_text(value)
+    else:
+        vector = np.asarray(value, dtype=VECTOR_DTYPE)
+    if dimension is not None and vector.shape != (dimension,):
+        raise ValueError(f"向量维度不符: 期望 {dimension}，实际 {vector.shape}")
+    return vector
+
+
+def to_json_text(vector) -> Optional[str]:
+    """编码为JSON文本（兼容旧的文本列）"""
+    if vector is None:
+        return None
+    return json.dumps(np.asarray(vector, dtype=np.float64).tolist())
+
+
+def to_pgvector_text(vector) -> Optional[str]:
+    """编码为pgvector文本字面量 '[0.1,0.2,...]'"""
+    if vector is None:
+        return None
+    return '[' + ','.join(map(str, np.asarray(vector, dtype=np.float64).tolist())) + ']'
+
+
+def encode_for_storage(vector) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    按当前存储模式编码向量
+
+    Returns:
+        (文本列的值, 二进制列的值)，未使用的一侧为None
+    """
+    if vector is None:
+        return None, None
+    if get_storage_mode() == STORAGE_MODE_BINARY:
+        return None, encode_vector(vector)
+    return to_json_text(vector), None
+
+
+# ----------------------------------------------------------------------
+# pgvector 类型适配：vector 列直接读出为 ndarray，PgVector 参数直接写入
+# ----------------------------------------------------------------------
+
+class PgVector:
+    """绑定到 vector 列的参数包装（只有该类型注册了适配器，其他 ndarray 参数不受影响）"""
+
+    __slots__ = ('array',)
+
+    def __init__(self, vector):
+        self.array = np.asarray(vector, dtype=VECTOR_DTYPE)
+
+
+def _cast_pgvector(value, cursor):
+    if value is None:
+        return None
+    return _parse_vector_text(value)
+
+
+def _adapt_pgvector(param: PgVector):
+    from psycopg2.extensions import AsIs, QuotedString
+    return AsIs(QuotedString(to_pgvector_text(param.array)).getquoted().decode())
+
+
+def register_pgvector_adapter(engine) -> bool:
+    """
+    为psycopg2连接注册pgvector类型转换
+
+    注册后 SELECT product_vector 直接返回float32数组，
+    PgVector(数组) 参数可直接绑定到 CAST(:v AS vector)
+    """
+    if engine.dialect.name != 'postgresql' or engine.dialect.driver != 'psycopg2':
+        return False
+    try:
+        import psycopg2.extensions
+    except ImportError:
+        return False
+
+    psycopg2.extensions.register_adapter(PgVector, _adapt_pgvector)
+
+    @event.listens_for(engine, 'connect')
+    def _register_vector_type(dbapi_connection, connection_record):
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SELECT oid FROM pg_type WHERE typname = 'vector'")
+            row = cursor.fetchone()
+            cursor.close()
+            dbapi_connection.rollback()
+            if row:
+                vector_type = psycopg2.extensions.new_type((row[0],), 'VECTOR', _cast_pgvector)
+                psycopg2.extensions.register_type(vector_type, dbapi_connection)
+        except Exception as e:
+            logger.warning(f"注册pgvector类型转换失败: {e}")
+
+    return True
+
+
+# 二进制向量列（由 flask migrate-vectors 添加）
+BINARY_VECTOR_COLUMNS = (
+    ('products', 'embedding_bin'),
+    ('tag_vectors', 'vector_bin'),
+    ('users', 'feature_vector_bin'),
+)
+
+
+def missing_vector_columns(engine) -> List[str]:
+    """
+    已存在的表中缺少的二进制向量列（模型映射了这些列，缺少时ORM读写对应表会失败）
+
+    Returns:
+        ['表.列', ...]
+    """
+    inspector = inspect(engine)
+    missing = []
+    for table, column in BINARY_VECTOR_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        if column not in {info['name'] for info in inspector.get_columns(table)}:
+            missing.append(f'{table}.{column}')
+    return missing
@@ -0,0 +1,81 @@
+"""
+子进程池
+Web与任务进程中有后台线程（写入队列、索引构建、任务线程池），在其中直接fork的子进程可能继承
+其他线程持有的锁（日志、连接池、jieba等）而死锁。进程池改由forkserver（不可用时spawn）启动：
+子进程从单线程的服务进程fork，不继承调用进程的状态，由初始化函数自行建立（如加载jieba词典）
+"""
+
+import multiprocessing
+import threading
+from typing import Callable, Iterable, Optional, Tuple
+
+# forkserver启动前预先导入的模块（子进程由此fork，无需各自导入）
+_preload = ['__main__']
+
+
+def pool_context():
+    """进程池使用的启动方式：优先forkserver，其次spawn"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def create_pool(workers: int, initializer: Optional[Callable] = None, initargs: tuple = (),
+                preload: Iterable[str] = ()):
+    """
+    创建进程池
+
+    Args:
+        workers: 进程数
+        initializer: 子进程初始化函数（模块级函数，建立工作所需的状态）
+        preload: forkserver预先导入的模块名（只在服务进程首次启动前生效）
+
+    Raises:
+        AssertionError, OSError: 当前进程不能创建子进程（如守护进程），由调用方降级为串行
+    """
+    context = pool_context()
+    if context.get_start_method() == 'forkserver':
+        for module in preload:
+            if module not in _preload:
+                _preload.append(module)
+        context.set_forkserver_preload(list(_preload))
+    return context.Pool(workers, initializer=initializer, initargs=initargs)
+
+
+class SharedPool:
+    """
+    进程内复用的进程池：首次使用时创建，之后各请求共用（可在多个线程中同时提交任务），
+    避免每次请求创建、销毁子进程；工作进程fork后调用 after_fork 丢弃从主进程继承的引用
+    """
+
+    def __init__(self, initializer: Optional[Callable] = None, preload: Iterable[str] = ()):
+        self.initializer = initializer
+        self.preload = tuple(preload)
+        self._pool = None
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def get(self, workers: int) -> Tuple[object, int]:
+        """
+        返回 (进程池, 进程数)：已创建时沿用首次创建时的进程数
+
+        Raises:
+            AssertionError, OSError: 当前进程不能创建子进程
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = create_pool(workers, initializer=self.initializer, preload=self.preload)
+                self._workers = workers
+            return self._pool, self._workers
+
+    def discard(self, pool):
+        """丢弃出错（如子进程被终止、任务超时）的进程池，下次使用时重建"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.terminate()
+
+    def after_fork(self):
+        """工作进程fork后丢弃主进程的进程池引用并重置锁"""
+        self._pool = None
+        self._workers = 0
+        self._lock = threading.Lock()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+裁剪词向量构建脚本
+从完整的Tencent词向量中只保留商品标签、jieba词典与历史查询可能用到的词，
+生成内存映射的词表目录，供 RecommendationService 快速加载
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(__file__))
+
+import jieba
+from gensim.models import KeyedVectors
+from sqlalchemy import text
+import logging
+
+from app import create_app, db
+from app.utils.pruned_word_vectors import PrunedWordVectors
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODEL_PATH = os.path.join(PROJECT_ROOT, 'model', 'Tencent_AILab_ChineseEmbedding.bin')
+DEFAULT_OUTPUT_PATH = os.path.join(PROJECT_ROOT, 'model', 'pruned_vocab')
+
+
+def _expand(text_value: str, words: set):
+    """加入原文及其搜索引擎模式分词结果"""
+    text_value = text_value.strip()
+    if not text_value:
+        return
+    words.add(text_value)
+    for word in jieba.cut_for_search(text_value):
+        word = word.strip()
+        if word:
+            words.add(word)
+
+
+def collect_database_words() -> set:
+    """商品标签、标签向量表与商品名称中的词"""
+    words = set()
+    for sql in (
+        "SELECT DISTINCT tag FROM product_tags",
+        "SELECT tag FROM tag_vectors",
+        "SELECT name FROM products",
+    ):
+        result = db.session.execute(text(sql))
+        while True:
+            rows = result.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                if row[0]:
+                    _expand(row[0], words)
+    logger.info(f"数据库候选词: {len(words)}")
+    return words
+
+
+def collect_jieba_words() -> set:
+    """jieba词典中词频大于0的词（含已加载的用户词典）"""
+    jieba.dt.check_initialized()
+    words = {word for word, freq in jieba.dt.FREQ.items() if freq > 0}
+    logger.info(f"jieba词典候选词: {len(words)}")
+    return words
+
+
+def collect_query_words(paths) -> set:
+    """历史查询文件（每行一个查询）中的词"""
+    words = set()
+    for path in paths or []:
+        if not os.path.exists(path):
+            logger.warning(f"查询文件不存在: {path}")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                _expand(line, words)
+    logger.info(f"历史查询候选词: {len(words)}")
+    return words
+
+
+def build_pruned_vocab(model_path: str = DEFAULT_MODEL_PATH, output_path: str = DEFAULT_OUTPUT_PATH,
+                       query_paths=None, include_database: bool = True, include_jieba: bool = True) -> int:
+    """
+    构建裁剪词表（include_database=True 时需在应用上下文中调用）
+
+    Returns:
+        写入的词数
+    """
+    candidates = set()
+    if include_database:
+        candidates |= collect_database_words()
+    if include_jieba:
+        candidates |= collect_jieba_words()
+    candidates |= collect_query_words(query_paths)
+
+    # 小写形式（get_word_vector 会回退查询小写）与单字（分词降级会逐字匹配）
+    for word in list(candidates):
+        candidates.add(word.lower())
+        candidates.update(word)
+    logger.info(f"候选词合计: {len(candidates)}")
+
+    logger.info(f"正在加载完整词向量模型: {model_path}")
+    word_vectors = KeyedVectors.load(model_path, mmap='r')
+    return PrunedWordVectors.build(word_vectors, candidates, output_path, source=model_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='构建裁剪词向量')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='完整词向量模型路径')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH, help='输出目录')
+    parser.add_argument('--queries', action='append', help='历史查询文件，每行一个查询，可重复指定')
+    parser.add_argument('--no-database', action='store_true', help='不从数据库收集标签与商品名称')
+    parser.add_argument('--no-jieba-dict', action='store_true', help='不包含jieba词典')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        count = build_pruned_vocab(
+            model_path=args.model,
+            output_path=args.output,
+            query_paths=args.queries,
+            include_database=not args.no_database,
+            include_jieba=not args.no_jieba_dict
+        )
+    print(f"裁剪词表构建完成: {count} 个词 -> {args.output}")
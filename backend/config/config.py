@@ -14,12 +14,98 @@ class Config:
     
     # Redis配置（用于缓存）
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    REDIS_CACHE_ENABLED = os.environ.get('REDIS_CACHE_ENABLED', 'true').lower() == 'true'  # 结果缓存是否使用Redis二级缓存
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.2))  # 秒
+    REDIS_RETRY_SECONDS = int(os.environ.get('REDIS_RETRY_SECONDS', 30))  # Redis失败后暂停使用的时间
+    CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', 1.0))  # 秒，缓存版本号的本地缓存时间
     
     # 推荐系统配置
     VECTOR_MODEL_PATH = os.environ.get('VECTOR_MODEL_PATH') or '../model/Tencent_AILab_ChineseEmbedding.bin'
     PRODUCT_DATA_PATH = os.environ.get('PRODUCT_DATA_PATH') or '../data/product.txt'
     PRODUCT_TYPE_PATH = os.environ.get('PRODUCT_TYPE_PATH') or '../data/productType.json'
     
+    # 启动时预加载词向量（建议先用 build_pruned_vocab.py 生成裁剪词表，否则加载完整模型较慢）
+    PRELOAD_WORD_VECTORS = os.environ.get('PRELOAD_WORD_VECTORS', 'false').lower() == 'true'
+    
+    # 进程内向量索引配置（hnswlib不可用或索引未就绪时降级到pgvector）
+    VECTOR_INDEX_ENABLED = os.environ.get('VECTOR_INDEX_ENABLED', 'true').lower() == 'true'
+    VECTOR_INDEX_BACKEND = os.environ.get('VECTOR_INDEX_BACKEND') or 'hnsw'
+    VECTOR_INDEX_PRELOAD = os.environ.get('VECTOR_INDEX_PRELOAD', 'true').lower() == 'true'
+    VECTOR_INDEX_REFRESH_INTERVAL = int(os.environ.get('VECTOR_INDEX_REFRESH_INTERVAL', 30))  # 秒
+    
+    # 向量存储模式：json 写JSON文本列；binary 写float32二进制列（需先执行 flask migrate-vectors）
+    VECTOR_STORAGE_MODE = os.environ.get('VECTOR_STORAGE_MODE') or 'json'
+    
+    # 查询向量缓存配置
+    QUERY_VECTOR_CACHE_SIZE = int(os.environ.get('QUERY_VECTOR_CACHE_SIZE', 20000))  # 缓存的规范化查询数
+    QUERY_WARMUP_PATH = os.environ.get('QUERY_WARMUP_PATH')  # 启动时预热的查询日志（每行一个查询）
+    QUERY_WARMUP_LIMIT = int(os.environ.get('QUERY_WARMUP_LIMIT', 10000))  # 预热的最高频查询数
+    
+    # 全文检索配置（需先执行 flask migrate-search-index）
+    FULL_TEXT_SEARCH_ENABLED = os.environ.get('FULL_TEXT_SEARCH_ENABLED', 'true').lower() == 'true'
+    SEARCH_RANK_CANDIDATES = int(os.environ.get('SEARCH_RANK_CANDIDATES', 5000))  # 参与相关度排序的最大匹配数
+    SEARCH_EXACT_COUNT_LIMIT = int(os.environ.get('SEARCH_EXACT_COUNT_LIMIT', 1000))  # 超过该数量时总数取查询计划估计值
+    
+    # 搜索建议前缀索引配置
+    SUGGESTION_INDEX_ENABLED = os.environ.get('SUGGESTION_INDEX_ENABLED', 'true').lower() == 'true'
+    SUGGESTION_INDEX_PRELOAD = os.environ.get('SUGGESTION_INDEX_PRELOAD', 'true').lower() == 'true'
+    SUGGESTION_MAX_NAMES = int(os.environ.get('SUGGESTION_MAX_NAMES', 50000))  # 参与建议的商品名称数（按热度）
+    SUGGESTION_PINYIN = os.environ.get('SUGGESTION_PINYIN', 'true').lower() == 'true'  # 拼音全拼/首字母检索（需pypinyin）
+    SUGGESTION_REFRESH_INTERVAL = int(os.environ.get('SUGGESTION_REFRESH_INTERVAL', 30))  # 秒，增量同步间隔
+    SUGGESTION_REBUILD_INTERVAL = int(os.environ.get('SUGGESTION_REBUILD_INTERVAL', 3600))  # 秒，全量重建间隔
+    
+    # 分类目录配置（分类层级、各分类商品数与标签统计常驻内存）
+    CATEGORY_CATALOG_ENABLED = os.environ.get('CATEGORY_CATALOG_ENABLED', 'true').lower() == 'true'
+    CATEGORY_CATALOG_PRELOAD = os.environ.get('CATEGORY_CATALOG_PRELOAD', 'true').lower() == 'true'
+    CATEGORY_CATALOG_REFRESH_INTERVAL = int(os.environ.get('CATEGORY_CATALOG_REFRESH_INTERVAL', 600))  # 秒，后台全量重建间隔
+    CATEGORY_CATALOG_POPULAR_TAGS = int(os.environ.get('CATEGORY_CATALOG_POPULAR_TAGS', 20))  # 统计中的常用标签数
+    
+    # 用户特征向量配置
+    USER_VECTOR_INCREMENTAL = os.environ.get('USER_VECTOR_INCREMENTAL', 'true').lower() == 'true'  # 记录交互时增量更新（需先执行 flask rebuild-user-vectors）
+    USER_VECTOR_REBUILD_INTERVAL = int(os.environ.get('USER_VECTOR_REBUILD_INTERVAL', 86400))  # 秒，自动提交全量重建任务的间隔，0为关闭
+    
+    # 交互事件异步批量写入配置
+    INTERACTION_WRITE_BEHIND = os.environ.get('INTERACTION_WRITE_BEHIND', 'true').lower() == 'true'  # 关闭时记录交互同步提交
+    INTERACTION_FLUSH_INTERVAL_MS = int(os.environ.get('INTERACTION_FLUSH_INTERVAL_MS', 200))  # 毫秒，批量写入间隔
+    INTERACTION_FLUSH_BATCH = int(os.environ.get('INTERACTION_FLUSH_BATCH', 500))  # 缓冲达到该条数时立即写入
+    INTERACTION_BUFFER_MAX = int(os.environ.get('INTERACTION_BUFFER_MAX', 20000))  # 每个进程未入库事件上限，超过时返回429
+    INTERACTION_ENQUEUE_TIMEOUT_MS = int(os.environ.get('INTERACTION_ENQUEUE_TIMEOUT_MS', 50))  # 毫秒，缓冲区满时的最长等待
+    INTERACTION_SPOOL_DIR = os.environ.get('INTERACTION_SPOOL_DIR', '../data/interaction_spool')  # 落盘分段目录，置空则只保存在内存中
+    INTERACTION_SPOOL_FSYNC = os.environ.get('INTERACTION_SPOOL_FSYNC', 'false').lower() == 'true'  # 每条事件fsync（可抵御断电，吞吐下降）
+    INTERACTION_SPOOL_RECOVER_INTERVAL = int(os.environ.get('INTERACTION_SPOOL_RECOVER_INTERVAL', 60))  # 秒，接管遗留分段的间隔
+    INTERACTION_ID_REFRESH_INTERVAL = int(os.environ.get('INTERACTION_ID_REFRESH_INTERVAL', 300))  # 秒，用户、商品ID集合重新加载间隔
+    INTERACTION_FLUSH_MAX_RETRIES = int(os.environ.get('INTERACTION_FLUSH_MAX_RETRIES', 3))  # 整批写入连续失败该次数后逐条写入，失败事件移入死信文件
+    
+    # 交互计数汇总配置（需先执行 flask rebuild-interaction-rollups）
+    INTERACTION_ROLLUP_ENABLED = os.environ.get('INTERACTION_ROLLUP_ENABLED', 'true').lower() == 'true'
+    INTERACTION_ROLLUP_HOUR_RETENTION_DAYS = int(os.environ.get('INTERACTION_ROLLUP_HOUR_RETENTION_DAYS', 32))  # 小时桶保留天数，需不小于统计窗口（30天）
+    INTERACTION_ROLLUP_DAY_RETENTION_DAYS = int(os.environ.get('INTERACTION_ROLLUP_DAY_RETENTION_DAYS', 400))  # 天桶保留天数
+    INTERACTION_ROLLUP_PRUNE_INTERVAL = int(os.environ.get('INTERACTION_ROLLUP_PRUNE_INTERVAL', 3600))  # 秒，每个进程清理过期桶的间隔
+    
+    # 商品结果组装配置
+    FAST_JSON_ENABLED = os.environ.get('FAST_JSON_ENABLED', 'true').lower() == 'true'  # 使用orjson编码响应（需安装orjson）
+    
+    # 批量语义搜索配置
+    BATCH_SEARCH_MAX_QUERIES = int(os.environ.get('BATCH_SEARCH_MAX_QUERIES', 5000))
+    BATCH_SEARCH_WORKERS = int(os.environ.get('BATCH_SEARCH_WORKERS', 0)) or None  # 并行分词进程数，默认CPU核数
+    
+    # 向量批量构建配置
+    VECTOR_BUILD_WORKERS = int(os.environ.get('VECTOR_BUILD_WORKERS', 0)) or None  # 标签并行分词进程数，默认CPU核数
+    
+    # 相似商品物化配置
+    SIMILAR_MATERIALIZE_TOP_N = int(os.environ.get('SIMILAR_MATERIALIZE_TOP_N', 60))  # 每个商品保存的相似商品数（多于接口limit上限50，留出已删除商品的余量）
+    SIMILAR_MATERIALIZE_TTL_DAYS = int(os.environ.get('SIMILAR_MATERIALIZE_TTL_DAYS', 7))  # 超过该时间未刷新的列表视为过期
+    SIMILAR_MATERIALIZE_AFTER_VECTOR_BUILD = os.environ.get('SIMILAR_MATERIALIZE_AFTER_VECTOR_BUILD', 'true').lower() == 'true'  # 商品向量任务完成后增量刷新
+    SIMILAR_MATERIALIZE_BLOCK_MB = int(os.environ.get('SIMILAR_MATERIALIZE_BLOCK_MB', 256))  # 单块相似度矩阵的内存上限，按商品数确定每块查询数
+    
+    # 商品导入配置
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 0)) or None  # 解析/分词进程数，默认CPU核数
+    
+    # 后台任务配置
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # 每个进程同时运行的后台任务数
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 10))  # 每个进程排队等待的后台任务上限
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 600))  # 运行中任务超过该时间未更新视为中断
+    
     # 分页配置
     POSTS_PER_PAGE = 20
     RECOMMENDATIONS_PER_PAGE = 10
@@ -38,6 +124,12 @@ class TestingConfig(Config):
     """测试环境配置"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///:memory:'
+    VECTOR_INDEX_ENABLED = False
+    REDIS_CACHE_ENABLED = False
+    SUGGESTION_INDEX_ENABLED = False
+    CATEGORY_CATALOG_ENABLED = False
+    INTERACTION_WRITE_BEHIND = False
+    USER_VECTOR_REBUILD_INTERVAL = 0
 
 config = {
     'development': DevelopmentConfig,
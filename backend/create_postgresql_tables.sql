@@ -19,7 +19,14 @@ CREATE TABLE IF NOT EXISTS products (
     image_url VARCHAR(500),
     tags TEXT,  -- JSON字符串存储标签
     embedding TEXT,  -- 原始JSON格式向量（保留兼容性）
+    embedding_bin BYTEA,  -- float32二进制向量
     product_vector vector(200),  -- pgvector格式向量
+    search_tokens TEXT,  -- jieba分词后的检索词串（名称 | 标签 | 描述）
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple'::regconfig, split_part(coalesce(search_tokens, ''), ' | ', 1)), 'A') ||
+        setweight(to_tsvector('simple'::regconfig, split_part(coalesce(search_tokens, ''), ' | ', 2)), 'B') ||
+        setweight(to_tsvector('simple'::regconfig, split_part(coalesce(search_tokens, ''), ' | ', 3)), 'D')
+    ) STORED,  -- 全文检索向量
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -38,6 +45,7 @@ CREATE TABLE IF NOT EXISTS tag_vectors (
     id SERIAL PRIMARY KEY,
     tag VARCHAR(100) UNIQUE NOT NULL,
     vector TEXT,  -- JSON格式存储标签向量
+    vector_bin BYTEA,  -- float32二进制向量
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -49,6 +57,10 @@ CREATE TABLE IF NOT EXISTS users (
     email VARCHAR(120) UNIQUE,
     preferences TEXT,  -- JSON格式存储用户偏好
     behavior_vector TEXT,  -- JSON格式存储行为向量
+    feature_vector TEXT,  -- JSON格式存储用户特征向量
+    feature_vector_pgvector TEXT,  -- pgvector文本格式用户特征向量
+    feature_vector_bin BYTEA,  -- float32二进制用户特征向量
+    vector_updated_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -64,6 +76,46 @@ CREATE TABLE IF NOT EXISTS user_interactions (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 创建交互计数汇总表
+CREATE TABLE IF NOT EXISTS interaction_rollups (
+    id SERIAL PRIMARY KEY,
+    scope VARCHAR(20) NOT NULL,
+    scope_id INTEGER NOT NULL,
+    sub_id INTEGER NOT NULL DEFAULT 0,
+    granularity VARCHAR(10) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    interaction_type VARCHAR(50) NOT NULL,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    score_sum FLOAT NOT NULL DEFAULT 0,
+    score_count INTEGER NOT NULL DEFAULT 0,
+    new_pairs INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_interaction_rollup UNIQUE (scope, scope_id, sub_id, granularity, bucket_start, interaction_type)
+);
+
+-- 创建交互计数汇总重建暂存表
+CREATE TABLE IF NOT EXISTS interaction_rollups_rebuild (
+    id SERIAL PRIMARY KEY,
+    scope VARCHAR(20) NOT NULL,
+    scope_id INTEGER NOT NULL,
+    sub_id INTEGER NOT NULL DEFAULT 0,
+    granularity VARCHAR(10) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    interaction_type VARCHAR(50) NOT NULL,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    score_sum FLOAT NOT NULL DEFAULT 0,
+    score_count INTEGER NOT NULL DEFAULT 0,
+    new_pairs INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_interaction_rollup_rebuild UNIQUE (scope, scope_id, sub_id, granularity, bucket_start, interaction_type)
+);
+
+-- 创建用户-商品组合表（交互汇总据此判断首次组合）
+CREATE TABLE IF NOT EXISTS interaction_pairs (
+    user_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    first_at TIMESTAMP,
+    PRIMARY KEY (user_id, product_id)
+);
+
 -- 创建推荐缓存表
 CREATE TABLE IF NOT EXISTS recommendation_cache (
     id SERIAL PRIMARY KEY,
@@ -76,12 +128,37 @@ CREATE TABLE IF NOT EXISTS recommendation_cache (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 创建后台任务表
+CREATE TABLE IF NOT EXISTS background_jobs (
+    id SERIAL PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    params TEXT,  -- JSON格式存储任务参数
+    total INTEGER,
+    processed INTEGER DEFAULT 0,
+    success_count INTEGER DEFAULT 0,
+    error_count INTEGER DEFAULT 0,
+    last_offset BIGINT DEFAULT 0,  -- 最后提交的位置，续跑从此处开始
+    throughput FLOAT,
+    eta_seconds FLOAT,
+    error_samples TEXT,  -- JSON格式存储错误样例
+    result TEXT,  -- JSON格式存储任务结果
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- 创建索引
 CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category_id);
 CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
 CREATE INDEX IF NOT EXISTS idx_products_created_at ON products(created_at);
 CREATE INDEX IF NOT EXISTS idx_products_embedding ON products(embedding);
 
+-- 创建全文检索索引
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING gin (search_vector);
+
 -- 创建向量索引
 CREATE INDEX IF NOT EXISTS products_product_vector_idx 
 ON products USING ivfflat (product_vector vector_cosine_ops) 
@@ -96,7 +173,17 @@ CREATE INDEX IF NOT EXISTS idx_categories_name ON categories(name);
 CREATE INDEX IF NOT EXISTS idx_user_product ON user_interactions(user_id, product_id);
 CREATE INDEX IF NOT EXISTS idx_interaction_type ON user_interactions(interaction_type);
 CREATE INDEX IF NOT EXISTS idx_created_at ON user_interactions(created_at);
+CREATE INDEX IF NOT EXISTS idx_interactions_user_created ON user_interactions(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_interactions_product_created ON user_interactions(product_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_users_created_id ON users(created_at, id);
+
+-- 创建交互计数汇总索引
+CREATE INDEX IF NOT EXISTS idx_rollup_scope_bucket ON interaction_rollups(scope, granularity, bucket_start);
 
 -- 创建推荐缓存索引
 CREATE INDEX IF NOT EXISTS idx_cache_key ON recommendation_cache(cache_key);
 CREATE INDEX IF NOT EXISTS idx_cache_expires ON recommendation_cache(expires_at);
+
+-- 创建后台任务索引
+CREATE INDEX IF NOT EXISTS ix_background_jobs_job_type ON background_jobs(job_type);
+CREATE INDEX IF NOT EXISTS ix_background_jobs_status ON background_jobs(status);
@@ -0,0 +1,78 @@
+"""
+Gunicorn配置
+preload模式下主进程在fork前加载应用、词向量、jieba词典与商品向量索引，
+工作进程以写时复制方式共享这些只读数据
+
+启动: gunicorn -c backend/gunicorn.conf.py backend.run:app
+"""
+
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# 向量索引在主进程构建的最长等待时间（秒），超时后由各工作进程自行构建
+vector_index_wait = int(os.environ.get('GUNICORN_VECTOR_INDEX_WAIT', 300))
+
+if preload_app:
+    # 主进程加载应用时一并加载词向量（Config在加载应用时读取该环境变量）
+    os.environ.setdefault('PRELOAD_WORD_VECTORS', 'true')
+
+
+def when_ready(server):
+    """主进程就绪、fork工作进程之前"""
+    if not preload_app:
+        return
+    from app.services.vector_index_service import ProductVectorIndex
+    from app.services.suggestion_index import SuggestionIndex
+    from app.services.category_catalog_service import CategoryCatalog
+
+    if ProductVectorIndex().wait_for_build(timeout=vector_index_wait):
+        server.log.info("商品向量索引已在主进程构建完成")
+    if SuggestionIndex().wait_for_build(timeout=vector_index_wait):
+        server.log.info("搜索建议索引已在主进程构建完成")
+    if CategoryCatalog().wait_for_build(timeout=vector_index_wait):
+        server.log.info("分类目录已在主进程构建完成")
+
+    # 将已有对象移入永久代，避免工作进程的GC遍历写入共享页面
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"preload完成，已冻结 {gc.get_freeze_count()} 个对象")
+
+
+def post_fork(server, worker):
+    """工作进程fork之后"""
+    if not preload_app:
+        return
+    from app import db
+    from app.services.job_manager import JobManager
+    from app.services.vector_index_service import ProductVectorIndex
+    from app.services.suggestion_index import SuggestionIndex
+    from app.services.category_catalog_service import CategoryCatalog
+    from app.services.interaction_ingest_service import InteractionIngestor
+    from app.services.pgvector_recommendation_service import segment_pool
+    from app.services.product_embedding_matrix import ProductEmbeddingMatrix
+    from app.services.user_profile_service import UserProfileService
+
+    ProductVectorIndex().after_fork()
+    ProductEmbeddingMatrix().after_fork()
+    SuggestionIndex().after_fork()
+    CategoryCatalog().after_fork()
+    InteractionIngestor().after_fork()
+    JobManager().after_fork()
+    UserProfileService.after_fork()
+    segment_pool.after_fork()
+    # 数据库连接不能跨进程共享，丢弃从主进程继承的连接池
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    """工作进程退出前写入缓冲区中的交互事件"""
+    from app.services.interaction_ingest_service import InteractionIngestor
+
+    InteractionIngestor().shutdown()
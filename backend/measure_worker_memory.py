@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Gunicorn工作进程内存测量脚本
+分别以 preload 关闭/开启 启动gunicorn，预热请求后读取每个工作进程的
+/proc/<pid>/smaps_rollup（RSS、PSS、私有页），对比每进程内存占用
+
+仅支持Linux
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_URLS = [
+    '/api/v1/recommendation/health',
+    '/api/v1/recommendation/test-word-vector?word=%E6%89%8B%E6%9C%BA',
+]
+
+
+def read_smaps_rollup(pid: int) -> dict:
+    """读取进程内存统计（单位KB）"""
+    stats = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == 'kB':
+                stats[parts[0].rstrip(':')] = int(parts[1])
+    return stats
+
+
+def child_pids(pid: int) -> list:
+    """主进程的子进程（工作进程）"""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+            return [int(p) for p in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def wait_until_ready(master_pid: int, workers: int, base_url: str, timeout: float) -> bool:
+    """等待工作进程全部启动且HTTP可访问"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if len(child_pids(master_pid)) >= workers:
+            try:
+                urllib.request.urlopen(base_url + DEFAULT_URLS[0], timeout=5).read()
+                return True
+            except Exception:
+                pass
+        time.sleep(0.5)
+    return False
+
+
+def measure(app_module: str, preload: bool, workers: int, port: int, urls: list,
+            requests_per_url: int, timeout: float) -> list:
+    """启动一次gunicorn并测量工作进程内存"""
+    env = os.environ.copy()
+    env.update({
+        'GUNICORN_PRELOAD': 'true' if preload else 'false',
+        'GUNICORN_WORKERS': str(workers),
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+    })
+    process = subprocess.Popen(
+        ['gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py'), app_module],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        if not wait_until_ready(process.pid, workers, base_url, timeout):
+            raise RuntimeError(f"gunicorn在 {timeout}s 内未就绪")
+
+        # 预热：请求轮流落到各工作进程，触发词向量、分词器等的懒加载
+        for url in urls:
+            for _ in range(requests_per_url):
+                try:
+                    urllib.request.urlopen(base_url + url, timeout=30).read()
+                except Exception as e:
+                    print(f"请求失败 {url}: {e}", file=sys.stderr)
+        time.sleep(1)
+
+        results = []
+        for pid in child_pids(process.pid):
+            stats = read_smaps_rollup(pid)
+            results.append({
+                'pid': pid,
+                'rss': stats.get('Rss', 0),
+                'pss': stats.get('Pss', 0),
+                'private': stats.get('Private_Clean', 0) + stats.get('Private_Dirty', 0),
+                'shared': stats.get('Shared_Clean', 0) + stats.get('Shared_Dirty', 0),
+            })
+        master = read_smaps_rollup(process.pid)
+        results.append({'pid': f'{process.pid}(master)', 'rss': master.get('Rss', 0),
+                        'pss': master.get('Pss', 0),
+                        'private': master.get('Private_Clean', 0) + master.get('Private_Dirty', 0),
+                        'shared': master.get('Shared_Clean', 0) + master.get('Shared_Dirty', 0)})
+        return results
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def print_report(label: str, results: list):
+    mb = lambda kb: f"{kb / 1024:8.1f}"
+    print(f"\n== {label} ==")
+    print(f"{'pid':>14} {'RSS(MB)':>8} {'PSS(MB)':>8} {'私有(MB)':>8} {'共享(MB)':>8}")
+    for row in results:
+        print(f"{str(row['pid']):>14} {mb(row['rss'])} {mb(row['pss'])} {mb(row['private'])} {mb(row['shared'])}")
+    workers = [row for row in results if isinstance(row['pid'], int)]
+    if workers:
+        print(f"{'工作进程平均':>10} {mb(sum(r['rss'] for r in workers) / len(workers))} "
+              f"{mb(sum(r['pss'] for r in workers) / len(workers))} "
+              f"{mb(sum(r['private'] for r in workers) / len(workers))}")
+        print(f"{'PSS合计(含主进程)':>10} {mb(sum(r['pss'] for r in results))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='对比gunicorn preload开启/关闭时的工作进程内存')
+    parser.add_argument('--app', default='run:app', help='WSGI应用，默认 run:app')
+    parser.add_argument('--workers', type=int, default=4, help='工作进程数')
+    parser.add_argument('--port', type=int, default=5099, help='测量使用的端口')
+    parser.add_argument('--url', action='append', help='预热请求路径，可重复指定')
+    parser.add_argument('--requests', type=int, default=20, help='每个路径的预热请求数')
+    parser.add_argument('--timeout', type=float, default=600, help='等待启动的超时时间（秒）')
+    args = parser.parse_args()
+
+    urls = args.url or DEFAULT_URLS
+    for preload in (False, True):
+        results = measure(args.app, preload, args.workers, args.port, urls, args.requests, args.timeout)
+        print_report(f"preload={'on' if preload else 'off'}, workers={args.workers}", results)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+交互与用户列表索引迁移脚本
+为键集分页添加复合索引：user_interactions (user_id, created_at, id)、(product_id, created_at, id)
+与 users (created_at, id)；PostgreSQL上使用 CREATE INDEX CONCURRENTLY，建索引期间不阻塞写入
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from app import create_app, db
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 与 models.py 及 create_postgresql_tables.sql 中的定义保持一致
+INDEXES = [
+    ('idx_interactions_user_created', 'user_interactions', 'user_id, created_at, id'),
+    ('idx_interactions_product_created', 'user_interactions', 'product_id, created_at, id'),
+    ('idx_users_created_id', 'users', 'created_at, id'),
+]
+
+
+def migrate_interaction_indexes() -> dict:
+    """创建缺失的复合索引并更新统计信息（需在应用上下文中调用）"""
+    concurrently = 'CONCURRENTLY ' if db.engine.dialect.name == 'postgresql' else ''
+    created = []
+    # CONCURRENTLY 不能在事务中执行，使用自动提交连接
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for name, table, columns in INDEXES:
+            connection.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"))
+            created.append(name)
+            logger.info(f"索引已就绪: {name}")
+        for table in sorted({table for _, table, _ in INDEXES}):
+            connection.execute(text(f"ANALYZE {table}"))
+    result = {'indexes': created}
+    logger.info(f"交互索引迁移完成: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        migrate_interaction_indexes()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+交互计数汇总迁移与重建脚本
+创建交互计数汇总表（已存在则跳过）并按交互记录全量重建；
+首次启用、删除用户或商品后以及需要纠正偏差时执行，建议在低峰期运行
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(__file__))
+
+from app import create_app, db
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def create_rollup_table():
+    """创建汇总表、重建暂存表、用户-商品组合表及索引（已存在则跳过）"""
+    from app.models import InteractionPair, InteractionRollup, InteractionRollupRebuild
+
+    InteractionRollup.__table__.create(db.engine, checkfirst=True)
+    InteractionRollupRebuild.__table__.create(db.engine, checkfirst=True)
+    InteractionPair.__table__.create(db.engine, checkfirst=True)
+    logger.info("交互汇总表已就绪: interaction_rollups, interaction_rollups_rebuild, interaction_pairs")
+
+
+def migrate_interaction_rollups(batch_size: int = 500) -> dict:
+    """
+    创建汇总表并全量重建（需在应用上下文中调用）
+
+    Args:
+        batch_size: 每批处理用户数
+    """
+    from app.services.interaction_rollup_service import InteractionRollupService
+
+    create_rollup_table()
+    InteractionRollupService._availability.clear()
+    result = InteractionRollupService().rebuild(batch_size=batch_size)
+    logger.info(f"交互计数汇总重建完成: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='创建交互计数汇总表并全量重建')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批处理用户数')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migrate_interaction_rollups(batch_size=args.batch_size)
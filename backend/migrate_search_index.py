@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+全文检索迁移脚本
+为商品表添加jieba分词检索词串列并回填；PostgreSQL上再添加由词串生成的
+search_vector（tsvector生成列，名称/标签/描述分别加权A/B/D）与GIN索引，
+以及标签表的pg_trgm索引（扩展不可用时跳过）
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(__file__))
+
+from app import create_app, db
+from app.utils.search_tokens import build_search_tokens
+from sqlalchemy import text, inspect
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 与 create_postgresql_tables.sql 中的定义保持一致
+SEARCH_VECTOR_EXPRESSION = """
+    setweight(to_tsvector('simple'::regconfig, split_part(coalesce(search_tokens, ''), ' | ', 1)), 'A') ||
+    setweight(to_tsvector('simple'::regconfig, split_part(coalesce(search_tokens, ''), ' | ', 2)), 'B') ||
+    setweight(to_tsvector('simple'::regconfig, split_part(coalesce(search_tokens, ''), ' | ', 3)), 'D')
+"""
+
+
+def add_token_column():
+    """添加检索词串列（已存在则跳过）"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('products')}
+    if 'search_tokens' in columns:
+        logger.info("列 products.search_tokens 已存在，跳过")
+        return
+    db.session.execute(text("ALTER TABLE products ADD COLUMN search_tokens TEXT"))
+    db.session.commit()
+    logger.info("成功添加列: products.search_tokens")
+
+
+def backfill_tokens(batch_size: int = 2000, rebuild: bool = False) -> int:
+    """按主键分批生成检索词串"""
+    condition = "" if rebuild else "search_tokens IS NULL AND "
+    select_sql = text(f"""
+        SELECT id, name, tags, description
+        FROM products
+        WHERE {condition}id > :last_id
+        ORDER BY id
+        LIMIT :batch_size
+    """)
+    update_sql = text("UPDATE products SET search_tokens = :tokens WHERE id = :id")
+
+    last_id = 0
+    converted = 0
+    while True:
+        rows = db.session.execute(select_sql, {'last_id': last_id, 'batch_size': batch_size}).fetchall()
+        if not rows:
+            break
+        db.session.execute(update_sql, [
+            {'id': row.id, 'tokens': build_search_tokens(row.name, row.tags, row.description)}
+            for row in rows
+        ])
+        db.session.commit()
+        converted += len(rows)
+        last_id = rows[-1].id
+        logger.info(f"products: 已生成 {converted} 条检索词串")
+    return converted
+
+
+def add_search_vector():
+    """PostgreSQL：添加tsvector生成列与索引"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('products')}
+    if 'search_vector' not in columns:
+        db.session.execute(text(f"""
+            ALTER TABLE products ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS ({SEARCH_VECTOR_EXPRESSION}) STORED
+        """))
+        db.session.commit()
+        logger.info("成功添加列: products.search_vector")
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING gin (search_vector)"
+    ))
+    db.session.commit()
+    logger.info("全文检索索引已就绪: idx_products_search_vector")
+
+    try:
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_product_tags_tag_trgm ON product_tags USING gin (tag gin_trgm_ops)"
+        ))
+        db.session.commit()
+        logger.info("标签三元组索引已就绪: idx_product_tags_tag_trgm")
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"pg_trgm不可用，标签建议继续使用顺序扫描: {e}")
+
+
+def migrate_search_index(batch_size: int = 2000, rebuild: bool = False) -> dict:
+    """
+    执行全文检索迁移（需在应用上下文中调用）
+
+    Args:
+        batch_size: 每批处理行数
+        rebuild: 重新生成全部商品的检索词串（调整分词词典后使用）
+    """
+    add_token_column()
+    result = {'tokens': backfill_tokens(batch_size=batch_size, rebuild=rebuild)}
+    if db.engine.dialect.name == 'postgresql':
+        add_search_vector()
+        db.session.execute(text("ANALYZE products"))
+        db.session.commit()
+        result['search_vector'] = True
+    logger.info(f"全文检索迁移完成: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='为商品表添加全文检索列与索引')
+    parser.add_argument('--batch-size', type=int, default=2000, help='每批处理行数')
+    parser.add_argument('--rebuild', action='store_true', help='重新生成全部检索词串')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migrate_search_index(batch_size=args.batch_size, rebuild=args.rebuild)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+用户特征向量迁移与重建脚本
+为用户表添加增量维护特征向量所需的向量和、权重合计列，并按交互记录全量重建所有用户的特征向量；
+建议定期执行（如每日），纠正增量累加的浮点误差以及商品向量重算后的偏差
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(__file__))
+
+from app import create_app, db
+from sqlalchemy import text, inspect
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def add_preference_columns():
+    """添加向量和与权重合计列（已存在则跳过）"""
+    binary_type = 'BYTEA' if db.engine.dialect.name == 'postgresql' else 'BLOB'
+    columns = {column['name'] for column in inspect(db.engine).get_columns('users')}
+    for column, column_type in (('preference_sum', binary_type), ('preference_weight', 'DOUBLE PRECISION')):
+        if column in columns:
+            logger.info(f"列 users.{column} 已存在，跳过")
+            continue
+        db.session.execute(text(f"ALTER TABLE users ADD COLUMN {column} {column_type}"))
+        db.session.commit()
+        logger.info(f"成功添加列: users.{column}")
+
+
+def migrate_user_vectors(batch_size: int = 500) -> dict:
+    """
+    添加列并全量重建用户特征向量（需在应用上下文中调用）
+
+    Args:
+        batch_size: 每批处理用户数
+    """
+    from app.services.user_profile_service import UserProfileService
+
+    add_preference_columns()
+    UserProfileService._availability.clear()
+    result = UserProfileService().rebuild_all(batch_size=batch_size)
+    logger.info(f"用户特征向量重建完成: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='添加用户向量和列并全量重建用户特征向量')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批处理用户数')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migrate_user_vectors(batch_size=args.batch_size)
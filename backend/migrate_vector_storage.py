@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+向量存储迁移脚本
+为商品、标签、用户表添加float32二进制向量列，并将JSON文本向量回填为二进制
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(__file__))
+
+from app import create_app, db
+from app.utils.vector_codec import decode_vector, encode_vector
+from sqlalchemy import text, inspect
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (表名, 二进制列, 文本来源表达式, 可清空的JSON文本列)
+VECTOR_COLUMNS = [
+    ('products', 'embedding_bin', 'embedding', 'embedding'),
+    ('tag_vectors', 'vector_bin', 'vector', 'vector'),
+    ('users', 'feature_vector_bin', 'COALESCE(feature_vector, feature_vector_pgvector)', 'feature_vector'),
+]
+
+
+def add_binary_columns():
+    """添加二进制向量列（已存在则跳过）"""
+    binary_type = 'BYTEA' if db.engine.dialect.name == 'postgresql' else 'BLOB'
+    inspector = inspect(db.engine)
+    for table, bin_column, _, _ in VECTOR_COLUMNS:
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if bin_column in columns:
+            logger.info(f"列 {table}.{bin_column} 已存在，跳过")
+            continue
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {bin_column} {binary_type}"))
+        db.session.commit()
+        logger.info(f"成功添加列: {table}.{bin_column}")
+
+
+def backfill_table(table: str, bin_column: str, source_expr: str, text_column: str,
+                   batch_size: int = 2000, clear_text: bool = False) -> int:
+    """按主键分批将文本向量转换为二进制"""
+    select_sql = text(f"""
+        SELECT id, {source_expr} AS vector
+        FROM {table}
+        WHERE {bin_column} IS NULL AND {source_expr} IS NOT NULL AND id > :last_id
+        ORDER BY id
+        LIMIT :batch_size
+    """)
+    set_clause = f"{bin_column} = :data" + (f", {text_column} = NULL" if clear_text else "")
+    update_sql = text(f"UPDATE {table} SET {set_clause} WHERE id = :id")
+
+    last_id = 0
+    converted = 0
+    while True:
+        rows = db.session.execute(select_sql, {'last_id': last_id, 'batch_size': batch_size}).fetchall()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            vector = decode_vector(row.vector)
+            if vector is not None and len(vector):
+                params.append({'id': row.id, 'data': encode_vector(vector)})
+        if params:
+            db.session.execute(update_sql, params)
+        db.session.commit()
+        converted += len(params)
+        last_id = rows[-1].id
+        logger.info(f"{table}: 已转换 {converted} 条")
+    return converted
+
+
+def migrate_vector_storage(batch_size: int = 2000, clear_text: bool = False) -> dict:
+    """
+    执行向量存储迁移（需在应用上下文中调用）
+
+    Args:
+        batch_size: 每批处理行数
+        clear_text: 转换后清空JSON文本列以释放空间
+    """
+    add_binary_columns()
+    result = {}
+    for table, bin_column, source_expr, text_column in VECTOR_COLUMNS:
+        try:
+            result[table] = backfill_table(table, bin_column, source_expr, text_column,
+                                           batch_size=batch_size, clear_text=clear_text)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"迁移 {table} 向量失败: {e}")
+            result[table] = f"error: {e}"
+    logger.info(f"向量存储迁移完成: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='迁移向量存储为float32二进制格式')
+    parser.add_argument('--batch-size', type=int, default=2000, help='每批处理行数')
+    parser.add_argument('--clear-text', action='store_true', help='转换后清空JSON文本列')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migrate_vector_storage(batch_size=args.batch_size, clear_text=args.clear_text)
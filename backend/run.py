@@ -5,6 +5,7 @@
 
 import os
 import sys
+import click
 
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -41,6 +42,87 @@ def migrate_db():
     upgrade()
     print("Database migration completed!")
 
+@app.cli.command('migrate-vectors')
+@click.option('--batch-size', default=2000, help='每批处理行数')
+@click.option('--clear-text', is_flag=True, help='转换后清空JSON文本列')
+def migrate_vectors(batch_size, clear_text):
+    """迁移向量存储为float32二进制格式"""
+    from migrate_vector_storage import migrate_vector_storage
+    result = migrate_vector_storage(batch_size=batch_size, clear_text=clear_text)
+    print(f"Vector storage migration completed: {result}")
+
+@app.cli.command('migrate-search-index')
+@click.option('--batch-size', default=2000, help='每批处理行数')
+@click.option('--rebuild', is_flag=True, help='重新生成全部检索词串')
+def migrate_search_index(batch_size, rebuild):
+    """添加商品全文检索列与索引并回填检索词串"""
+    from migrate_search_index import migrate_search_index as run_migration
+    result = run_migration(batch_size=batch_size, rebuild=rebuild)
+    print(f"Search index migration completed: {result}")
+
+@app.cli.command('rebuild-user-vectors')
+@click.option('--batch-size', default=500, help='每批处理用户数')
+def rebuild_user_vectors(batch_size):
+    """按交互记录全量重建用户特征向量（首次执行时添加所需列，建议定期执行）"""
+    from migrate_user_vectors import migrate_user_vectors
+    result = migrate_user_vectors(batch_size=batch_size)
+    print(f"User vectors rebuilt: {result}")
+
+@app.cli.command('rebuild-interaction-rollups')
+@click.option('--batch-size', default=500, help='每批处理用户数')
+def rebuild_interaction_rollups(batch_size):
+    """创建交互计数汇总表并按交互记录全量重建（首次启用及纠正偏差时执行）"""
+    from migrate_interaction_rollups import migrate_interaction_rollups
+    result = migrate_interaction_rollups(batch_size=batch_size)
+    print(f"Interaction rollups rebuilt: {result}")
+
+@app.cli.command('migrate-interaction-indexes')
+def migrate_interaction_indexes():
+    """添加交互记录与用户列表键集分页使用的复合索引"""
+    from migrate_interaction_indexes import migrate_interaction_indexes as run_migration
+    result = run_migration()
+    print(f"Interaction index migration completed: {result}")
+
+@app.cli.command('build-vocab')
+@click.option('--queries', multiple=True, help='历史查询文件，每行一个查询，可重复指定')
+@click.option('--output', default=None, help='输出目录，默认 model/pruned_vocab')
+def build_vocab(queries, output):
+    """构建裁剪词向量（只保留商品标签、jieba词典与历史查询用到的词）"""
+    from build_pruned_vocab import build_pruned_vocab, DEFAULT_OUTPUT_PATH
+    count = build_pruned_vocab(output_path=output or DEFAULT_OUTPUT_PATH, query_paths=list(queries))
+    print(f"Pruned vocabulary built: {count} words")
+
+@app.cli.command('build-tag-vectors')
+@click.option('--workers', default=None, type=int, help='分词进程数，默认CPU核数')
+@click.option('--chunk-size', default=5000, help='每批写入的标签数')
+def build_tag_vectors(workers, chunk_size):
+    """批量预计算缺失的标签向量"""
+    from app.services.vector_build_service import VectorBuildService
+    result = VectorBuildService().build_tag_vectors(workers=workers, chunk_size=chunk_size)
+    print(f"Tag vectors built: {result}")
+
+@app.cli.command('build-product-vectors')
+@click.option('--chunk-size', default=2000, help='每批商品数')
+@click.option('--all', 'rebuild_all', is_flag=True, help='重算全部商品（默认只计算尚无向量的商品）')
+@click.option('--resume', is_flag=True, help='从上次中断的断点继续')
+def build_product_vectors(chunk_size, rebuild_all, resume):
+    """批量重算商品向量（标签向量加权平均）"""
+    from app.services.vector_build_service import VectorBuildService
+    result = VectorBuildService().build_product_vectors(
+        chunk_size=chunk_size, only_missing=not rebuild_all, resume=resume
+    )
+    print(f"Product vectors built: {result}")
+
+@app.cli.command('materialize-similar')
+@click.option('--full', is_flag=True, help='全量重算（默认只增量刷新变更的商品）')
+@click.option('--top-n', default=None, type=int, help='每个商品保存的相似商品数，默认 SIMILAR_MATERIALIZE_TOP_N')
+@click.option('--batch-size', default=2000, help='每批计算并提交的商品数')
+def materialize_similar(full, top_n, batch_size):
+    """物化相似商品列表到 recommendation_cache"""
+    from app.services.similar_product_materializer import SimilarProductMaterializer
+    result = SimilarProductMaterializer().materialize(full=full, top_n=top_n, batch_size=batch_size)
+    print(f"Similar products materialized: {result}")
+
 if __name__ == '__main__':
     # 开发环境运行
     port = int(os.environ.get('FLASK_RUN_PORT', 5004))
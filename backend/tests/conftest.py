@@ -0,0 +1,36 @@
+"""
+测试公共夹具
+Redis相关测试使用 fakeredis 作为本地Redis替身，不需要运行中的Redis服务
+"""
+
+import pytest
+
+from app.utils.cache import clear_caches
+from app.utils.result_cache import RedisCacheTier
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def redis_server():
+    """fakeredis 服务端（可通过 connected=False 模拟Redis不可用）"""
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_tier(redis_server):
+    """接入 fakeredis 客户端的 RedisCacheTier，测试结束后恢复为未启用状态"""
+    tier = RedisCacheTier()
+    saved = (tier.enabled, tier.url, tier.retry_seconds)
+    tier.set_client(fakeredis.FakeRedis(server=redis_server))
+    tier._versions.clear()
+    tier._local_versions.clear()
+    tier.errors = 0
+    clear_caches()
+    yield tier
+    tier.set_client(None)
+    tier.enabled, tier.url, tier.retry_seconds = saved
+    tier._versions.clear()
+    tier._local_versions.clear()
+    tier.errors = 0
+    clear_caches()
@@ -0,0 +1,161 @@
+"""两级结果缓存（app.utils.result_cache）测试"""
+
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app.utils.result_cache import (
+    CATALOG_SCOPE, KEY_PREFIX, TieredCache, bump_catalog_version, bump_user_version, pack, unpack,
+    user_scope
+)
+
+
+# ----------------------------------------------------------------------
+# msgpack 编解码
+# ----------------------------------------------------------------------
+
+def test_pack_float_array_round_trips_as_float32():
+    vector = np.random.default_rng(0).random((3, 4))
+    restored = unpack(pack({'vector': vector}))['vector']
+    assert restored.dtype == np.float32
+    assert restored.shape == (3, 4)
+    np.testing.assert_allclose(restored, vector.astype(np.float32))
+
+
+def test_pack_keeps_integer_arrays_and_scalars():
+    ids = np.arange(5, dtype=np.int64)
+    value = {
+        'ids': ids,
+        'score': np.float64(0.5),
+        'created_at': datetime(2026, 1, 2, 3, 4, 5),
+        'price': Decimal('9.90'),
+        1: 'int key'
+    }
+    restored = unpack(pack(value))
+    assert restored['ids'].dtype == np.int64
+    np.testing.assert_array_equal(restored['ids'], ids)
+    assert restored['score'] == 0.5
+    assert restored['created_at'] == '2026-01-02T03:04:05'
+    assert restored['price'] == pytest.approx(9.9)
+    assert restored[1] == 'int key'
+
+
+def test_pack_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        pack({'value': object()})
+
+
+# ----------------------------------------------------------------------
+# L1 / L2
+# ----------------------------------------------------------------------
+
+def test_l2_hit_backfills_l1(redis_tier):
+    cache = TieredCache('test_backfill', ttl=60)
+    key = cache.key(('query', 1))
+    cache.set(key, {'ids': [1, 2, 3]})
+    assert redis_tier.client.get(KEY_PREFIX + key) is not None
+
+    # 模拟另一个工作进程：L1为空时从L2读取并回填L1
+    cache.local.clear()
+    assert cache.get(key) == {'ids': [1, 2, 3]}
+    assert cache.local.get(key) == {'ids': [1, 2, 3]}
+
+
+def test_get_or_set_computes_once_across_workers(redis_tier):
+    cache = TieredCache('test_get_or_set', ttl=60)
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return [{'id': 7, 'vector': np.ones(4)}]
+
+    first = cache.get_or_set(('similar', 7), factory)
+    cache.local.clear()
+    second = cache.get_or_set(('similar', 7), factory)
+    assert len(calls) == 1
+    assert second[0]['id'] == 7
+    assert second[0]['vector'].dtype == np.float32
+    np.testing.assert_array_equal(second[0]['vector'], first[0]['vector'])
+
+
+def test_empty_results_are_not_cached(redis_tier):
+    cache = TieredCache('test_empty', ttl=60)
+    calls = []
+    cache.get_or_set(('nothing',), lambda: calls.append(1) or [])
+    cache.get_or_set(('nothing',), lambda: calls.append(1) or [])
+    assert len(calls) == 2
+
+
+# ----------------------------------------------------------------------
+# 版本号
+# ----------------------------------------------------------------------
+
+def test_catalog_bump_invalidates_older_keys(redis_tier):
+    cache = TieredCache('test_catalog_version', ttl=60)
+    old_key = cache.key(('search', 'phone'))
+    cache.set(old_key, ['old'])
+
+    bump_catalog_version()
+    new_key = cache.key(('search', 'phone'))
+    assert new_key != old_key
+    assert cache.get(new_key) is None
+    assert cache.get_or_set(('search', 'phone'), lambda: ['new']) == ['new']
+
+
+def test_user_bump_only_affects_that_user(redis_tier):
+    cache = TieredCache('test_user_version', ttl=60)
+    key_1 = cache.key((1, 12), scopes=(CATALOG_SCOPE, user_scope(1)))
+    key_2 = cache.key((2, 12), scopes=(CATALOG_SCOPE, user_scope(2)))
+
+    bump_user_version(1)
+    assert cache.key((1, 12), scopes=(CATALOG_SCOPE, user_scope(1))) != key_1
+    assert cache.key((2, 12), scopes=(CATALOG_SCOPE, user_scope(2))) == key_2
+
+
+def test_version_bump_is_shared_through_redis(redis_tier):
+    bump_catalog_version()
+    bump_catalog_version()
+    # 模拟另一个工作进程：本地版本号缓存为空时从Redis读取
+    redis_tier._versions.clear()
+    redis_tier._local_versions.clear()
+    assert redis_tier.get_version(CATALOG_SCOPE) == 2
+
+
+# ----------------------------------------------------------------------
+# Redis不可用
+# ----------------------------------------------------------------------
+
+def test_redis_down_backs_off_to_l1(redis_tier, redis_server):
+    redis_tier.retry_seconds = 30
+    cache = TieredCache('test_backoff', ttl=60)
+    key = cache.key(('query',))
+    redis_server.connected = False
+
+    # 写入L2失败：记录错误并进入退避期，值仍写入L1
+    cache.set(key, ['value'])
+    assert redis_tier.errors == 1
+    assert redis_tier.client is None
+    assert cache.get(key) == ['value']
+
+    # 退避期内不再访问Redis，版本号在本地递增
+    before = redis_tier.get_version(CATALOG_SCOPE)
+    bump_catalog_version()
+    assert redis_tier.errors == 1
+    assert redis_tier.get_version(CATALOG_SCOPE) == before + 1
+
+
+def test_redis_recovers_after_backoff(redis_tier, redis_server):
+    redis_tier.retry_seconds = 30
+    cache = TieredCache('test_recover', ttl=60)
+    redis_server.connected = False
+    cache.set(cache.key(('query',)), ['value'])
+    assert redis_tier.client is None
+
+    redis_server.connected = True
+    redis_tier._retry_at = 0.0  # 退避期结束
+    assert redis_tier.client is not None
+    key = cache.key(('query', 2))
+    cache.set(key, ['fresh'])
+    assert redis_tier.client.get(KEY_PREFIX + key) is not None